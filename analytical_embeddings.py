@@ -0,0 +1,88 @@
+"""
+CustomsAI – Embedding precalcolati per la query analitica DU
+
+In analytical mode main.query cerca i chunk normativi con la query
+"obblighi autorizzazione esportazione <DU1> <DU2> <DU3>". L'universo dei
+codici DU è finito (dual_use_items), quindi gli embedding possono essere
+precalcolati (tools/precompute_analytical_embeddings.py) e letti da un file
+locale invece di chiamare OpenAI nel ramo più lento della pipeline:
+
+  - hit esatto → la combinazione di codici è nello store
+  - media      → tutti i codici sono nello store singolarmente:
+                 media normalizzata dei vettori per codice
+  - None       → il chiamante calcola l'embedding live
+
+File: config.ANALYTICAL_EMBEDDINGS_FILE (.npz con "keys" e "vectors").
+"""
+
+import os
+from pathlib import Path
+
+import numpy as np
+
+import config
+
+
+ANALYTICAL_QUERY_PREFIX = "obblighi autorizzazione esportazione"
+
+# Codici DU usati nella query analitica (i primi, nell'ordine di scoperta).
+ANALYTICAL_MAX_CODES = 3
+
+# Store caricato nel processo: chiave → riga della matrice. None = non ancora letto.
+_STORE: tuple[dict[str, int], np.ndarray] | None = None
+
+
+def analytical_key(codes: list[str]) -> str:
+    return " ".join(codes[:ANALYTICAL_MAX_CODES])
+
+
+def analytical_query(codes: list[str]) -> str:
+    """Query focalizzata sui codici DU, senza il codice NC che sposta l'embedding verso la nomenclatura."""
+    return f"{ANALYTICAL_QUERY_PREFIX} {analytical_key(codes)}"
+
+
+def save_store(keys: list[str], vectors: list[list[float]]) -> Path:
+    """Scrive lo store (scrittura atomica) e invalida quello caricato nel processo."""
+    global _STORE
+    path = Path(config.ANALYTICAL_EMBEDDINGS_FILE)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.stem + ".tmp.npz")
+    np.savez(tmp, keys=np.array(keys), vectors=np.asarray(vectors, dtype=np.float32))
+    os.replace(tmp, path)
+    _STORE = None
+    return path
+
+
+def _load_store() -> tuple[dict[str, int], np.ndarray]:
+    global _STORE
+    if _STORE is None:
+        path = Path(config.ANALYTICAL_EMBEDDINGS_FILE)
+        try:
+            with np.load(path) as data:
+                keys, vectors = data["keys"], data["vectors"]
+            _STORE = ({str(k): i for i, k in enumerate(keys)}, vectors)
+            print(f"[analytical] store {path.name} → {len(keys)} embedding")
+        except (OSError, KeyError, ValueError):
+            _STORE = ({}, np.zeros((0, 0), dtype=np.float32))
+    return _STORE
+
+
+def lookup(codes: list[str]) -> tuple[list[float], str] | None:
+    """
+    Embedding della query analitica per `codes` dallo store: (vettore, "exact" | "mean"),
+    oppure None se la combinazione non è ricostruibile.
+    """
+    index, vectors = _load_store()
+    if not codes or not index:
+        return None
+
+    row = index.get(analytical_key(codes))
+    if row is not None:
+        return vectors[row].tolist(), "exact"
+
+    rows = [index.get(c) for c in codes[:ANALYTICAL_MAX_CODES]]
+    if any(r is None for r in rows):
+        return None
+    mean = vectors[rows].mean(axis=0)
+    norm = np.linalg.norm(mean)
+    return (mean / norm if norm else mean).tolist(), "mean"
@@ -7,6 +7,8 @@ CLI invariato: python3 main.py "domanda"
 
 import streamlit as st
 
+import config
+from deadline import Deadline
 from main import query, _format_eurlex_text
 
 
@@ -27,6 +29,8 @@ def _render_entry(question: str, result: dict, show_question: bool = True) -> No
         st.warning("Nessun risultato trovato.")
 
     elif result["mode"] == "direct":
+        if result.get("note"):
+            st.info(result["note"])
         st.subheader("Testo normativo")
         for chunk in result["chunks"]:
             raw = chunk.get("chunk_text", "")
@@ -78,9 +82,17 @@ if submitted:
     if not question.strip():
         st.warning("Inserire una domanda.")
     else:
+        # Un nuovo invio annulla la richiesta precedente ancora in corso
+        # (Streamlit la lascia girare fino al prossimo st.*).
+        previous = st.session_state.get("deadline")
+        if previous is not None:
+            previous.cancel()
+        deadline = Deadline(config.QUERY_DEADLINE_SECONDS or None)
+        st.session_state.deadline = deadline
+
         with st.spinner("Elaborazione..."):
             try:
-                result = query(question.strip())
+                result = query(question.strip(), deadline=deadline)
             except Exception as e:
                 st.error(f"Errore: {e}")
                 result = None
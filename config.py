@@ -24,6 +24,84 @@ TABLE_NAME: str = "chunks"
 # Retrieval: number of chunks to fetch (cursorrules: 5–15).
 TOP_K: int = min(20, max(5, int(os.getenv("TOP_K", "15"))))
 
+# Diversity selection after vector search (retrieval.vector_search, mmr.py):
+# over-fetch MMR_OVERFETCH × TOP_K candidates, keep TOP_K by maximal marginal relevance.
+MMR_ENABLED: bool = os.getenv("MMR_ENABLED", "false").strip().lower() in ("1", "true", "yes")
+MMR_OVERFETCH: int = max(1, int(os.getenv("MMR_OVERFETCH", "3")))
+MMR_LAMBDA: float = min(1.0, max(0.0, float(os.getenv("MMR_LAMBDA", "0.7"))))
+
+# Hybrid retrieval (retrieval.lexical_search, lexical.py): local BM25 index on chunks.text.
+# GENERIC queries try BM25 first; when the lexical match is decisive (anchor terms such as
+# article numbers all present, enough idf-weighted coverage, clear margin over the runner-up)
+# the query embedding and vector search are skipped, otherwise the two rankings are fused (RRF).
+HYBRID_ENABLED: bool = os.getenv("HYBRID_ENABLED", "false").strip().lower() in ("1", "true", "yes")
+LEXICAL_MIN_COVERAGE: float = float(os.getenv("LEXICAL_MIN_COVERAGE", "0.8"))
+LEXICAL_MIN_MARGIN: float = float(os.getenv("LEXICAL_MIN_MARGIN", "1.2"))
+
+# Semantic near-duplicate question cache (semantic_cache.py): reuse retrieval/answer of a
+# previous question whose query embedding has cosine similarity >= threshold.
+SEMANTIC_CACHE_ENABLED: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "false").strip().lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_ENTRIES: int = max(1, int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000")))
+
+# Storage of embeddings kept in local caches/indexes (quantize.py): float32 | float16 | int8.
+EMBEDDING_STORAGE: str = os.getenv("EMBEDDING_STORAGE", "int8").strip().lower()
+
+# Streaming collateral lookups (retrieval.iter_collateral): rows per page.
+COLLATERAL_PAGE_SIZE: int = max(1, int(os.getenv("COLLATERAL_PAGE_SIZE", "200")))
+
+# Multi-hop links_to traversal (traversal.py): max hops and new codes per table per hop.
+TRAVERSAL_MAX_DEPTH: int = max(0, int(os.getenv("TRAVERSAL_MAX_DEPTH", "2")))
+TRAVERSAL_MAX_FANOUT: int = max(1, int(os.getenv("TRAVERSAL_MAX_FANOUT", "20")))
+
+# Local snapshots of whole tables backing in-memory indexes (snapshots.py).
+CACHE_DIR: Path = Path(
+    os.getenv("CUSTOMSAI_CACHE_DIR", str(Path(__file__).resolve().parent / ".cache"))
+)
+SNAPSHOT_TTL_HOURS: float = float(os.getenv("SNAPSHOT_TTL_HOURS", "24"))
+
+# Precomputed embeddings of the analytical DU query (analytical_embeddings.py,
+# written by tools/precompute_analytical_embeddings.py).
+ANALYTICAL_EMBEDDINGS_FILE: Path = Path(
+    os.getenv("ANALYTICAL_EMBEDDINGS_FILE", str(CACHE_DIR / "analytical_embeddings.npz"))
+)
+
+# Resilience of Supabase/OpenAI calls (resilience.py): retries for idempotent calls on
+# transient errors (jittered exponential backoff), per-dependency circuit breakers and
+# optional hedged duplicate reads once a call exceeds the HEDGE_PERCENTILE latency.
+RETRY_MAX_ATTEMPTS: int = max(0, int(os.getenv("RETRY_MAX_ATTEMPTS", "2")))
+RETRY_BASE_DELAY: float = float(os.getenv("RETRY_BASE_DELAY", "0.2"))
+RETRY_MAX_DELAY: float = float(os.getenv("RETRY_MAX_DELAY", "2.0"))
+BREAKER_FAILURE_THRESHOLD: int = max(1, int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5")))
+BREAKER_RESET_SECONDS: float = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+HEDGE_ENABLED: bool = os.getenv("HEDGE_ENABLED", "false").strip().lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE: float = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES: int = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
+# Single-flight (singleflight.py): concurrent identical lookup_collateral / get_embedding /
+# vector_search calls share one in-flight call and its result.
+SINGLE_FLIGHT_ENABLED: bool = os.getenv("SINGLE_FLIGHT_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+
+# End-to-end time budget of query() (deadline.py). 0 = no deadline (CLI default);
+# the Streamlit app and the HTTP service pass QUERY_DEADLINE_SECONDS when > 0.
+# Below LLM_MIN_SECONDS of remaining budget the LLM stage is skipped and query()
+# degrades to mode="direct" with the retrieved text and a note.
+QUERY_DEADLINE_SECONDS: float = float(os.getenv("QUERY_DEADLINE_SECONDS", "0"))
+LLM_MIN_SECONDS: float = float(os.getenv("LLM_MIN_SECONDS", "3"))
+# Per-request HTTP timeout for OpenAI calls (capped by the remaining deadline budget).
+OPENAI_TIMEOUT_SECONDS: float = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "120"))
+# Per-request HTTP timeout for Supabase/PostgREST reads in retrieval.py (same cap).
+SUPABASE_TIMEOUT_SECONDS: float = float(os.getenv("SUPABASE_TIMEOUT_SECONDS", "120"))
+
+# HTTP/JSON service (server.py): bounded worker pool; beyond SERVER_WORKERS + SERVER_MAX_QUEUE
+# pending requests the service answers 503. On SIGTERM in-flight requests get
+# SERVER_SHUTDOWN_SECONDS to finish before their deadlines are cancelled.
+SERVER_HOST: str = os.getenv("SERVER_HOST", "127.0.0.1").strip()
+SERVER_PORT: int = int(os.getenv("SERVER_PORT", "8000"))
+SERVER_WORKERS: int = max(1, int(os.getenv("SERVER_WORKERS", "8")))
+SERVER_MAX_QUEUE: int = max(0, int(os.getenv("SERVER_MAX_QUEUE", "32")))
+SERVER_SHUTDOWN_SECONDS: float = float(os.getenv("SERVER_SHUTDOWN_SECONDS", "30"))
+
 # Optional: max total context length in characters to avoid token overflow.
 # Can be tuned later; for now we rely on TOP_K to keep context small.
 MAX_CONTEXT_CHARS: int = int(os.getenv("MAX_CONTEXT_CHARS", "30000"))
@@ -0,0 +1,103 @@
+"""
+CustomsAI – Grafo di correlazioni in memoria per le entry con links_to
+
+Costruito una sola volta dalle righe di una tabella di correlazione
+(es. dual_use_correlations: cn_codes_2026 → dual_use_codification):
+
+  - forward(prefix)    → codici collegati ai codici sorgente con quel prefisso  (NC → DU)
+  - reverse(code)      → codici sorgente collegati al codice destinazione       (DU → NC)
+  - rows_for_source()  / rows_for_target() → righe raw per costruire i ChunkRow
+
+Le chiavi sono tenute ordinate: le ricerche per prefisso sono due bisect
+sull'array ordinato, senza scansioni.
+
+Nessun accesso al DB: il caricamento delle righe è compito di retrieval.py.
+"""
+
+from bisect import bisect_left
+
+
+def _prefix_range(keys: list[str], prefix: str) -> range:
+    """Indici di `keys` (ordinate) che iniziano con `prefix`."""
+    lo = bisect_left(keys, prefix)
+    # "￿" è maggiore di qualsiasi carattere ammesso nei codici.
+    hi = bisect_left(keys, prefix + "￿", lo)
+    return range(lo, hi)
+
+
+class CorrelationGraph:
+    """Mappe di adiacenza sorgente → destinazione e destinazione → sorgente."""
+
+    def __init__(self, rows: list[dict], code_field: str, text_field: str):
+        self._code_field = code_field
+        self._rows_by_source: dict[str, list[dict]] = {}
+        self._rows_by_target: dict[str, list[dict]] = {}
+        self._forward: dict[str, list[str]] = {}
+        self._reverse: dict[str, list[str]] = {}
+
+        for r in rows:
+            source = str(r.get(code_field) or "").strip()
+            target = str(r.get(text_field) or "").strip().upper()
+            if not source or not target:
+                continue
+            self._rows_by_source.setdefault(source, []).append(r)
+            self._rows_by_target.setdefault(target, []).append(r)
+            if target not in self._forward.setdefault(source, []):
+                self._forward[source].append(target)
+            if source not in self._reverse.setdefault(target, []):
+                self._reverse[target].append(source)
+
+        self._sources = sorted(self._forward)
+        self._targets = sorted(self._reverse)
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._forward.values())
+
+    def sources(self) -> list[str]:
+        """Codici sorgente distinti, ordinati."""
+        return list(self._sources)
+
+    def forward(self, prefix: str) -> list[str]:
+        """
+        Codici destinazione collegati a tutti i codici sorgente che iniziano con
+        `prefix` (es. "8544" → tutti i DU delle voci 8544xxxxxx), senza duplicati,
+        nell'ordine dei codici sorgente.
+        """
+        seen: dict[str, None] = {}
+        for i in _prefix_range(self._sources, prefix.strip()):
+            for target in self._forward[self._sources[i]]:
+                seen.setdefault(target, None)
+        return list(seen)
+
+    def reverse(self, code: str) -> list[str]:
+        """
+        Codici sorgente collegati al codice destinazione `code`, incluse le sue
+        sotto-voci (es. "3E001" → anche le righe con "3E001.a"), ordinati.
+        """
+        sources: set[str] = set()
+        for i in _prefix_range(self._targets, code.strip().upper()):
+            sources.update(self._reverse[self._targets[i]])
+        return sorted(sources)
+
+    def rows_for_source(self, code: str, prefix: bool = True) -> list[dict]:
+        """
+        Righe raw con codice sorgente uguale a `code` (prefix=False) oppure che
+        inizia con `code` (prefix=True), ordinate per codice sorgente.
+        """
+        code = code.strip()
+        if not prefix:
+            return list(self._rows_by_source.get(code, []))
+        return [
+            r
+            for i in _prefix_range(self._sources, code)
+            for r in self._rows_by_source[self._sources[i]]
+        ]
+
+    def rows_for_target(self, code: str) -> list[dict]:
+        """Righe raw il cui codice destinazione è `code` o una sua sotto-voce, ordinate per sorgente."""
+        rows = [
+            r
+            for i in _prefix_range(self._targets, code.strip().upper())
+            for r in self._rows_by_target[self._targets[i]]
+        ]
+        return sorted(rows, key=lambda r: str(r.get(self._code_field, "")))
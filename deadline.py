@@ -0,0 +1,93 @@
+"""
+CustomsAI – Deadline e cancellazione per query()
+
+Un Deadline è il budget di tempo di una richiesta. main.query lo attiva
+nel contesto corrente (contextvars) e ogni stadio lo consulta:
+
+  - resilience.call   → non parte / non ritenta oltre il budget, smette di
+                        attendere una chiamata in volo alla scadenza o alla cancellazione
+  - embeddings / llm  → timeout HTTP = min(default, tempo rimanente)
+  - retrieval         → idem per ogni richiesta PostgREST (retrieval._execute)
+  - main.query        → regole di degradazione (es. niente LLM → mode="direct")
+
+cancel() può essere chiamato da un altro thread (es. Streamlit al reinvio
+del form): le attese in corso terminano subito con QueryCancelled.
+"""
+
+import contextvars
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+
+class DeadlineExceeded(TimeoutError):
+    """Budget di tempo della richiesta esaurito."""
+
+
+class QueryCancelled(DeadlineExceeded):
+    """Richiesta annullata dal chiamante."""
+
+
+class Deadline:
+    def __init__(self, seconds: float | None):
+        """seconds=None: nessun limite di tempo, ma annullabile con cancel()."""
+        self.seconds = seconds
+        self._expires_at = time.monotonic() + seconds if seconds is not None else float("inf")
+        self._cancelled = threading.Event()
+
+    def remaining(self) -> float:
+        """Secondi rimanenti (0 se scaduto o annullato)."""
+        if self._cancelled.is_set():
+            return 0.0
+        return max(0.0, self._expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def check(self, stage: str) -> None:
+        """Solleva QueryCancelled / DeadlineExceeded se il budget è finito prima di `stage`."""
+        if self._cancelled.is_set():
+            raise QueryCancelled(f"richiesta annullata prima di: {stage}")
+        if self.expired():
+            raise DeadlineExceeded(f"tempo esaurito ({self.seconds:.1f}s) prima di: {stage}")
+
+    def timeout(self, default: float | None = None) -> float:
+        """Timeout per una singola chiamata: tempo rimanente, limitato a `default` se indicato."""
+        left = self.remaining()
+        return min(left, default) if default is not None else left
+
+    def wait(self, seconds: float) -> bool:
+        """Attende fino a `seconds` (limitati al budget); False se annullato nel frattempo."""
+        return not self._cancelled.wait(min(seconds, self.remaining()))
+
+
+_CURRENT: contextvars.ContextVar[Deadline | None] = contextvars.ContextVar("deadline", default=None)
+
+
+def current() -> Deadline | None:
+    """Deadline attivo nel contesto corrente (None = nessun limite)."""
+    return _CURRENT.get()
+
+
+@contextmanager
+def active(deadline: Deadline | None) -> Iterator[Deadline | None]:
+    """Attiva `deadline` per la durata del blocco (None = nessun limite)."""
+    token = _CURRENT.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _CURRENT.reset(token)
+
+
+def call_timeout(default: float) -> float:
+    """Timeout HTTP per la prossima chiamata: min(default, tempo rimanente del deadline attivo)."""
+    d = current()
+    return d.timeout(default) if d is not None else default
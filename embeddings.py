@@ -3,9 +3,12 @@ Generate embedding for the user question.
 This vector enables semantic search in the vector database.
 """
 
-from openai import OpenAI
+import functools
 
 import config
+import resilience
+import singleflight
+from deadline import call_timeout
 
 
 def get_embedding(text: str) -> list[float]:
@@ -15,10 +18,62 @@ def get_embedding(text: str) -> list[float]:
     """
     if not text or not text.strip():
         raise ValueError("get_embedding requires non-empty text")
-    client = OpenAI(api_key=config.OPENAI_API_KEY)
-    response = client.embeddings.create(
-        model=config.EMBEDDING_MODEL,
-        input=text.strip(),
+    # Concurrent identical requests share one API call (singleflight.py).
+    return singleflight.do("get_embedding", text.strip(), lambda: _get_embedding(text.strip()))
+
+
+@functools.cache
+def _get_client():
+    """
+    Client OpenAI condiviso, creato al primo uso: il package openai costa ~0.5 s
+    di import e i lookup diretti (CODE_SPECIFIC) non lo usano mai.
+    """
+    from openai import OpenAI
+    return OpenAI(api_key=config.OPENAI_API_KEY, max_retries=0)  # retry in resilience.call
+
+
+def _get_embedding(text: str) -> list[float]:
+    client = _get_client()
+    response = resilience.call(
+        "openai_embeddings",
+        lambda: client.embeddings.create(
+            model=config.EMBEDDING_MODEL,
+            input=text,
+            timeout=call_timeout(config.OPENAI_TIMEOUT_SECONDS),
+        ),
+        hedge=True,
     )
     # Single input => single embedding.
     return response.data[0].embedding
+
+
+def get_embeddings(texts: list[str], batch_size: int = 100) -> list[list[float]]:
+    """
+    Return embeddings for many texts, one API request per batch of `batch_size`.
+    Output order matches input order. Raises like get_embedding().
+    """
+    vectors: list[list[float]] = []
+    for start in range(0, len(texts), batch_size):
+        vectors += embed_batch(texts[start:start + batch_size])[0]
+    return vectors
+
+
+def embed_batch(texts: list[str]) -> tuple[list[list[float]], int]:
+    """
+    Embed a batch of texts in a single API request.
+    Return (vectors in input order, total tokens billed for the request).
+    """
+    if not texts or any(not t or not t.strip() for t in texts):
+        raise ValueError("embed_batch requires non-empty texts")
+    client = _get_client()
+    response = resilience.call(
+        "openai_embeddings",
+        lambda: client.embeddings.create(
+            model=config.EMBEDDING_MODEL,
+            input=[t.strip() for t in texts],
+            timeout=call_timeout(config.OPENAI_TIMEOUT_SECONDS),
+        ),
+    )
+    vectors = [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+    usage = getattr(response, "usage", None)
+    return vectors, int(getattr(usage, "total_tokens", 0) or 0)
@@ -0,0 +1,145 @@
+"""
+CustomsAI – Indice gerarchico in memoria per i DB collaterali ad albero
+
+Costruisce l'albero della Nomenclatura Combinata (o di qualsiasi tabella con la
+stessa struttura) a partire dalle righe: code_field + indent + hier_pos.
+
+  - path(key)          → percorso radice → nodo         O(profondità)
+  - children(key)      → figli diretti                  O(figli)
+  - subtree_size(key)  → righe nel sottoalbero          O(1)
+  - resolve(code)      → nodo corrispondente al codice digitato dall'utente
+
+Nessun accesso al DB: il caricamento delle righe è compito di retrieval.py.
+"""
+
+from dataclasses import dataclass, field
+
+# Campi della tabella usati per ricostruire la gerarchia.
+HIERARCHY_INDENT_FIELD = "indent"     # None=voce, "-"=livello 1, "- -"=livello 2, ecc.
+HIERARCHY_ORDER_FIELD  = "hier_pos"   # posizione della riga nella gerarchia ufficiale
+
+# Lunghezza del codice NC completo (goods_code = "{10 cifre} {2 cifre}").
+_CODE_LENGTH = 10
+
+# Suffisso della riga "dichiarabile" quando lo stesso codice ha più righe
+# (le altre sono righe di raggruppamento, es. "8544420000 10").
+_DECLARABLE_SUFFIX = "80"
+
+
+@dataclass
+class _Node:
+    key:      str                      # valore raw di code_field (es. "8544000000 80")
+    row:      dict
+    depth:    int
+    parent:   "_Node | None" = None
+    children: list["_Node"] = field(default_factory=list)
+    size:     int = 1                  # righe nel sottoalbero, nodo incluso
+
+
+def _split_code(raw: str) -> tuple[str, str]:
+    """ "8544000000 80" → ("8544000000", "80") """
+    parts = str(raw).split()
+    return (parts[0] if parts else "", parts[1] if len(parts) > 1 else "")
+
+
+def _depth(numeric_code: str, indent: str | None) -> int:
+    """
+    Profondità del nodo nell'albero:
+      capitolo (es. 8500000000)  → 0
+      voce (indent None)         → 1
+      "-" / "- -" / …            → 1 + numero di trattini
+    """
+    level = indent.count("-") if indent else 0
+    is_chapter = len(numeric_code) == _CODE_LENGTH and not numeric_code[2:].strip("0")
+    return level + (0 if is_chapter else 1)
+
+
+class HierarchyIndex:
+    """
+    Albero costruito in un solo passaggio sulle righe in ordine gerarchico
+    (hier_pos, oppure code_field se hier_pos manca): il padre di ogni riga è
+    l'ultima riga precedente con profondità minore (stack).
+    """
+
+    def __init__(self, rows: list[dict], code_field: str):
+        self._nodes: dict[str, _Node] = {}
+        self._by_numeric: dict[str, list[_Node]] = {}
+        self.roots: list[_Node] = []
+
+        ordered = sorted(
+            rows,
+            key=lambda r: (
+                r.get(HIERARCHY_ORDER_FIELD) is None,
+                r.get(HIERARCHY_ORDER_FIELD) or 0,
+                str(r.get(code_field, "")),
+            ),
+        )
+
+        stack: list[_Node] = []
+        for r in ordered:
+            key = str(r.get(code_field, ""))
+            if not key or key in self._nodes:
+                continue
+            numeric, _ = _split_code(key)
+            node = _Node(key=key, row=r, depth=_depth(numeric, r.get(HIERARCHY_INDENT_FIELD)))
+
+            while stack and stack[-1].depth >= node.depth:
+                stack.pop()
+            if stack:
+                node.parent = stack[-1]
+                stack[-1].children.append(node)
+            else:
+                self.roots.append(node)
+            stack.append(node)
+
+            self._nodes[key] = node
+            self._by_numeric.setdefault(numeric, []).append(node)
+
+        # I figli seguono sempre il padre nell'ordine: un passaggio a ritroso
+        # accumula le dimensioni dei sottoalberi.
+        for node in reversed(list(self._nodes.values())):
+            if node.parent is not None:
+                node.parent.size += node.size
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def resolve(self, code: str) -> str | None:
+        """
+        Nodo corrispondente al codice digitato (4–10 cifre, completato con zeri).
+        Se lo stesso codice ha più righe si preferisce quella dichiarabile (suffisso 80).
+        Restituisce la chiave del nodo o None.
+        """
+        numeric, _ = _split_code(code or "")
+        if not numeric:
+            return None
+        candidates = self._by_numeric.get(numeric.ljust(_CODE_LENGTH, "0"))
+        if not candidates:
+            return None
+        for node in candidates:
+            if _split_code(node.key)[1] == _DECLARABLE_SUFFIX:
+                return node.key
+        return candidates[-1].key
+
+    def path(self, key: str) -> list[dict]:
+        """Righe dalla radice al nodo (incluso)."""
+        rows: list[dict] = []
+        node = self._nodes.get(key)
+        while node is not None:
+            rows.append(node.row)
+            node = node.parent
+        return rows[::-1]
+
+    def ancestors(self, key: str) -> list[dict]:
+        """Righe dalla radice al padre del nodo (escluso il nodo)."""
+        return self.path(key)[:-1]
+
+    def children(self, key: str) -> list[dict]:
+        """Figli diretti del nodo, in ordine gerarchico."""
+        node = self._nodes.get(key)
+        return [c.row for c in node.children] if node else []
+
+    def subtree_size(self, key: str) -> int:
+        """Numero di righe nel sottoalbero del nodo (nodo incluso); 0 se assente."""
+        node = self._nodes.get(key)
+        return node.size if node else 0
@@ -0,0 +1,174 @@
+"""
+CustomsAI – Indice lessicale BM25 in memoria su chunks.text
+
+Complementa la vector search per le domande in cui il match letterale è
+decisivo (numeri di articolo, estremi di regolamento, frasi citate):
+
+  - tokenize()   → tokenizzazione italiana deterministica (minuscolo, accenti
+                   rimossi, elisioni separate, stopword scartate; "2021/821" resta
+                   un solo token)
+  - BM25Index    → postings compatti in array NumPy (formato CSR: indptr,
+                   doc_ids, tfs), scoring BM25 vettorizzato
+  - confidence() → decide se il risultato lessicale basta da solo
+                   (nessun embedding necessario)
+
+Nessun accesso al DB: il caricamento dei chunk è compito di retrieval.py.
+"""
+
+import re
+import unicodedata
+from dataclasses import dataclass
+
+import numpy as np
+
+
+# ============================================================
+# Tokenizzazione
+# ============================================================
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[/.][a-z0-9]+)*")
+
+# Le elisioni ("dell'", "all'") arrivano qui già separate dall'apostrofo.
+# I token di una sola lettera (lettere di paragrafo "a", "b"…) sono scartati in tokenize().
+_STOPWORDS = frozenset("""
+ad al alla alle allo agli ai anche che chi ci come con cosa da dal dalla dalle
+dai dagli degli dei del della delle dello di ed gli ha hanno il in la le lo
+ma mi ne nei nel nella nelle nello non per piu quale quali quando questo questa
+questi queste se si sia sono su sul sulla sulle tra fra un una uno dell
+all nell sull dall quello quella essere cui loro suo sua suoi sue
+""".split())
+
+
+def _fold(text: str) -> str:
+    """Minuscolo + rimozione accenti (è → e, più → piu)."""
+    nfkd = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in nfkd if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Tokenizza testo italiano normativo.
+    "dell'articolo 22 del regolamento (UE) 2021/821" →
+        ["articolo", "22", "regolamento", "ue", "2021/821"]
+    """
+    folded = _fold(text or "").replace("'", " ").replace("’", " ")
+    return [
+        t.strip(".")
+        for t in _TOKEN_RE.findall(folded)
+        if t.strip(".") and t not in _STOPWORDS and (len(t) > 1 or t.isdigit())
+    ]
+
+
+def anchor_terms(query: str) -> list[str]:
+    """
+    Termini "ancora" della query: token con cifre (articoli, regolamenti, codici)
+    e token delle frasi tra virgolette. Sono quelli per cui il match letterale è decisivo.
+    """
+    quoted = " ".join(re.findall(r"[\"“«]([^\"”»]+)[\"”»]", query or ""))
+    anchors = [t for t in tokenize(query) if any(ch.isdigit() for ch in t)]
+    anchors += tokenize(quoted)
+    return list(dict.fromkeys(anchors))
+
+
+# ============================================================
+# Indice BM25
+# ============================================================
+
+@dataclass
+class LexicalHit:
+    doc:      int      # indice del documento nell'indice
+    score:    float    # punteggio BM25
+    coverage: float    # quota (pesata per idf) dei termini della query presenti nel doc
+    anchors:  bool     # True se il doc contiene tutti i termini ancora
+
+
+class BM25Index:
+    """
+    Indice invertito BM25 (k1, b standard) con postings in formato CSR:
+    i documenti del termine t sono doc_ids[indptr[t]:indptr[t+1]], con le
+    frequenze corrispondenti in tfs.
+    """
+
+    def __init__(self, texts: list[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b  = b
+        self.n_docs = len(texts)
+
+        postings: dict[str, dict[int, int]] = {}
+        lengths = np.zeros(self.n_docs, dtype=np.float32)
+        for doc, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[doc] = len(tokens)
+            for t in tokens:
+                postings.setdefault(t, {})
+                postings[t][doc] = postings[t].get(doc, 0) + 1
+
+        self.vocab: dict[str, int] = {t: i for i, t in enumerate(sorted(postings))}
+        counts = np.array([len(postings[t]) for t in self.vocab], dtype=np.int64)
+        self.indptr  = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.doc_ids = np.empty(int(self.indptr[-1]), dtype=np.int32)
+        self.tfs     = np.empty(int(self.indptr[-1]), dtype=np.float32)
+        for t, i in self.vocab.items():
+            start = self.indptr[i]
+            docs = sorted(postings[t].items())
+            self.doc_ids[start:start + len(docs)] = [d for d, _ in docs]
+            self.tfs[start:start + len(docs)]     = [f for _, f in docs]
+
+        self.idf = np.log(1 + (self.n_docs - counts + 0.5) / (counts + 0.5)).astype(np.float32)
+        avg = float(lengths.mean()) if self.n_docs else 0.0
+        self._norm = (k1 * (1 - b + b * lengths / avg)).astype(np.float32) if avg else lengths
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    def _postings(self, term_id: int) -> tuple[np.ndarray, np.ndarray]:
+        lo, hi = self.indptr[term_id], self.indptr[term_id + 1]
+        return self.doc_ids[lo:hi], self.tfs[lo:hi]
+
+    def search(self, query: str, top_k: int) -> list[LexicalHit]:
+        """Top-k documenti per punteggio BM25 (solo documenti con punteggio > 0)."""
+        terms = [self.vocab[t] for t in dict.fromkeys(tokenize(query)) if t in self.vocab]
+        if not terms or not self.n_docs:
+            return []
+
+        scores  = np.zeros(self.n_docs, dtype=np.float32)
+        matched = np.zeros(self.n_docs, dtype=np.float32)   # idf dei termini presenti
+        for t in terms:
+            docs, tf = self._postings(t)
+            scores[docs]  += self.idf[t] * tf * (self.k1 + 1) / (tf + self._norm[docs])
+            matched[docs] += self.idf[t]
+
+        # Copertura sui soli termini noti: le parole colloquiali assenti dal corpus
+        # ("prevede", "dimmi") non penalizzano; le ancore assenti sono gestite a parte.
+        total_idf = float(self.idf[terms].sum())
+
+        anchor_ids = [self.vocab.get(t) for t in anchor_terms(query)]
+        k = min(top_k, int((scores > 0).sum()))
+        top = np.argpartition(-scores, k - 1)[:k] if k else np.array([], dtype=np.int64)
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        return [
+            LexicalHit(
+                doc=int(d),
+                score=float(scores[d]),
+                coverage=float(matched[d] / total_idf) if total_idf else 0.0,
+                anchors=bool(anchor_ids) and all(
+                    a is not None and int(d) in self._postings(a)[0] for a in anchor_ids
+                ),
+            )
+            for d in top
+        ]
+
+
+def confidence(hits: list[LexicalHit], min_coverage: float, min_margin: float) -> bool:
+    """
+    True se il risultato lessicale è decisivo da solo:
+      - la query ha termini ancora e il primo documento li contiene tutti
+      - il primo documento copre almeno min_coverage dei termini (pesati per idf)
+      - il primo punteggio supera il secondo di almeno il fattore min_margin
+    """
+    if not hits or not hits[0].anchors or hits[0].coverage < min_coverage:
+        return False
+    if len(hits) > 1 and hits[0].score < min_margin * hits[1].score:
+        return False
+    return True
@@ -3,12 +3,21 @@ Call the LLM with the retrieved context to produce a cited answer.
 Handles API errors and enforces max context length to avoid token overflow.
 """
 
-from openai import OpenAI, APIError, APIConnectionError
+import functools
 
 import config
+import resilience
+from deadline import call_timeout
 import prompt as prompt_module
 
 
+@functools.cache
+def _get_client():
+    """Client OpenAI condiviso, creato (e importato) alla prima risposta generata."""
+    from openai import OpenAI
+    return OpenAI(api_key=config.OPENAI_API_KEY, max_retries=0)  # retry in resilience.call
+
+
 def generate_answer(
     question: str,
     context: str,
@@ -31,10 +40,15 @@ def generate_answer(
         used_structured_by_code=used_structured_by_code,
         analytical=analytical,
     )
-    client = OpenAI(api_key=config.OPENAI_API_KEY)
-    response = client.chat.completions.create(
-        model=config.LLM_MODEL,
-        messages=messages,
-        temperature=0.0,
+    client = _get_client()
+    # Nessun side effect lato server: retry sicuri. Niente hedging (costo doppio dei token).
+    response = resilience.call(
+        "openai_llm",
+        lambda: client.chat.completions.create(
+            model=config.LLM_MODEL,
+            messages=messages,
+            temperature=0.0,
+            timeout=call_timeout(config.OPENAI_TIMEOUT_SECONDS),
+        ),
     )
     return (response.choices[0].message.content or "").strip()
@@ -3,26 +3,29 @@ CustomsAI v3 – Pipeline registry-first
 
 Flusso:
   detect_intent (keyword) + detect_code_from_registry (pattern)
+    → REVERSE_CORR.  : grafo inverso (es. DU→NC) → testo diretto, nessun LLM
     → CODE_SPECIFIC  : lookup collaterale → testo diretto, nessun LLM
     → PROCEDURAL+code: lookup collaterale + vector_search → LLM interpretativo
     → CLASSIFICATION : vector_search (ANNEX_CODE) → LLM interpretativo
-    → GENERIC        : vector_search globale → LLM interpretativo
+    → GENERIC        : vector_search globale (+ BM25 locale se HYBRID_ENABLED) → LLM interpretativo
 
 Le fonti normative sono sempre stampate da Python, mai dall'LLM.
 """
 
 import sys
-from typing import TypedDict
-
-from openai import APIError, APIConnectionError
+from typing import NotRequired, TypedDict
 
 import config
+import deadline as deadline_mod
 import embeddings
 import retrieval
 import prompt as prompt_module
 import llm
 from query_normalizer import normalize_query
-from registry import detect_code_from_registry
+from deadline import Deadline, DeadlineExceeded, QueryCancelled
+from resilience import CircuitOpenError
+from traversal import traverse_links
+from registry import detect_code_from_registry, entries_linking_to, get_entry
 
 
 # ---------------------------------------------------------------------------
@@ -38,6 +41,7 @@ class QueryResult(TypedDict):
     answer:  str | None   # risposta LLM (solo mode="llm")
     sources: list[dict]   # [{"label": str|None, "celex": str, "url": str}]
     log:     list[str]    # messaggi di routing/debug in ordine
+    note:    NotRequired[str]  # solo se degradato (es. LLM saltato per deadline)
 
 
 # ---------------------------------------------------------------------------
@@ -302,35 +306,6 @@ def _format_eurlex_text(text: str) -> str:
 # Correlation graph helpers (Fase 3 – deterministico, nessun LLM)
 # ---------------------------------------------------------------------------
 
-def _extract_linked_codes(
-    registry_matches: list[tuple[dict, str]],
-    collateral_results: list[dict],
-) -> list[str]:
-    """
-    Estrae i codici "linked" dai risultati collaterali delle entry che hanno 'links_to'.
-    Legge 'links_to' dal registry (nessun hardcoding di ID).
-
-    Esempio: dual_use_correlations ha links_to="dual_use" → i text_value dei suoi
-    risultati sono codici DU (es. "3E001") da usare per la Opzione A della Fase 3.
-    """
-    linking_ids = {
-        entry["id"]
-        for entry, _ in registry_matches
-        if entry.get("links_to")
-    }
-
-    codes: list[str] = []
-    seen: set[str] = set()
-    for chunk in collateral_results:
-        source_id = chunk.get("metadata", {}).get("source_id")
-        if source_id in linking_ids:
-            text_value = chunk.get("metadata", {}).get("text_value", "").strip()
-            if text_value and text_value not in seen:
-                seen.add(text_value)
-                codes.append(text_value)
-    return codes
-
-
 def _build_correlation_preamble(
     registry_matches: list[tuple[dict, str]],
     collateral_results: list[dict],
@@ -378,15 +353,60 @@ def _display_direct_text(chunks: list[dict]) -> None:
 # Query – pura computazione, nessun print
 # ---------------------------------------------------------------------------
 
-def query(question: str) -> QueryResult:
+def query(question: str, deadline: Deadline | float | None = None) -> QueryResult:
     """
     Esegue la pipeline di retrieval e restituisce un QueryResult strutturato.
     Nessun print: i messaggi di routing vanno in result["log"].
 
+    deadline: budget di tempo in secondi (o un Deadline, annullabile da un altro
+    thread con cancel()). Ogni richiesta HTTP (OpenAI e Supabase) riceve un timeout
+    pari al tempo rimanente, limitato a OPENAI_TIMEOUT_SECONDS / SUPABASE_TIMEOUT_SECONDS;
+    la cancellazione interrompe l'attesa ma non la richiesta già in volo. Se non
+    resta tempo per l'LLM ma c'è testo recuperato, il risultato degrada a
+    mode="direct" con result["note"].
+
     Raises:
         ValueError: se la domanda è vuota.
-        APIError, APIConnectionError: errori OpenAI (embedding o LLM).
+        APIError, APIConnectionError: errori OpenAI (embedding o LLM) dopo i retry.
+        CircuitOpenError: dipendenza esterna temporaneamente esclusa dal circuit breaker.
+        DeadlineExceeded: budget esaurito prima di avere testo da restituire.
+        QueryCancelled: richiesta annullata dal chiamante.
+    """
+    d = Deadline(deadline) if isinstance(deadline, (int, float)) else deadline
+    with deadline_mod.active(d):
+        return _query(question)
+
+
+def _generate_answer(q: str, context: str, log: list[str], **kwargs) -> tuple[str | None, str | None]:
     """
+    Stadio LLM con regole di degradazione: restituisce (answer, None) oppure
+    (None, nota) se il budget residuo non basta o scade durante la chiamata.
+    """
+    d = deadline_mod.current()
+    if d is not None and d.cancelled:
+        raise QueryCancelled("richiesta annullata prima dell'interpretazione")
+    if d is not None and d.remaining() < config.LLM_MIN_SECONDS:
+        note = f"Tempo insufficiente per l'interpretazione ({d.remaining():.1f}s rimanenti)"
+    else:
+        try:
+            return llm.generate_answer(q, context, **kwargs) + prompt_module.DISCLAIMER, None
+        except QueryCancelled:
+            raise
+        except DeadlineExceeded:
+            note = "Tempo esaurito durante l'interpretazione"
+    note += ": testo normativo recuperato senza risposta interpretativa."
+    log.append(f"[deadline] {note}")
+    return None, note
+
+
+def _with_note(result: QueryResult, note: str | None) -> QueryResult:
+    if note:
+        result["note"] = note
+    return result
+
+
+def _query(question: str) -> QueryResult:
+    """Pipeline di query() con il deadline già attivo nel contesto."""
     q = (question or "").strip()
     if not q:
         raise ValueError("Domanda vuota.")
@@ -398,12 +418,24 @@ def query(question: str) -> QueryResult:
     registry_matches = detect_code_from_registry(q)   # list[tuple[dict, str]]
 
     # ── 2. Intent finale ───────────────────────────────────────────────────
-    if registry_matches:
+    # REVERSE_CORRELATION solo se un codice trovato ha un indice inverso
+    # (entry con correlation_index che punta alla sua entry); altrimenti vale
+    # l'intent delle keyword.
+    reversible = any(
+        linking.get("correlation_index")
+        for entry, _ in registry_matches
+        for linking in entries_linking_to(entry["id"])
+    )
+    if reversible and retrieval.asks_reverse_correlation(q):
+        intent = retrieval.Intent.REVERSE_CORRELATION
+    elif registry_matches:
         intent = (
-            base_intent
+            retrieval.Intent.PROCEDURAL
             if base_intent == retrieval.Intent.PROCEDURAL
             else retrieval.Intent.CODE_SPECIFIC
         )
+    elif base_intent == retrieval.Intent.REVERSE_CORRELATION:
+        intent = retrieval.Intent.GENERIC  # nessun codice da invertire
     else:
         intent = base_intent
 
@@ -413,6 +445,35 @@ def query(question: str) -> QueryResult:
         f"db={','.join(e['id'] for e,_ in registry_matches) if registry_matches else '-'}"
     )
 
+    # ── 3a. REVERSE_CORRELATION: grafo inverso (es. DU→NC), nessun LLM ────
+    if intent == retrieval.Intent.REVERSE_CORRELATION:
+        chunks = []
+        active_entries = []
+        for entry, code in registry_matches:
+            for linking in entries_linking_to(entry["id"]):
+                if not linking.get("correlation_index"):
+                    continue
+                results = retrieval.reverse_lookup(linking, code)
+                if results:
+                    chunks += results
+                    if linking not in active_entries:
+                        active_entries.append(linking)
+
+        if not chunks:
+            log.append("[routing] nessuna correlazione inversa → lookup collaterale")
+            intent = retrieval.Intent.CODE_SPECIFIC  # ricade nel ramo collaterale
+        else:
+            return QueryResult(
+                mode="direct",
+                intent=intent.value,
+                codes=[c for _, c in registry_matches],
+                dbs=[e["id"] for e in active_entries],
+                chunks=chunks,
+                answer=None,
+                sources=_build_sources(chunks, active_entries),
+                log=log,
+            )
+
     # ── 3. CODE_SPECIFIC: lookup collaterale, nessun embedding, nessun LLM ─
     if intent == retrieval.Intent.CODE_SPECIFIC:
         chunks: list[dict] = []
@@ -439,9 +500,46 @@ def query(question: str) -> QueryResult:
             )
 
     # ── 4. Embedding (necessario per tutti i rami rimanenti) ───────────────
+    # GENERIC con HYBRID_ENABLED: prima BM25 locale; se il match letterale è
+    # decisivo (es. numero di articolo) embedding e vector search sono saltati.
     normalized_query = normalize_query(q, intent)
-    log.append(f"[normalization] embedding query: {normalized_query}")
-    query_embedding = embeddings.get_embedding(normalized_query)  # può raise
+    lexical_chunks: list[dict] = []
+    lexical_confident = False
+    if config.HYBRID_ENABLED and intent == retrieval.Intent.GENERIC:
+        lexical_chunks, lexical_confident = retrieval.lexical_search(normalized_query)
+
+    if lexical_confident:
+        log.append("[routing] lexical: match decisivo → embedding saltato")
+        query_embedding = None
+    else:
+        log.append(f"[normalization] embedding query: {normalized_query}")
+        query_embedding = embeddings.get_embedding(normalized_query)  # può raise
+
+    # ── 4b. Cache semantica: domanda quasi identica già risposta ───────────
+    codes = [c for _, c in registry_matches]
+    if config.SEMANTIC_CACHE_ENABLED and query_embedding is not None:
+        import semantic_cache       # NumPy: caricato solo se la cache è abilitata
+        cached = semantic_cache.get_cache().lookup(query_embedding, intent.value, codes)
+        if cached is not None:
+            entry = cached.entry
+            if cached.reuse_answer:
+                answer, note = entry.answer, None
+            else:
+                answer, note = _generate_answer(q, entry.context, log, analytical=entry.analytical)
+            log.append(
+                f"[cache] semantic hit sim={cached.similarity:.3f} "
+                f"({'risposta' if cached.reuse_answer else 'retrieval'} riusato da: {entry.query})"
+            )
+            return _with_note(QueryResult(
+                mode="llm" if answer else "direct",
+                intent=intent.value,
+                codes=codes,
+                dbs=entry.dbs,
+                chunks=entry.chunks,
+                answer=answer,
+                sources=entry.sources,
+                log=log,
+            ), note)
 
     # ── 5. PROCEDURAL + codice: collaterale + annex (A) + vector (B) → LLM ─
     if intent == retrieval.Intent.PROCEDURAL and registry_matches:
@@ -453,8 +551,22 @@ def query(question: str) -> QueryResult:
                 collateral += results
                 active_entries.append(entry)
 
+        # Traversal links_to (BFS, una query per tabella per hop): righe delle
+        # entry collegate (es. dual_use_correlations → dual_use) + codici linked
+        traversal    = traverse_links(collateral)
+        linked_codes = traversal.codes
+        for entry_id in traversal.entry_ids:
+            linked_entry = get_entry(entry_id)
+            if linked_entry not in active_entries:
+                active_entries.append(linked_entry)
+        if traversal.hops:
+            log.append(
+                f"[routing] traversal links_to: hops={traversal.hops} "
+                f"queries={traversal.queries} righe={len(traversal.chunks)}"
+                + (" (troncata)" if traversal.truncated else "")
+            )
+
         # Opzione A: definizioni annex per i codici DU collegati (links_to)
-        linked_codes = _extract_linked_codes(registry_matches, collateral)
         annex_chunks = retrieval.get_annex_chunks_by_codes(linked_codes) if linked_codes else []
         if linked_codes:
             log.append(f"[routing] analytical mode: linked_codes={linked_codes}")
@@ -462,21 +574,35 @@ def query(question: str) -> QueryResult:
         # Opzione B: vector search
         # In analytical mode usa una query focalizzata sui DU codes trovati,
         # senza il codice NC che sposta l'embedding verso la nomenclatura.
-        if linked_codes:
-            du_query = f"obblighi autorizzazione esportazione {' '.join(linked_codes[:3])}"
-            log.append(f"[routing] analytical vector query: {du_query}")
-            analytical_embedding = embeddings.get_embedding(du_query)
-            vec_chunks = retrieval.vector_search(analytical_embedding)
-        else:
-            vec_chunks = retrieval.vector_search(query_embedding)
-
-        combined = collateral + annex_chunks + vec_chunks
+        # Embedding dallo store precalcolato se disponibile, altrimenti live.
+        # A deadline scaduto si prosegue con il solo testo deterministico.
+        try:
+            if linked_codes:
+                import analytical_embeddings    # NumPy: solo in analytical mode
+                du_query = analytical_embeddings.analytical_query(linked_codes)
+                log.append(f"[routing] analytical vector query: {du_query}")
+                stored = analytical_embeddings.lookup(linked_codes)
+                if stored is not None:
+                    analytical_embedding, how = stored
+                    log.append(f"[routing] analytical embedding precalcolato ({how})")
+                else:
+                    analytical_embedding = embeddings.get_embedding(du_query)
+                vec_chunks = retrieval.vector_search(analytical_embedding)
+            else:
+                vec_chunks = retrieval.vector_search(query_embedding)
+        except QueryCancelled:
+            raise
+        except DeadlineExceeded as e:
+            log.append(f"[deadline] vector search saltata: {e}")
+            vec_chunks = []
+
+        combined = collateral + traversal.chunks + annex_chunks + vec_chunks
 
         if not combined:
             return QueryResult(
                 mode="empty",
                 intent=intent.value,
-                codes=[c for _, c in registry_matches],
+                codes=codes,
                 dbs=[],
                 chunks=[],
                 answer=None,
@@ -486,35 +612,44 @@ def query(question: str) -> QueryResult:
 
         preamble = _build_correlation_preamble(registry_matches, collateral)
         context  = prompt_module.format_context(combined, preamble=preamble)
-        answer   = llm.generate_answer(q, context, analytical=bool(linked_codes))
-        answer  += prompt_module.DISCLAIMER
-        return QueryResult(
-            mode="llm",
+        answer, note = _generate_answer(q, context, log, analytical=bool(linked_codes))
+        result = _with_note(QueryResult(
+            mode="llm" if answer else "direct",
             intent=intent.value,
-            codes=[c for _, c in registry_matches],
+            codes=codes,
             dbs=[e["id"] for e in active_entries],
             chunks=combined,
             answer=answer,
             sources=_build_sources(combined, active_entries),
             log=log,
-        )
+        ), note)
+        if answer:
+            _cache_answer(query_embedding, normalized_query, result, context, bool(linked_codes))
+        return result
 
-    # ── 6. CLASSIFICATION / GENERIC: solo vector search → LLM ─────────────
+    # ── 6. CLASSIFICATION / GENERIC: vector search (+ BM25 se hybrid) → LLM ─
     type_filters = (
         ["ANNEX_CODE"] if intent == retrieval.Intent.CLASSIFICATION else None
     )
 
-    chunks = retrieval.vector_search(query_embedding, type_filters=type_filters)
+    if lexical_confident:
+        chunks = lexical_chunks
+    else:
+        chunks = retrieval.vector_search(query_embedding, type_filters=type_filters)
+
+        if not chunks and type_filters:
+            log.append(f"[routing] nessun risultato con filtri={type_filters} → fallback global")
+            chunks = retrieval.vector_search(query_embedding)
 
-    if not chunks and type_filters:
-        log.append(f"[routing] nessun risultato con filtri={type_filters} → fallback global")
-        chunks = retrieval.vector_search(query_embedding)
+        if lexical_chunks:
+            log.append(f"[routing] hybrid: fusione RRF lessicale ({len(lexical_chunks)}) + vettoriale ({len(chunks)})")
+            chunks = retrieval.fuse_rankings(lexical_chunks, chunks)
 
     if not chunks:
         return QueryResult(
             mode="empty",
             intent=intent.value,
-            codes=[c for _, c in registry_matches],
+            codes=codes,
             dbs=[],
             chunks=[],
             answer=None,
@@ -523,24 +658,59 @@ def query(question: str) -> QueryResult:
         )
 
     context = prompt_module.format_context(chunks)
-    answer  = llm.generate_answer(q, context, used_structured_by_code=False)
-    answer += prompt_module.DISCLAIMER
-    return QueryResult(
-        mode="llm",
+    answer, note = _generate_answer(q, context, log, used_structured_by_code=False)
+    result = _with_note(QueryResult(
+        mode="llm" if answer else "direct",
         intent=intent.value,
-        codes=[c for _, c in registry_matches],
+        codes=codes,
         dbs=[],
         chunks=chunks,
         answer=answer,
         sources=_build_sources(chunks, []),
         log=log,
-    )
+    ), note)
+    if answer:
+        _cache_answer(query_embedding, normalized_query, result, context, False)
+    return result
+
+
+def _cache_answer(
+    query_embedding: list[float] | None,
+    normalized_query: str,
+    result: QueryResult,
+    context: str,
+    analytical: bool,
+) -> None:
+    """Memorizza una risposta LLM nella cache semantica (se abilitata e c'è un embedding)."""
+    if not config.SEMANTIC_CACHE_ENABLED or query_embedding is None:
+        return
+    import semantic_cache
+    semantic_cache.get_cache().store(query_embedding, semantic_cache.CachedAnswer(
+        query=normalized_query,
+        intent=result["intent"],
+        codes=tuple(result["codes"]),
+        chunks=result["chunks"],
+        dbs=result["dbs"],
+        sources=result["sources"],
+        context=context,
+        analytical=analytical,
+        answer=result["answer"],
+    ))
 
 
 # ---------------------------------------------------------------------------
 # Run – wrapper CLI (output identico all'attuale)
 # ---------------------------------------------------------------------------
 
+def _openai_errors() -> tuple[type[Exception], ...]:
+    """
+    Errori OpenAI da riportare come messaggio. openai è importato solo al primo
+    embedding o LLM: se non è in sys.modules nessuna chiamata può averli sollevati.
+    """
+    openai = sys.modules.get("openai")
+    return (openai.APIError, openai.APIConnectionError) if openai else ()
+
+
 def run(question: str) -> None:
     q = (question or "").strip()
     if not q:
@@ -548,8 +718,8 @@ def run(question: str) -> None:
         sys.exit(1)
 
     try:
-        result = query(q)
-    except (APIError, APIConnectionError, ValueError) as e:
+        result = query(q, deadline=config.QUERY_DEADLINE_SECONDS or None)
+    except (*_openai_errors(), CircuitOpenError, DeadlineExceeded, ValueError) as e:
         print("Errore:", e)
         sys.exit(1)
 
@@ -560,6 +730,8 @@ def run(question: str) -> None:
         print("Nessun risultato trovato.")
         sys.exit(0)
     elif result["mode"] == "direct":
+        if result.get("note"):
+            print(f"\nNota: {result['note']}")
         _display_direct_text(result["chunks"])
     else:
         print("\n=== RISPOSTA ===\n")
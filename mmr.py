@@ -0,0 +1,82 @@
+"""
+CustomsAI – Selezione per diversità (Maximal Marginal Relevance)
+
+Dopo una vector search con over-fetch, sceglie k chunk che bilanciano
+rilevanza rispetto alla query e diversità tra loro, scartando i paragrafi
+quasi identici (es. stesso testo in consolidazioni successive).
+
+  score(d) = λ · sim(d, query) − (1 − λ) · max_{s ∈ selezionati} sim(d, s)
+
+Tutto vettorizzato in NumPy: una matrice di similarità n×n calcolata una
+volta, poi k passaggi O(n). Nessuna chiamata esterna.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class MMRStats:
+    candidates:        int    # chunk ricevuti dall'over-fetch
+    selected:          int    # chunk selezionati
+    replaced:          int    # chunk del top-k per similarità sostituiti dalla selezione MMR
+    redundancy_before: float  # max similarità media tra coppie nel top-k per similarità
+    redundancy_after:  float  # idem nella selezione MMR
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=-1, keepdims=True)
+    return m / np.where(norms == 0, 1.0, norms)
+
+
+def _redundancy(sim: np.ndarray, idx: list[int]) -> float:
+    """Media, sui chunk in idx, della similarità massima con un altro chunk di idx."""
+    if len(idx) < 2:
+        return 0.0
+    sub = sim[np.ix_(idx, idx)].copy()
+    np.fill_diagonal(sub, -np.inf)
+    return float(sub.max(axis=1).mean())
+
+
+def mmr_select(
+    query_embedding: list[float],
+    candidate_embeddings: list[list[float]],
+    k: int,
+    lambda_mult: float = 0.7,
+) -> tuple[list[int], MMRStats]:
+    """
+    Restituisce (indici selezionati in ordine di selezione, statistiche).
+    lambda_mult = 1.0 → solo rilevanza (equivale al top-k); 0.0 → solo diversità.
+    """
+    n = len(candidate_embeddings)
+    if n == 0 or k <= 0:
+        return [], MMRStats(n, 0, 0, 0.0, 0.0)
+
+    docs  = _normalize(np.asarray(candidate_embeddings, dtype=np.float32))
+    query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+
+    relevance = docs @ query
+    sim = docs @ docs.T
+
+    selected: list[int] = []
+    max_sim = np.zeros(n, dtype=np.float32)   # penalità di ridondanza per candidato
+    available = np.ones(n, dtype=bool)
+
+    for _ in range(min(k, n)):
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * max_sim
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        max_sim = np.maximum(max_sim, sim[best])
+
+    top_k = list(np.argsort(-relevance, kind="stable")[: len(selected)])
+    stats = MMRStats(
+        candidates=n,
+        selected=len(selected),
+        replaced=len(set(top_k) - set(selected)),
+        redundancy_before=_redundancy(sim, top_k),
+        redundancy_after=_redundancy(sim, selected),
+    )
+    return selected, stats
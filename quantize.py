@@ -0,0 +1,88 @@
+"""
+CustomsAI – Storage quantizzato degli embedding per cache e indici locali
+
+Un embedding text-embedding-3-small (1536 dim) occupa 6 KB in float32.
+QuantizedMatrix conserva le righe in:
+
+  - "float32" → nessuna compressione (riferimento)
+  - "float16" → metà memoria, errore ~1e-3 sul prodotto scalare
+  - "int8"    → un quarto della memoria: ogni riga è scalata sul proprio
+                massimo assoluto (scale = max|x| / 127) e arrotondata a int8
+
+dot() calcola query · riga senza ricostruire la matrice float32: i codici
+sono moltiplicati a blocchi di _BLOCK_ROWS righe e la scala per riga è
+applicata al vettore risultato, quindi la memoria temporanea resta limitata.
+"""
+
+import numpy as np
+
+
+STORAGE_DTYPES = ("float32", "float16", "int8")
+
+# Righe convertite per blocco in dot(): limita la copia temporanea a ~_BLOCK_ROWS × dim float32.
+_BLOCK_ROWS = 4096
+
+
+class QuantizedMatrix:
+    """Matrice di embedding (n_rows × dim) a righe quantizzate, aggiornabile riga per riga."""
+
+    def __init__(self, n_rows: int, dim: int, dtype: str = "int8"):
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"dtype non supportato: {dtype!r} (ammessi: {', '.join(STORAGE_DTYPES)})")
+        self.dtype  = dtype
+        self.codes  = np.zeros((n_rows, dim), dtype=np.dtype(dtype))
+        self.scales = np.ones(n_rows, dtype=np.float32) if dtype == "int8" else None
+
+    @classmethod
+    def from_array(cls, matrix, dtype: str = "int8") -> "QuantizedMatrix":
+        m = np.asarray(matrix, dtype=np.float32)
+        q = cls(m.shape[0], m.shape[1], dtype)
+        q._assign(slice(None), m)
+        return q
+
+    def __len__(self) -> int:
+        return self.codes.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def _assign(self, rows, values: np.ndarray) -> None:
+        if self.dtype != "int8":
+            self.codes[rows] = values
+            return
+        max_abs = np.abs(values).max(axis=-1)
+        scales  = np.where(max_abs == 0, 1.0, max_abs / 127.0).astype(np.float32)
+        self.codes[rows]  = np.rint(values / np.expand_dims(scales, -1)).astype(np.int8)
+        self.scales[rows] = scales
+
+    def __setitem__(self, row: int, vector) -> None:
+        self._assign(row, np.asarray(vector, dtype=np.float32))
+
+    def dot(self, query, n_rows: int | None = None) -> np.ndarray:
+        """Prodotti scalari query · riga per le prime n_rows righe (default: tutte), in float32."""
+        q = np.asarray(query, dtype=np.float32)
+        n = len(self) if n_rows is None else n_rows
+        out = np.empty(n, dtype=np.float32)
+        for start in range(0, n, _BLOCK_ROWS):
+            stop = min(start + _BLOCK_ROWS, n)
+            out[start:stop] = self.codes[start:stop].astype(np.float32, copy=False) @ q
+        if self.scales is not None:
+            out *= self.scales[:n]
+        return out
+
+    def dequantize(self) -> np.ndarray:
+        """Matrice float32 ricostruita (per test e benchmark)."""
+        m = self.codes.astype(np.float32)
+        return m * self.scales[:, None] if self.scales is not None else m
+
+
+def recall_at_k(exact_scores: np.ndarray, approx_scores: np.ndarray, k: int) -> float:
+    """
+    Quota dei top-k esatti (float32) ritrovati nei top-k approssimati.
+    Accetta una riga per query: shape (n_queries, n_docs).
+    """
+    exact  = np.argsort(-exact_scores, axis=1)[:, :k]
+    approx = np.argsort(-approx_scores, axis=1)[:, :k]
+    found = [len(set(e) & set(a)) for e, a in zip(exact, approx)]
+    return float(np.mean(found)) / k if found else 1.0
@@ -20,6 +20,21 @@ Struttura di ogni entry:
     source      – configurazione fonte:
                     {"type": "celex_field"}               → CELEX letto dalla riga
                     {"type": "static_celex", "celex": …}  → CELEX fisso
+    hierarchy_index – (opzionale) True → lookup_collateral restituisce percorso dalla
+                  radice + figli diretti da un indice in memoria (hierarchy.py).
+                  Richiede i campi "indent" e "hier_pos" nella tabella.
+    correlation_index – (opzionale, con links_to) True → lookup serviti da un grafo
+                  in memoria (correlation_graph.py) con mappa diretta e inversa;
+                  abilita le domande inverse ("quali codici NC sono soggetti a 3E001").
+    fetch       – (opzionale) piano di fetch per lookup_collateral:
+                    {"columns": [...], "order_by": str | None, "limit": int | None}
+                  Ogni chiave omessa viene derivata da get_fetch_plan(): colonne
+                  effettivamente usate, ordinamento su code_field per "prefix",
+                  limit = TOP_K.
+    key_field   – (opzionale) colonna univoca (default "id", la primary key delle
+                  tabelle Supabase): secondo criterio della keyset pagination di
+                  retrieval.iter_collateral / iter_table_rows, perché code_field può
+                  avere duplicati.
 """
 
 import re
@@ -49,6 +64,9 @@ REGISTRY: list[dict] = [
         # gerarchica (basata sul campo "indent": null=voce, "-"=livello 1, "- -"=livello 2, ecc.)
         # Il valore del campo ha formato "{10 cifre} {2 cifre}" → viene estratta solo la parte numerica.
         "display_code_field": "goods_code",
+        # hierarchy_index: lookup tramite albero in memoria (goods_code + indent + hier_pos)
+        # → percorso dalla radice al codice + figli diretti, invece del prefix scan troncato
+        "hierarchy_index": True,
         "source": {
             "type": "static_celex",
             "celex": "31987R2658",
@@ -70,6 +88,13 @@ REGISTRY: list[dict] = [
         # links_to: i valori di text_field (dual_use_codification) sono codici
         # dell'entry "dual_use" → usato per costruire il grafo di correlazioni NC→DU
         "links_to": "dual_use",
+        # correlation_index: lookup serviti dal grafo NC→DU / DU→NC in memoria
+        "correlation_index": True,
+        # fetch: la tabella non ha la colonna "indent" → piano dichiarato esplicitamente
+        # (quello derivato includerebbe "indent" per via di display_code_field)
+        "fetch": {
+            "columns": ["cn_codes_2026", "dual_use_codification"],
+        },
         "source": {
             "type": "static_celex",
             "celex": "32021R0821",
@@ -103,3 +128,50 @@ def detect_code_from_registry(query: str) -> list[tuple[dict, str]]:
             code = match.group(0).upper()
             matches.append((entry, code))
     return matches
+
+
+def get_fetch_plan(entry: dict) -> dict:
+    """
+    Restituisce il piano di fetch dell'entry: {"columns", "order_by", "limit"}.
+
+    Le chiavi dichiarate in entry["fetch"] hanno precedenza; quelle mancanti
+    sono derivate dai campi dell'entry, in modo che lookup_collateral() legga
+    solo le colonne che usa davvero (niente select("*") su tabelle larghe):
+      - code_field, text_field                → sempre
+      - display_code_field + "indent"         → se display_code_field presente
+      - celex_consolidated                    → se source.type == "celex_field"
+    order_by è code_field per match_mode "prefix" (gerarchia ordinata), None
+    per "exact". limit None significa "usa TOP_K".
+    """
+    declared = entry.get("fetch", {})
+
+    columns = [entry["code_field"], entry["text_field"]]
+    display_code_field = entry.get("display_code_field")
+    if display_code_field:
+        columns += [display_code_field, "indent"]
+    if entry.get("source", {}).get("type") == "celex_field":
+        columns.append("celex_consolidated")
+
+    return {
+        "columns":  list(dict.fromkeys(declared.get("columns") or columns)),
+        "order_by": declared.get(
+            "order_by",
+            entry["code_field"] if entry.get("match_mode") == "prefix" else None,
+        ),
+        "limit":    declared.get("limit"),
+    }
+
+
+def get_key_field(entry: dict) -> str:
+    """Colonna univoca dell'entry per la keyset pagination (default "id")."""
+    return entry.get("key_field") or "id"
+
+
+def entries_linking_to(entry_id: str) -> list[dict]:
+    """Entry del registry il cui links_to punta a `entry_id` (es. "dual_use" → [dual_use_correlations])."""
+    return [e for e in REGISTRY if e.get("links_to") == entry_id]
+
+
+def get_entry(entry_id: str) -> dict | None:
+    """Entry del registry con l'id indicato, oppure None."""
+    return next((e for e in REGISTRY if e["id"] == entry_id), None)
@@ -0,0 +1,342 @@
+"""
+CustomsAI – Resilienza delle chiamate esterne (Supabase, OpenAI)
+
+Ogni chiamata passa da call(dependency, fn):
+
+  - retry      → solo per operazioni idempotenti e solo per errori transitori
+                 (timeout, errori di connessione, 429, 5xx), con backoff
+                 esponenziale e full jitter: sleep = U(0, min(max, base·2^n))
+  - breaker    → un circuit breaker per dipendenza: dopo BREAKER_FAILURE_THRESHOLD
+                 errori transitori consecutivi le chiamate falliscono subito
+                 (CircuitOpenError) per BREAKER_RESET_SECONDS, poi una chiamata
+                 di prova (half-open) decide se richiudere
+  - hedging    → facoltativo per le letture: se la risposta non arriva entro il
+                 percentile HEDGE_PERCENTILE delle latenze recenti, parte una
+                 richiesta duplicata e vince la prima che termina
+  - metriche   → contatori e latenze per dipendenza (metrics_snapshot())
+  - deadline   → con un deadline attivo (deadline.py) nessun tentativo o backoff
+                 oltre il budget; l'attesa di una chiamata in volo si interrompe
+                 alla scadenza o alla cancellazione (DeadlineExceeded / QueryCancelled)
+
+Nessuna dipendenza dai client: gli errori transitori sono riconosciuti per
+nome della classe e status code, così il modulo vale per openai, httpx e postgrest.
+"""
+
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import TypeVar
+
+import config
+import deadline as deadline_mod
+from deadline import Deadline, DeadlineExceeded, QueryCancelled
+
+
+T = TypeVar("T")
+
+# Classi di errore transitorie (anche come classi base, es. httpx.ReadTimeout → TimeoutException).
+_TRANSIENT_ERROR_NAMES = {
+    "APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError",
+    "TimeoutException", "TransportError", "NetworkError", "RemoteProtocolError",
+    "TimeoutError", "ConnectionError",
+}
+
+# Codici PostgREST (non SQLSTATE) per database non raggiungibile: risposta 503.
+_TRANSIENT_POSTGREST_CODES = {"PGRST000", "PGRST001", "PGRST002"}
+
+# Latenze recenti conservate per dipendenza (base del percentile di hedging).
+_LATENCY_WINDOW = 200
+
+# Intervallo di controllo della cancellazione durante l'attesa di una chiamata.
+_POLL_SECONDS = 0.05
+
+
+class CircuitOpenError(RuntimeError):
+    """Circuit breaker aperto: la dipendenza è considerata non disponibile."""
+
+
+def _http_status(exc: BaseException) -> int | None:
+    """
+    Status HTTP dell'errore: exc.status_code (openai), exc.response.status_code
+    (httpx.HTTPStatusError) o exc.code se è un int. Il postgrest APIError mette in
+    code lo status HTTP (int) quando il corpo non è JSON, caso normale per le
+    pagine 502/503/504 del gateway; altrimenti lo SQLSTATE (str, es. "42703"),
+    che come intero sembrerebbe un 5xx e non va mai letto come status.
+    """
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is None:
+        code = getattr(exc, "code", None)
+        status = code if isinstance(code, int) and not isinstance(code, bool) else None
+    try:
+        status = int(status)
+    except (TypeError, ValueError):
+        return None
+    return status if 100 <= status <= 599 else None
+
+
+def is_transient(exc: BaseException) -> bool:
+    """
+    True per timeout, errori di rete, 429 e 5xx (non per la scadenza del deadline).
+    Dal postgrest APIError conta solo il codice PostgREST di database irraggiungibile.
+    """
+    if isinstance(exc, DeadlineExceeded):
+        return False
+    if any(cls.__name__ in _TRANSIENT_ERROR_NAMES for cls in type(exc).__mro__):
+        return True
+    if getattr(exc, "code", None) in _TRANSIENT_POSTGREST_CODES:
+        return True
+    status = _http_status(exc)
+    return status is not None and (status == 429 or status >= 500)
+
+
+# ============================================================
+# Metriche
+# ============================================================
+
+@dataclass
+class DependencyMetrics:
+    calls:          int = 0
+    failures:       int = 0   # chiamate fallite dopo tutti i tentativi
+    retries:        int = 0
+    short_circuits: int = 0   # chiamate rifiutate a breaker aperto
+    breaker_opens:  int = 0
+    hedges:         int = 0   # richieste duplicate lanciate
+    hedge_wins:     int = 0   # richieste duplicate arrivate per prime
+    latencies_ms:   deque = field(default_factory=lambda: deque(maxlen=_LATENCY_WINDOW))
+
+    def percentile(self, p: float) -> float | None:
+        if not self.latencies_ms:
+            return None
+        ordered = sorted(self.latencies_ms)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+# ============================================================
+# Circuit breaker
+# ============================================================
+
+class CircuitBreaker:
+    """closed → open (dopo N errori consecutivi) → half-open (dopo reset_seconds) → closed/open."""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds     = reset_seconds
+        self.state      = "closed"
+        self._failures  = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                return True     # una sola chiamata di prova
+            return self.state == "closed"
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+
+    def abandon_probe(self) -> None:
+        """
+        Chiamata di prova half-open abbandonata (deadline o cancellazione): nessun
+        esito → di nuovo open con un nuovo periodo di reset, così un'altra chiamata
+        potrà fare da prova. Senza, allow() resterebbe False per sempre.
+        """
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def record_failure(self) -> bool:
+        """Registra un errore transitorio; True se il breaker si è appena aperto."""
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                opened = self.state != "open"
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                return opened
+            return False
+
+
+# ============================================================
+# Registro per dipendenza
+# ============================================================
+
+_LOCK = threading.Lock()
+_BREAKERS: dict[str, CircuitBreaker] = {}
+_METRICS: dict[str, DependencyMetrics] = {}
+_HEDGE_POOL: ThreadPoolExecutor | None = None
+_CALL_POOL: ThreadPoolExecutor | None = None
+
+
+def _state(dependency: str) -> tuple[CircuitBreaker, DependencyMetrics]:
+    with _LOCK:
+        if dependency not in _BREAKERS:
+            _BREAKERS[dependency] = CircuitBreaker(
+                config.BREAKER_FAILURE_THRESHOLD, config.BREAKER_RESET_SECONDS
+            )
+            _METRICS[dependency] = DependencyMetrics()
+        return _BREAKERS[dependency], _METRICS[dependency]
+
+
+def _hedge_pool() -> ThreadPoolExecutor:
+    global _HEDGE_POOL
+    with _LOCK:
+        if _HEDGE_POOL is None:
+            _HEDGE_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+        return _HEDGE_POOL
+
+
+def _call_pool() -> ThreadPoolExecutor:
+    global _CALL_POOL
+    with _LOCK:
+        if _CALL_POOL is None:
+            _CALL_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="deadline")
+        return _CALL_POOL
+
+
+def metrics_snapshot() -> dict[str, dict]:
+    """Contatori, stato del breaker e p50/p95 per dipendenza."""
+    with _LOCK:
+        items = list(_METRICS.items())
+    return {
+        name: {
+            "calls":          m.calls,
+            "failures":       m.failures,
+            "retries":        m.retries,
+            "short_circuits": m.short_circuits,
+            "breaker_opens":  m.breaker_opens,
+            "breaker_state":  _BREAKERS[name].state,
+            "hedges":         m.hedges,
+            "hedge_wins":     m.hedge_wins,
+            "p50_ms":         m.percentile(50),
+            "p95_ms":         m.percentile(95),
+        }
+        for name, m in items
+    }
+
+
+def reset() -> None:
+    """Azzera breaker e metriche (test, riavvio a caldo)."""
+    with _LOCK:
+        _BREAKERS.clear()
+        _METRICS.clear()
+
+
+# ============================================================
+# Chiamata protetta
+# ============================================================
+
+def _backoff(attempt: int) -> float:
+    return random.uniform(0, min(config.RETRY_MAX_DELAY, config.RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def _hedged(fn: Callable[[], T], metrics: DependencyMetrics) -> T:
+    """Esegue fn; oltre la soglia di latenza lancia un duplicato e restituisce il primo risultato."""
+    threshold = metrics.percentile(config.HEDGE_PERCENTILE)
+    if threshold is None or len(metrics.latencies_ms) < config.HEDGE_MIN_SAMPLES:
+        return fn()
+
+    pool = _hedge_pool()
+    primary = pool.submit(fn)
+    done, _ = wait([primary], timeout=threshold / 1000)
+    if done:
+        return primary.result()
+
+    metrics.hedges += 1
+    backup = pool.submit(fn)
+    done, _ = wait([primary, backup], return_when=FIRST_COMPLETED)
+    winner = next(iter(done))
+    if winner is backup:
+        metrics.hedge_wins += 1
+    # Se il primo finito è fallito, il risultato dell'altro resta l'ultima possibilità.
+    if winner.exception() is not None:
+        other = backup if winner is primary else primary
+        return other.result()
+    return winner.result()
+
+
+def _run_until(fn: Callable[[], T], d: Deadline, dependency: str) -> T:
+    """
+    Esegue fn in un worker e ne attende il risultato finché il deadline lo consente.
+    Alla scadenza/cancellazione smette di attendere: la chiamata in volo termina
+    da sola entro il proprio timeout HTTP, che embeddings, llm e retrieval._execute
+    (Supabase) limitano al budget rimanente. Un worker resta quindi occupato al più
+    fino alla scadenza del deadline (la cancellazione non interrompe la richiesta HTTP).
+    """
+    future = _call_pool().submit(contextvars.copy_context().run, fn)
+    while True:
+        done, _ = wait([future], timeout=min(_POLL_SECONDS, max(d.remaining(), 0.001)))
+        if done:
+            return future.result()
+        d.check(dependency)
+
+
+def call(
+    dependency: str,
+    fn: Callable[[], T],
+    idempotent: bool = True,
+    hedge: bool = False,
+) -> T:
+    """
+    Esegue fn() con breaker, retry (se idempotent) e hedging (se hedge e HEDGE_ENABLED).
+    Solleva CircuitOpenError a breaker aperto, altrimenti l'ultimo errore di fn().
+    """
+    breaker, metrics = _state(dependency)
+    attempts = 1 + (config.RETRY_MAX_ATTEMPTS if idempotent else 0)
+    d = deadline_mod.current()
+
+    for attempt in range(attempts):
+        if d is not None:
+            d.check(dependency)
+        if not breaker.allow():
+            metrics.short_circuits += 1
+            raise CircuitOpenError(f"{dependency}: circuit breaker aperto, riprovare più tardi")
+        probe = breaker.state == "half_open"
+
+        metrics.calls += 1
+        start = time.perf_counter()
+        run = (lambda: _hedged(fn, metrics)) if hedge and config.HEDGE_ENABLED else fn
+        try:
+            result = run() if d is None else _run_until(run, d, dependency)
+        except DeadlineExceeded:
+            if probe:
+                breaker.abandon_probe()      # la prova non ha dato esito: riaprire, non bloccare
+            raise                            # budget del chiamante: né retry né breaker
+        except Exception as e:
+            if not is_transient(e):
+                breaker.record_success()     # la dipendenza ha risposto: errore applicativo
+                metrics.failures += 1
+                raise
+            if breaker.record_failure():
+                metrics.breaker_opens += 1
+                print(f"[resilience] {dependency}: circuit breaker aperto ({type(e).__name__})")
+            if attempt == attempts - 1:
+                metrics.failures += 1
+                raise
+            delay = _backoff(attempt)
+            if d is not None and delay >= d.remaining():
+                metrics.failures += 1
+                raise                        # il retry non finirebbe in tempo
+            metrics.retries += 1
+            if d is None:
+                time.sleep(delay)
+            elif not d.wait(delay):
+                raise QueryCancelled(f"richiesta annullata durante il retry di: {dependency}")
+            continue
+
+        metrics.latencies_ms.append((time.perf_counter() - start) * 1000)
+        breaker.record_success()
+        return result
+
+    raise AssertionError("unreachable")
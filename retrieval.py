@@ -10,12 +10,25 @@ Regole:
 - vector_search() interroga solo la tabella chunks via RPC
 """
 
+import functools
 import json
+from collections.abc import Iterator
 from enum import Enum
-
-from supabase import create_client, Client
+from typing import TYPE_CHECKING
 
 import config
+import deadline as deadline_mod
+import resilience
+import singleflight
+import snapshots
+from correlation_graph import CorrelationGraph
+from hierarchy import HierarchyIndex, HIERARCHY_INDENT_FIELD, HIERARCHY_ORDER_FIELD
+from registry import REGISTRY, get_fetch_plan, get_key_field
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+    from lexical import BM25Index
 
 ChunkRow = dict[str, object]
 
@@ -25,10 +38,11 @@ ChunkRow = dict[str, object]
 # ============================================================
 
 class Intent(str, Enum):
-    CODE_SPECIFIC  = "code_specific"
-    CLASSIFICATION = "classification"
-    PROCEDURAL     = "procedural"
-    GENERIC        = "generic"
+    CODE_SPECIFIC       = "code_specific"
+    CLASSIFICATION      = "classification"
+    PROCEDURAL          = "procedural"
+    REVERSE_CORRELATION = "reverse_correlation"
+    GENERIC             = "generic"
 
 
 _PROCEDURAL_KEYWORDS = [
@@ -39,11 +53,27 @@ _CLASSIFICATION_KEYWORDS = [
     "che codice", "voce doganale", "classificazione",
 ]
 
+# Domande "inverse" sulle correlazioni: quali codici sorgente sono collegati a un codice
+# (es. "quali codici NC sono soggetti a 3E001").
+_REVERSE_KEYWORDS = [
+    "quali codici", "quali voci", "quali merci", "quali prodotti",
+]
+
+
+def asks_reverse_correlation(query: str) -> bool:
+    """True se la query contiene una keyword di domanda inversa ("quali codici", …)."""
+    q = (query or "").lower()
+    return any(k in q for k in _REVERSE_KEYWORDS)
+
 
 def detect_intent(query: str) -> Intent:
     """
     Rileva l'intent dalla query in modo deterministico (solo keyword matching).
     Non rileva codici: quello è compito di detect_code_from_registry() in registry.py.
+
+    Le keyword inverse hanno la priorità più bassa: "quali merci richiedono
+    autorizzazione" resta PROCEDURAL. main.py sceglie REVERSE_CORRELATION anche
+    sopra la keyword procedurale solo se un codice trovato ha un indice inverso.
     """
     q = (query or "").lower()
 
@@ -53,6 +83,9 @@ def detect_intent(query: str) -> Intent:
     if any(k in q for k in _CLASSIFICATION_KEYWORDS):
         return Intent.CLASSIFICATION
 
+    if asks_reverse_correlation(q):
+        return Intent.REVERSE_CORRELATION
+
     return Intent.GENERIC
 
 
@@ -60,10 +93,47 @@ def detect_intent(query: str) -> Intent:
 # Supabase client
 # ============================================================
 
-def _get_client() -> Client:
+@functools.cache
+def _get_client() -> "Client":
+    """
+    Client Supabase condiviso, creato al primo uso (import del package incluso):
+    `import retrieval` resta leggero e le connessioni HTTP sono riusate tra le query.
+    """
+    from supabase import create_client
     return create_client(config.SUPABASE_URL, config.SUPABASE_SERVICE_KEY)
 
 
+class _TimeoutSession:
+    """
+    Sessione httpx condivisa con timeout per singola richiesta: postgrest-py non
+    accetta un timeout in execute(), quindi la sessione della query è avvolta.
+    Il timeout è calcolato a ogni tentativo dal deadline catturato alla creazione
+    (i thread di hedging non ereditano il contesto).
+    """
+
+    def __init__(self, session, d: "deadline_mod.Deadline | None"):
+        self._session = session
+        self._deadline = d
+
+    def request(self, *args, **kwargs):
+        default = config.SUPABASE_TIMEOUT_SECONDS
+        kwargs["timeout"] = self._deadline.timeout(default) if self._deadline is not None else default
+        return self._session.request(*args, **kwargs)
+
+
+def _execute(query, hedge: bool = False):
+    """
+    Esegue una query/RPC PostgREST di sola lettura tramite resilience.call:
+    retry sugli errori transitori, circuit breaker "supabase", hedging se hedge=True.
+    Ogni richiesta HTTP ha timeout = min(SUPABASE_TIMEOUT_SECONDS, budget rimanente),
+    così una chiamata abbandonata alla scadenza del deadline non resta in volo oltre.
+    """
+    request = getattr(query, "request", None)
+    if getattr(request, "session", None) is not None:
+        request.session = _TimeoutSession(request.session, deadline_mod.current())
+    return resilience.call("supabase", query.execute, hedge=hedge)
+
+
 def _parse_metadata(raw) -> dict:
     if isinstance(raw, dict):
         return raw
@@ -87,10 +157,45 @@ def lookup_collateral(entry: dict, code: str, top_k: int | None = None) -> list[
       - "exact"  → .eq(code_field, code)
       - "prefix" → .like(code_field, "{code}%")
 
+    Legge solo le colonne del piano di fetch (registry.get_fetch_plan), con
+    l'ordinamento e il limit dichiarati; top_k esplicito ha precedenza sul limit.
+
+    Entry con "hierarchy_index": restituisce il percorso dalla radice al codice
+    e i suoi figli diretti (indice in memoria), senza troncamento a TOP_K.
+    Se il codice non è un nodo dell'indice si usa il lookup standard.
+
+    Entry con "correlation_index": righe lette dal grafo di correlazioni in
+    memoria (stesso match_mode, stesso limit), senza round trip verso il DB.
+
+    Gli indici non sono mai costruiti qui (lettura dell'intera tabella): se non
+    sono in memoria né in uno snapshot valido si usa il lookup standard, finché
+    warm_indexes() non li rende disponibili.
+
     Restituisce lista di ChunkRow con chunk_text, metadata, celex_consolidated, similarity.
     celex_consolidated è None per le entry con source.type == "static_celex".
+
+    Chiamate concorrenti identiche (stessa entry, codice, top_k) condividono
+    un'unica esecuzione (singleflight.py).
     """
-    k = top_k or config.TOP_K
+    return singleflight.do(
+        "lookup_collateral", (entry["id"], id(entry), code, top_k),
+        lambda: _lookup_collateral(entry, code, top_k),
+    )
+
+
+def _lookup_collateral(entry: dict, code: str, top_k: int | None) -> list[ChunkRow]:
+    if entry.get("hierarchy_index"):
+        results = _lookup_hierarchy(entry, code)
+        if results is not None:
+            return results
+
+    plan = get_fetch_plan(entry)
+    k = top_k or plan["limit"] or config.TOP_K
+
+    if entry.get("correlation_index"):
+        results = _lookup_correlations(entry, code, k)
+        if results is not None:
+            return results
     client = _get_client()
 
     table      = entry["table"]
@@ -98,7 +203,7 @@ def lookup_collateral(entry: dict, code: str, top_k: int | None = None) -> list[
     text_field = entry["text_field"]
     match_mode = entry["match_mode"]
 
-    query = client.table(table).select("*")
+    query = client.table(table).select(",".join(plan["columns"]))
 
     if match_mode == "exact":
         query = query.eq(code_field, code)
@@ -107,45 +212,436 @@ def lookup_collateral(entry: dict, code: str, top_k: int | None = None) -> list[
     else:
         raise ValueError(f"match_mode non supportato: {match_mode!r}")
 
-    response = query.limit(k).execute()
+    if plan["order_by"]:
+        query = query.order(plan["order_by"])
+
+    response = _execute(query.limit(k), hedge=True)
     rows = response.data or []
 
     print(f"[collateral] {entry['id']} | {match_mode} '{code}' → {len(rows)} risultati")
 
+    return [_to_chunk_row(entry, r) for r in rows]
+
+
+def _indent_level(indent_str: str | None) -> int:
+    """indent: None=voce principale, "-"=livello 1, "- -"=livello 2, ecc."""
+    return indent_str.count("-") if indent_str else 0
+
+
+def _to_chunk_row(entry: dict, r: dict) -> ChunkRow:
+    """Converte una riga del DB collaterale in ChunkRow (formato comune a tutti i lookup)."""
+    code_field         = entry["code_field"]
+    text_field         = entry["text_field"]
     display_code_field = entry.get("display_code_field")
-    results = []
 
-    for r in rows:
-        text = r.get(text_field, "")
+    text = r.get(text_field, "")
 
-        if display_code_field:
-            # Formatta chunk_text con codice + indentazione gerarchica.
-            # goods_code ha formato "{10 cifre} {2 cifre}" (es. "8544000000 80"):
-            # si estrae solo la parte numerica principale.
-            raw_code = str(r.get(display_code_field, ""))
-            numeric_code = raw_code.split()[0] if raw_code else ""
+    if display_code_field:
+        # Formatta chunk_text con codice + indentazione gerarchica.
+        # goods_code ha formato "{10 cifre} {2 cifre}" (es. "8544000000 80"):
+        # si estrae solo la parte numerica principale.
+        raw_code = str(r.get(display_code_field, ""))
+        numeric_code = raw_code.split()[0] if raw_code else ""
 
-            # indent: None=voce principale, "-"=livello 1, "- -"=livello 2, ecc.
-            indent_str = r.get("indent") or ""
-            level = indent_str.count("-") if indent_str else 0
-            indent_prefix = "  " * level
+        indent_prefix = "  " * _indent_level(r.get("indent"))
 
-            chunk_text = f"{indent_prefix}{numeric_code}  {text}"
+        chunk_text = f"{indent_prefix}{numeric_code}  {text}"
+    else:
+        chunk_text = text
+
+    return {
+        "chunk_text":         chunk_text,
+        "metadata":           {
+            "code":       r.get(code_field),
+            "source_id":  entry["id"],
+            "text_value": str(r.get(text_field, "")),  # valore raw del text_field
+        },
+        "celex_consolidated":  r.get("celex_consolidated"),
+        "similarity":         1.0,
+    }
+
+
+def lookup_collateral_batch(
+    entry: dict,
+    codes: list[str],
+    top_k: int | None = None,
+) -> list[ChunkRow]:
+    """
+    Lookup collaterale di più codici con UNA sola query sulla tabella dell'entry:
+      - "exact"  → code_field IN (codes)
+      - "prefix" → code_field LIKE c1% OR code_field LIKE c2% …
+    limit = top_k (o limit del piano / TOP_K) per ciascun codice: la query legge
+    fino a k × codici righe e ne tiene al più k per codice; se la risposta è piena
+    (un codice può aver consumato il limite degli altri) i codici rimasti sotto k
+    sono riletti con una query ciascuno.
+
+    Entry con hierarchy_index / correlation_index sono servite dagli indici in
+    memoria (nessuna query). Usato dalla traversal multi-hop (traversal.py).
+    """
+    codes = list(dict.fromkeys(c for c in codes if c))
+    if not codes:
+        return []
+
+    plan = get_fetch_plan(entry)
+    k = top_k or plan["limit"] or config.TOP_K
+
+    if entry.get("hierarchy_index") or entry.get("correlation_index"):
+        return [r for code in codes for r in lookup_collateral(entry, code, top_k=k)]
+
+    code_field = entry["code_field"]
+    match_mode = entry["match_mode"]
+    if match_mode not in ("exact", "prefix"):
+        raise ValueError(f"match_mode non supportato: {match_mode!r}")
+    client = _get_client()
+
+    def _fetch(batch: list[str], limit: int) -> list[dict]:
+        query = client.table(entry["table"]).select(",".join(plan["columns"]))
+        if match_mode == "exact":
+            query = query.in_(code_field, batch)
         else:
-            chunk_text = text
-
-        results.append({
-            "chunk_text":         chunk_text,
-            "metadata":           {
-                "code":       r.get(code_field),
-                "source_id":  entry["id"],
-                "text_value": str(r.get(text_field, "")),  # valore raw del text_field
-            },
-            "celex_consolidated":  r.get("celex_consolidated"),
-            "similarity":         1.0,
-        })
+            query = query.or_(",".join(f"{code_field}.like.{_filter_value(c + '*')}" for c in batch))
+        if plan["order_by"]:
+            query = query.order(plan["order_by"])
+        return _execute(query.limit(limit), hedge=True).data or []
+
+    def _matches(row: dict, code: str) -> bool:
+        value = str(row.get(code_field) or "")
+        return value == code if match_mode == "exact" else value.startswith(code)
+
+    fetched = _fetch(codes, k * len(codes))
+    per_code = {code: [r for r in fetched if _matches(r, code)][:k] for code in codes}
+    if len(fetched) >= k * len(codes):
+        for code in codes:
+            if len(per_code[code]) < k:
+                per_code[code] = _fetch([code], k)
+    # Ordine della query, poi le righe rilette; una riga che matcha più prefissi
+    # compare una volta sola.
+    selected = [r for code in codes for r in per_code[code]]
+    rows: list[dict] = []
+    for r in [r for r in fetched if r in selected] + selected:
+        if r not in rows:
+            rows.append(r)
+
+    print(f"[collateral] {entry['id']} | batch {match_mode} {codes} → {len(rows)} risultati")
+
+    return [_to_chunk_row(entry, r) for r in rows]
+
+
+# ============================================================
+# Collateral DB lookup in streaming (keyset pagination)
+# ============================================================
+
+def _depth_filter(max_depth: int) -> str:
+    """
+    Filtro PostgREST per le righe con livello di indentazione <= max_depth:
+    indent null (voce principale) oppure "-", "- -", … fino a max_depth trattini.
+    """
+    levels = ",".join(f'"{" ".join("-" * n)}"' for n in range(1, max_depth + 1))
+    return f"indent.is.null,indent.in.({levels})" if levels else "indent.is.null"
+
+
+def iter_collateral(
+    entry: dict,
+    code: str,
+    page_size: int | None = None,
+    max_depth: int | None = None,
+) -> Iterator[list[ChunkRow]]:
+    """
+    Lookup collaterale in streaming: restituisce un generatore di pagine di ChunkRow.
+
+    A differenza di lookup_collateral() non tronca a TOP_K: percorre tutte le righe
+    che matchano il codice con keyset pagination su (code_field, key_field)
+    (registry.get_key_field), una query per pagina. Il chiamante può interrompere
+    in qualsiasi momento (break) senza che vengano lette le pagine successive.
+
+    max_depth: se indicato, restituisce solo le righe con livello di indentazione
+    <= max_depth (0 = solo voci principali, 1 = anche "-", ecc.). Il filtro è
+    applicato dal DB, quindi le righe più profonde non vengono trasferite.
+    """
+    for rows in _iter_rows(entry, code, page_size=page_size, max_depth=max_depth):
+        yield [_to_chunk_row(entry, r) for r in rows]
+
+
+def iter_table_rows(
+    entry: dict,
+    columns: list[str] | None = None,
+    page_size: int | None = None,
+) -> Iterator[list[dict]]:
+    """
+    Tutte le righe della tabella dell'entry, in pagine di righe raw ordinate per
+    (code_field, key_field). Anche per le entry "exact" (il prefix "" seleziona
+    l'intera tabella). columns: default = piano di fetch dell'entry. Per i tool
+    che scorrono intere tabelle (es. precompute degli embedding analitici).
+    """
+    scan_entry = {**entry, "match_mode": "prefix"}
+    return _iter_rows(scan_entry, "", page_size=page_size or _INDEX_PAGE_SIZE, columns=columns)
+
+
+def _filter_value(value) -> str:
+    """Valore tra doppi apici per i filtri logici PostgREST (or/and): spazi, virgole, punti."""
+    escaped = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
+
 
-    return results
+def _keyset_filter(code_field: str, key_field: str, last: dict) -> str:
+    """
+    Condizione (code_field, key_field) > (ultimo codice, ultima chiave) in sintassi
+    PostgREST: code_field non è univoco (es. un codice NC con più codici DU), quindi
+    le righe con lo stesso codice dell'ultima letta si distinguono per key_field.
+    """
+    code, key = _filter_value(last[code_field]), _filter_value(last[key_field])
+    return f"{code_field}.gt.{code},and({code_field}.eq.{code},{key_field}.gt.{key})"
+
+
+def _iter_rows(
+    entry: dict,
+    code: str,
+    page_size: int | None = None,
+    max_depth: int | None = None,
+    columns: list[str] | None = None,
+) -> Iterator[list[dict]]:
+    """
+    Generatore di pagine di righe raw, keyset pagination su (code_field, key_field):
+    ORDER BY code_field, key_field e cursore composto sull'ultima riga letta
+    ("exact": code_field è costante, basta key_field).
+    columns: colonne da leggere; default = piano di fetch dell'entry. key_field
+    è sempre letto (serve al cursore).
+    code="" con match_mode "prefix" percorre l'intera tabella.
+    """
+    size = page_size or config.COLLATERAL_PAGE_SIZE
+    code_field = entry["code_field"]
+    key_field  = get_key_field(entry)
+    match_mode = entry["match_mode"]
+    if match_mode not in ("exact", "prefix"):
+        raise ValueError(f"match_mode non supportato: {match_mode!r}")
+
+    select = ",".join(dict.fromkeys([*(columns or get_fetch_plan(entry)["columns"]), key_field]))
+    client = _get_client()
+
+    last: dict | None = None
+    page_no = 0
+    while True:
+        query = client.table(entry["table"]).select(select)
+        if match_mode == "exact":
+            query = query.eq(code_field, code)
+        else:
+            query = query.like(code_field, f"{code}%")
+        if max_depth is not None:
+            query = query.or_(_depth_filter(max_depth))
+        if last is not None:
+            if match_mode == "exact":
+                query = query.gt(key_field, last[key_field])
+            else:
+                query = query.or_(_keyset_filter(code_field, key_field, last))
+
+        if match_mode == "prefix":
+            query = query.order(code_field)
+        rows = _execute(query.order(key_field).limit(size)).data or []
+        page_no += 1
+
+        print(
+            f"[collateral] {entry['id']} | {match_mode} '{code}' "
+            f"pagina {page_no} → {len(rows)} risultati"
+        )
+
+        if rows:
+            yield rows
+        if len(rows) < size:
+            return
+        last = rows[-1]
+
+
+# ============================================================
+# Indice gerarchico in memoria (entry con "hierarchy_index")
+# ============================================================
+
+# Indici già costruiti nel processo, per entry id.
+_HIERARCHY_INDEXES: dict[str, HierarchyIndex] = {}
+
+# Righe lette per pagina durante la costruzione degli indici in memoria.
+_INDEX_PAGE_SIZE = 1000
+
+# Versione degli snapshot di indici e grafi: cambia quando cambia il modo in cui
+# le righe sono lette, così gli snapshot scritti prima non vengono riusati
+# (v2: keyset pagination composta, prima le righe con codice duplicato a cavallo
+# di pagina andavano perse).
+_SNAPSHOT_VERSION = 2
+
+
+def _snapshot_name(kind: str, entry: dict) -> str:
+    return f"{kind}_{entry['id']}_v{_SNAPSHOT_VERSION}"
+
+
+def _get_hierarchy_index(entry: dict, wait: bool = True) -> HierarchyIndex | None:
+    """
+    Restituisce l'indice gerarchico dell'entry, costruendolo al primo uso.
+    Le righe (code_field + text_field + indent + hier_pos) sono lette dallo
+    snapshot locale se ancora valido, altrimenti dall'intera tabella in streaming.
+
+    wait=False (percorso di lookup): se l'indice non è in memoria né in uno
+    snapshot valido restituisce None invece di leggere l'intera tabella; la
+    costruzione spetta a warm_indexes() (avvio del server, tools/warm_indexes.py).
+    """
+    index = _HIERARCHY_INDEXES.get(entry["id"])
+    if index is not None:
+        return index
+
+    name = _snapshot_name("hierarchy", entry)
+    if not wait and not snapshots.is_fresh(name):
+        return None
+
+    columns = list(dict.fromkeys(
+        get_fetch_plan(entry)["columns"] + [HIERARCHY_INDENT_FIELD, HIERARCHY_ORDER_FIELD]
+    ))
+
+    def _fetch_all() -> list[dict]:
+        return [
+            r
+            for page in _iter_rows(entry, "", page_size=_INDEX_PAGE_SIZE, columns=columns)
+            for r in page
+        ]
+
+    rows = snapshots.load_rows(name, _fetch_all)
+    index = HierarchyIndex(rows, entry["code_field"])
+    _HIERARCHY_INDEXES[entry["id"]] = index
+    return index
+
+
+def _lookup_hierarchy(entry: dict, code: str) -> list[ChunkRow] | None:
+    """
+    Lookup tramite indice gerarchico: percorso dalla radice al codice + figli diretti.
+    Restituisce None se l'indice non è ancora pronto o se il codice non
+    corrisponde a un nodo dell'indice (il chiamante ricade sul prefix scan).
+    """
+    index = _get_hierarchy_index(entry, wait=False)
+    if index is None:
+        print(f"[collateral] {entry['id']} | indice gerarchico non pronto → prefix scan")
+        return None
+    key = index.resolve(code)
+    if key is None:
+        return None
+
+    path     = index.path(key)
+    children = index.children(key)
+
+    print(
+        f"[collateral] {entry['id']} | tree '{code}' → "
+        f"{len(path)} antenati+nodo, {len(children)} figli "
+        f"(sottoalbero: {index.subtree_size(key)} righe)"
+    )
+
+    return [_to_chunk_row(entry, r) for r in path + children]
+
+
+# ============================================================
+# Grafo di correlazioni in memoria (entry con "correlation_index")
+# ============================================================
+
+# Grafi già costruiti nel processo, per entry id.
+_CORRELATION_GRAPHS: dict[str, CorrelationGraph] = {}
+
+
+def _get_correlation_graph(entry: dict, wait: bool = True) -> CorrelationGraph | None:
+    """
+    Restituisce il grafo di correlazioni dell'entry, costruendolo al primo uso
+    dallo snapshot locale (se valido) o dall'intera tabella in streaming.
+    wait=False: come _get_hierarchy_index, None se servirebbe leggere la tabella.
+    """
+    graph = _CORRELATION_GRAPHS.get(entry["id"])
+    if graph is not None:
+        return graph
+
+    name = _snapshot_name("correlations", entry)
+    if not wait and not snapshots.is_fresh(name):
+        return None
+
+    def _fetch_all() -> list[dict]:
+        return [
+            r
+            for page in _iter_rows(entry, "", page_size=_INDEX_PAGE_SIZE)
+            for r in page
+        ]
+
+    rows = snapshots.load_rows(name, _fetch_all)
+    graph = CorrelationGraph(rows, entry["code_field"], entry["text_field"])
+    _CORRELATION_GRAPHS[entry["id"]] = graph
+    return graph
+
+
+def _lookup_correlations(entry: dict, code: str, k: int) -> list[ChunkRow] | None:
+    """
+    Lookup collaterale servito dal grafo (equivalente a eq/like + order + limit).
+    None se il grafo non è ancora pronto (il chiamante usa la query standard).
+    """
+    graph = _get_correlation_graph(entry, wait=False)
+    if graph is None:
+        print(f"[collateral] {entry['id']} | grafo non pronto → lookup {entry['match_mode']}")
+        return None
+    rows = graph.rows_for_source(code, prefix=entry["match_mode"] == "prefix")[:k]
+
+    print(f"[collateral] {entry['id']} | graph {entry['match_mode']} '{code}' → {len(rows)} risultati")
+
+    return [_to_chunk_row(entry, r) for r in rows]
+
+
+def warm_indexes(entries: list[dict] | None = None, refresh: bool = False) -> dict[str, int]:
+    """
+    Costruisce gli indici in memoria (gerarchie e grafi di correlazione) delle
+    entry che li dichiarano e, con HYBRID_ENABLED e senza `entries`, l'indice
+    BM25 dei chunk, leggendo gli snapshot validi o le tabelle intere e
+    riscrivendo gli snapshot. I lookup non aspettano mai questa costruzione:
+    finché l'indice non è pronto usano la query sul DB. Chiamata in background
+    all'avvio di server.py e da tools/warm_indexes.py (CLI, cron).
+    refresh=True ignora snapshot e indici già costruiti e rilegge le tabelle.
+    Restituisce {entry id (o "lexical"): righe indicizzate}.
+    """
+    global _LEXICAL_INDEX
+    built: dict[str, int] = {}
+    for entry in REGISTRY if entries is None else entries:
+        if refresh:
+            for kind, cache in (("hierarchy", _HIERARCHY_INDEXES), ("correlations", _CORRELATION_GRAPHS)):
+                snapshots.invalidate(_snapshot_name(kind, entry))
+                cache.pop(entry["id"], None)
+        if entry.get("hierarchy_index"):
+            built[entry["id"]] = len(_get_hierarchy_index(entry))
+        if entry.get("correlation_index"):
+            built[entry["id"]] = len(_get_correlation_graph(entry))
+    if config.HYBRID_ENABLED and entries is None:
+        if refresh:
+            snapshots.invalidate(_LEXICAL_SNAPSHOT)
+            _LEXICAL_INDEX = None
+        built["lexical"] = len(_get_lexical_index()[1])
+    return built
+
+
+def correlation_graph(entry: dict) -> CorrelationGraph:
+    """
+    Grafo di correlazioni completo dell'entry (correlation_index), costruito se
+    serve da snapshot o tabella: per chi ha bisogno di tutti gli archi
+    (traversal inversa, tool di precompute).
+    """
+    return _get_correlation_graph(entry)
+
+
+def linked_codes(entry: dict, code: str) -> list[str]:
+    """
+    Codici collegati (links_to) al codice dato, per un'entry con correlation_index.
+    Prefix-aware: considera tutti i codici sorgente che iniziano con `code`.
+    """
+    return _get_correlation_graph(entry).forward(code)
+
+
+def reverse_lookup(entry: dict, code: str) -> list[ChunkRow]:
+    """
+    Direzione inversa del grafo: tutte le righe dell'entry (es. dual_use_correlations)
+    il cui codice destinazione è `code` o una sua sotto-voce
+    (es. "3E001" → tutti i codici NC soggetti a 3E001).
+    """
+    rows = _get_correlation_graph(entry).rows_for_target(code)
+
+    print(f"[collateral] {entry['id']} | reverse '{code}' → {len(rows)} risultati")
+
+    return [_to_chunk_row(entry, r) for r in rows]
 
 
 # ============================================================
@@ -158,24 +654,27 @@ def get_annex_chunks_by_codes(codes: list[str]) -> list[ChunkRow]:
     Usato in Fase 3 per ottenere la definizione normativa esatta dei codici DU
     collegati tramite dual_use_correlations.
 
-    Usa una query diretta (no vector) su metadata->>'code'.
+    Usa una sola query diretta (no vector) su metadata->>'code' IN (codes),
+    con i valori tra doppi apici (_filter_value).
     metadata.code è popolato SOLO per unit_type=ANNEX_CODE, quindi il filtro
     restituisce naturalmente solo le voci dell'allegato.
+    I risultati seguono l'ordine di `codes`.
     """
     if not codes:
         return []
 
     client = _get_client()
-    all_rows: list[dict] = []
-
-    for code in codes:
-        resp = (
-            client.table("chunks")
-            .select("text, metadata, celex_consolidated, source_url")
-            .filter("metadata->>code", "eq", code)
-            .execute()
-        )
-        all_rows.extend(resp.data or [])
+    resp = _execute(
+        client.table("chunks")
+        .select("text, metadata, celex_consolidated, source_url")
+        .filter("metadata->>code", "in", f"({','.join(_filter_value(c) for c in codes)})"),
+        hedge=True,
+    )
+    rank = {code: i for i, code in enumerate(codes)}
+    all_rows = sorted(
+        resp.data or [],
+        key=lambda r: rank.get(_parse_metadata(r.get("metadata")).get("code"), len(rank)),
+    )
 
     print(f"[annex] codes={codes} → {len(all_rows)} risultati")
 
@@ -198,14 +697,37 @@ def vector_search(
     query_embedding: list[float],
     top_k: int | None = None,
     type_filters: list[str] | None = None,
+    diversify: bool | None = None,
 ) -> list[ChunkRow]:
     """
     Ricerca vettoriale su public.chunks tramite RPC search_chunks_multi_type.
 
     type_filters: lista di unit_type in UPPERCASE (es. ["ARTICLE"], ["ANNEX_CODE"]).
     Se None → ricerca globale su tutti i tipi.
+
+    diversify: se True (default: config.MMR_ENABLED) chiede MMR_OVERFETCH × k
+    candidati con i relativi embedding (RPC search_chunks_multi_type_mmr) e ne
+    seleziona k con Maximal Marginal Relevance (mmr.py), scartando i quasi-duplicati.
+
+    Ricerche concorrenti identiche condividono un'unica RPC (singleflight.py).
     """
+    key = (tuple(query_embedding), top_k, tuple(type_filters or ()), diversify)
+    return singleflight.do(
+        "vector_search", key,
+        lambda: _vector_search(query_embedding, top_k, type_filters, diversify),
+    )
+
+
+def _vector_search(
+    query_embedding: list[float],
+    top_k: int | None,
+    type_filters: list[str] | None,
+    diversify: bool | None,
+) -> list[ChunkRow]:
     k = top_k or config.TOP_K
+    if config.MMR_ENABLED if diversify is None else diversify:
+        return _vector_search_mmr(query_embedding, k, type_filters)
+
     client = _get_client()
 
     rpc_params = {
@@ -214,17 +736,165 @@ def vector_search(
         "type_filters":    type_filters or None,
     }
 
-    response = client.rpc("search_chunks_multi_type", rpc_params).execute()
+    response = _execute(client.rpc("search_chunks_multi_type", rpc_params), hedge=True)
     rows = response.data or []
 
     print(f"[vector] type_filters={type_filters} → {len(rows)} risultati")
 
+    return [_vector_row(r) for r in rows]
+
+
+def _vector_row(r: dict) -> ChunkRow:
+    return {
+        "chunk_text":        r["text"],
+        "metadata":          _parse_metadata(r["metadata"]),
+        "celex_consolidated": r.get("celex_consolidated"),
+        "similarity":        r.get("similarity"),
+    }
+
+
+def _parse_embedding(raw) -> list[float]:
+    """pgvector può arrivare come array JSON o come stringa "[0.1,0.2,…]"."""
+    if isinstance(raw, str):
+        return json.loads(raw)
+    return list(raw or [])
+
+
+def _vector_search_mmr(
+    query_embedding: list[float],
+    k: int,
+    type_filters: list[str] | None,
+) -> list[ChunkRow]:
+    """Over-fetch con embedding + selezione MMR dei k chunk più rilevanti e diversi."""
+    client = _get_client()
+
+    rpc_params = {
+        "query_embedding": query_embedding,
+        "match_count":     k * config.MMR_OVERFETCH,
+        "type_filters":    type_filters or None,
+    }
+
+    response = _execute(client.rpc("search_chunks_multi_type_mmr", rpc_params), hedge=True)
+    rows = [r for r in (response.data or []) if r.get("embedding")]
+
+    from mmr import mmr_select      # NumPy: caricato solo se MMR_ENABLED
+
+    selected, stats = mmr_select(
+        query_embedding,
+        [_parse_embedding(r["embedding"]) for r in rows],
+        k,
+        lambda_mult=config.MMR_LAMBDA,
+    )
+
+    print(
+        f"[vector] type_filters={type_filters} | mmr λ={config.MMR_LAMBDA} → "
+        f"{stats.selected}/{stats.candidates} selezionati, {stats.replaced} sostituiti, "
+        f"ridondanza {stats.redundancy_before:.2f} → {stats.redundancy_after:.2f}"
+    )
+
+    return [_vector_row(rows[i]) for i in selected]
+
+
+# ============================================================
+# Ricerca lessicale BM25 e fusione ibrida (lexical.py)
+# ============================================================
+
+# Indice BM25 su chunks.text (indice, righe chunk), costruito da warm_indexes()
+# o da uno snapshot valido.
+_LEXICAL_INDEX: "tuple[BM25Index, list[dict]] | None" = None
+
+_LEXICAL_SNAPSHOT = "lexical_chunks"
+
+# Costante k della Reciprocal Rank Fusion (valore standard della letteratura).
+_RRF_K = 60
+
+
+def _get_lexical_index(wait: bool = True) -> "tuple[BM25Index, list[dict]] | None":
+    """
+    Restituisce l'indice BM25 dei chunk, costruendolo dallo snapshot locale (se
+    valido) o leggendo public.chunks a pagine (keyset su id, senza embedding).
+    wait=False (percorso di query): come _get_hierarchy_index, None se servirebbe
+    leggere la tabella; la costruzione spetta a warm_indexes().
+    """
+    global _LEXICAL_INDEX
+    if _LEXICAL_INDEX is not None:
+        return _LEXICAL_INDEX
+    if not wait and not snapshots.is_fresh(_LEXICAL_SNAPSHOT):
+        return None
+
+    def _fetch_all() -> list[dict]:
+        client = _get_client()
+        rows: list[dict] = []
+        while True:
+            query = client.table(config.TABLE_NAME).select("id, text, metadata, celex_consolidated")
+            if rows:
+                query = query.gt("id", rows[-1]["id"])
+            page = _execute(query.order("id").limit(_INDEX_PAGE_SIZE)).data or []
+            rows += page
+            if len(page) < _INDEX_PAGE_SIZE:
+                return rows
+
+    from lexical import BM25Index   # NumPy: caricato solo se HYBRID_ENABLED
+
+    rows = snapshots.load_rows(_LEXICAL_SNAPSHOT, _fetch_all)
+    _LEXICAL_INDEX = (BM25Index([r.get("text") or "" for r in rows]), rows)
+    return _LEXICAL_INDEX
+
+
+def lexical_search(query: str, top_k: int | None = None) -> tuple[list[ChunkRow], bool]:
+    """
+    Ricerca BM25 locale su chunks.text.
+    Restituisce (chunk in ordine di punteggio, confident): confident=True se il
+    match letterale è decisivo (lexical.confidence) e la vector search può essere
+    saltata insieme all'embedding della query.
+    similarity = punteggio BM25 normalizzato sul primo risultato (0–1).
+    Finché l'indice non è pronto restituisce ([], False): solo vector search.
+    """
+    from lexical import confidence as lexical_confidence
+
+    k = top_k or config.TOP_K
+    lexical_index = _get_lexical_index(wait=False)
+    if lexical_index is None:
+        print("[lexical] indice BM25 non pronto → solo vector search")
+        return [], False
+    index, rows = lexical_index
+    hits = index.search(query, k)
+    confident = lexical_confidence(
+        hits, config.LEXICAL_MIN_COVERAGE, config.LEXICAL_MIN_MARGIN
+    )
+
+    print(
+        f"[lexical] {len(hits)} risultati"
+        + (f", top score={hits[0].score:.2f} copertura={hits[0].coverage:.2f}" if hits else "")
+        + (" → decisivo" if confident else "")
+    )
+
+    top_score = hits[0].score if hits else 1.0
     return [
         {
-            "chunk_text":        r["text"],
-            "metadata":          _parse_metadata(r["metadata"]),
-            "celex_consolidated": r.get("celex_consolidated"),
-            "similarity":        r.get("similarity"),
+            "chunk_text":         rows[h.doc].get("text") or "",
+            "metadata":           _parse_metadata(rows[h.doc].get("metadata")),
+            "celex_consolidated": rows[h.doc].get("celex_consolidated"),
+            "similarity":         round(h.score / top_score, 4),
         }
-        for r in rows
-    ]
+        for h in hits
+    ], confident
+
+
+def fuse_rankings(*rankings: list[ChunkRow], top_k: int | None = None) -> list[ChunkRow]:
+    """
+    Reciprocal Rank Fusion di più liste ordinate di chunk (es. lessicale + vettoriale):
+    score(c) = Σ 1 / (_RRF_K + rank). I duplicati (stesso testo) sono fusi,
+    mantenendo la riga della prima lista in cui compaiono.
+    """
+    k = top_k or config.TOP_K
+    scores: dict[str, float] = {}
+    first_row: dict[str, ChunkRow] = {}
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking, start=1):
+            key = chunk["chunk_text"]
+            scores[key] = scores.get(key, 0.0) + 1.0 / (_RRF_K + rank)
+            first_row.setdefault(key, chunk)
+
+    ordered = sorted(scores, key=lambda key: scores[key], reverse=True)
+    return [first_row[key] for key in ordered[:k]]
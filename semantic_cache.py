@@ -0,0 +1,164 @@
+"""
+CustomsAI – Cache semantica delle domande (quasi-duplicati)
+
+Le riformulazioni della stessa domanda ("obblighi export 2B002" vs
+"che obblighi ci sono per esportare 2B002") mancano qualsiasi cache a
+stringa esatta. Qui ogni domanda risposta dall'LLM è memorizzata con
+l'embedding della query normalizzata; una nuova domanda calcola le
+similarità con un solo prodotto matrice-vettore (NumPy) e, tra le voci sopra
+la soglia, sceglie la più simile nel primo gruppo non vuoto:
+
+  - stessi codici + stesso intent → riuso di retrieval e risposta ("hit")
+  - stessi codici, intent diverso → riuso del solo retrieval ("retrieval_hit")
+  - solo codici diversi           → ignorato ("false_hit": simile ma non equivalente,
+                                    es. 2B002 vs 2B003)
+
+Le voci sono copiate in ingresso e in uscita: i chiamanti possono modificare
+chunk e fonti del risultato senza alterare la cache.
+
+Capacità fissa, sostituzione FIFO (ring buffer). Solo in memoria, per processo.
+Gli embedding sono conservati quantizzati (config.EMBEDDING_STORAGE, quantize.py).
+"""
+
+import copy
+import threading
+from dataclasses import dataclass, field
+
+import numpy as np
+
+import config
+from quantize import QuantizedMatrix
+
+
+@dataclass
+class CachedAnswer:
+    query:      str          # query normalizzata che ha prodotto la voce
+    intent:     str
+    codes:      tuple[str, ...]
+    chunks:     list[dict]
+    dbs:        list[str]
+    sources:    list[dict]
+    context:    str          # contesto passato all'LLM (riusabile con intent diverso)
+    analytical: bool
+    answer:     str
+
+
+@dataclass
+class CacheLookup:
+    entry:        CachedAnswer
+    similarity:   float
+    reuse_answer: bool       # False → riusare solo il retrieval e rigenerare la risposta
+
+
+@dataclass
+class CacheStats:
+    lookups:        int = 0
+    hits:           int = 0   # risposta riusata
+    retrieval_hits: int = 0   # solo retrieval riusato
+    false_hits:     int = 0   # vicino sopra soglia ma con codici diversi
+    misses:         int = 0
+    similarities:   list[float] = field(default_factory=list)  # similarità dei vicini sopra soglia
+
+    @property
+    def hit_rate(self) -> float:
+        return (self.hits + self.retrieval_hits) / self.lookups if self.lookups else 0.0
+
+
+def _normalize_codes(codes: list[str]) -> tuple[str, ...]:
+    return tuple(sorted(c.strip().upper() for c in codes))
+
+
+class SemanticCache:
+    """
+    Cache dei quasi-duplicati su embedding normalizzati (similarità coseno = prodotto scalare).
+    La matrice degli embedding è allocata al primo store (dimensione del modello).
+    """
+
+    def __init__(self, threshold: float, max_entries: int, storage: str = "float32"):
+        self.threshold   = threshold
+        self.max_entries = max_entries
+        self.storage     = storage
+        self.stats       = CacheStats()
+        self._matrix: QuantizedMatrix | None = None
+        self._entries: list[CachedAnswer | None] = [None] * max_entries
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def _unit(embedding: list[float]) -> np.ndarray:
+        v = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def lookup(self, embedding: list[float], intent: str, codes: list[str]) -> CacheLookup | None:
+        """
+        Voce più simile sopra soglia con gli stessi codici (stesso intent se c'è),
+        altrimenti None. Restituisce una copia della voce.
+        """
+        wanted = _normalize_codes(codes)
+        with self._lock:
+            self.stats.lookups += 1
+            if not self._size:
+                self.stats.misses += 1
+                return None
+
+            sims = self._matrix.dot(self._unit(embedding), self._size)
+            above = np.flatnonzero(sims >= self.threshold)
+            if not above.size:
+                self.stats.misses += 1
+                return None
+
+            self.stats.similarities.append(float(sims[above].max()))
+            same_codes = [i for i in above if self._entries[i].codes == wanted]
+            if not same_codes:
+                self.stats.false_hits += 1
+                return None
+
+            same_intent = [i for i in same_codes if self._entries[i].intent == intent]
+            candidates = same_intent or same_codes
+            best = max(candidates, key=lambda i: sims[i])
+            reuse_answer = bool(same_intent)
+            if reuse_answer:
+                self.stats.hits += 1
+            else:
+                self.stats.retrieval_hits += 1
+            return CacheLookup(copy.deepcopy(self._entries[best]), float(sims[best]), reuse_answer)
+
+    def store(self, embedding: list[float], entry: CachedAnswer) -> None:
+        """Aggiunge una voce; a capacità piena sostituisce la più vecchia."""
+        vector = self._unit(embedding)
+        entry = copy.deepcopy(entry)
+        entry.codes = _normalize_codes(list(entry.codes))
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = QuantizedMatrix(self.max_entries, vector.shape[0], self.storage)
+            self._matrix[self._next] = vector
+            self._entries[self._next] = entry
+            self._next = (self._next + 1) % self.max_entries
+            self._size = min(self._size + 1, self.max_entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._matrix = None
+            self._entries = [None] * self.max_entries
+            self._size = self._next = 0
+            self.stats = CacheStats()
+
+
+# Cache del processo, creata al primo uso con i parametri di config.
+_CACHE: SemanticCache | None = None
+
+
+def get_cache() -> SemanticCache:
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = SemanticCache(
+            config.SEMANTIC_CACHE_THRESHOLD,
+            config.SEMANTIC_CACHE_MAX_ENTRIES,
+            config.EMBEDDING_STORAGE,
+        )
+    return _CACHE
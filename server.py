@@ -0,0 +1,352 @@
+"""
+CustomsAI – Servizio HTTP/JSON attorno a main.query
+
+Accesso programmatico per gli altri sistemi (la CLI e Streamlit sono
+monoutente). Solo libreria standard: http.server con un pool di worker
+limitato al posto di un thread per connessione.
+
+Endpoint:
+  POST /query    {"question": str, "deadline": float?}            → QueryResult
+  POST /lookup   {"entry": str, "code": str, "top_k": int?}       → chunk del DB collaterale
+  GET  /healthz  processo vivo
+  GET  /readyz   pronto a ricevere traffico (non in chiusura, nessun breaker aperto),
+                 con metriche per dipendenza e contatori single-flight
+
+Ogni risposta porta un request ID (header X-Request-ID, ripreso dalla
+richiesta se presente) anche nel corpo JSON. Errori → {"error", "request_id"}:
+  400 richiesta non valida · 404 entry/endpoint sconosciuti · 500 errore interno
+  502 errore OpenAI o Supabase · 503 pool saturo, breaker aperto o servizio in
+  chiusura · 504 deadline esaurito
+
+Chiusura ordinata (SIGTERM/SIGINT): /readyz passa a 503, nessuna nuova
+connessione, le richieste in corso hanno SERVER_SHUTDOWN_SECONDS per
+terminare, poi i loro deadline vengono annullati.
+
+Utilizzo:
+    python3 server.py                  # SERVER_HOST:SERVER_PORT da config
+    python3 server.py --port 8080 --workers 16
+"""
+
+import argparse
+import json
+import signal
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from openai import APIError, APIConnectionError
+
+import config
+import main
+import resilience
+import retrieval
+import singleflight
+from deadline import Deadline, DeadlineExceeded, QueryCancelled
+from registry import get_entry
+from resilience import CircuitOpenError
+
+
+# Dimensione massima del corpo di una richiesta (le domande sono brevi).
+_MAX_BODY_BYTES = 64 * 1024
+
+# Package dei client Supabase: i loro errori non gestiti diventano 502, non 500.
+# Riconosciuti per modulo, così server.py non importa supabase all'avvio.
+_UPSTREAM_PACKAGES = {"postgrest", "httpx", "supabase"}
+
+
+class RequestError(Exception):
+    """Errore da restituire al client con lo status indicato."""
+
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+# ============================================================
+# Server con pool di worker
+# ============================================================
+
+class QueryServer(HTTPServer):
+    """
+    HTTPServer che serve le connessioni su un ThreadPoolExecutor di `workers` thread.
+    Oltre workers + max_queue richieste in attesa risponde subito 503 (backpressure).
+    """
+
+    def __init__(self, address: tuple[str, int], workers: int, max_queue: int):
+        super().__init__(address, _Handler)
+        self.workers   = workers
+        self.draining  = False
+        self._pool     = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query")
+        self._slots    = threading.BoundedSemaphore(workers + max_queue)
+        self._lock     = threading.Lock()
+        self._inflight: dict[str, Deadline] = {}
+
+    def process_request(self, request, client_address) -> None:
+        if not self._slots.acquire(blocking=False):
+            _reject_busy(request)
+            self.shutdown_request(request)
+            return
+        self._pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    # ── Richieste in corso (annullabili alla chiusura) ────────────────────
+
+    def track(self, request_id: str, deadline: Deadline) -> None:
+        with self._lock:
+            self._inflight[request_id] = deadline
+
+    def untrack(self, request_id: str) -> None:
+        with self._lock:
+            self._inflight.pop(request_id, None)
+
+    def inflight(self) -> int:
+        with self._lock:
+            return len(self._inflight)
+
+    def drain(self, grace_seconds: float) -> None:
+        """Smette di accettare connessioni, attende le richieste in corso, poi le annulla."""
+        self.draining = True
+        self.shutdown()              # termina serve_forever (chiamare da un altro thread)
+        self.server_close()
+        end = time.monotonic() + grace_seconds
+        while self.inflight() and time.monotonic() < end:
+            time.sleep(0.05)
+        with self._lock:
+            pending = list(self._inflight.values())
+        for d in pending:
+            d.cancel()
+        if pending:
+            print(f"[server] {len(pending)} richieste annullate alla chiusura")
+        self._pool.shutdown(wait=True)
+
+
+def _reject_busy(request) -> None:
+    body = json.dumps({"error": "Servizio saturo, riprovare più tardi."}).encode("utf-8")
+    head = (
+        "HTTP/1.1 503 Service Unavailable\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Retry-After: 1\r\n"
+        "Connection: close\r\n\r\n"
+    ).encode("ascii")
+    try:
+        request.sendall(head + body)
+    except OSError:
+        pass
+
+
+# ============================================================
+# Endpoint
+# ============================================================
+
+def _handle_query(server: QueryServer, request_id: str, body: dict) -> dict:
+    question = body.get("question")
+    if not isinstance(question, str) or not question.strip():
+        raise RequestError(HTTPStatus.BAD_REQUEST, "Campo 'question' mancante o vuoto.")
+    seconds = body.get("deadline", config.QUERY_DEADLINE_SECONDS or None)
+    if seconds is not None and (isinstance(seconds, bool) or not isinstance(seconds, (int, float))
+                                or seconds <= 0):
+        raise RequestError(HTTPStatus.BAD_REQUEST, "Campo 'deadline' non valido (secondi > 0).")
+
+    d = Deadline(seconds)
+    server.track(request_id, d)
+    try:
+        return dict(main.query(question, deadline=d))
+    finally:
+        server.untrack(request_id)
+
+
+def _handle_lookup(server: QueryServer, request_id: str, body: dict) -> dict:
+    entry = get_entry(str(body.get("entry", "")))
+    if entry is None:
+        raise RequestError(HTTPStatus.NOT_FOUND, f"Entry sconosciuta: {body.get('entry')!r}")
+    code = body.get("code")
+    if not isinstance(code, str) or not code.strip():
+        raise RequestError(HTTPStatus.BAD_REQUEST, "Campo 'code' mancante o vuoto.")
+    top_k = body.get("top_k")
+    if top_k is not None and (isinstance(top_k, bool) or not isinstance(top_k, int) or top_k <= 0):
+        raise RequestError(HTTPStatus.BAD_REQUEST, "Campo 'top_k' non valido (intero > 0).")
+
+    chunks = retrieval.lookup_collateral(entry, code.strip(), top_k=top_k)
+    return {"entry": entry["id"], "code": code.strip(), "chunks": chunks}
+
+
+def _readiness(server: QueryServer) -> tuple[HTTPStatus, dict]:
+    metrics = resilience.metrics_snapshot()
+    open_deps = sorted(n for n, m in metrics.items() if m["breaker_state"] == "open")
+    ready = not server.draining and not open_deps
+    payload = {
+        "status":       "ready" if ready else ("draining" if server.draining else "degraded"),
+        "open_breakers": open_deps,
+        "inflight":     server.inflight(),
+        "workers":      server.workers,
+        "dependencies": metrics,
+        "coalesced":    singleflight.stats(),
+    }
+    return (HTTPStatus.OK if ready else HTTPStatus.SERVICE_UNAVAILABLE), payload
+
+
+_POST_ROUTES = {
+    "/query":  _handle_query,
+    "/lookup": _handle_lookup,
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: QueryServer
+
+    def do_GET(self) -> None:
+        request_id = self._request_id()
+        if self.path == "/healthz":
+            self._send(HTTPStatus.OK, {"status": "ok"}, request_id)
+        elif self.path == "/readyz":
+            status, payload = _readiness(self.server)
+            self._send(status, payload, request_id)
+        else:
+            self._send(HTTPStatus.NOT_FOUND, {"error": f"Endpoint sconosciuto: {self.path}"}, request_id)
+
+    def do_POST(self) -> None:
+        request_id = self._request_id()
+        start = time.perf_counter()
+        route = _POST_ROUTES.get(self.path)
+        try:
+            if route is None:
+                raise RequestError(HTTPStatus.NOT_FOUND, f"Endpoint sconosciuto: {self.path}")
+            if self.server.draining:
+                raise RequestError(HTTPStatus.SERVICE_UNAVAILABLE, "Servizio in chiusura.")
+            status, payload = HTTPStatus.OK, route(self.server, request_id, self._read_json())
+        except RequestError as e:
+            status, payload = e.status, {"error": str(e)}
+        except ValueError as e:
+            status, payload = HTTPStatus.BAD_REQUEST, {"error": str(e)}
+        except QueryCancelled as e:
+            status, payload = HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(e)}
+        except DeadlineExceeded as e:
+            status, payload = HTTPStatus.GATEWAY_TIMEOUT, {"error": str(e)}
+        except CircuitOpenError as e:
+            status, payload = HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(e)}
+        except (APIError, APIConnectionError) as e:
+            status, payload = HTTPStatus.BAD_GATEWAY, {"error": f"Errore OpenAI: {e}"}
+        except Exception as e:
+            print(f"[server] {request_id} POST {self.path} errore non gestito:\n{traceback.format_exc()}")
+            if type(e).__module__.split(".")[0] in _UPSTREAM_PACKAGES:
+                status, payload = HTTPStatus.BAD_GATEWAY, {"error": f"Errore Supabase: {type(e).__name__}: {e}"}
+            else:
+                status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Errore interno del servizio."}
+        self._send(status, payload, request_id)
+        print(f"[server] {request_id} POST {self.path} → {status.value} "
+              f"({(time.perf_counter() - start) * 1000:.0f} ms)")
+
+    # ── Helper ────────────────────────────────────────────────────────────
+
+    def _request_id(self) -> str:
+        rid = (self.headers.get("X-Request-ID") or "").strip()
+        return rid[:128] if rid else uuid.uuid4().hex
+
+    def _read_json(self) -> dict:
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Content-Length non valido.")
+        if length > _MAX_BODY_BYTES:
+            raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Corpo della richiesta troppo grande.")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Corpo JSON non valido.")
+        if not isinstance(body, dict):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Il corpo JSON deve essere un oggetto.")
+        return body
+
+    def _send(self, status: HTTPStatus, payload: dict, request_id: str) -> None:
+        data = json.dumps({**payload, "request_id": request_id}, ensure_ascii=False, default=str)
+        body = data.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Request-ID", request_id)
+        if status == HTTPStatus.SERVICE_UNAVAILABLE:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass    # una riga per richiesta già stampata da do_POST
+
+
+# ============================================================
+# Avvio
+# ============================================================
+
+def create_server(
+    host: str | None = None,
+    port: int | None = None,
+    workers: int | None = None,
+    max_queue: int | None = None,
+) -> QueryServer:
+    """Crea il server (port=0 → porta libera scelta dal sistema, utile nei test)."""
+    return QueryServer(
+        (host if host is not None else config.SERVER_HOST,
+         port if port is not None else config.SERVER_PORT),
+        workers=workers or config.SERVER_WORKERS,
+        max_queue=max_queue if max_queue is not None else config.SERVER_MAX_QUEUE,
+    )
+
+
+def _warm_indexes() -> None:
+    started = time.monotonic()
+    try:
+        built = retrieval.warm_indexes()
+    except Exception as e:      # i lookup restano serviti dal DB
+        print(f"[server] costruzione indici fallita: {type(e).__name__}: {e}")
+        return
+    print(f"[server] indici pronti in {time.monotonic() - started:.1f}s: {built}")
+
+
+def serve(server: QueryServer, grace_seconds: float | None = None) -> None:
+    """serve_forever con chiusura ordinata su SIGTERM/SIGINT."""
+    grace = config.SERVER_SHUTDOWN_SECONDS if grace_seconds is None else grace_seconds
+    drainer = threading.Thread(target=server.drain, args=(grace,), daemon=True)
+
+    def _stop(signum, _frame) -> None:
+        if drainer.is_alive() or server.draining:
+            return
+        print(f"[server] segnale {signal.Signals(signum).name}: chiusura (attesa max {grace:.0f}s)")
+        drainer.start()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    # Indici in memoria costruiti in background: le prime richieste usano le query sul DB.
+    threading.Thread(target=_warm_indexes, daemon=True, name="warm-indexes").start()
+    host, port = server.server_address[:2]
+    print(f"[server] in ascolto su http://{host}:{port} ({server.workers} worker)")
+    server.serve_forever()
+    # serve_forever termina appena drain chiama shutdown: attende la fine del drain.
+    drainer.join()
+    print("[server] chiuso")
+
+
+def _parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="CustomsAI – servizio HTTP/JSON.")
+    p.add_argument("--host",      default=None, help=f"Indirizzo (default {config.SERVER_HOST})")
+    p.add_argument("--port",      type=int, default=None, help=f"Porta (default {config.SERVER_PORT})")
+    p.add_argument("--workers",   type=int, default=None, help=f"Worker (default {config.SERVER_WORKERS})")
+    p.add_argument("--max-queue", type=int, default=None, help=f"Richieste in attesa oltre i worker (default {config.SERVER_MAX_QUEUE})")
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    serve(create_server(args.host, args.port, args.workers, args.max_queue))
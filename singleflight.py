@@ -0,0 +1,185 @@
+"""
+CustomsAI – Single-flight: coalescenza di chiamate identiche concorrenti
+
+Sotto carico un codice popolare produce decine di lookup_collateral,
+get_embedding e vector_search identici nello stesso istante. Con do(key, fn)
+la prima richiesta (leader) esegue fn, le altre con la stessa chiave
+(follower) ne attendono il risultato invece di ripetere la chiamata:
+
+  - il risultato (o l'eccezione) del leader è condiviso con tutti i follower
+  - nessuna cache: a chiamata terminata la chiave è libera, la successiva riparte
+  - un follower attende al più il proprio deadline (deadline.py); se il leader
+    esaurisce il *suo* deadline, il follower riprova come nuovo leader
+  - do_async(key, coro_fn) è l'equivalente per asyncio (stesso event loop)
+
+Le liste restituite sono copie superficiali per chiamante: i follower non
+vedono le modifiche dell'uno sulla lista dell'altro.
+"""
+
+import asyncio
+import threading
+from collections.abc import Awaitable, Callable, Hashable
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from dataclasses import dataclass
+from typing import TypeVar
+
+import config
+import deadline as deadline_mod
+from deadline import DeadlineExceeded
+
+
+T = TypeVar("T")
+
+# Intervallo di controllo del deadline del follower durante l'attesa.
+_POLL_SECONDS = 0.05
+
+
+@dataclass
+class FlightStats:
+    calls:     int = 0   # chiamate totali a do()/do_async()
+    leaders:   int = 0   # chiamate eseguite davvero
+    coalesced: int = 0   # chiamate servite dal risultato di un leader in volo
+
+
+def _copy(result: T) -> T:
+    return list(result) if isinstance(result, list) else result
+
+
+class Group:
+    """Gruppo di chiamate coalescibili con contatori per nome (es. "lookup_collateral")."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: dict[Hashable, Future] = {}
+        self._async_flights: dict[tuple[int, Hashable], asyncio.Future] = {}
+        self._stats: dict[str, FlightStats] = {}
+
+    def _stat(self, name: str) -> FlightStats:
+        if name not in self._stats:
+            self._stats[name] = FlightStats()
+        return self._stats[name]
+
+    # ── Thread ────────────────────────────────────────────────────────────
+
+    def do(self, name: str, key: Hashable, fn: Callable[[], T]) -> T:
+        """Esegue fn() una sola volta per le chiamate concorrenti con la stessa (name, key)."""
+        if not config.SINGLE_FLIGHT_ENABLED:
+            return fn()
+        flight_key = (name, key)
+        while True:
+            with self._lock:
+                stat = self._stat(name)
+                stat.calls += 1
+                future = self._flights.get(flight_key)
+                leader = future is None
+                if leader:
+                    future = self._flights[flight_key] = Future()
+                    stat.leaders += 1
+                else:
+                    stat.coalesced += 1
+
+            if leader:
+                return _copy(self._lead(flight_key, future, fn))
+            try:
+                return _copy(self._follow(future, name))
+            except DeadlineExceeded:
+                d = deadline_mod.current()
+                if d is not None and (d.cancelled or d.expired()):
+                    raise                # budget del follower: non riprovare
+                with self._lock:         # budget del leader: nuovo tentativo come leader
+                    stat.calls -= 1
+                    stat.coalesced -= 1
+
+    def _lead(self, flight_key: tuple, future: Future, fn: Callable[[], T]) -> T:
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._flights.pop(flight_key, None)
+
+    @staticmethod
+    def _follow(future: Future, name: str) -> T:
+        d = deadline_mod.current()
+        if d is None:
+            return future.result()
+        while True:
+            try:
+                return future.result(timeout=min(_POLL_SECONDS, max(d.remaining(), 0.001)))
+            except FutureTimeout:
+                d.check(name)
+
+    # ── asyncio ───────────────────────────────────────────────────────────
+
+    async def do_async(self, name: str, key: Hashable, coro_fn: Callable[[], Awaitable[T]]) -> T:
+        """Come do() per coroutine: un solo await di coro_fn() per chiave e event loop."""
+        if not config.SINGLE_FLIGHT_ENABLED:
+            return await coro_fn()
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), (name, key))
+        with self._lock:
+            stat = self._stat(name)
+            stat.calls += 1
+            future = self._async_flights.get(flight_key)
+            leader = future is None
+            if leader:
+                future = self._async_flights[flight_key] = loop.create_future()
+                stat.leaders += 1
+            else:
+                stat.coalesced += 1
+
+        if not leader:
+            # shield: la cancellazione di un follower non annulla il risultato condiviso.
+            return _copy(await asyncio.shield(future))
+        try:
+            result = await coro_fn()
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()           # segnato come letto: nessun warning senza follower
+            raise
+        else:
+            future.set_result(result)
+            return _copy(result)
+        finally:
+            with self._lock:
+                self._async_flights.pop(flight_key, None)
+
+    # ── Contatori ─────────────────────────────────────────────────────────
+
+    def stats(self) -> dict[str, dict]:
+        with self._lock:
+            return {
+                name: {"calls": s.calls, "leaders": s.leaders, "coalesced": s.coalesced}
+                for name, s in self._stats.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+# Gruppo di processo usato da retrieval ed embeddings.
+_GROUP = Group()
+
+
+def do(name: str, key: Hashable, fn: Callable[[], T]) -> T:
+    return _GROUP.do(name, key, fn)
+
+
+async def do_async(name: str, key: Hashable, coro_fn: Callable[[], Awaitable[T]]) -> T:
+    return await _GROUP.do_async(name, key, coro_fn)
+
+
+def stats() -> dict[str, dict]:
+    """Contatori per nome: calls, leaders, coalesced."""
+    return _GROUP.stats()
+
+
+def reset() -> None:
+    _GROUP.reset()
@@ -0,0 +1,74 @@
+"""
+CustomsAI – Snapshot locali delle tabelle usate dagli indici in memoria
+
+Gli indici costruiti da intere tabelle (es. gerarchia della nomenclatura)
+leggono le righe da un file JSON locale se ancora valido, evitando di
+rileggere la tabella da Supabase a ogni avvio.
+
+  load_rows(name, fetch)  → righe dallo snapshot, oppure fetch() + salvataggio
+  is_fresh(name)          → True se load_rows() non dovrebbe leggere dal DB
+  invalidate(name)        → forza il refresh al prossimo load_rows()
+
+Posizione: config.CACHE_DIR. Validità: config.SNAPSHOT_TTL_HOURS (0 = sempre refresh).
+"""
+
+import json
+import os
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import config
+
+
+def _path(name: str) -> Path:
+    return Path(config.CACHE_DIR) / f"{name}.json"
+
+
+def _is_fresh(path: Path) -> bool:
+    if not path.exists() or config.SNAPSHOT_TTL_HOURS <= 0:
+        return False
+    age_hours = (time.time() - path.stat().st_mtime) / 3600
+    return age_hours < config.SNAPSHOT_TTL_HOURS
+
+
+def is_fresh(name: str) -> bool:
+    """True se lo snapshot `name` esiste e non è scaduto."""
+    return _is_fresh(_path(name))
+
+
+def load_rows(name: str, fetch: Callable[[], list[dict]]) -> list[dict]:
+    """
+    Restituisce le righe dello snapshot `name`.
+    Se lo snapshot manca, è scaduto o illeggibile, chiama fetch() e lo riscrive.
+    """
+    path = _path(name)
+    if _is_fresh(path):
+        try:
+            rows = json.loads(path.read_text(encoding="utf-8"))
+            print(f"[snapshot] {name} → {len(rows)} righe (cache locale)")
+            return rows
+        except (OSError, ValueError):
+            pass  # snapshot corrotto: si rilegge dal DB
+
+    rows = fetch()
+    _write(path, rows)
+    print(f"[snapshot] {name} → {len(rows)} righe (refresh dal DB)")
+    return rows
+
+
+def invalidate(name: str) -> None:
+    """Elimina lo snapshot `name` (se presente)."""
+    _path(name).unlink(missing_ok=True)
+
+
+def _write(path: Path, rows: list[dict]) -> None:
+    """Scrittura atomica: file temporaneo + rename, mai uno snapshot a metà."""
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(rows, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+    except OSError as e:
+        # Cache non scrivibile (es. filesystem read-only): l'indice funziona comunque.
+        print(f"[snapshot] impossibile salvare {path.name}: {e}")
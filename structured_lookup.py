@@ -9,12 +9,19 @@ It does NOT call the LLM.
 It does NOT modify database schema.
 """
 
+import functools
 from typing import Optional, Dict, Any
-from supabase import create_client
+
 from config import SUPABASE_URL, SUPABASE_SERVICE_KEY
 
 
-supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+@functools.cache
+def _get_client():
+    """
+    Supabase client, created on first lookup (not at import time).
+    """
+    from supabase import create_client
+    return create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 
 
 def lookup_nomenclature(code: str) -> Optional[Dict[str, Any]]:
@@ -22,7 +29,7 @@ def lookup_nomenclature(code: str) -> Optional[Dict[str, Any]]:
     Lookup CN code (8–10 digits).
     """
     response = (
-        supabase
+        _get_client()
         .table("nomenclature")
         .select("*")
         .eq("goods_code", code)
@@ -41,7 +48,7 @@ def lookup_dual_use(code: str) -> Optional[Dict[str, Any]]:
     Lookup Dual Use code (e.g. 1A001).
     """
     response = (
-        supabase
+        _get_client()
         .table("dual_use_items")
         .select("*")
         .eq("code", code)
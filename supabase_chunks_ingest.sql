@@ -0,0 +1,26 @@
+-- CustomsAI – Colonne per l'ingestion incrementale dei chunk (tools/ingest_chunks.py)
+--
+-- chunk_key    → identità stabile del chunk (upsert on_conflict)
+-- content_hash → SHA-256 del testo normalizzato negli spazi (ciò che viene embeddato):
+--                 se invariato il chunk è saltato; un testo già presente sotto un'altra
+--                 chunk_key (es. nuova consolidazione) riusa il suo embedding
+--
+-- Migrazione: le righe già presenti restano con chunk_key NULL e l'upsert non le
+-- vede, quindi il primo caricamento le affianca ai nuovi chunk. Dopo un run completo,
+-- `tools/ingest_chunks.py … --replace-legacy` elimina le righe NULL dei celex ingeriti,
+-- `--prune` le chunk_key non più presenti nei file sorgente.
+
+ALTER TABLE public.chunks ADD COLUMN IF NOT EXISTS chunk_key    text;
+ALTER TABLE public.chunks ADD COLUMN IF NOT EXISTS content_hash text;
+
+CREATE UNIQUE INDEX IF NOT EXISTS chunks_chunk_key_key ON public.chunks (chunk_key);
+CREATE INDEX IF NOT EXISTS chunks_content_hash_idx ON public.chunks (content_hash);
+
+-- Ricalcolo degli hash con la stessa normalizzazione di content_hash() in Python
+-- (spazi iniziali/finali rimossi, sequenze di spazi → uno spazio): vale anche per le
+-- righe legacy e per quelle con l'hash precedente (testo + celex), così i loro
+-- embedding diventano riusabili. Una differenza residua costa solo un ricalcolo.
+UPDATE public.chunks
+SET content_hash = encode(sha256(convert_to(
+        regexp_replace(btrim(text, E' \t\n\r\f\v'), '\s+', ' ', 'g'), 'UTF8')), 'hex')
+WHERE text IS NOT NULL;
@@ -0,0 +1,45 @@
+-- CustomsAI – RPC per la vector search con selezione MMR
+-- Deployare nel SQL Editor di Supabase insieme a supabase_rpc.sql.
+--
+-- FUNZIONI:
+--   search_chunks_multi_type_mmr(query_embedding, match_count, type_filters)
+--     → come search_chunks_multi_type, ma restituisce anche l'embedding di ogni
+--       chunk (real[]) per la selezione Maximal Marginal Relevance lato Python
+--       (retrieval._vector_search_mmr, con MMR_ENABLED=true).
+--
+-- NOTE:
+--   - match_count è già moltiplicato per MMR_OVERFETCH dal client.
+--   - embedding::real[] → array JSON (evita il parsing della stringa pgvector).
+
+
+drop function if exists search_chunks_multi_type_mmr(vector, int, text[]);
+
+create or replace function search_chunks_multi_type_mmr(
+  query_embedding vector(1536),
+  match_count     int,
+  type_filters    text[] default null
+)
+returns table(
+  text               text,
+  metadata           jsonb,
+  celex_consolidated text,
+  source_url         text,
+  similarity         float,
+  embedding          real[]
+)
+language sql
+stable
+as $$
+  select
+    c.text,
+    c.metadata,
+    c.celex_consolidated,
+    c.source_url,
+    1 - (c.embedding <=> query_embedding) as similarity,
+    c.embedding::real[]                   as embedding
+  from public.chunks c
+  where type_filters is null
+     or c.unit_type = any(type_filters)
+  order by c.embedding <=> query_embedding
+  limit match_count;
+$$;
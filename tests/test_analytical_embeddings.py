@@ -0,0 +1,53 @@
+"""
+Level 1 – Unit test: analytical_embeddings.py (store embedding query analitica DU)
+
+Testa:
+  - query analitica costruita sui primi 3 codici
+  - hit esatto sulla combinazione
+  - media normalizzata dei vettori per codice
+  - None se un codice manca o lo store non esiste
+Usa un file .npz temporaneo, nessuna chiamata esterna.
+"""
+
+import numpy as np
+import pytest
+
+import analytical_embeddings as ae
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr("config.ANALYTICAL_EMBEDDINGS_FILE", tmp_path / "analytical.npz")
+    monkeypatch.setattr(ae, "_STORE", None)
+    ae.save_store(
+        ["3E001", "3A001", "3E001 3A001"],
+        [[1.0, 0.0], [0.0, 1.0], [0.6, 0.8]],
+    )
+    yield
+    monkeypatch.setattr(ae, "_STORE", None)
+
+
+def test_analytical_query_uses_first_three_codes():
+    assert ae.analytical_query(["A", "B", "C", "D"]) == "obblighi autorizzazione esportazione A B C"
+
+
+def test_exact_hit(store):
+    vector, how = ae.lookup(["3E001", "3A001"])
+    assert how == "exact"
+    assert vector == pytest.approx([0.6, 0.8])
+
+
+def test_mean_of_per_code_vectors(store):
+    vector, how = ae.lookup(["3A001", "3E001"])
+    assert how == "mean"
+    assert vector == pytest.approx([np.sqrt(0.5), np.sqrt(0.5)])
+
+
+def test_missing_code_returns_none(store):
+    assert ae.lookup(["3E001", "9Z999"]) is None
+
+
+def test_missing_store_returns_none(tmp_path, monkeypatch):
+    monkeypatch.setattr("config.ANALYTICAL_EMBEDDINGS_FILE", tmp_path / "assente.npz")
+    monkeypatch.setattr(ae, "_STORE", None)
+    assert ae.lookup(["3E001"]) is None
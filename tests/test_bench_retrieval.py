@@ -0,0 +1,113 @@
+"""
+Level 2 – Unit test: tools/bench_retrieval.py (vector search finta)
+
+Testa:
+  - golden set JSONL: riferimenti obbligatori, normalizzazione in maiuscolo
+  - recall: CELEX, codici come sotto-voce di metadata.code o nel testo
+  - griglia TOP_K × filtri × soglie: filtri "pipeline" (ANNEX_CODE per CLASSIFICATION)
+    con fallback globale, soglie che accorciano il contesto
+  - frontiera di Pareto e raccomandazione della combinazione più economica
+Nessuna dipendenza esterna.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tools.bench_retrieval import (
+    GoldenItem,
+    load_golden,
+    pareto_front,
+    recall,
+    recommend,
+    render_text,
+    run_benchmark,
+)
+
+
+def _chunk(i: int, celex: str | None = None, code: str | None = None, text: str = "testo") -> dict:
+    return {
+        "chunk_text": text * 20,
+        "metadata": {"code": code} if code else {},
+        "celex_consolidated": celex,
+        "similarity": round(0.9 - 0.05 * i, 2),
+    }
+
+
+def test_load_golden(tmp_path):
+    path = tmp_path / "g.jsonl"
+    path.write_text(
+        '# commento\n{"question": "obblighi", "expected_celex": ["32021r0821"], "expected_codes": ["5d002"]}\n',
+        encoding="utf-8",
+    )
+    assert load_golden(path) == [GoldenItem("obblighi", ["32021R0821"], ["5D002"])]
+
+    path.write_text('{"question": "senza riferimenti"}\n', encoding="utf-8")
+    with pytest.raises(ValueError, match=":1:"):
+        load_golden(path)
+
+
+def test_recall_matches_celex_and_codes():
+    item = GoldenItem("q", ["32021R0821"], ["8544", "5D002"])
+    chunks = [
+        _chunk(0, celex="32021R0821"),
+        _chunk(1, code="8544000000 80"),            # sotto-voce di 8544
+        _chunk(2, text="Voce 5D002 software "),    # codice nel testo
+    ]
+    assert recall(item, chunks) == 1.0
+    assert recall(item, chunks[:1]) == pytest.approx(1 / 3)
+    assert recall(item, []) == 0.0
+
+
+def test_grid_filters_thresholds_and_fallback():
+    items = [
+        GoldenItem("obblighi dell'esportatore", ["32021R0821"]),
+        GoldenItem("che codice ha un sensore acustico", [], ["6A001"], intent="classification"),
+    ]
+    calls: list[tuple[int, tuple]] = []
+
+    def search(vector, k, filters):
+        calls.append((k, tuple(filters or ())))
+        if filters == ["ANNEX_CODE"]:
+            return []                                       # → fallback globale
+        rows = [_chunk(i) for i in range(k)]
+        rows[k - 1] = _chunk(k - 1, celex="32021R0821", code="6A001")
+        return rows
+
+    results = run_benchmark(
+        items, top_ks=(2, 4), filter_modes=("none", "pipeline"), thresholds=(0.0, 0.8),
+        search=search, embed=lambda text: [0.0],
+    )
+    configs = {(c["filters"], c["top_k"], c["threshold"]): c for c in results["configs"]}
+
+    assert len(results["configs"]) == 8
+    assert configs[("none", 2, 0.0)]["recall"] == 1.0
+    # Soglia 0.8: l'ultimo chunk (similarity 0.85 con k=2, 0.75 con k=4) viene scartato a k=4.
+    assert configs[("none", 4, 0.8)]["recall"] == 0.0
+    assert configs[("none", 4, 0.8)]["tokens"] < configs[("none", 4, 0.0)]["tokens"]
+    # Pipeline: la domanda CLASSIFICATION prova ANNEX_CODE, poi ricade sulla ricerca globale.
+    assert (2, ("ANNEX_CODE",)) in calls and configs[("pipeline", 2, 0.0)]["hit_rate"] == 1.0
+
+
+def _config(k: int, threshold: float, recall_: float, tokens: int, p95: float) -> dict:
+    return {"filters": "none", "top_k": k, "threshold": threshold, "recall": recall_,
+            "hit_rate": 1.0, "tokens": tokens, "p50_ms": p95 / 2, "p95_ms": p95}
+
+
+def test_recommend_picks_cheapest_within_tolerance():
+    configs = [
+        _config(20, 0.0, 0.95, 4000, 90.0),
+        _config(10, 0.0, 0.94, 2000, 70.0),
+        _config(5,  0.0, 0.80, 1000, 60.0),
+        _config(15, 0.4, 0.90, 2500, 80.0),
+    ]
+    assert recommend(configs)["top_k"] == 10
+    assert recommend(configs, tolerance=0.2)["top_k"] == 5
+    assert [c["top_k"] for c in pareto_front(configs)] == [20, 10, 5]
+
+    text = render_text({"questions": 4, "embedding_ms": 12.0, "configs": configs})
+    assert "Consigliato: none/k=10/t=0" in text
+    assert "frontiera di Pareto" in text
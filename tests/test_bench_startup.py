@@ -0,0 +1,60 @@
+"""
+Level 2 – Integration test: tools/bench_startup.py (processi Python nuovi)
+
+Testa:
+  - parsing di `-X importtime`: intestazione ignorata, profondità dal rientro,
+    costo per package di primo livello
+  - `import main` non carica openai, supabase né numpy (import differiti)
+  - lookup diretto CODE_SPECIFIC (codice DU e codice NC) con Supabase stand-in:
+    mode "direct", nessun import di openai/numpy, nessuna lettura di intere tabelle
+Nessuna dipendenza esterna.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tools.bench_startup import (
+    DEFAULT_QUESTIONS,
+    DEFERRED_ON_DIRECT,
+    FULL_SCAN_STUB_MS,
+    measure_direct_path,
+    measure_import,
+    package_costs,
+    parse_importtime,
+)
+
+
+_IMPORTTIME = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |     _io
+import time:       300 |        500 |   openai._models
+import time:       200 |        700 | openai
+import time:        50 |        800 | main
+"""
+
+
+def test_parse_importtime_and_package_costs():
+    rows = parse_importtime(_IMPORTTIME)
+    assert rows[1] == ("openai._models", 300, 500, 1)
+    assert rows[-1] == ("main", 50, 800, 0)
+    assert package_costs(rows) == {"openai": 0.5, "_io": 0.12, "main": 0.05}
+
+
+def test_import_main_defers_heavy_packages():
+    report = measure_import("main", repeats=1)
+    assert report["deferred_loaded"] == []
+    assert report["cumulative_ms"] > 0
+
+
+@pytest.mark.parametrize("question", DEFAULT_QUESTIONS)
+def test_direct_path_needs_no_openai_nor_full_scans(question):
+    report = measure_direct_path(question, repeats=1, target_ms=60_000)
+    assert (report["intent"], report["mode"]) == ("code_specific", "direct")
+    assert "openai" in DEFERRED_ON_DIRECT and report["deferred_loaded"] == []
+    # Indice gerarchico / grafo non pronti → query sul DB, nessuna tabella letta per intero.
+    assert report["query_ms"] < FULL_SCAN_STUB_MS
+    assert report["ok"]
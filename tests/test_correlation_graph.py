@@ -0,0 +1,76 @@
+"""
+Level 1 – Unit test: correlation_graph.py (grafo NC→DU in memoria)
+
+Testa:
+  - mappa diretta prefix-aware (NC → DU)
+  - mappa inversa con sotto-voci (DU → NC)
+  - righe raw per sorgente (exact/prefix) e per destinazione
+Nessuna dipendenza esterna.
+"""
+
+import pytest
+
+from correlation_graph import CorrelationGraph
+
+
+ROWS = [
+    {"cn_codes_2026": "8544300000", "dual_use_codification": "3E001"},
+    {"cn_codes_2026": "8544300000", "dual_use_codification": "3E001"},   # duplicato
+    {"cn_codes_2026": "8544420000", "dual_use_codification": "3A001"},
+    {"cn_codes_2026": "8542310000", "dual_use_codification": "3E001"},
+    {"cn_codes_2026": "8704229100", "dual_use_codification": "9a115b"},
+    {"cn_codes_2026": "8471300000", "dual_use_codification": ""},        # scartata
+]
+
+
+@pytest.fixture
+def graph():
+    return CorrelationGraph(ROWS, "cn_codes_2026", "dual_use_codification")
+
+
+def test_size_counts_distinct_edges(graph):
+    assert len(graph) == 4
+
+
+@pytest.mark.parametrize("prefix,expected", [
+    ("8544300000", ["3E001"]),
+    ("8544",       ["3E001", "3A001"]),
+    ("85",         ["3E001", "3A001"]),
+    ("8704",       ["9A115B"]),
+    ("9999",       []),
+])
+def test_forward_prefix_aware(graph, prefix, expected):
+    assert graph.forward(prefix) == expected
+
+
+def test_reverse(graph):
+    assert graph.reverse("3E001") == ["8542310000", "8544300000"]
+
+
+def test_reverse_includes_sub_items(graph):
+    assert graph.reverse("9A115") == ["8704229100"]
+
+
+def test_reverse_case_insensitive(graph):
+    assert graph.reverse("3e001") == ["8542310000", "8544300000"]
+
+
+def test_reverse_unknown(graph):
+    assert graph.reverse("1A001") == []
+
+
+def test_rows_for_source_prefix_sorted(graph):
+    rows = graph.rows_for_source("854")
+    assert [r["cn_codes_2026"] for r in rows] == [
+        "8542310000", "8544300000", "8544300000", "8544420000",
+    ]
+
+
+def test_rows_for_source_exact(graph):
+    assert graph.rows_for_source("8544", prefix=False) == []
+    assert len(graph.rows_for_source("8544420000", prefix=False)) == 1
+
+
+def test_rows_for_target_sorted_by_source(graph):
+    rows = graph.rows_for_target("3E001")
+    assert [r["cn_codes_2026"] for r in rows] == ["8542310000", "8544300000", "8544300000"]
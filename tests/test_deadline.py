@@ -0,0 +1,88 @@
+"""
+Level 1 – Unit test: deadline.py + integrazione con resilience.call
+
+Testa:
+  - budget, timeout per chiamata, cancellazione da un altro thread
+  - resilience.call smette di attendere una chiamata lenta alla scadenza
+  - nessun retry oltre il budget residuo
+Nessuna dipendenza esterna.
+"""
+
+import threading
+import time
+
+import pytest
+
+import deadline as deadline_mod
+import resilience
+from deadline import Deadline, DeadlineExceeded, QueryCancelled, call_timeout
+
+
+@pytest.fixture(autouse=True)
+def _reset():
+    resilience.reset()
+    yield
+    resilience.reset()
+
+
+def test_remaining_and_call_timeout():
+    d = Deadline(10)
+    assert 9 < d.remaining() <= 10
+    assert call_timeout(120) == 120                 # nessun deadline attivo
+    with deadline_mod.active(d):
+        assert call_timeout(120) <= 10
+        assert call_timeout(1) == 1
+    assert deadline_mod.current() is None
+
+
+def test_no_limit_but_cancellable():
+    d = Deadline(None)
+    d.check("stadio")
+    d.cancel()
+    with pytest.raises(QueryCancelled):
+        d.check("stadio")
+
+
+def test_expired_check_raises():
+    d = Deadline(0)
+    with pytest.raises(DeadlineExceeded):
+        d.check("llm")
+
+
+def test_call_stops_waiting_at_deadline():
+    release = threading.Event()
+    with deadline_mod.active(Deadline(0.2)):
+        start = time.perf_counter()
+        with pytest.raises(DeadlineExceeded):
+            resilience.call("dep", lambda: release.wait(5))
+    assert time.perf_counter() - start < 1.0
+    release.set()
+    # La scadenza del chiamante non conta come guasto della dipendenza.
+    assert resilience.metrics_snapshot()["dep"]["breaker_state"] == "closed"
+
+
+def test_cancel_from_other_thread():
+    d = Deadline(None)
+    release = threading.Event()
+    threading.Timer(0.1, d.cancel).start()
+    with deadline_mod.active(d):
+        with pytest.raises(QueryCancelled):
+            resilience.call("dep", lambda: release.wait(5))
+    release.set()
+
+
+def test_no_retry_beyond_budget(monkeypatch):
+    monkeypatch.setattr("config.RETRY_MAX_ATTEMPTS", 5)
+    monkeypatch.setattr("config.RETRY_BASE_DELAY", 10.0)
+    monkeypatch.setattr("config.RETRY_MAX_DELAY", 10.0)
+    monkeypatch.setattr("resilience.random.uniform", lambda a, b: b)
+    calls = {"n": 0}
+
+    def fn():
+        calls["n"] += 1
+        raise TimeoutError("lento")
+
+    with deadline_mod.active(Deadline(1.0)):
+        with pytest.raises(TimeoutError):
+            resilience.call("dep", fn)
+    assert calls["n"] == 1
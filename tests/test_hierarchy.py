@@ -0,0 +1,101 @@
+"""
+Level 1 – Unit test: hierarchy.py (indice gerarchico in memoria)
+
+Testa la costruzione dell'albero da goods_code + indent + hier_pos:
+  - percorso radice → nodo (capitolo, voce, livelli "-")
+  - figli diretti e dimensione dei sottoalberi
+  - risoluzione del codice digitato (padding, suffisso dichiarabile)
+Nessuna dipendenza esterna.
+"""
+
+import pytest
+
+from hierarchy import HierarchyIndex
+
+
+# ── Fixture: estratto del capitolo 85 ────────────────────────────────────────
+
+ROWS = [
+    {"goods_code": "8500000000 80", "description": "CAPITOLO 85",         "indent": None,    "hier_pos": 1},
+    {"goods_code": "8543000000 80", "description": "Macchine elettriche", "indent": None,    "hier_pos": 2},
+    {"goods_code": "8544000000 80", "description": "Fili isolati",        "indent": None,    "hier_pos": 3},
+    {"goods_code": "8544110000 10", "description": "Fili per avvolgimenti", "indent": "-",   "hier_pos": 4},
+    {"goods_code": "8544110000 80", "description": "di rame",             "indent": "- -",   "hier_pos": 5},
+    {"goods_code": "8544111000 80", "description": "smaltati",            "indent": "- - -", "hier_pos": 6},
+    {"goods_code": "8544119000 80", "description": "altri",               "indent": "- - -", "hier_pos": 7},
+    {"goods_code": "8544190000 80", "description": "altri",               "indent": "- -",   "hier_pos": 8},
+    {"goods_code": "8544200000 80", "description": "Cavi coassiali",      "indent": "-",     "hier_pos": 9},
+]
+
+
+@pytest.fixture
+def index():
+    return HierarchyIndex(ROWS, "goods_code")
+
+
+def _codes(rows: list[dict]) -> list[str]:
+    return [r["goods_code"] for r in rows]
+
+
+# ── Costruzione ──────────────────────────────────────────────────────────────
+
+def test_all_rows_indexed(index):
+    assert len(index) == len(ROWS)
+    assert _codes([n.row for n in index.roots]) == ["8500000000 80"]
+
+
+def test_order_from_hier_pos_not_input_order():
+    index = HierarchyIndex(list(reversed(ROWS)), "goods_code")
+    assert _codes(index.children("8544000000 80")) == ["8544110000 10", "8544200000 80"]
+
+
+# ── Percorso alla radice ─────────────────────────────────────────────────────
+
+def test_path_of_leaf(index):
+    assert _codes(index.path("8544111000 80")) == [
+        "8500000000 80", "8544000000 80", "8544110000 10",
+        "8544110000 80", "8544111000 80",
+    ]
+
+
+def test_ancestors_exclude_node(index):
+    assert _codes(index.ancestors("8544200000 80")) == ["8500000000 80", "8544000000 80"]
+
+
+def test_path_unknown_key_empty(index):
+    assert index.path("0000000000 80") == []
+
+
+# ── Figli e sottoalberi ──────────────────────────────────────────────────────
+
+def test_children_of_heading(index):
+    assert _codes(index.children("8544000000 80")) == ["8544110000 10", "8544200000 80"]
+
+
+def test_children_of_chapter(index):
+    assert _codes(index.children("8500000000 80")) == ["8543000000 80", "8544000000 80"]
+
+
+def test_subtree_sizes(index):
+    assert index.subtree_size("8500000000 80") == 9
+    assert index.subtree_size("8544000000 80") == 7
+    assert index.subtree_size("8544110000 80") == 3
+    assert index.subtree_size("8544119000 80") == 1
+    assert index.subtree_size("9999999999 80") == 0
+
+
+# ── Risoluzione codice utente ────────────────────────────────────────────────
+
+@pytest.mark.parametrize("code,expected", [
+    ("85",         "8500000000 80"),
+    ("8544",       "8544000000 80"),
+    ("854411",     "8544110000 80"),   # suffisso 80 preferito alla riga di raggruppamento
+    ("8544111000", "8544111000 80"),
+])
+def test_resolve(index, code, expected):
+    assert index.resolve(code) == expected
+
+
+def test_resolve_unknown_code(index):
+    assert index.resolve("8545") is None
+    assert index.resolve("") is None
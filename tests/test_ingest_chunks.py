@@ -0,0 +1,217 @@
+"""
+Test per tools/ingest_chunks.py – pipeline con embedding e upsert finti.
+
+Livello 1: content_hash, chunk_key (ordinale per chunk con gli stessi metadata),
+           iter_source_chunks (checkpoint per percorso + dimensione + mtime, righe non
+           valide), run_ingestion (solo chunk modificati, batch, token, checkpoint con
+           batch fuori ordine e batch fallito, chunk_key ripetuta nello stesso batch,
+           riuso degli embedding per content_hash), stale_keys (--prune), render_report.
+"""
+
+import json
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tools.ingest_chunks import (
+    IngestReport,
+    checkpoint_key,
+    chunk_key,
+    content_hash,
+    iter_source_chunks,
+    render_report,
+    run_ingestion,
+    stale_keys,
+)
+
+
+def _write_jsonl(path: Path, n: int, bad_line: bool = False) -> Path:
+    lines = [
+        json.dumps({"text": f"Articolo {i} – testo", "metadata": {"unit_type": "ARTICLE", "n": i},
+                    "celex_consolidated": "32021R0821"})
+        for i in range(1, n + 1)
+    ]
+    if bad_line:
+        lines.insert(1, "{non json")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return path
+
+
+def _fake_embed(texts):
+    return [[float(len(t))] for t in texts], 10 * len(texts)
+
+
+# ── hash e chiavi ─────────────────────────────────────────────────────────────
+
+def test_content_hash_covers_only_the_embedded_text():
+    assert content_hash("a  b\n") == content_hash("a b")
+    assert content_hash("a b") != content_hash("a c")
+
+
+def test_chunk_key_explicit_or_from_metadata():
+    assert chunk_key({"key": "art-3"}) == "art-3"
+    a = chunk_key({"celex_consolidated": "X", "metadata": {"n": 1, "t": "A"}})
+    b = chunk_key({"celex_consolidated": "X", "metadata": {"t": "A", "n": 1}})
+    assert a == b and len(a) == 32
+    assert chunk_key({"celex_consolidated": "X", "metadata": {"n": 1}}, 1) != chunk_key(
+        {"celex_consolidated": "X", "metadata": {"n": 1}}, 0)
+
+
+def test_chunks_with_same_metadata_get_distinct_stable_keys(tmp_path):
+    # Articolo spezzato in tre chunk con gli stessi metadata.
+    path = tmp_path / "c.jsonl"
+    path.write_text("\n".join(
+        json.dumps({"text": f"parte {i}", "metadata": {"unit_type": "ARTICLE", "n": 7},
+                    "celex_consolidated": "X"})
+        for i in range(3)) + "\n", encoding="utf-8")
+    keys = [c.key for c in iter_source_chunks([path], {}, IngestReport())]
+    assert len(set(keys)) == 3
+
+    # Ripresa dal checkpoint: le righe saltate contano comunque per l'ordinale.
+    resumed = list(iter_source_chunks([path], {checkpoint_key(path): 2}, IngestReport()))
+    assert [c.key for c in resumed] == keys[2:]
+
+
+# ── iter_source_chunks ───────────────────────────────────────────────────────
+
+def test_iter_source_chunks_skips_checkpoint_and_invalid(tmp_path):
+    path = _write_jsonl(tmp_path / "c.jsonl", 3, bad_line=True)
+    report = IngestReport()
+    chunks = list(iter_source_chunks([path], {checkpoint_key(path): 2}, report))
+    assert [c.line for c in chunks] == [3, 4]
+    assert report.skipped == 2 and report.read == 2 and report.invalid == 0
+
+
+def test_regenerated_file_is_read_again(tmp_path):
+    path = _write_jsonl(tmp_path / "c.jsonl", 3)
+    checkpoint: dict = {}
+    run_ingestion(iter_source_chunks([path], checkpoint, IngestReport()), {}, _fake_embed,
+                  lambda rows: None, IngestReport(), batch_size=2, checkpoint=checkpoint)
+    assert checkpoint == {checkpoint_key(path): 3}
+
+    # Stesso percorso, contenuto nuovo: nessuna riga saltata, voce vecchia rimossa.
+    _write_jsonl(path, 4)
+    report = IngestReport()
+    chunks = list(iter_source_chunks([path], checkpoint, report))
+    assert len(chunks) == 4 and report.skipped == 0
+    assert checkpoint == {}
+
+
+def test_repeated_key_in_batch_keeps_last_occurrence(tmp_path):
+    path = tmp_path / "c.jsonl"
+    path.write_text("\n".join(
+        json.dumps({"key": "art-1", "text": t, "celex_consolidated": "X"}) for t in ("v1", "v2")
+    ) + "\n", encoding="utf-8")
+    upserts: list[list[dict]] = []
+    run_ingestion(iter_source_chunks([path], {}, IngestReport()), {}, _fake_embed,
+                  upserts.append, IngestReport(), batch_size=10)
+    assert [[r["text"] for r in batch] for batch in upserts] == [["v2"]]
+
+
+# ── run_ingestion ────────────────────────────────────────────────────────────
+
+def test_only_new_or_changed_chunks_are_embedded(tmp_path):
+    path = _write_jsonl(tmp_path / "c.jsonl", 5)
+    report = IngestReport()
+    chunks = list(iter_source_chunks([path], {}, report))
+    existing = {chunks[0].key: chunks[0].hash, chunks[1].key: "hash-vecchio"}
+    upserts: list[list[dict]] = []
+
+    run_ingestion(chunks, existing, _fake_embed, upserts.append, report, batch_size=2, concurrency=2)
+
+    written = [r["chunk_key"] for batch in upserts for r in batch]
+    assert sorted(written) == sorted(c.key for c in chunks[1:])
+    assert all("embedding" in r for batch in upserts for r in batch)
+    assert report.unchanged == 1 and report.embedded == 4 and report.batches == 2
+    assert report.tokens == 40
+
+
+def test_checkpoint_waits_for_out_of_order_batches(tmp_path):
+    path = _write_jsonl(tmp_path / "c.jsonl", 4)
+    report = IngestReport()
+    release_first = threading.Event()
+
+    def _embed(texts):
+        if texts[0].startswith("Articolo 1 "):
+            release_first.wait(2)          # il primo batch termina per ultimo
+        return _fake_embed(texts)
+
+    saved: list[dict] = []
+
+    def _upsert(rows):
+        if rows[0]["text"].startswith("Articolo 3 "):
+            release_first.set()
+
+    run_ingestion(
+        iter_source_chunks([path], {}, report), {}, _embed, _upsert, report,
+        batch_size=2, concurrency=2, checkpoint={},
+        on_checkpoint=lambda cp: saved.append(dict(cp)),
+    )
+
+    source = checkpoint_key(path)
+    assert saved[0] == {source: 4}         # mai {…: 2} prima che il batch 1 sia scritto
+    assert saved[-1] == {source: 4}
+
+
+def test_failed_batch_blocks_checkpoint(tmp_path):
+    path = _write_jsonl(tmp_path / "c.jsonl", 4)
+    report = IngestReport()
+
+    def _embed(texts):
+        if texts[0].startswith("Articolo 3 "):
+            raise RuntimeError("503")
+        return _fake_embed(texts)
+
+    checkpoint: dict = {}
+    run_ingestion(
+        iter_source_chunks([path], {}, report), {}, _embed, lambda rows: None, report,
+        batch_size=2, concurrency=1, checkpoint=checkpoint,
+    )
+
+    assert checkpoint == {checkpoint_key(path): 2}
+    assert report.embedded == 2
+    assert "RuntimeError: 503" in report.errors[0]
+    assert "Errori (1)" in render_report(report)
+
+
+def test_new_consolidation_reuses_embeddings_and_prunes_old_keys(tmp_path):
+    # Consolidazione precedente già in tabella.
+    old = _write_jsonl(tmp_path / "old.jsonl", 3)
+    old_chunks = list(iter_source_chunks([old], {}, IngestReport()))
+    existing = {c.key: c.hash for c in old_chunks}
+    stored = {c.hash: [42.0] for c in old_chunks}
+
+    # Nuova consolidazione: stesso testo tranne l'articolo 3, celex diverso.
+    new = tmp_path / "new.jsonl"
+    new.write_text("\n".join(
+        json.dumps({"text": f"Articolo {i} – testo" + (" modificato" if i == 3 else ""),
+                    "metadata": {"unit_type": "ARTICLE", "n": i},
+                    "celex_consolidated": "32021R0821-20240101"})
+        for i in range(1, 4)) + "\n", encoding="utf-8")
+    embedded: list[str] = []
+    lookups: list[list[str]] = []
+
+    def _embed(texts):
+        embedded.extend(texts)
+        return _fake_embed(texts)
+
+    def _reuse(hashes):
+        lookups.append(hashes)
+        return {h: stored[h] for h in hashes if h in stored}
+
+    seen: dict = {}
+    upserts: list[list[dict]] = []
+    report = IngestReport()
+    run_ingestion(iter_source_chunks([new], {}, report, seen), existing, _embed, upserts.append,
+                  report, batch_size=10, reuse_fn=_reuse)
+
+    assert embedded == ["Articolo 3 – testo modificato"]
+    assert report.reused == 2 and report.embedded == 1 and report.upserted == 3
+    assert [r["embedding"] for r in upserts[0]] == [[42.0], [42.0], [29.0]]
+    assert "Embedding riusati:    2" in render_report(report)
+    assert set(seen.values()) == {"32021R0821-20240101"}
+    assert stale_keys([c.key for c in old_chunks], seen) == sorted(c.key for c in old_chunks)
+    assert stale_keys([c.key for c in old_chunks], {**seen, old_chunks[0].key: "X"}) == sorted(
+        c.key for c in old_chunks[1:])
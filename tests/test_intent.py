@@ -6,7 +6,7 @@ Nessuna dipendenza esterna.
 """
 
 import pytest
-from retrieval import detect_intent, Intent
+from retrieval import asks_reverse_correlation, detect_intent, Intent
 
 
 # ── PROCEDURAL ───────────────────────────────────────────────────────────────
@@ -64,3 +64,27 @@ def test_procedural_beats_classification():
     """Se la query ha sia keyword classificazione che procedurale, vince PROCEDURAL."""
     query = "che codice devo usare per esportare?"
     assert detect_intent(query) == Intent.PROCEDURAL
+
+
+# ── REVERSE_CORRELATION ──────────────────────────────────────────────────────
+
+@pytest.mark.parametrize("query", [
+    "quali codici NC sono soggetti a 3E001",
+    "quali voci doganali corrispondono a 2B002",
+    "quali merci ricadono nel 3A001",
+])
+def test_reverse_correlation_intent(query):
+    assert detect_intent(query) == Intent.REVERSE_CORRELATION
+
+@pytest.mark.parametrize("query, expected", [
+    ("quali merci richiedono autorizzazione per l'esportazione", Intent.PROCEDURAL),
+    ("quali prodotti hanno la stessa classificazione", Intent.CLASSIFICATION),
+])
+def test_reverse_keyword_does_not_override_keyword_intent(query, expected):
+    """
+    Le keyword inverse hanno la priorità più bassa: senza codice una domanda
+    procedurale o di classificazione conserva il suo intent (main.py sceglie
+    REVERSE_CORRELATION solo per codici con indice inverso).
+    """
+    assert detect_intent(query) == expected
+    assert asks_reverse_correlation(query)
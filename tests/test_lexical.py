@@ -0,0 +1,67 @@
+"""
+Level 1 – Unit test: lexical.py (indice BM25 in memoria)
+
+Testa:
+  - tokenizzazione italiana (elisioni, accenti, stopword, "2021/821" come un token)
+  - termini ancora (numeri, frasi tra virgolette)
+  - ranking BM25 e postings CSR compatti
+  - confidence: decisivo solo con ancore presenti, copertura e margine sufficienti
+Nessuna dipendenza esterna (solo NumPy).
+"""
+
+import numpy as np
+
+from lexical import BM25Index, anchor_terms, confidence, tokenize
+
+
+DOCS = [
+    "Articolo 22 – Le autorizzazioni per il trasferimento all'interno dell'Unione.",
+    "Articolo 3 – È richiesta un'autorizzazione per l'esportazione dei prodotti a duplice uso.",
+    "Articolo 12 – Autorizzazioni generali di esportazione dell'Unione.",
+    "Regolamento (UE) 2021/821 del Parlamento europeo e del Consiglio.",
+]
+
+
+def test_tokenize_italian():
+    assert tokenize("dell'articolo 22 del Regolamento (UE) 2021/821") == [
+        "articolo", "22", "regolamento", "ue", "2021/821",
+    ]
+    assert tokenize("È richiesta più attenzione") == ["richiesta", "attenzione"]
+
+
+def test_anchor_terms():
+    assert anchor_terms("cosa prevede l'articolo 22?") == ["22"]
+    assert anchor_terms('definizione di "duplice uso"') == ["duplice", "uso"]
+    assert anchor_terms("quali sono gli obblighi generali") == []
+
+
+def test_postings_are_compact_csr():
+    index = BM25Index(DOCS)
+    assert len(index) == 4
+    assert index.doc_ids.dtype == np.int32
+    assert index.indptr[-1] == len(index.doc_ids) == len(index.tfs)
+    docs, _ = index._postings(index.vocab["articolo"])
+    assert list(docs) == [0, 1, 2]
+
+
+def test_search_ranks_exact_article_first():
+    index = BM25Index(DOCS)
+    hits = index.search("cosa prevede l'articolo 22", top_k=3)
+    assert hits[0].doc == 0
+    assert hits[0].anchors is True
+    assert hits[0].coverage == 1.0
+    assert all(h.score > 0 for h in hits)
+    assert [h.score for h in hits] == sorted((h.score for h in hits), reverse=True)
+
+
+def test_search_unknown_terms_empty():
+    assert BM25Index(DOCS).search("zzz yyy", top_k=5) == []
+
+
+def test_confidence_requires_anchor():
+    index = BM25Index(DOCS)
+    assert confidence(index.search("articolo 22", 5), 0.8, 1.2) is True
+    # Nessun termine ancora → la vector search resta necessaria.
+    assert confidence(index.search("autorizzazioni esportazione", 5), 0.8, 1.2) is False
+    # Ancora assente dal corpus → copertura insufficiente.
+    assert confidence(index.search("articolo 99", 5), 0.8, 1.2) is False
@@ -0,0 +1,130 @@
+"""
+Level 2 – Integration test: tools/loadtest.py (stand-in di Supabase e OpenAI)
+
+Testa:
+  - corpus JSONL: commenti ignorati, domanda mancante → errore con riga
+  - percentile nearest-rank e istogramma a bucket
+  - closed loop su main.query(): intent dai risultati, lookup diretti senza latenza LLM
+  - open loop: arrivi al tasso richiesto
+  - server in processo saturo → errori HTTP 503 contati nel report
+  - stand_ins() ripristina client e indici in memoria all'uscita
+  - CLI --stub: ogni latenza arriva al campo giusto di Stubs (riga settings)
+Nessuna dipendenza esterna.
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import retrieval
+import tools.loadtest as loadtest
+from tools.loadtest import (
+    Stubs,
+    histogram,
+    http_target,
+    in_process_server,
+    load_corpus,
+    local_target,
+    percentile,
+    run_closed_loop,
+    run_open_loop,
+    stand_ins,
+    summarize,
+)
+
+
+_FAST = Stubs(supabase_ms=2, embedding_ms=5, llm_ms=60, jitter=0.0)
+
+_CORPUS = [
+    {"question": "Cosa è il bene 2B002?"},
+    {"question": "Quali obblighi ha l'esportatore per esportare 2B002?"},
+    {"question": "Che codice ha un sensore acustico subacqueo?"},
+    {"question": "Chi è l'autorità competente?"},
+]
+
+
+def test_load_corpus(tmp_path):
+    path = tmp_path / "c.jsonl"
+    path.write_text('# commento\n{"question": "2B002", "intent": "code_specific"}\n\n', encoding="utf-8")
+    assert load_corpus(path) == [{"question": "2B002", "intent": "code_specific"}]
+
+    path.write_text('{"question": "ok"}\n{"intent": "generic"}\n', encoding="utf-8")
+    with pytest.raises(ValueError, match=":2:"):
+        load_corpus(path)
+
+
+def test_percentile_and_histogram():
+    values = [float(v) for v in range(1, 101)]
+    assert (percentile(values, 50), percentile(values, 95), percentile(values, 99)) == (50.0, 95.0, 99.0)
+    assert percentile([], 50) == 0.0
+    buckets = dict(histogram([5, 9, 30, 40000]))
+    assert buckets["≤10"] == 2 and buckets["≤50"] == 1 and buckets[">30000"] == 1
+
+
+def test_closed_loop_local_with_stand_ins():
+    with stand_ins(_FAST):
+        samples, elapsed = run_closed_loop(local_target(), _CORPUS, concurrency=4, requests=12)
+    report = summarize(samples, elapsed)
+
+    assert report["requests"] == 12 and report["error_rate"] == 0.0
+    assert set(report["latency"]) == {"all", "code_specific", "procedural", "classification", "generic"}
+    # Lookup diretto: nessun LLM → ben sotto la latenza stand-in del modello.
+    assert report["latency"]["code_specific"]["p95_ms"] < _FAST.llm_ms
+    assert report["latency"]["generic"]["p50_ms"] >= _FAST.llm_ms
+    assert report["modes"] == {"llm": 9, "direct": 3}
+
+
+def test_open_loop_paces_arrivals():
+    samples, elapsed = run_open_loop(lambda q: {"intent": "generic", "mode": "llm"}, _CORPUS, qps=50, requests=10)
+    assert len(samples) == 10 and all(s.ok for s in samples)
+    assert elapsed >= 9 / 50
+
+
+def test_saturated_server_reports_503():
+    slow = Stubs(supabase_ms=2, embedding_ms=5, llm_ms=300, jitter=0.0)
+    with stand_ins(slow), in_process_server(workers=1, max_queue=0) as url:
+        samples, elapsed = run_open_loop(http_target(url), [{**_CORPUS[3], "intent": "generic"}], qps=40, requests=6)
+    report = summarize(samples, elapsed)
+
+    assert report["errors"].get("HTTP 503", 0) >= 3
+    assert report["completed"] >= 1
+    assert report["latency"]["generic"]["errors"] == report["errors"]["HTTP 503"]
+    json.dumps(report)      # serializzabile per --json
+
+
+def test_stand_ins_restore_pipeline_state():
+    original_client = retrieval._get_client
+    retrieval._HIERARCHY_INDEXES["sentinel"] = "x"
+    try:
+        with stand_ins(_FAST):
+            assert retrieval._get_client is not original_client
+            assert "sentinel" not in retrieval._HIERARCHY_INDEXES
+            local_target()("dimmi il codice 8544")
+        assert retrieval._get_client is original_client
+        assert retrieval._HIERARCHY_INDEXES == {"sentinel": "x"}
+    finally:
+        retrieval._HIERARCHY_INDEXES.pop("sentinel", None)
+
+
+def test_failed_requests_keep_corpus_intent():
+    def _boom(question):
+        raise TimeoutError
+    samples, _ = run_closed_loop(_boom, [{"question": "x", "intent": "procedural"}], concurrency=1, requests=2)
+    assert all(s.error == "TimeoutError" and s.intent == "procedural" for s in samples)
+
+
+def test_cli_stub_latencies_reach_their_fields(tmp_path, monkeypatch, capsys):
+    corpus = tmp_path / "corpus.jsonl"
+    corpus.write_text(json.dumps({"question": "Cosa è il bene 2B002?"}) + "\n", encoding="utf-8")
+    monkeypatch.setattr(sys, "argv", [
+        "loadtest.py", str(corpus), "--stub", "--concurrency", "1", "--json",
+        "--supabase-ms", "1", "--scan-ms", "7", "--embedding-ms", "5", "--llm-ms", "50", "--jitter", "0",
+    ])
+    loadtest.main()
+    report = json.loads(capsys.readouterr().out)
+    assert report["settings"]["stubs"] == "supabase 1 ms (scan +7 ms), embedding 5 ms, llm 50 ms ±0%"
+    assert report["requests"] == 1 and report["error_rate"] == 0.0
@@ -0,0 +1,69 @@
+"""
+Level 1 – Unit test: mmr.py (Maximal Marginal Relevance)
+
+Testa la selezione per diversità su embedding sintetici:
+  - quasi-duplicati scartati a favore di chunk diversi
+  - λ=1 equivale al top-k per similarità
+  - statistiche di ridondanza
+Nessuna dipendenza esterna (solo NumPy).
+"""
+
+import numpy as np
+import pytest
+
+from mmr import mmr_select
+
+
+QUERY = [1.0, 0.0, 0.0]
+
+# 0 e 1 sono quasi identici (stesso paragrafo in due consolidazioni),
+# 2 è meno rilevante ma diverso.
+CANDIDATES = [
+    [0.95, 0.30, 0.00],
+    [0.95, 0.31, 0.00],
+    [0.80, 0.00, 0.60],
+]
+
+
+def test_near_duplicate_dropped():
+    selected, stats = mmr_select(QUERY, CANDIDATES, k=2, lambda_mult=0.5)
+    assert selected == [1, 2] or selected == [0, 2]
+    assert stats.replaced == 1
+    assert stats.redundancy_after < stats.redundancy_before
+
+
+def test_lambda_one_is_plain_top_k():
+    selected, stats = mmr_select(QUERY, CANDIDATES, k=2, lambda_mult=1.0)
+    relevance = [np.dot(c, QUERY) / np.linalg.norm(c) for c in CANDIDATES]
+    assert selected == list(np.argsort(relevance)[::-1][:2])
+    assert stats.replaced == 0
+
+
+def test_first_pick_is_most_relevant():
+    selected, _ = mmr_select(QUERY, CANDIDATES, k=1, lambda_mult=0.3)
+    assert selected in ([0], [1])
+
+
+def test_k_larger_than_candidates():
+    selected, stats = mmr_select(QUERY, CANDIDATES, k=10)
+    assert sorted(selected) == [0, 1, 2]
+    assert stats.candidates == 3 and stats.selected == 3
+
+
+def test_empty_candidates():
+    selected, stats = mmr_select(QUERY, [], k=5)
+    assert selected == []
+    assert stats.selected == 0
+
+
+def test_zero_vector_does_not_crash():
+    selected, _ = mmr_select(QUERY, [[0.0, 0.0, 0.0], [1.0, 0.0, 0.0]], k=2)
+    assert selected[0] == 1
+
+
+@pytest.mark.parametrize("n", [60, 300])
+def test_selection_unique_indices(n):
+    rng = np.random.default_rng(0)
+    cands = rng.normal(size=(n, 16)).tolist()
+    selected, _ = mmr_select(rng.normal(size=16).tolist(), cands, k=15)
+    assert len(selected) == len(set(selected)) == 15
@@ -6,7 +6,7 @@ Testa i 5 scenari di routing della pipeline v3:
   2. CODE_SPECIFIC NC         → lookup collaterale, nessun LLM, fonti static_celex
   3. CODE_SPECIFIC fallback   → lookup vuoto → vector search → LLM
   4. PROCEDURAL + codice      → lookup collaterale + vector → LLM
-  5. GENERIC (nessun codice)  → solo vector → LLM
+  5. GENERIC (nessun codice)  → solo vector → LLM (hybrid: BM25 decisivo o fusione RRF)
   6. CLASSIFICATION           → vector con filtro ANNEX_CODE → LLM
   7. Nessun risultato         → messaggio e uscita
 
@@ -177,6 +177,75 @@ def test_procedural_with_code(capsys):
     assert "Art. 3" in context_arg
 
 
+# ── Scenario 4b: PROCEDURAL + codice NC correlato → traversal links_to ───────
+
+def test_procedural_nc_traverses_links_to(capsys):
+    """
+    Codice NC con correlazione DU → traversal batch verso dual_use, righe DU nel
+    contesto, annex lookup e analytical mode sui codici collegati.
+    """
+    corr_chunk = {
+        "chunk_text": "8544300000  3E001",
+        "metadata":   {"code": "8544300000", "source_id": "dual_use_correlations",
+                       "text_value": "3E001"},
+        "celex_consolidated": None,
+        "similarity": 1.0,
+    }
+    du_row = dict(DUAL_USE_CHUNK, chunk_text="3E001: Tecnologia per lo sviluppo…",
+                  metadata={"code": "3E001", "source_id": "dual_use"})
+
+    def _lookup(entry, code):
+        return [NC_CHUNK] if entry["id"] == "nomenclature" else [corr_chunk]
+
+    with patch("main.detect_code_from_registry",
+               return_value=[(NOMENCLATURE_ENTRY, "8544"), (DU_CORRELATIONS_ENTRY, "8544")]), \
+         patch("retrieval.lookup_collateral", side_effect=_lookup), \
+         patch("retrieval.lookup_collateral_batch", return_value=[du_row]) as mock_batch, \
+         patch("retrieval.get_annex_chunks_by_codes", return_value=[]) as mock_annex, \
+         _patch_embedding(), \
+         patch("retrieval.vector_search", return_value=[ARTICLE_CHUNK]), \
+         patch("llm.generate_answer", return_value=MOCK_LLM_ANSWER) as mock_llm:
+
+        from main import query
+        result = query("obblighi per esportare 8544")
+
+    mock_batch.assert_called_once_with(DUAL_USE_ENTRY, ["3E001"])
+    mock_annex.assert_called_once_with(["3E001"])
+    assert "dual_use" in result["dbs"]
+    assert "3E001: Tecnologia" in mock_llm.call_args[0][1]
+    assert mock_llm.call_args[1]["analytical"] is True
+    assert any("traversal links_to: hops=1" in m for m in result["log"])
+
+
+def test_procedural_analytical_uses_precomputed_embedding():
+    """Combinazione DU nello store precalcolato → nessun embedding live per la query analitica."""
+    corr_chunk = {
+        "chunk_text": "8544300000  3E001",
+        "metadata":   {"code": "8544300000", "source_id": "dual_use_correlations",
+                       "text_value": "3E001"},
+        "celex_consolidated": None,
+        "similarity": 1.0,
+    }
+    stored = [0.5] * 1536
+
+    with patch("main.detect_code_from_registry", return_value=[(DU_CORRELATIONS_ENTRY, "8544")]), \
+         patch("retrieval.lookup_collateral", return_value=[corr_chunk]), \
+         patch("retrieval.lookup_collateral_batch", return_value=[]), \
+         patch("retrieval.get_annex_chunks_by_codes", return_value=[]), \
+         patch("analytical_embeddings.lookup", return_value=(stored, "exact")) as mock_store, \
+         _patch_embedding() as mock_emb, \
+         patch("retrieval.vector_search", return_value=[ARTICLE_CHUNK]) as mock_vec, \
+         patch("llm.generate_answer", return_value=MOCK_LLM_ANSWER):
+
+        from main import query
+        result = query("obblighi per esportare 8544")
+
+    mock_store.assert_called_once_with(["3E001"])
+    mock_emb.assert_called_once()            # solo la query normalizzata
+    mock_vec.assert_called_once_with(stored)
+    assert "[routing] analytical embedding precalcolato (exact)" in result["log"]
+
+
 # ── Scenario 5: GENERIC (nessun codice) → solo vector → LLM ──────────────────
 
 def test_generic_no_code(capsys):
@@ -196,6 +265,121 @@ def test_generic_no_code(capsys):
     mock_llm.assert_called_once()
 
 
+# ── Scenario 5b: GENERIC hybrid → BM25 decisivo, nessun embedding ────────────
+
+def test_generic_hybrid_lexical_skips_embedding():
+    with patch("config.HYBRID_ENABLED", True), \
+         patch("main.detect_code_from_registry", return_value=[]), \
+         patch("retrieval.lexical_search", return_value=([ARTICLE_CHUNK], True)), \
+         patch("embeddings.get_embedding") as mock_emb, \
+         patch("retrieval.vector_search") as mock_vec, \
+         patch("llm.generate_answer", return_value=MOCK_LLM_ANSWER):
+
+        from main import query
+        result = query("cosa prevede l'articolo 3")
+
+    assert result["mode"] == "llm"
+    assert result["chunks"] == [ARTICLE_CHUNK]
+    assert any("embedding saltato" in line for line in result["log"])
+    mock_emb.assert_not_called()
+    mock_vec.assert_not_called()
+
+
+def test_generic_hybrid_not_confident_fuses_rankings():
+    lexical_chunk = {**ARTICLE_CHUNK, "chunk_text": "Art. 12 – Autorizzazioni generali..."}
+
+    with patch("config.HYBRID_ENABLED", True), \
+         patch("main.detect_code_from_registry", return_value=[]), \
+         patch("retrieval.lexical_search", return_value=([lexical_chunk], False)), \
+         _patch_embedding() as mock_emb, \
+         patch("retrieval.vector_search", return_value=[ARTICLE_CHUNK]), \
+         patch("llm.generate_answer", return_value=MOCK_LLM_ANSWER):
+
+        from main import query
+        result = query("cosa dice il regolamento sulle autorizzazioni generali")
+
+    mock_emb.assert_called_once()
+    assert {c["chunk_text"] for c in result["chunks"]} == {
+        lexical_chunk["chunk_text"], ARTICLE_CHUNK["chunk_text"],
+    }
+
+
+# ── Scenario 5c: cache semantica → riformulazione servita senza retrieval/LLM ──
+
+def test_semantic_cache_reuses_answer_for_rephrased_question():
+    from semantic_cache import SemanticCache
+
+    cache = SemanticCache(threshold=0.95, max_entries=10)
+    with patch("config.SEMANTIC_CACHE_ENABLED", True), \
+         patch("semantic_cache.get_cache", return_value=cache), \
+         patch("main.detect_code_from_registry", return_value=[]), \
+         patch("embeddings.get_embedding", return_value=[1.0] + [0.0] * 1535), \
+         patch("retrieval.vector_search", return_value=[ARTICLE_CHUNK]) as mock_vec, \
+         patch("llm.generate_answer", return_value=MOCK_LLM_ANSWER) as mock_llm:
+
+        from main import query
+        first  = query("cosa dice il regolamento sulle autorizzazioni generali")
+        second = query("che cosa dice il regolamento riguardo le autorizzazioni generali")
+
+    assert mock_vec.call_count == 1
+    assert mock_llm.call_count == 1
+    assert second["answer"] == first["answer"]
+    assert second["chunks"] == first["chunks"]
+    assert any(line.startswith("[cache] semantic hit") for line in second["log"])
+    assert cache.stats.hits == 1
+
+
+# ── Scenario 5d: deadline → LLM saltato, testo recuperato in mode="direct" ───
+
+def test_deadline_too_short_for_llm_degrades_to_direct():
+    with patch("config.LLM_MIN_SECONDS", 60), \
+         patch("main.detect_code_from_registry", return_value=[(DUAL_USE_ENTRY, "2B002")]), \
+         patch("retrieval.lookup_collateral", return_value=[DUAL_USE_CHUNK]), \
+         _patch_embedding(), \
+         patch("retrieval.vector_search", return_value=[ARTICLE_CHUNK]), \
+         patch("llm.generate_answer") as mock_llm:
+
+        from main import query
+        result = query("obblighi per esportare 2B002", deadline=30)
+
+    mock_llm.assert_not_called()
+    assert result["mode"] == "direct"
+    assert result["answer"] is None
+    assert DUAL_USE_CHUNK in result["chunks"]
+    assert "senza risposta interpretativa" in result["note"]
+
+
+def test_llm_timeout_degrades_to_direct():
+    from deadline import DeadlineExceeded
+
+    with patch("main.detect_code_from_registry", return_value=[]), \
+         _patch_embedding(), \
+         patch("retrieval.vector_search", return_value=[ARTICLE_CHUNK]), \
+         patch("llm.generate_answer", side_effect=DeadlineExceeded("scaduto")):
+
+        from main import query
+        result = query("cosa dice il regolamento sulle autorizzazioni generali", deadline=30)
+
+    assert result["mode"] == "direct"
+    assert result["chunks"] == [ARTICLE_CHUNK]
+    assert any(line.startswith("[deadline]") for line in result["log"])
+
+
+def test_cancelled_query_raises():
+    from deadline import Deadline, QueryCancelled
+
+    d = Deadline(None)
+    d.cancel()
+    with patch("main.detect_code_from_registry", return_value=[]), \
+         _patch_embedding(), \
+         patch("retrieval.vector_search", return_value=[ARTICLE_CHUNK]), \
+         patch("llm.generate_answer", side_effect=QueryCancelled("annullata")):
+
+        from main import query
+        with pytest.raises(QueryCancelled):
+            query("cosa dice il regolamento sulle autorizzazioni generali", deadline=d)
+
+
 # ── Scenario 6: CLASSIFICATION → vector con filtro ANNEX_CODE ────────────────
 
 def test_classification_uses_annex_code_filter(capsys):
@@ -222,6 +406,99 @@ def test_classification_uses_annex_code_filter(capsys):
     assert call_kwargs.get("type_filters") == ["ANNEX_CODE"]
 
 
+# ── Scenario 6b: REVERSE_CORRELATION → grafo inverso DU→NC, nessun LLM ──────
+
+def test_reverse_correlation_direct(capsys):
+    """
+    "quali codici NC sono soggetti a 3E001" → reverse_lookup sulle entry che puntano
+    a dual_use (links_to), testo diretto, fonte static_celex della tabella di correlazione.
+    """
+    reverse_chunk = {
+        "chunk_text": "8544300000  3E001",
+        "metadata":   {"code": "8544300000", "source_id": "dual_use_correlations",
+                       "text_value": "3E001"},
+        "celex_consolidated": None,
+        "similarity": 1.0,
+    }
+
+    with patch("main.detect_code_from_registry", return_value=[(DUAL_USE_ENTRY, "3E001")]), \
+         patch("retrieval.reverse_lookup", return_value=[reverse_chunk]) as mock_rev, \
+         patch("retrieval.lookup_collateral") as mock_lookup, \
+         patch("llm.generate_answer") as mock_llm:
+
+        from main import query
+        result = query("quali codici NC sono soggetti a 3E001")
+
+    assert result["mode"] == "direct"
+    assert result["intent"] == "reverse_correlation"
+    assert result["dbs"] == ["dual_use_correlations"]
+    assert "32021R0821" in [s["celex"] for s in result["sources"]]
+    mock_rev.assert_called_once_with(DU_CORRELATIONS_ENTRY, "3E001")
+    mock_lookup.assert_not_called()
+    mock_llm.assert_not_called()
+
+
+def test_reverse_correlation_empty_falls_back_to_collateral():
+    with patch("main.detect_code_from_registry", return_value=[(DUAL_USE_ENTRY, "2B002")]), \
+         patch("retrieval.reverse_lookup", return_value=[]), \
+         patch("retrieval.lookup_collateral", return_value=[DUAL_USE_CHUNK]), \
+         patch("llm.generate_answer") as mock_llm:
+
+        from main import query
+        result = query("quali codici sono soggetti a 2B002")
+
+    assert result["mode"] == "direct"
+    assert result["intent"] == "code_specific"
+    assert result["dbs"] == ["dual_use"]
+    mock_llm.assert_not_called()
+
+
+def test_reverse_keyword_with_procedural_and_reversible_code():
+    """Codice con indice inverso (dual_use ← dual_use_correlations): REVERSE vince sul procedurale."""
+    with patch("main.detect_code_from_registry", return_value=[(DUAL_USE_ENTRY, "3E001")]), \
+         patch("retrieval.reverse_lookup", return_value=[NC_CHUNK]) as mock_rev, \
+         patch("llm.generate_answer") as mock_llm:
+
+        from main import query
+        result = query("quali codici richiedono autorizzazione per 3E001")
+
+    assert result["intent"] == "reverse_correlation"
+    mock_rev.assert_called_once_with(DU_CORRELATIONS_ENTRY, "3E001")
+    mock_llm.assert_not_called()
+
+
+def test_reverse_keyword_without_reverse_mapping_stays_procedural():
+    """Codice NC (nessuna entry inversa): la domanda procedurale va all'LLM, non al lookup diretto."""
+    with patch("main.detect_code_from_registry", return_value=[(NOMENCLATURE_ENTRY, "8544300000")]), \
+         patch("retrieval.reverse_lookup") as mock_rev, \
+         patch("retrieval.lookup_collateral", return_value=[NC_CHUNK]), \
+         _patch_embedding(), \
+         patch("retrieval.vector_search", return_value=[ARTICLE_CHUNK]), \
+         patch("llm.generate_answer", return_value=MOCK_LLM_ANSWER) as mock_llm:
+
+        from main import query
+        result = query("quali prodotti 8544300000 richiedono autorizzazione")
+
+    assert result["intent"] == "procedural"
+    assert result["mode"] == "llm"
+    mock_rev.assert_not_called()
+    mock_llm.assert_called_once()
+
+
+def test_reverse_keyword_without_code_keeps_classification_filter():
+    """Senza codice la keyword inversa non degrada a GENERIC: resta il filtro ANNEX_CODE."""
+    with patch("main.detect_code_from_registry", return_value=[]), \
+         _patch_embedding(), \
+         patch("retrieval.vector_search", return_value=[ARTICLE_CHUNK]) as mock_vec, \
+         patch("llm.generate_answer", return_value=MOCK_LLM_ANSWER):
+
+        from main import query
+        result = query("quali merci rientrano nella classificazione dei beni a duplice uso")
+
+    assert result["intent"] == "classification"
+    assert mock_vec.call_args[1].get("type_filters") == ["ANNEX_CODE"]
+
+
 # ── Scenario 7: nessun risultato → messaggio e sys.exit ──────────────────────
 
 def test_no_results_exits(capsys):
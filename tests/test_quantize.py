@@ -0,0 +1,64 @@
+"""
+Level 1 – Unit test: quantize.py (storage float16 / int8 degli embedding)
+
+Testa:
+  - memoria: float16 = 1/2, int8 ≈ 1/4 di float32
+  - dot() vicino al prodotto scalare float32, anche a blocchi
+  - aggiornamento riga per riga (scala per riga int8)
+  - recall_at_k
+Nessuna dipendenza esterna (solo NumPy).
+"""
+
+import numpy as np
+import pytest
+
+import quantize
+from quantize import QuantizedMatrix, recall_at_k
+
+
+@pytest.fixture
+def corpus():
+    m = np.random.default_rng(0).normal(size=(300, 64)).astype(np.float32)
+    return m / np.linalg.norm(m, axis=1, keepdims=True)
+
+
+def test_memory_footprint(corpus):
+    f32 = QuantizedMatrix.from_array(corpus, "float32").nbytes
+    assert QuantizedMatrix.from_array(corpus, "float16").nbytes == f32 // 2
+    assert QuantizedMatrix.from_array(corpus, "int8").nbytes <= f32 // 4 + 4 * len(corpus)
+
+
+@pytest.mark.parametrize("dtype,tol", [("float32", 1e-6), ("float16", 1e-3), ("int8", 2e-2)])
+def test_dot_close_to_float32(corpus, dtype, tol):
+    query = corpus[7]
+    scores = QuantizedMatrix.from_array(corpus, dtype).dot(query)
+    assert np.abs(scores - corpus @ query).max() < tol
+    assert int(np.argmax(scores)) == 7
+
+
+def test_dot_blocks_and_prefix(corpus):
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(quantize, "_BLOCK_ROWS", 64)
+        scores = QuantizedMatrix.from_array(corpus, "int8").dot(corpus[0], n_rows=150)
+    assert scores.shape == (150,)
+    assert np.abs(scores - corpus[:150] @ corpus[0]).max() < 2e-2
+
+
+def test_setitem_per_row_scale():
+    m = QuantizedMatrix(2, 3, "int8")
+    m[0] = [0.5, -0.25, 0.0]
+    m[1] = [10.0, 0.0, -5.0]
+    assert m.codes[0, 0] == 127 and m.codes[1, 0] == 127
+    np.testing.assert_allclose(m.dequantize(), [[0.5, -0.25, 0.0], [10.0, 0.0, -5.0]], atol=0.05)
+
+
+def test_unknown_dtype_rejected():
+    with pytest.raises(ValueError):
+        QuantizedMatrix(1, 1, "int4")
+
+
+def test_recall_at_k():
+    exact  = np.array([[0.9, 0.8, 0.1, 0.0]])
+    approx = np.array([[0.9, 0.1, 0.8, 0.0]])
+    assert recall_at_k(exact, approx, 1) == 1.0
+    assert recall_at_k(exact, approx, 2) == 0.5
@@ -8,10 +8,11 @@ Testa:
   - priorità: dual_use prima di nomenclature
   - multi-match: codice NC restituisce anche dual_use_correlations
   - nessun match per query generiche
+  - piano di fetch (colonne proiettate, ordinamento, limit)
 """
 
 import pytest
-from registry import REGISTRY, detect_code_from_registry
+from registry import REGISTRY, detect_code_from_registry, get_fetch_plan
 
 
 # ── Struttura del registry ──────────────────────────────────────────────────
@@ -128,3 +129,33 @@ def test_no_match(query):
 def test_none_input():
     matches = detect_code_from_registry(None)
     assert matches == []
+
+
+# ── Piano di fetch ───────────────────────────────────────────────────────────
+
+def _entry(entry_id: str) -> dict:
+    return next(e for e in REGISTRY if e["id"] == entry_id)
+
+def test_fetch_plan_derived_celex_field():
+    plan = get_fetch_plan(_entry("dual_use"))
+    assert plan["columns"] == ["code", "description", "celex_consolidated"]
+    assert plan["order_by"] is None       # exact → nessun ordinamento
+    assert plan["limit"] is None
+
+def test_fetch_plan_derived_display_code_field():
+    """display_code_field → indent incluso, codice non duplicato, ordinamento prefix."""
+    plan = get_fetch_plan(_entry("nomenclature"))
+    assert plan["columns"] == ["goods_code", "description", "indent"]
+    assert plan["order_by"] == "goods_code"
+
+def test_fetch_plan_declared_columns_override():
+    plan = get_fetch_plan(_entry("dual_use_correlations"))
+    assert plan["columns"] == ["cn_codes_2026", "dual_use_codification"]
+    assert plan["order_by"] == "cn_codes_2026"
+
+def test_fetch_plan_never_selects_star():
+    for entry in REGISTRY:
+        plan = get_fetch_plan(entry)
+        assert "*" not in plan["columns"]
+        assert entry["code_field"] in plan["columns"]
+        assert entry["text_field"] in plan["columns"]
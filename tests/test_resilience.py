@@ -0,0 +1,177 @@
+"""
+Level 1 – Unit test: resilience.py (retry, circuit breaker, hedging, metriche)
+
+Testa:
+  - errori transitori riconosciuti per classe e status code (mai per lo SQLSTATE
+    del postgrest APIError)
+  - retry con backoff solo per operazioni idempotenti e solo su errori transitori
+  - apertura del breaker, short-circuit, half-open dopo il reset
+  - hedging: richiesta duplicata oltre il percentile di latenza
+Nessuna dipendenza esterna: le chiamate sono funzioni Python.
+"""
+
+import threading
+import time
+
+import pytest
+
+import resilience
+from resilience import CircuitOpenError, is_transient
+
+
+class APITimeoutError(Exception):
+    pass
+
+
+class _HTTPError(Exception):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+@pytest.fixture(autouse=True)
+def _fast(monkeypatch):
+    monkeypatch.setattr("config.RETRY_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr("config.RETRY_BASE_DELAY", 0.0)
+    monkeypatch.setattr("config.BREAKER_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr("config.BREAKER_RESET_SECONDS", 60)
+    resilience.reset()
+    yield
+    resilience.reset()
+
+
+def _flaky(failures, exc=None):
+    calls = {"n": 0}
+
+    def fn():
+        calls["n"] += 1
+        if calls["n"] <= failures:
+            raise exc or APITimeoutError("timeout")
+        return "ok"
+    return fn, calls
+
+
+def test_is_transient():
+    assert is_transient(APITimeoutError())
+    assert is_transient(TimeoutError())
+    assert is_transient(_HTTPError(503))
+    assert is_transient(_HTTPError(429))
+    assert not is_transient(_HTTPError(400))
+    assert not is_transient(ValueError("x"))
+
+
+def test_postgrest_sqlstate_is_not_a_status_code():
+    APIError = pytest.importorskip("postgrest.exceptions").APIError
+
+    assert not is_transient(APIError({"code": "42703", "message": "column does not exist"}))
+    assert not is_transient(APIError({"code": "23505", "message": "duplicate key"}))
+    assert is_transient(APIError({"code": "PGRST001", "message": "connection failed"}))
+
+
+@pytest.mark.parametrize("status", [502, 503, 504])
+def test_postgrest_gateway_error_without_json_is_transient(status):
+    exceptions = pytest.importorskip("postgrest.exceptions")
+
+    class _Response:
+        status_code = status
+        content = b"<html>Bad Gateway</html>"
+
+    exc = exceptions.APIError(exceptions.generate_default_error_message(_Response()))
+    assert exc.code == status and is_transient(exc)
+    assert not is_transient(exceptions.APIError({"code": "22P02", "message": "invalid input"}))
+
+
+def test_status_from_response():
+    class _Response:
+        status_code = 502
+
+    class HTTPStatusError(Exception):
+        response = _Response()
+
+    assert is_transient(HTTPStatusError())
+
+
+def test_retry_then_success():
+    fn, calls = _flaky(2)
+    assert resilience.call("dep", fn) == "ok"
+    assert calls["n"] == 3
+    assert resilience.metrics_snapshot()["dep"]["retries"] == 2
+
+
+def test_non_idempotent_not_retried():
+    fn, calls = _flaky(1)
+    with pytest.raises(APITimeoutError):
+        resilience.call("dep", fn, idempotent=False)
+    assert calls["n"] == 1
+
+
+def test_application_error_not_retried():
+    fn, calls = _flaky(1, exc=_HTTPError(400))
+    with pytest.raises(_HTTPError):
+        resilience.call("dep", fn)
+    assert calls["n"] == 1
+
+
+def test_breaker_opens_and_short_circuits():
+    fn, calls = _flaky(100)
+    with pytest.raises(APITimeoutError):
+        resilience.call("dep", fn)           # 3 tentativi → breaker aperto
+    with pytest.raises(CircuitOpenError):
+        resilience.call("dep", fn)
+    assert calls["n"] == 3
+    snap = resilience.metrics_snapshot()["dep"]
+    assert snap["breaker_state"] == "open"
+    assert snap["breaker_opens"] == 1 and snap["short_circuits"] == 1
+
+
+def test_breaker_half_open_recovers(monkeypatch):
+    monkeypatch.setattr("config.BREAKER_RESET_SECONDS", 0.0)
+    fn, _ = _flaky(3)
+    with pytest.raises(APITimeoutError):
+        resilience.call("dep", fn)
+    assert resilience.call("dep", fn) == "ok"   # chiamata di prova half-open
+    assert resilience.metrics_snapshot()["dep"]["breaker_state"] == "closed"
+
+
+def test_abandoned_half_open_probe_reopens_breaker(monkeypatch):
+    from deadline import Deadline, DeadlineExceeded, active
+
+    monkeypatch.setattr("config.BREAKER_FAILURE_THRESHOLD", 1)
+    monkeypatch.setattr("config.BREAKER_RESET_SECONDS", 0.05)
+    monkeypatch.setattr("config.RETRY_MAX_ATTEMPTS", 0)
+    resilience.reset()
+    with pytest.raises(APITimeoutError):
+        resilience.call("dep", _flaky(1)[0])
+    time.sleep(0.06)
+
+    # La prova half-open supera il deadline: il breaker torna open, non resta bloccato.
+    with active(Deadline(0.05)), pytest.raises(DeadlineExceeded):
+        resilience.call("dep", lambda: time.sleep(0.3))
+    assert resilience.metrics_snapshot()["dep"]["breaker_state"] == "open"
+
+    time.sleep(0.06)
+    assert resilience.call("dep", lambda: "ok") == "ok"
+    assert resilience.metrics_snapshot()["dep"]["breaker_state"] == "closed"
+
+
+def test_hedged_read_wins_over_slow_primary(monkeypatch):
+    monkeypatch.setattr("config.HEDGE_ENABLED", True)
+    monkeypatch.setattr("config.HEDGE_MIN_SAMPLES", 5)
+    for _ in range(5):
+        resilience.call("dep", lambda: "warm", hedge=True)   # latenze ~0 ms
+
+    release = threading.Event()
+    calls = {"n": 0}
+
+    def fn():
+        calls["n"] += 1
+        if calls["n"] == 1:
+            release.wait(2)        # primaria lenta
+            return "slow"
+        return "fast"
+
+    start = time.perf_counter()
+    assert resilience.call("dep", fn, hedge=True) == "fast"
+    assert time.perf_counter() - start < 1.0
+    release.set()
+    snap = resilience.metrics_snapshot()["dep"]
+    assert snap["hedges"] == 1 and snap["hedge_wins"] == 1
@@ -1,14 +1,20 @@
 """
 Level 2 – Integration test: retrieval.py (Supabase mockato)
 
-Testa lookup_collateral() e vector_search() senza chiamate reali al DB.
+Testa lookup_collateral(), iter_collateral(), vector_search() e la ricerca ibrida senza chiamate reali al DB.
 Usa unittest.mock per simulare il client Supabase.
 """
 
+import re
+
 import pytest
 from unittest.mock import MagicMock, patch
 
-from retrieval import lookup_collateral, vector_search
+from retrieval import (
+    lookup_collateral, lookup_collateral_batch, iter_collateral, reverse_lookup, linked_codes,
+    get_annex_chunks_by_codes, vector_search, lexical_search, fuse_rankings, _depth_filter,
+    iter_table_rows,
+)
 
 
 # ── Fixture: entry registry ───────────────────────────────────────────────────
@@ -56,11 +62,12 @@ def _mock_client_exact(rows: list[dict]) -> MagicMock:
 
 
 def _mock_client_prefix(rows: list[dict]) -> MagicMock:
-    """Mock per query con .like() (prefix match)."""
+    """Mock per query con .like() (prefix match, ordinata su code_field)."""
     mock = MagicMock()
     (mock.table.return_value
          .select.return_value
          .like.return_value
+         .order.return_value
          .limit.return_value
          .execute.return_value
          .data) = rows
@@ -140,6 +147,57 @@ def test_lookup_collateral_prefix_uses_like(mock_get_client, nomenclature_entry)
     )
 
 
+# ── lookup_collateral – piano di fetch ────────────────────────────────────────
+
+@patch("retrieval._get_client")
+def test_lookup_collateral_projects_only_used_columns(mock_get_client, dual_use_entry):
+    """Nessun select("*"): solo code_field, text_field e celex_consolidated (celex_field)."""
+    mock_get_client.return_value = _mock_client_exact([])
+
+    lookup_collateral(dual_use_entry, "2B002")
+
+    mock_client = mock_get_client.return_value
+    mock_client.table.return_value.select.assert_called_once_with(
+        "code,description,celex_consolidated"
+    )
+
+
+@patch("retrieval._get_client")
+def test_lookup_collateral_prefix_orders_by_code_field(mock_get_client, nomenclature_entry):
+    mock_get_client.return_value = _mock_client_prefix([])
+
+    lookup_collateral(nomenclature_entry, "8544")
+
+    like = mock_get_client.return_value.table.return_value.select.return_value.like
+    like.return_value.order.assert_called_once_with("goods_code")
+
+
+@patch("retrieval._get_client")
+def test_lookup_collateral_declared_fetch_plan(mock_get_client, nomenclature_entry):
+    """Colonne e limit dichiarati nell'entry sostituiscono quelli derivati."""
+    nomenclature_entry["fetch"] = {"columns": ["goods_code", "description"], "limit": 7}
+    mock_get_client.return_value = _mock_client_prefix([])
+
+    lookup_collateral(nomenclature_entry, "8544")
+
+    select = mock_get_client.return_value.table.return_value.select
+    select.assert_called_once_with("goods_code,description")
+    order = select.return_value.like.return_value.order
+    order.return_value.limit.assert_called_once_with(7)
+
+
+@patch("retrieval._get_client")
+def test_lookup_collateral_top_k_overrides_plan_limit(mock_get_client, nomenclature_entry):
+    nomenclature_entry["fetch"] = {"limit": 7}
+    mock_get_client.return_value = _mock_client_prefix([])
+
+    lookup_collateral(nomenclature_entry, "8544", top_k=3)
+
+    order = (mock_get_client.return_value.table.return_value
+             .select.return_value.like.return_value.order)
+    order.return_value.limit.assert_called_once_with(3)
+
+
 # ── lookup_collateral – match_mode non valido ─────────────────────────────────
 
 @patch("retrieval._get_client")
@@ -226,6 +284,401 @@ def test_lookup_collateral_metadata_contains_code(mock_get_client, dual_use_entr
     assert results[0]["metadata"]["source_id"] == "dual_use"
 
 
+# ── iter_collateral – streaming con keyset pagination ────────────────────────
+
+class _FakeTableQuery:
+    """
+    Stand-in minimale del query builder PostgREST: applica eq/like/gt, il cursore
+    keyset (or_) e order/limit su righe in memoria e registra le chiamate.
+    """
+
+    _KEYSET = re.compile(r'^(\w+)\.gt\."(.*)",and\(\1\.eq\."(.*)",(\w+)\.gt\."(.*)"\)$')
+
+    def __init__(self, rows: list[dict], calls: list[tuple]):
+        self._rows  = rows
+        self._calls = calls
+        self._order: list[str] = []
+        self._limit = None
+
+    def select(self, cols):
+        self._calls.append(("select", cols))
+        return self
+
+    def eq(self, field, value):
+        self._rows = [r for r in self._rows if r[field] == value]
+        return self
+
+    def like(self, field, pattern):
+        self._calls.append(("like", field, pattern))
+        self._rows = [r for r in self._rows if r[field].startswith(pattern.rstrip("%"))]
+        return self
+
+    def or_(self, filters):
+        self._calls.append(("or", filters))
+        m = self._KEYSET.match(filters)
+        if m:
+            code_field, code, _, key_field, key = m.groups()
+            self._rows = [
+                r for r in self._rows
+                if r[code_field] > code or (r[code_field] == code and r[key_field] > int(key))
+            ]
+        return self
+
+    def gt(self, field, value):
+        self._calls.append(("gt", field, value))
+        self._rows = [r for r in self._rows if r[field] > value]
+        return self
+
+    def order(self, field):
+        self._order.append(field)
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def execute(self):
+        rows = sorted(self._rows, key=lambda r: tuple(r[f] for f in self._order))
+        return MagicMock(data=rows[: self._limit])
+
+
+def _fake_client(rows: list[dict], calls: list[tuple]) -> MagicMock:
+    mock = MagicMock()
+    mock.table.side_effect = lambda name: _FakeTableQuery(list(rows), calls)
+    return mock
+
+
+NC_ROWS = [
+    {"id": i, "goods_code": f"84{i:02d}000000 80", "description": f"Voce {i}", "indent": None}
+    for i in range(1, 8)
+]
+
+
+@patch("retrieval._get_client")
+def test_iter_collateral_streams_all_pages(mock_get_client, nomenclature_entry):
+    """7 righe con page_size=3 → pagine da 3, 3, 1: nessun troncamento a TOP_K."""
+    calls: list[tuple] = []
+    mock_get_client.return_value = _fake_client(NC_ROWS, calls)
+
+    pages = list(iter_collateral(nomenclature_entry, "84", page_size=3))
+
+    assert [len(p) for p in pages] == [3, 3, 1]
+    codes = [c["metadata"]["code"] for p in pages for c in p]
+    assert codes == [r["goods_code"] for r in NC_ROWS]
+    # Keyset: la seconda e terza pagina partono da (ultimo codice, ultimo id) letti
+    cursors = [c[1] for c in calls if c[0] == "or"]
+    assert cursors == [
+        'goods_code.gt."8403000000 80",and(goods_code.eq."8403000000 80",id.gt."3")',
+        'goods_code.gt."8406000000 80",and(goods_code.eq."8406000000 80",id.gt."6")',
+    ]
+    assert ("select", "goods_code,description,id") in calls
+
+
+@patch("retrieval._get_client")
+def test_iter_collateral_duplicate_codes_across_pages(mock_get_client, nomenclature_entry):
+    """Codici duplicati a cavallo della pagina: nessuna riga saltata né ripetuta."""
+    rows = [
+        {"id": i, "goods_code": code, "description": f"Riga {i}", "indent": None}
+        for i, code in enumerate(["8401", "8402", "8402", "8402", "8402", "8403", "8403"], start=1)
+    ]
+    mock_get_client.return_value = _fake_client(rows, [])
+
+    pages = list(iter_collateral(nomenclature_entry, "84", page_size=3))
+
+    assert [c["metadata"]["text_value"] for p in pages for c in p] == [f"Riga {i}" for i in range(1, 8)]
+
+
+@patch("retrieval._get_client")
+def test_iter_collateral_exact_mode_pages_on_key(mock_get_client, dual_use_entry):
+    """match_mode exact: code_field costante, il cursore è solo sulla chiave univoca."""
+    rows = [{"id": i, "code": "2B002", "description": f"Riga {i}"} for i in range(1, 6)]
+    calls: list[tuple] = []
+    mock_get_client.return_value = _fake_client(rows, calls)
+
+    pages = list(iter_collateral(dual_use_entry, "2B002", page_size=2))
+
+    assert [len(p) for p in pages] == [2, 2, 1]
+    assert [c for c in calls if c[0] == "gt"] == [("gt", "id", 2), ("gt", "id", 4)]
+
+
+@patch("retrieval._get_client")
+def test_iter_table_rows_scans_exact_entry_whole_table(mock_get_client, dual_use_entry):
+    rows = [{"id": i, "code": code, "description": "d"} for i, code in enumerate(["1A001", "2B002", "2B002"], 1)]
+    calls: list[tuple] = []
+    mock_get_client.return_value = _fake_client(rows, calls)
+
+    pages = list(iter_table_rows(dual_use_entry, columns=["code"], page_size=2))
+
+    assert [r["id"] for p in pages for r in p] == [1, 2, 3]
+    assert ("like", "code", "%") in calls and ("select", "code,id") in calls
+
+
+@patch("retrieval._get_client")
+def test_iter_collateral_early_stop_reads_one_page(mock_get_client, nomenclature_entry):
+    calls: list[tuple] = []
+    mock_get_client.return_value = _fake_client(NC_ROWS, calls)
+
+    for page in iter_collateral(nomenclature_entry, "84", page_size=3):
+        break
+
+    assert len(page) == 3
+    assert mock_get_client.return_value.table.call_count == 1
+
+
+@patch("retrieval._get_client")
+def test_iter_collateral_exact_page_boundary(mock_get_client, nomenclature_entry):
+    """Numero di righe multiplo di page_size → un'ultima query vuota, nessuna pagina vuota."""
+    calls: list[tuple] = []
+    mock_get_client.return_value = _fake_client(NC_ROWS[:6], calls)
+
+    pages = list(iter_collateral(nomenclature_entry, "84", page_size=3))
+
+    assert [len(p) for p in pages] == [3, 3]
+
+
+@patch("retrieval._get_client")
+def test_iter_collateral_max_depth_filters_server_side(mock_get_client, nomenclature_entry):
+    calls: list[tuple] = []
+    mock_get_client.return_value = _fake_client(NC_ROWS, calls)
+
+    list(iter_collateral(nomenclature_entry, "84", page_size=10, max_depth=2))
+
+    assert ("or", 'indent.is.null,indent.in.("-","- -")') in calls
+
+
+def test_depth_filter_top_level_only():
+    assert _depth_filter(0) == "indent.is.null"
+
+
+# ── lookup_collateral – indice gerarchico ────────────────────────────────────
+
+@patch("retrieval._get_client")
+@patch("retrieval._get_hierarchy_index")
+def test_lookup_collateral_hierarchy_path_and_children(mock_index, mock_get_client, nomenclature_entry):
+    """Entry con hierarchy_index → percorso alla radice + figli diretti, nessuna query."""
+    from hierarchy import HierarchyIndex
+    rows = [
+        {"goods_code": "8500000000 80", "description": "CAPITOLO 85",    "indent": None, "hier_pos": 1},
+        {"goods_code": "8544000000 80", "description": "Fili isolati",   "indent": None, "hier_pos": 2},
+        {"goods_code": "8544200000 80", "description": "Cavi coassiali", "indent": "-",  "hier_pos": 3},
+        {"goods_code": "8544300000 80", "description": "Cavi accensione", "indent": "-", "hier_pos": 4},
+    ]
+    mock_index.return_value = HierarchyIndex(rows, "goods_code")
+    nomenclature_entry["hierarchy_index"] = True
+
+    results = lookup_collateral(nomenclature_entry, "8544")
+
+    assert [r["metadata"]["code"] for r in results] == [
+        "8500000000 80", "8544000000 80", "8544200000 80", "8544300000 80",
+    ]
+    mock_get_client.assert_not_called()
+
+
+@patch("retrieval._get_client")
+@patch("retrieval._get_hierarchy_index")
+def test_lookup_collateral_hierarchy_miss_falls_back_to_prefix(mock_index, mock_get_client, nomenclature_entry):
+    from hierarchy import HierarchyIndex
+    mock_index.return_value = HierarchyIndex([], "goods_code")
+    nomenclature_entry["hierarchy_index"] = True
+    mock_get_client.return_value = _mock_client_prefix([
+        {"goods_code": "8544000000 80", "description": "Fili isolati"},
+    ])
+
+    results = lookup_collateral(nomenclature_entry, "8544")
+
+    assert len(results) == 1
+    mock_get_client.return_value.table.return_value.select.return_value.like.assert_called_once()
+
+
+@patch("retrieval._get_client")
+def test_cold_hierarchy_index_uses_prefix_then_warm_builds_it(mock_get_client, nomenclature_entry, tmp_path):
+    """Senza indice né snapshot: prefix scan (una query), mai l'intera tabella nel lookup."""
+    import retrieval
+    rows = [
+        {"id": 1, "goods_code": "8500000000 80", "description": "CAPITOLO 85", "indent": None, "hier_pos": 1},
+        {"id": 2, "goods_code": "8544000000 80", "description": "Fili isolati", "indent": None, "hier_pos": 2},
+        {"id": 3, "goods_code": "8544200000 80", "description": "Cavi coassiali", "indent": "-", "hier_pos": 3},
+    ]
+    calls: list[tuple] = []
+    mock_get_client.return_value = _fake_client(rows, calls)
+    nomenclature_entry["hierarchy_index"] = True
+
+    with patch("config.CACHE_DIR", tmp_path), patch.dict(retrieval._HIERARCHY_INDEXES, clear=True):
+        cold = lookup_collateral(nomenclature_entry, "8544")
+        assert ("like", "goods_code", "8544%") in calls and ("like", "goods_code", "%") not in calls
+        assert [r["metadata"]["code"] for r in cold] == ["8544000000 80", "8544200000 80"]
+
+        assert retrieval.warm_indexes([nomenclature_entry]) == {"nomenclature": 3}
+        warm = lookup_collateral(nomenclature_entry, "8544")
+
+    assert [r["metadata"]["code"] for r in warm] == ["8500000000 80", "8544000000 80", "8544200000 80"]
+    assert (tmp_path / "hierarchy_nomenclature_v2.json").exists()
+
+
+# ── lookup_collateral – grafo di correlazioni ────────────────────────────────
+
+CORRELATION_ENTRY = {
+    "id":                 "dual_use_correlations",
+    "table":              "dual_use_correlations",
+    "code_field":         "cn_codes_2026",
+    "text_field":         "dual_use_codification",
+    "match_mode":         "prefix",
+    "display_code_field": "cn_codes_2026",
+    "links_to":           "dual_use",
+    "correlation_index":  True,
+    "source":             {"type": "static_celex", "celex": "32021R0821"},
+}
+
+CORRELATION_ROWS = [
+    {"cn_codes_2026": "8544300000", "dual_use_codification": "3E001"},
+    {"cn_codes_2026": "8544420000", "dual_use_codification": "3A001"},
+    {"cn_codes_2026": "8542310000", "dual_use_codification": "3E001"},
+]
+
+
+@pytest.fixture
+def correlation_graph():
+    from correlation_graph import CorrelationGraph
+    with patch("retrieval._get_correlation_graph") as mock_graph:
+        mock_graph.return_value = CorrelationGraph(
+            CORRELATION_ROWS, "cn_codes_2026", "dual_use_codification",
+        )
+        yield mock_graph
+
+
+@patch("retrieval._get_client")
+def test_lookup_collateral_served_from_graph(mock_get_client, correlation_graph):
+    """Entry con correlation_index → nessuna query al DB, stesso formato ChunkRow."""
+    results = lookup_collateral(CORRELATION_ENTRY, "8544")
+
+    assert [r["metadata"]["text_value"] for r in results] == ["3E001", "3A001"]
+    assert results[0]["chunk_text"] == "8544300000  3E001"
+    mock_get_client.assert_not_called()
+
+
+def test_lookup_collateral_graph_respects_top_k(correlation_graph):
+    assert len(lookup_collateral(CORRELATION_ENTRY, "85", top_k=2)) == 2
+
+
+def test_linked_codes_forward(correlation_graph):
+    assert linked_codes(CORRELATION_ENTRY, "8544") == ["3E001", "3A001"]
+
+
+def test_reverse_lookup(correlation_graph):
+    results = reverse_lookup(CORRELATION_ENTRY, "3E001")
+    assert [r["metadata"]["code"] for r in results] == ["8542310000", "8544300000"]
+    assert all(r["metadata"]["source_id"] == "dual_use_correlations" for r in results)
+
+
+@patch("retrieval._INDEX_PAGE_SIZE", 2)
+@patch("retrieval._get_client")
+def test_correlation_graph_keeps_edges_across_pages(mock_get_client, tmp_path):
+    """Un codice NC con più codici DU a cavallo della pagina: nessun arco perso."""
+    import retrieval
+    rows = [
+        {"id": 1, "cn_codes_2026": "8401000000", "dual_use_codification": "0A001"},
+        {"id": 2, "cn_codes_2026": "8544300000", "dual_use_codification": "3E001"},
+        {"id": 3, "cn_codes_2026": "8544300000", "dual_use_codification": "3A001"},
+        {"id": 4, "cn_codes_2026": "8544300000", "dual_use_codification": "5A002"},
+        {"id": 5, "cn_codes_2026": "8544420000", "dual_use_codification": "3A001"},
+    ]
+    mock_get_client.return_value = _fake_client(rows, [])
+
+    with patch("config.CACHE_DIR", tmp_path), patch.dict(retrieval._CORRELATION_GRAPHS, clear=True):
+        assert sorted(linked_codes(CORRELATION_ENTRY, "8544300000")) == ["3A001", "3E001", "5A002"]
+        reverse = reverse_lookup(CORRELATION_ENTRY, "3A001")
+
+    assert [r["metadata"]["code"] for r in reverse] == ["8544300000", "8544420000"]
+    assert (tmp_path / "correlations_dual_use_correlations_v2.json").exists()
+
+
+# ── lookup_collateral_batch – una query per più codici ──────────────────────
+
+@patch("retrieval._get_client")
+def test_lookup_collateral_batch_exact_uses_in(mock_get_client, dual_use_entry):
+    mock = MagicMock()
+    (mock.table.return_value.select.return_value
+         .in_.return_value.limit.return_value.execute.return_value.data) = [
+        {"code": "3E001", "description": "Tecnologia", "celex_consolidated": "32021R0821"},
+    ]
+    mock_get_client.return_value = mock
+
+    results = lookup_collateral_batch(dual_use_entry, ["3E001", "3A001", "3E001"])
+
+    select = mock.table.return_value.select
+    select.return_value.in_.assert_called_once_with("code", ["3E001", "3A001"])
+    select.return_value.in_.return_value.limit.assert_called_once_with(2 * 15)
+    assert mock.table.call_count == 1
+    assert results[0]["metadata"]["code"] == "3E001"
+
+
+@patch("retrieval._get_client")
+def test_lookup_collateral_batch_prefix_uses_or_like(mock_get_client, nomenclature_entry):
+    mock = MagicMock()
+    (mock.table.return_value.select.return_value
+         .or_.return_value.order.return_value.limit.return_value
+         .execute.return_value.data) = []
+    mock_get_client.return_value = mock
+
+    lookup_collateral_batch(nomenclature_entry, ["8544", "8542"])
+
+    mock.table.return_value.select.return_value.or_.assert_called_once_with(
+        'goods_code.like."8544*",goods_code.like."8542*"'
+    )
+
+
+@patch("retrieval._get_client")
+def test_lookup_collateral_batch_limit_is_per_code(mock_get_client, dual_use_entry):
+    """Un codice con molte righe non consuma il limite degli altri: k righe per codice."""
+    rows = (
+        [{"id": i, "code": "3E001", "description": f"E{i}", "celex_consolidated": None} for i in range(1, 6)]
+        + [{"id": 9, "code": "3A001", "description": "A", "celex_consolidated": None}]
+    )
+
+    def _table(name):
+        query = MagicMock()
+        query.select.return_value = query
+        query.in_.side_effect = lambda field, codes: (
+            setattr(query, "_rows", [r for r in rows if r[field] in codes]) or query)
+        query.limit.side_effect = lambda n: MagicMock(execute=MagicMock(
+            return_value=MagicMock(data=query._rows[:n])))
+        return query
+
+    mock_get_client.return_value = MagicMock(table=MagicMock(side_effect=_table))
+
+    results = lookup_collateral_batch(dual_use_entry, ["3E001", "3A001"], top_k=2)
+
+    # Prima query piena (4 righe di 3E001): 3E001 tagliato a 2, 3A001 riletto da solo.
+    assert [r["metadata"]["text_value"] for r in results] == ["E1", "E2", "A"]
+    assert mock_get_client.return_value.table.call_count == 2
+
+
+def test_lookup_collateral_batch_empty_codes_no_query():
+    with patch("retrieval._get_client") as mock_get_client:
+        assert lookup_collateral_batch({"id": "x"}, []) == []
+    mock_get_client.assert_not_called()
+
+
+# ── get_annex_chunks_by_codes ─────────────────────────────────────────────────
+
+@patch("retrieval._get_client")
+def test_annex_chunks_single_query_in_input_order(mock_get_client):
+    mock = MagicMock()
+    (mock.table.return_value.select.return_value
+         .filter.return_value.execute.return_value.data) = [
+        {"text": "3A001 …", "metadata": {"code": "3A001"}, "celex_consolidated": "X"},
+        {"text": "3E001 …", "metadata": {"code": "3E001"}, "celex_consolidated": "X"},
+    ]
+    mock_get_client.return_value = mock
+
+    results = get_annex_chunks_by_codes(["3E001", "3A001"])
+
+    mock.table.return_value.select.return_value.filter.assert_called_once_with(
+        "metadata->>code", "in", '("3E001","3A001")'
+    )
+    assert [r["metadata"]["code"] for r in results] == ["3E001", "3A001"]
+
+
 # ── vector_search ─────────────────────────────────────────────────────────────
 
 FAKE_EMBEDDING = [0.1] * 1536
@@ -288,3 +741,133 @@ def test_vector_search_metadata_parsed(mock_get_client):
     results = vector_search(FAKE_EMBEDDING)
 
     assert results[0]["metadata"] == {"unit_type": "ARTICLE"}
+
+
+# ── vector_search – over-fetch + MMR ─────────────────────────────────────────
+
+@patch("config.MMR_LAMBDA", 0.5)
+@patch("retrieval._get_client")
+def test_vector_search_diversify_overfetches_and_selects(mock_get_client):
+    rows = [
+        {"text": "Art. 3 (consolidato 2023)", "metadata": {}, "celex_consolidated": "A",
+         "similarity": 0.95, "embedding": [0.95, 0.30, 0.0]},
+        {"text": "Art. 3 (consolidato 2024)", "metadata": {}, "celex_consolidated": "B",
+         "similarity": 0.95, "embedding": "[0.95,0.31,0.0]"},   # formato stringa pgvector
+        {"text": "Art. 22", "metadata": {}, "celex_consolidated": "B",
+         "similarity": 0.80, "embedding": [0.80, 0.0, 0.60]},
+    ]
+    mock_get_client.return_value = _mock_client_rpc(rows)
+
+    results = vector_search([1.0, 0.0, 0.0], top_k=2, diversify=True)
+
+    name, params = mock_get_client.return_value.rpc.call_args[0]
+    assert name == "search_chunks_multi_type_mmr"
+    assert params["match_count"] == 2 * 3
+    texts = [r["chunk_text"] for r in results]
+    assert "Art. 22" in texts
+    assert len(texts) == 2
+    assert "embedding" not in results[0]
+
+
+@patch("retrieval._get_client")
+def test_vector_search_diversify_off_uses_plain_rpc(mock_get_client):
+    mock_get_client.return_value = _mock_client_rpc([])
+
+    vector_search(FAKE_EMBEDDING, diversify=False)
+
+    assert mock_get_client.return_value.rpc.call_args[0][0] == "search_chunks_multi_type"
+
+
+# ── lexical_search / fuse_rankings – ricerca ibrida ──────────────────────────
+
+LEXICAL_ROWS = [
+    {"text": "Articolo 22 – Autorizzazioni per trasferimenti intra-UE.",
+     "metadata": '{"unit_type": "ARTICLE"}', "celex_consolidated": "32021R0821"},
+    {"text": "Articolo 3 – Autorizzazione per l'esportazione di prodotti a duplice uso.",
+     "metadata": {"unit_type": "ARTICLE"}, "celex_consolidated": "32021R0821"},
+]
+
+
+@pytest.fixture
+def lexical_index():
+    from lexical import BM25Index
+    with patch("retrieval._get_lexical_index") as mock_index:
+        mock_index.return_value = (BM25Index([r["text"] for r in LEXICAL_ROWS]), LEXICAL_ROWS)
+        yield mock_index
+
+
+@patch("retrieval._get_client")
+def test_lexical_search_confident_on_article_number(mock_get_client, lexical_index):
+    results, confident = lexical_search("cosa prevede l'articolo 22")
+
+    assert confident is True
+    assert results[0]["chunk_text"].startswith("Articolo 22")
+    assert results[0]["metadata"] == {"unit_type": "ARTICLE"}
+    assert results[0]["similarity"] == 1.0
+    mock_get_client.assert_not_called()
+
+
+def test_lexical_search_not_confident_without_anchor(lexical_index):
+    results, confident = lexical_search("autorizzazione esportazione")
+    assert confident is False
+    assert results
+
+
+@patch("retrieval._get_client")
+def test_cold_lexical_index_is_vector_only_then_warm_builds_it(mock_get_client, tmp_path):
+    """Senza indice né snapshot la query non legge chunks; warm_indexes pagina con keyset su id."""
+    import retrieval
+    extra = {"text": "Allegato I – Elenco dei prodotti a duplice uso.", "metadata": {}, "celex_consolidated": None}
+    rows = [{"id": i, **r} for i, r in enumerate([*LEXICAL_ROWS, extra], start=1)]
+    calls: list[tuple] = []
+    mock_get_client.return_value = _fake_client(rows, calls)
+
+    with patch("config.CACHE_DIR", tmp_path), patch("config.HYBRID_ENABLED", True), \
+         patch("retrieval.REGISTRY", []), patch("retrieval._LEXICAL_INDEX", None), \
+         patch("retrieval._INDEX_PAGE_SIZE", 2):
+        assert lexical_search("cosa prevede l'articolo 22") == ([], False)
+        mock_get_client.assert_not_called()
+
+        assert retrieval.warm_indexes() == {"lexical": 3}
+        results, confident = lexical_search("cosa prevede l'articolo 22")
+
+    assert confident and results[0]["chunk_text"].startswith("Articolo 22")
+    assert [c for c in calls if c[0] == "gt"] == [("gt", "id", 2)]
+
+
+def test_fuse_rankings_rrf_merges_duplicates():
+    a = {"chunk_text": "A", "similarity": 1.0}
+    b = {"chunk_text": "B", "similarity": 0.9}
+    c = {"chunk_text": "C", "similarity": 0.8}
+
+    fused = fuse_rankings([a, b], [{**b, "similarity": 0.5}, c], top_k=3)
+
+    assert [x["chunk_text"] for x in fused] == ["B", "A", "C"]
+    assert fused[0]["similarity"] == 0.9   # riga della prima lista
+
+
+# ── _execute – timeout HTTP per richiesta ────────────────────────────────────
+
+def test_execute_caps_postgrest_timeout_to_deadline(monkeypatch):
+    import deadline
+    from retrieval import _execute
+
+    monkeypatch.setattr("config.SUPABASE_TIMEOUT_SECONDS", 30.0)
+    timeouts: list[float] = []
+
+    class _Session:
+        def request(self, *args, **kwargs):
+            timeouts.append(kwargs["timeout"])
+
+    def _query():
+        query = MagicMock()
+        query.request.session = _Session()
+        query.execute.side_effect = lambda: query.request.session.request("GET", "/t")
+        return query
+
+    _execute(_query())
+    with deadline.active(deadline.Deadline(2.0)):
+        _execute(_query())
+
+    assert timeouts[0] == 30.0
+    assert 0 < timeouts[1] <= 2.0
@@ -2,29 +2,58 @@
 Test per tools/scan_db.py – funzioni pure (nessuna dipendenza esterna).
 
 Livello 1: detect_pattern, detect_match_mode, _match_registry_patterns,
-           _apply_heuristics, ScanResult.status, render_json_report, _draft_dict.
+           _apply_heuristics, ScanResult.status, render_json_report, _draft_dict,
+           _check_fetch_plan.
+Livello 2: run_scan con --workers e --deep (client Supabase finto con latenze casuali;
+           stream_table senza chiave su ctid, copertura esatta o stimata),
+           Throttle / ThrottledClient, sample_table (1 RPC per tabella + fallback),
+           ScanCache (profili con campionamento fallito esclusi), pattern_coverage (RPC) + to_postgres_regex,
+           check_lookup_performance (latenza + piano EXPLAIN della query del piano di fetch),
+           suggest_indexes (indici richiesti vs list_table_indexes).
 """
 
 import json
+import random
+import re
+import threading
+import time
 import pytest
 import sys
 from pathlib import Path
+from unittest.mock import MagicMock
 
 # Il modulo tools/scan_db.py aggiunge già il root al path, ma i test
 # sono eseguiti dalla root del progetto, quindi l'import funziona direttamente.
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
+from registry import REGISTRY
+import tools.scan_db as scan_db
 from tools.scan_db import (
     detect_pattern,
     detect_match_mode,
+    prefix_profile,
+    to_postgres_regex,
+    validate_registry_entry,
+    PatternTranslationError,
+    check_lookup_performance,
     _match_registry_patterns,
     _apply_heuristics,
     _draft_dict,
+    _check_fetch_plan,
     render_json_report,
     render_text_report,
     ScanResult,
     DraftEntry,
     Check,
+    ScanCache,
+    Throttle,
+    ThrottledClient,
+    run_scan,
+    IndexSpec,
+    index_covers,
+    required_indexes,
+    suggest_indexes,
+    render_index_report,
 )
 
 
@@ -190,6 +219,54 @@ class TestDetectMatchMode:
         assert detect_match_mode(samples) == "prefix"
 
 
+# ── prefix_profile ───────────────────────────────────────────────────────────
+
+def _brute_force_pairs(samples: list[str]) -> int:
+    clean = [s.strip().split()[0] for s in samples]
+    return sum(
+        1
+        for i in range(len(clean))
+        for j in range(i + 1, len(clean))
+        if clean[i].startswith(clean[j]) or clean[j].startswith(clean[i])
+    )
+
+
+class TestPrefixProfile:
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_pairs_match_quadratic_definition(self, seed):
+        rng = random.Random(seed)
+        samples = [
+            "".join(rng.choice("0123") for _ in range(rng.randint(1, 6)))
+            + (" 80" if rng.random() < 0.2 else "")
+            for _ in range(300)
+        ]
+        assert prefix_profile(samples).prefix_pairs == _brute_force_pairs(samples)
+
+    def test_depth_and_levels(self):
+        profile = prefix_profile(["85", "8544", "854420", "8544200000", "8545", "9001"])
+        assert profile.length_distribution == {2: 1, 4: 3, 6: 1, 10: 1}
+        assert profile.depth_distribution == {0: 2, 1: 2, 2: 1, 3: 1}
+        assert profile.max_depth == 3
+
+    def test_duplicates_count_as_prefix_pairs(self):
+        profile = prefix_profile(["2B002", "2B002", "1A001"])
+        assert profile.prefix_pairs == 1
+        assert profile.depth_distribution == {0: 2}
+
+    def test_scales_to_large_samples(self):
+        rng = random.Random(0)
+        chapters = [f"{c:02d}" for c in range(1, 98)]
+        samples = [rng.choice(chapters) + f"{rng.randrange(10 ** 8):08d}" for _ in range(50_000)]
+        samples += chapters + [c + "44" for c in chapters]
+        start = time.perf_counter()
+        profile = prefix_profile(samples)
+        assert time.perf_counter() - start < 2.0
+        assert profile.n == len(samples)
+        assert profile.max_depth == 2
+        assert detect_match_mode(samples, profile) == "prefix"
+
+
 # ── ScanResult.status ────────────────────────────────────────────────────────
 
 class TestScanResultStatus:
@@ -209,6 +286,45 @@ class TestScanResultStatus:
         assert r.status == "ok"
 
 
+# ── _check_fetch_plan ────────────────────────────────────────────────────────
+
+class TestCheckFetchPlan:
+
+    ENTRY = {
+        "id": "nomenclature", "table": "nomenclature",
+        "code_field": "goods_code", "text_field": "description",
+        "match_mode": "prefix", "display_code_field": "goods_code",
+        "source": {"type": "static_celex"},
+    }
+
+    def test_all_columns_present(self):
+        c = _check_fetch_plan(self.ENTRY, {"goods_code", "description", "indent", "hier_pos"})
+        assert c.passed
+        assert "3 colonne" in c.detail
+
+    def test_missing_derived_column_suggests_declaring_fetch(self):
+        c = _check_fetch_plan(self.ENTRY, {"goods_code", "description"})
+        assert not c.passed
+        assert "indent" in c.detail
+        assert "fetch" in c.detail
+
+    def test_declared_plan_checked(self):
+        entry = dict(self.ENTRY, fetch={"columns": ["goods_code", "description"]})
+        assert _check_fetch_plan(entry, {"goods_code", "description"}).passed
+
+    def test_hierarchy_index_requires_hier_pos(self):
+        entry = dict(self.ENTRY, hierarchy_index=True)
+        c = _check_fetch_plan(entry, {"goods_code", "description", "indent"})
+        assert not c.passed
+        assert "hier_pos" in c.detail
+
+    def test_missing_order_by_column(self):
+        entry = dict(self.ENTRY, fetch={"columns": ["goods_code"], "order_by": "hier_pos"})
+        c = _check_fetch_plan(entry, {"goods_code", "description"})
+        assert not c.passed
+        assert "hier_pos" in c.detail
+
+
 # ── _draft_dict ──────────────────────────────────────────────────────────────
 
 class TestDraftDict:
@@ -369,3 +485,589 @@ class TestRenderTextReport:
         out = render_text_report([], [d])
         assert "log_table" in out
         assert "supporto" in out.lower()
+
+
+# ── run_scan concorrente (client finto) ──────────────────────────────────────
+
+_FAKE_DB: dict[str, dict] = {
+    "dual_use_items": {
+        "columns": [("id", "bigint"), ("code", "text"), ("description", "text"),
+                    ("celex_consolidated", "text")],
+        "rows": [{"id": i, "code": c, "description": f"Item {c}", "celex_consolidated": "32021R0821"}
+                 for i, c in enumerate(["1A001", "2B002", "3A225", "9E003"])],
+    },
+    **{
+        f"extra_{n:02d}": {
+            "columns": [("id", "bigint"), ("ref_code", "text"), ("label", "text"),
+                        ("note", "text"), ("embedding", "vector")],
+            "rows": [{"id": i, "ref_code": f"{n:02d}{i:04d}", "label": f"Voce {n}/{i}", "note": "x" * i}
+                     for i in range(1, 6)],
+        }
+        for n in range(8)
+    },
+}
+
+
+class _FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class _FakeQuery:
+    def __init__(self, db: "_FakeClient", fn):
+        self._db, self._fn = db, fn
+
+    def execute(self):
+        return self._db.run(self._fn)
+
+
+class _FakeTable:
+    def __init__(self, db: "_FakeClient", table: str):
+        self._db, self._rows = db, list(_FAKE_DB.get(table, {}).get("rows", []))
+
+    def select(self, *_):
+        return self
+
+    def eq(self, col, value):
+        self._rows = [r for r in self._rows if str(r.get(col)) == value]
+        return self
+
+    def like(self, col, pattern):
+        self._rows = [r for r in self._rows if str(r.get(col)).startswith(pattern.rstrip("%"))]
+        return self
+
+    def order(self, col):
+        self._rows = sorted(self._rows, key=lambda r: str(r.get(col)) if col != "id" else r[col])
+        return self
+
+    def gt(self, col, value):
+        self._rows = [r for r in self._rows if r[col] > value]
+        return self
+
+    def limit(self, n):
+        rows = self._rows[:n]
+        return _FakeQuery(self._db, lambda: rows)
+
+    def range(self, start, end):
+        rows = self._rows[start:end + 1]
+        return _FakeQuery(self._db, lambda: rows)
+
+
+class _FakeClient:
+    """Catalog RPC + query PostgREST su _FAKE_DB, con latenza casuale e conteggio delle chiamate in volo."""
+
+    def __init__(self, table_sampling: bool = True, coverage_rpc: bool = True, plan: str | None = "Index Only Scan",
+                 ctid_streaming: bool = True):
+        self._lock = threading.Lock()
+        self.ctid_streaming = ctid_streaming
+        self._rng = random.Random(7)
+        self.inflight = self.max_inflight = self.calls = 0
+        self.table_sampling = table_sampling
+        self.coverage_rpc = coverage_rpc
+        self.plan = plan            # tipo di scansione restituito da explain_lookup (None = RPC assente)
+        self.rpc_calls: list[str] = []
+
+    def run(self, fn):
+        with self._lock:
+            self.inflight += 1
+            self.calls += 1
+            self.max_inflight = max(self.max_inflight, self.inflight)
+            delay = self._rng.uniform(0, 0.01)
+        try:
+            time.sleep(delay)
+            return _FakeResponse(fn())
+        finally:
+            with self._lock:
+                self.inflight -= 1
+
+    def rpc(self, name, params):
+        with self._lock:
+            self.rpc_calls.append(name)
+        if name == "list_public_tables":
+            return _FakeQuery(self, lambda: [
+                {"table_name": t, "row_estimate": len(d["rows"])} for t, d in _FAKE_DB.items()
+            ])
+        if name == "get_table_columns":
+            cols = _FAKE_DB.get(params["p_table"], {}).get("columns", [])
+            return _FakeQuery(self, lambda: [
+                {"column_name": c, "data_type": t, "is_nullable": True} for c, t in cols
+            ])
+        if name == "sample_column_values":
+            rows = _FAKE_DB.get(params["p_table"], {}).get("rows", [])
+            return _FakeQuery(self, lambda: [
+                {"value": str(r[params["p_column"]])} for r in rows[:params["p_limit"]]
+                if r.get(params["p_column"]) not in (None, "")
+            ])
+        if name == "sample_table_columns":
+            if not self.table_sampling:
+                raise Exception("PGRST202: Could not find the function public.sample_table_columns")
+            rows = _FAKE_DB.get(params["p_table"], {}).get("rows", [])
+            return _FakeQuery(self, lambda: [
+                {"column_name": c, "value": str(r[c])}
+                for c in params["p_columns"] for r in rows[:params["p_limit"]]
+                if r.get(c) not in (None, "")
+            ])
+        if name == "pattern_coverage":
+            if not self.coverage_rpc:
+                raise Exception("PGRST202: Could not find the function public.pattern_coverage")
+            # ARE → re: solo le traduzioni usate dal registry (\y ↔ \b).
+            regex = re.compile(params["p_pattern"].replace(r"\y", r"\b"), re.IGNORECASE)
+            values = [str(r[params["p_column"]]) for r in _FAKE_DB[params["p_table"]]["rows"]
+                      if r.get(params["p_column"]) is not None]
+            misses = [v for v in values if not regex.search(v)]
+            return _FakeQuery(self, lambda: [{
+                "total": len(values), "matched": len(values) - len(misses),
+                "examples": misses[:params["p_examples"]],
+            }])
+        if name == "stream_table_page":
+            if not self.ctid_streaming:
+                raise Exception("PGRST202: Could not find the function public.stream_table_page")
+            # ctid finto: posizione della riga nella tabella, "(0,n)".
+            rows = _FAKE_DB[params["p_table"]]["rows"]
+            start = int(params["p_after"][3:-1]) + 1 if params["p_after"] else 0
+            page = list(enumerate(rows))[start:start + params["p_limit"]]
+            return _FakeQuery(self, lambda: [
+                {"row_ctid": f"(0,{i})", "row_data": {c: r.get(c) for c in params["p_columns"]}}
+                for i, r in page
+            ])
+        if name == "explain_lookup":
+            self.explain_params = params
+            if self.plan is None:
+                raise Exception("PGRST202: Could not find the function public.explain_lookup")
+            scan = {"Node Type": self.plan, "Relation Name": params["p_table"]}
+            if "Index" in self.plan:
+                scan["Index Name"] = f"{params['p_table']}_{params['p_column']}_idx"
+            return _FakeQuery(self, lambda: [{"Plan": {"Node Type": "Limit", "Plans": [scan]}}])
+        raise AssertionError(name)
+
+    def table(self, name):
+        return _FakeTable(self, name)
+
+
+@pytest.fixture(autouse=True)
+def _table_sampling_available(monkeypatch):
+    monkeypatch.setattr(scan_db, "_TABLE_SAMPLING_AVAILABLE", True)
+    monkeypatch.setattr(scan_db, "_CTID_STREAMING_AVAILABLE", True)
+
+
+class TestConcurrentScan:
+
+    def _report(self, workers: int) -> tuple[str, str, _FakeClient]:
+        client = _FakeClient()
+        wrapped = ThrottledClient(client, Throttle(workers)) if workers > 1 else client
+        results, drafts = run_scan(wrapped, skip=set(), workers=workers)
+        return render_text_report(results, drafts), render_json_report(results, drafts), client
+
+    def test_reports_identical_to_sequential(self):
+        seq_text, seq_json, seq_client = self._report(1)
+        par_text, par_json, par_client = self._report(6)
+        assert par_text == seq_text
+        assert par_json == seq_json
+        assert par_client.calls == seq_client.calls
+        assert "extra_00" in seq_text and "extra_07" in seq_text
+        assert "ref_code" in seq_text                   # code_field rilevato dai campioni
+
+    def test_bounded_concurrency(self):
+        _, _, seq_client = self._report(1)
+        _, _, par_client = self._report(4)
+        assert seq_client.max_inflight == 1
+        assert 1 < par_client.max_inflight <= 4
+
+    def test_check_only_skips_profiling(self):
+        results, drafts = run_scan(_FakeClient(), skip=set(), check_only=True, workers=3)
+        assert drafts == []
+        assert [r.entry_id for r in results] == [e["id"] for e in REGISTRY]
+
+
+class TestTableSampling:
+
+    def test_one_rpc_per_table(self):
+        client = _FakeClient()
+        run_scan(client, skip=set())
+        assert client.rpc_calls.count("sample_table_columns") == 8
+        # RPC per colonna: solo la validazione di dual_use_items (codici a pattern del
+        # registry e campioni già completi: nessun campione ampio del code_field).
+        assert client.rpc_calls.count("sample_column_values") == 1
+
+    @pytest.mark.parametrize("code, n, wide", [
+        ("AB{:04d}", 30, True),     # pattern nuovo, campione troncato → campione ampio
+        ("AB{:04d}", 10, False),    # campione già completo
+        ("{:06d}",   30, False),    # pattern del registry → match_mode dall'entry
+    ])
+    def test_wide_code_sample_only_when_needed(self, monkeypatch, code, n, wide):
+        rows = [{"id": i, "ref_code": code.format(i), "label": f"Voce {i}", "note": None} for i in range(1, n + 1)]
+        monkeypatch.setitem(_FAKE_DB, "wide_codes", {"columns": _FAKE_DB["extra_00"]["columns"], "rows": rows})
+        client = _FakeClient()
+        draft = scan_db.profile_unknown_table(client, "wide_codes", n)
+        assert draft.code_field == "ref_code"
+        assert client.rpc_calls.count("sample_column_values") == int(wide)
+
+    def test_fallback_per_column_gives_same_report(self):
+        batched = _FakeClient()
+        fallback = _FakeClient(table_sampling=False)
+        r1, d1 = run_scan(batched, skip=set())
+        r2, d2 = run_scan(fallback, skip=set())
+        assert render_text_report(r2, d2) == render_text_report(r1, d1)
+        # Un solo tentativo fallito, poi RPC per colonna (ref_code, label, note × 8 tabelle)
+        # oltre alla validazione.
+        assert fallback.rpc_calls.count("sample_table_columns") == 1
+        assert fallback.rpc_calls.count("sample_column_values") == 3 * 8 + 1
+
+
+class TestDeepProfile:
+
+    def _big_table(self, monkeypatch, n: int = 2500):
+        rows = [
+            {"id": i, "ref_code": f"{i % 97:02d}{i:06d}" if i % 10 else "N/D", "label": f"Voce {i}", "note": None}
+            for i in range(1, n + 1)
+        ]
+        monkeypatch.setitem(_FAKE_DB, "big_codes", {"columns": _FAKE_DB["extra_00"]["columns"], "rows": rows})
+        monkeypatch.setattr(scan_db, "DEEP_PAGE_SIZE", 400)
+        return rows
+
+    def test_streams_all_rows_with_keyset_pages(self, monkeypatch):
+        rows = self._big_table(monkeypatch)
+        cols = [scan_db.ColumnInfo("ref_code", "text", True), scan_db.ColumnInfo("note", "text", True)]
+        sketches = scan_db.deep_profile_columns(_FakeClient(), "big_codes", cols, key="id")
+
+        code = sketches["ref_code"]
+        assert code.rows == len(rows)
+        assert sketches["note"].nulls == len(rows)
+        distinct = len({r["ref_code"] for r in rows})
+        assert abs(code.distinct.estimate() - distinct) / distinct < 0.05
+        assert code.coverage(r"\b\d{8}\b") == pytest.approx(0.9)
+
+    def test_deep_draft_has_full_table_stats(self, monkeypatch):
+        rows = self._big_table(monkeypatch)
+        client = _FakeClient()
+        draft = scan_db.profile_unknown_table(client, "big_codes", len(rows), deep=True)
+
+        assert draft.code_field == "ref_code"
+        stats = draft.column_stats["ref_code"]
+        assert stats["rows"] == len(rows)
+        assert stats["code_pattern_coverage"] == pytest.approx(0.9)
+        assert any("Profilo completo: 2500 righe" in n for n in draft.notes)
+        assert "sample_table_columns" not in client.rpc_calls
+        data = json.loads(render_json_report([], [draft]))
+        assert data["unregistered_tables"][0]["columns"]["ref_code"]["nulls"] == 0
+
+    @pytest.mark.parametrize("ctid_streaming", [True, False])
+    def test_streams_tables_without_key(self, monkeypatch, ctid_streaming):
+        # Prima colonna con valori ripetuti: un OFFSET ordinato solo su di essa salterebbe righe.
+        rows = [{"grp": f"G{i % 3}", "val": f"V{i:04d}"} for i in range(1, 1001)]
+        monkeypatch.setitem(_FAKE_DB, "no_key", {"columns": [("grp", "text"), ("val", "text")], "rows": rows})
+        client = _FakeClient(ctid_streaming=ctid_streaming)
+        pages = list(scan_db.stream_table(client, "no_key", ["grp", "val"], key=None, page_size=300))
+        assert sorted(r["val"] for page in pages for r in page) == sorted(r["val"] for r in rows)
+        # Keyset su ctid: 4 pagine; senza la RPC un solo tentativo, poi OFFSET su tutte le colonne.
+        assert client.rpc_calls.count("stream_table_page") == (4 if ctid_streaming else 1)
+
+    @pytest.mark.parametrize("coverage_rpc, note", [
+        (True,  "copertura pattern 100%"),
+        (False, "copertura pattern ~100%"),
+    ])
+    def test_deep_coverage_of_new_pattern_exact_or_labelled(self, monkeypatch, coverage_rpc, note):
+        # Pattern alfanumerico non nel registry: non contato durante lo streaming.
+        rows = [{"id": i, "ref_code": f"AB{i:04d}", "label": f"Voce {i}", "note": None} for i in range(1, 501)]
+        monkeypatch.setitem(_FAKE_DB, "alnum_codes", {"columns": _FAKE_DB["extra_00"]["columns"], "rows": rows})
+        draft = scan_db.profile_unknown_table(_FakeClient(coverage_rpc=coverage_rpc), "alnum_codes", 500, deep=True)
+        assert draft.pattern == r"\b[A-Z0-9]{6}\b"
+        assert draft.column_stats["ref_code"]["code_pattern_coverage_exact"] is coverage_rpc
+        assert any(note in n for n in draft.notes)
+        if not coverage_rpc:
+            assert any("stimata" in n for n in draft.notes)
+
+    def test_deep_and_shallow_cached_separately(self, tmp_path):
+        cache = ScanCache(tmp_path / "scan_cache.json")
+        run_scan(_FakeClient(), skip=set(), cache=cache)
+        run_scan(_FakeClient(), skip=set(), cache=cache, deep=True)
+        assert cache.hits == 0 and cache.misses == 16
+
+
+class TestScanCache:
+
+    def test_unchanged_tables_reuse_profile(self, tmp_path):
+        path = tmp_path / "scan_cache.json"
+        first = ScanCache(path)
+        r1, d1 = run_scan(_FakeClient(), skip=set(), cache=first)
+        first.save({d.table for d in d1})
+        assert first.misses == 8 and first.hits == 0
+
+        client, second = _FakeClient(), ScanCache(path)
+        r2, d2 = run_scan(client, skip=set(), cache=second)
+        assert second.hits == 8 and second.misses == 0
+        assert "sample_table_columns" not in client.rpc_calls
+        assert render_json_report(r2, d2) == render_json_report(r1, d1)
+
+    def test_changed_row_estimate_reprofiles(self, tmp_path, monkeypatch):
+        path = tmp_path / "scan_cache.json"
+        cache = ScanCache(path)
+        run_scan(_FakeClient(), skip=set(), cache=cache)
+        cache.save()
+
+        rows = _FAKE_DB["extra_03"]["rows"] + [{"id": 9, "ref_code": "039999", "label": "Nuova", "note": ""}]
+        monkeypatch.setitem(_FAKE_DB, "extra_03", {**_FAKE_DB["extra_03"], "rows": rows})
+        client, cache = _FakeClient(), ScanCache(path)
+        run_scan(client, skip=set(), cache=cache)
+        assert cache.misses == 1 and cache.hits == 7
+        assert client.rpc_calls.count("sample_table_columns") == 1
+
+    def test_failed_sampling_is_not_cached(self, tmp_path):
+        class _FailingClient(_FakeClient):
+            def rpc(self, name, params):
+                if name == "sample_table_columns" and params["p_table"] == "extra_02":
+                    raise Exception("57014: canceling statement due to statement timeout")
+                return super().rpc(name, params)
+
+        cache = ScanCache(tmp_path / "scan_cache.json")
+        _, drafts = run_scan(_FailingClient(), skip=set(), cache=cache)
+        failed = next(d for d in drafts if d.table == "extra_02")
+        assert failed.sampling_failed and "statement timeout" in failed.notes[0]
+        assert scan_db._TABLE_SAMPLING_AVAILABLE       # non confuso con la RPC assente
+
+        cache.misses = 0
+        run_scan(_FakeClient(), skip=set(), cache=cache)
+        assert cache.misses == 1 and cache.hits == 7
+
+    def test_failed_deep_profile_is_not_cached(self, tmp_path, monkeypatch):
+        stream = scan_db.stream_table
+
+        def _failing_stream(client, table, *args, **kwargs):
+            if table == "extra_02":
+                raise Exception("57014: canceling statement due to statement timeout")
+            return stream(client, table, *args, **kwargs)
+
+        monkeypatch.setattr(scan_db, "stream_table", _failing_stream)
+        cache = ScanCache(tmp_path / "scan_cache.json")
+        _, drafts = run_scan(_FakeClient(), skip=set(), cache=cache, deep=True)
+        failed = next(d for d in drafts if d.table == "extra_02")
+        assert failed.sampling_failed and "statement timeout" in failed.notes[0]
+        assert sum(not d.sampling_failed for d in drafts) == 7   # le altre tabelle profilate
+
+        monkeypatch.setattr(scan_db, "stream_table", stream)
+        cache.misses = 0
+        run_scan(_FakeClient(), skip=set(), cache=cache, deep=True)
+        assert cache.misses == 1 and cache.hits == 7
+
+    def test_version_mismatch_discards_cache(self, tmp_path):
+        path = tmp_path / "scan_cache.json"
+        path.write_text(json.dumps({"version": -1, "tables": {"x": {"signature": "s", "draft": {}}}}))
+        assert ScanCache(path).get("x", "s") is None
+
+
+class TestPatternCoverage:
+
+    DUAL_USE = next(e for e in REGISTRY if e["id"] == "dual_use")
+
+    @pytest.mark.parametrize("pattern, expected", [
+        (r"\b[0-9][A-Z][0-9]{3}\b", r"\y[0-9][A-Z][0-9]{3}\y"),
+        (r"\b\d{4,10}\b",           r"\y\d{4,10}\y"),
+        (r"(?i)(?P<code>\d+)\B",     r"(\d+)\Y"),
+        (r"[\b]x\\b",                r"[\b]x\\b"),      # backspace in classe, backslash letterale
+        (r"\AX\Z",                   r"^X$"),
+    ])
+    def test_to_postgres_regex(self, pattern, expected):
+        assert to_postgres_regex(pattern) == expected
+
+    @pytest.mark.parametrize("pattern", [r"(?P<a>x)(?P=a)", r"(?m)^x"])
+    def test_untranslatable_patterns(self, pattern):
+        with pytest.raises(PatternTranslationError):
+            to_postgres_regex(pattern)
+
+    def test_registry_patterns_translate(self):
+        for entry in REGISTRY:
+            to_postgres_regex(entry["pattern"])
+
+    def test_validation_uses_full_table_coverage(self, monkeypatch):
+        rows = _FAKE_DB["dual_use_items"]["rows"] + [
+            {"id": 10, "code": "X-99", "description": "?", "celex_consolidated": None},
+        ]
+        monkeypatch.setitem(_FAKE_DB, "dual_use_items", {**_FAKE_DB["dual_use_items"], "rows": rows})
+        client = _FakeClient()
+        result = validate_registry_entry(client, self.DUAL_USE, set(_FAKE_DB))
+
+        check = next(c for c in result.checks if c.name == "pattern_coverage")
+        assert check.passed
+        assert "80.0% di 5 righe" in check.detail
+        assert "non conformi: X-99" in check.detail
+        assert client.rpc_calls.count("pattern_coverage") == 1
+
+    def test_below_threshold_fails(self, monkeypatch):
+        rows = [{"id": i, "code": f"BAD{i}", "description": "", "celex_consolidated": None} for i in range(9)]
+        rows.append({"id": 99, "code": "2B002", "description": "", "celex_consolidated": None})
+        monkeypatch.setitem(_FAKE_DB, "dual_use_items", {**_FAKE_DB["dual_use_items"], "rows": rows})
+        result = validate_registry_entry(_FakeClient(), self.DUAL_USE, set(_FAKE_DB))
+        check = next(c for c in result.checks if c.name == "pattern_coverage")
+        assert not check.passed and "soglia" in check.detail
+
+    def test_falls_back_to_samples_without_rpc(self):
+        result = validate_registry_entry(_FakeClient(coverage_rpc=False), self.DUAL_USE, set(_FAKE_DB))
+        check = next(c for c in result.checks if c.name == "pattern_coverage")
+        assert check.passed
+        assert "100% dei campioni" in check.detail and "non deployata" in check.detail
+
+
+class TestLookupPerformance:
+
+    DUAL_USE = next(e for e in REGISTRY if e["id"] == "dual_use")
+
+    def test_index_scan_passes(self):
+        check, perf = check_lookup_performance(_FakeClient(), self.DUAL_USE, row_estimate=50_000, repeats=3)
+        assert check.passed
+        assert perf.mode == "exact" and perf.code == "1A001"
+        assert perf.scan_nodes == ["Index Only Scan"]
+        assert perf.index == "dual_use_items_code_idx"
+        assert "p95" in check.detail and "Index Only Scan" in check.detail
+
+    def test_probe_and_explain_follow_fetch_plan(self, monkeypatch):
+        monkeypatch.setattr("config.TOP_K", 7)
+        entry = {**self.DUAL_USE, "match_mode": "prefix", "fetch": {"order_by": "code"}}
+        plan = scan_db.get_fetch_plan(entry)
+
+        client = MagicMock()
+        scan_db._lookup_query(client, entry, "1A00")
+        query = client.table.return_value
+        query.select.assert_called_once_with(",".join(plan["columns"]))
+        query.select.return_value.like.return_value.order.assert_called_once_with("code")
+        query.select.return_value.like.return_value.order.return_value.limit.assert_called_once_with(7)
+
+        fake = _FakeClient()
+        check_lookup_performance(fake, entry, row_estimate=10, repeats=1)
+        assert fake.explain_params["p_columns"] == plan["columns"]
+        assert (fake.explain_params["p_order"], fake.explain_params["p_limit"]) == ("code", 7)
+
+    def test_seq_scan_on_large_prefix_table_fails(self):
+        entry = {**self.DUAL_USE, "match_mode": "prefix"}
+        check, perf = check_lookup_performance(_FakeClient(plan="Seq Scan"), entry, row_estimate=50_000)
+        assert not check.passed and perf.seq_scan
+        assert perf.code == "1A00"
+        assert "text_pattern_ops" in check.detail
+
+    def test_seq_scan_on_small_table_is_fine(self):
+        check, _ = check_lookup_performance(_FakeClient(plan="Seq Scan"), self.DUAL_USE, row_estimate=10)
+        assert check.passed
+
+    def test_p95_over_threshold_fails(self, monkeypatch):
+        monkeypatch.setattr(scan_db, "LOOKUP_P95_WARN_MS", 0.0)
+        check, _ = check_lookup_performance(_FakeClient(), self.DUAL_USE, row_estimate=10)
+        assert not check.passed and "p95 oltre" in check.detail
+
+    def test_missing_explain_rpc_still_times(self):
+        check, perf = check_lookup_performance(_FakeClient(plan=None), self.DUAL_USE, row_estimate=10)
+        assert check.passed and perf.scan_nodes == []
+        assert "explain_lookup non deployata" in check.detail
+
+    def test_throttle_wait_is_not_timed(self):
+        # Lookup a latenza zero dietro un Throttle a 3 richieste/s: le attese tra
+        # una richiesta e l'altra (~333 ms) non entrano nella latenza misurata.
+        client = ThrottledClient(_FakeClient(), Throttle(1, rate=3))
+        check, perf = check_lookup_performance(client, self.DUAL_USE, row_estimate=10, repeats=3)
+        assert check.passed
+        assert perf.p95_ms < 50
+
+    def test_run_scan_perf_in_reports(self):
+        results, drafts = run_scan(_FakeClient(), skip=set(), check_only=True, perf=True, perf_repeats=2)
+        dual = next(r for r in results if r.entry_id == "dual_use")
+        assert dual.checks[-1].name == "lookup_performance"
+        assert "lookup performance" in render_text_report(results, drafts)
+        data = json.loads(render_json_report(results, drafts))
+        entry = next(e for e in data["registry_validation"] if e["id"] == "dual_use")
+        assert entry["performance"]["index"] == "dual_use_items_code_idx"
+        # Entry con tabella assente: nessun check di performance.
+        missing = next(e for e in data["registry_validation"] if e["id"] != "dual_use")
+        assert "performance" not in missing
+
+
+class TestThrottle:
+
+    def test_rate_limits_request_starts(self):
+        throttle = Throttle(max_inflight=8, rate=50)
+        start = time.perf_counter()
+        threads = [threading.Thread(target=throttle.run, args=(lambda: None,)) for _ in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # 10 avvii a 50/s → almeno 9 intervalli da 20 ms
+        assert time.perf_counter() - start >= 0.17
+
+    def test_throttled_client_wraps_builder_chain(self):
+        raw = MagicMock()
+        raw.table.return_value.select.return_value.eq.return_value.limit.return_value.execute.return_value = "ok"
+        calls = []
+        throttle = Throttle(2)
+        throttle.run = lambda fn: (calls.append(1), fn())[1]
+        client = ThrottledClient(raw, throttle)
+        assert client.table("t").select("c").eq("c", "1").limit(5).execute() == "ok"
+        assert calls == [1]
+
+
+class TestSuggestIndexes:
+
+    _INDEXES = {
+        "dual_use_items": [
+            ("dual_use_items_pkey", "CREATE UNIQUE INDEX dual_use_items_pkey ON public.dual_use_items USING btree (id)"),
+            ("dual_use_items_code_key", "CREATE UNIQUE INDEX dual_use_items_code_key ON public.dual_use_items USING btree (code)"),
+        ],
+        "nomenclature": [
+            ("nomenclature_goods_code_id_idx", "CREATE INDEX nomenclature_goods_code_id_idx ON public.nomenclature USING btree (goods_code, id)"),
+        ],
+        "chunks": [
+            ("chunks_ann_annex", "CREATE INDEX chunks_ann_annex ON public.chunks USING hnsw (embedding vector_cosine_ops) "
+                                 "WHERE (unit_type = 'ANNEX_CODE'::text)"),
+        ],
+    }
+
+    def _client(self, deployed: bool = True):
+        def _rpc(name, params):
+            if not deployed:
+                raise Exception("PGRST202: Could not find the function public.list_table_indexes")
+            rows = [{"index_name": n, "index_def": d} for n, d in self._INDEXES.get(params["p_table"], [])]
+            return MagicMock(execute=MagicMock(return_value=MagicMock(data=rows)))
+        client = MagicMock()
+        client.rpc.side_effect = _rpc
+        return client
+
+    def test_required_indexes_follow_match_mode(self):
+        by_key = {(s.table, s.key): s for s in required_indexes()}
+        assert ("dual_use_items", "code") in by_key
+        assert ("dual_use_items", "code text_pattern_ops") not in by_key
+        assert ("nomenclature", "goods_code text_pattern_ops") in by_key
+        assert ("nomenclature", "goods_code, id") in by_key
+        assert by_key[("chunks", "(metadata->>'code')")].where == "(metadata->>'code') is not null"
+        ann = [s for s in required_indexes() if s.method == "hnsw"]
+        assert [s.where for s in ann] == [None, "unit_type = 'ANNEX_CODE'"]
+
+    def test_index_covers_normalizes_pg_indexdef(self):
+        spec = IndexSpec("chunks", "x", "(metadata->>'code')", where="(metadata->>'code') is not null")
+        assert index_covers(
+            "CREATE INDEX i ON public.chunks USING btree (((metadata ->> 'code'::text))) "
+            "WHERE ((metadata ->> 'code'::text) IS NOT NULL)", spec,
+        )
+        # Senza predicato, o con opclass diversa, l'indice non vale come copertura.
+        assert not index_covers("CREATE INDEX i ON public.chunks USING btree (((metadata ->> 'code'::text)))", spec)
+        pattern = IndexSpec("nomenclature", "x", "goods_code text_pattern_ops")
+        assert not index_covers("CREATE INDEX i ON public.nomenclature USING btree (goods_code)", pattern)
+
+    def test_suggest_marks_existing_and_emits_ddl_for_missing(self):
+        specs = suggest_indexes(self._client(), {"dual_use_items", "nomenclature", "chunks"})
+        existing = {(s.table, s.key, s.where): s.existing for s in specs}
+        assert existing[("dual_use_items", "code", None)] == "dual_use_items_code_key"
+        assert existing[("nomenclature", "goods_code, id", None)] == "nomenclature_goods_code_id_idx"
+        assert existing[("nomenclature", "goods_code text_pattern_ops", None)] is None
+        assert existing[("chunks", "embedding vector_cosine_ops", "unit_type = 'ANNEX_CODE'")] == "chunks_ann_annex"
+
+        sql = render_index_report(specs)
+        assert (
+            "create index concurrently if not exists nomenclature_goods_code_pattern_idx\n"
+            "  on public.nomenclature using btree (goods_code text_pattern_ops);"
+        ) in sql
+        assert "-- già presente: dual_use_items_code_key" in sql
+        assert "using hnsw (embedding vector_cosine_ops);" in sql
+        data = json.loads(render_index_report(specs, as_json=True))
+        assert sum(1 for i in data["indexes"] if i["ddl"]) == sum(1 for s in specs if not s.existing)
+
+    def test_absent_tables_and_missing_rpc(self):
+        specs = suggest_indexes(self._client(deployed=False), {"dual_use_items"})
+        assert {s.table for s in specs} == {"dual_use_items"}
+        assert all(s.existing is None for s in specs)
@@ -0,0 +1,96 @@
+"""
+Level 1 – Unit test: semantic_cache.py (cache dei quasi-duplicati)
+
+Testa:
+  - hit con stessi codici e intent → risposta riusata
+  - intent diverso → solo retrieval riusato
+  - codici diversi sopra soglia → false hit, nessun riuso
+  - vicino più simile con codici diversi: vince la voce sopra soglia con i codici giusti
+  - voci restituite e memorizzate sono copie
+  - soglia, sostituzione FIFO a capacità piena, statistiche
+Nessuna dipendenza esterna (solo NumPy).
+"""
+
+from semantic_cache import CachedAnswer, SemanticCache
+
+
+def _entry(query="obblighi export 2B002", intent="procedural", codes=("2B002",)):
+    return CachedAnswer(
+        query=query, intent=intent, codes=codes, chunks=[{"chunk_text": "x"}],
+        dbs=["dual_use"], sources=[], context="ctx", analytical=False, answer="risposta",
+    )
+
+
+def test_near_duplicate_same_codes_and_intent_reuses_answer():
+    cache = SemanticCache(threshold=0.95, max_entries=10)
+    cache.store([1.0, 0.0, 0.0], _entry())
+
+    hit = cache.lookup([0.99, 0.05, 0.0], "procedural", ["2b002"])
+
+    assert hit is not None and hit.reuse_answer is True
+    assert hit.entry.answer == "risposta"
+    assert cache.stats.hits == 1
+
+
+def test_different_intent_reuses_retrieval_only():
+    cache = SemanticCache(threshold=0.95, max_entries=10)
+    cache.store([1.0, 0.0, 0.0], _entry())
+
+    hit = cache.lookup([1.0, 0.0, 0.0], "generic", ["2B002"])
+
+    assert hit is not None and hit.reuse_answer is False
+    assert cache.stats.retrieval_hits == 1
+
+
+def test_different_codes_counted_as_false_hit():
+    cache = SemanticCache(threshold=0.95, max_entries=10)
+    cache.store([1.0, 0.0, 0.0], _entry())
+
+    assert cache.lookup([1.0, 0.0, 0.0], "procedural", ["2B003"]) is None
+    assert cache.stats.false_hits == 1
+    assert cache.stats.hit_rate == 0.0
+
+
+def test_below_threshold_is_miss():
+    cache = SemanticCache(threshold=0.95, max_entries=10)
+    assert cache.lookup([1.0, 0.0], "generic", []) is None   # cache vuota
+    cache.store([1.0, 0.0], _entry(codes=()))
+    assert cache.lookup([0.0, 1.0], "generic", []) is None
+    assert cache.stats.misses == 2
+
+
+def test_fifo_replacement_at_capacity():
+    cache = SemanticCache(threshold=0.99, max_entries=2)
+    cache.store([1.0, 0.0, 0.0], _entry(query="a"))
+    cache.store([0.0, 1.0, 0.0], _entry(query="b"))
+    cache.store([0.0, 0.0, 1.0], _entry(query="c"))
+
+    assert len(cache) == 2
+    assert cache.lookup([1.0, 0.0, 0.0], "procedural", ["2B002"]) is None
+    assert cache.lookup([0.0, 0.0, 1.0], "procedural", ["2B002"]).entry.query == "c"
+
+
+def test_nearest_with_other_codes_does_not_hide_matching_entry():
+    """2B003 è il vicino più simile, ma 2B002 è sopra soglia con i codici richiesti."""
+    cache = SemanticCache(threshold=0.9, max_entries=10)
+    cache.store([1.0, 0.0, 0.0], _entry(query="obblighi 2B003", codes=("2B003",)))
+    cache.store([0.95, 0.31, 0.0], _entry(query="obblighi 2B002 generico", intent="generic"))
+    cache.store([0.93, 0.37, 0.0], _entry(query="obblighi 2B002"))
+
+    hit = cache.lookup([1.0, 0.0, 0.0], "procedural", ["2B002"])
+
+    assert hit is not None and hit.reuse_answer is True
+    assert hit.entry.query == "obblighi 2B002"        # stesso intent prima della similarità
+    assert cache.stats.hits == 1 and cache.stats.false_hits == 0
+
+
+def test_entries_are_copied_in_and_out():
+    cache = SemanticCache(threshold=0.9, max_entries=10)
+    stored = _entry()
+    cache.store([1.0, 0.0], stored)
+    stored.chunks[0]["chunk_text"] = "modificato dal chiamante"
+
+    first = cache.lookup([1.0, 0.0], "procedural", ["2B002"])
+    first.entry.chunks[0]["chunk_text"] = "modificato dal primo lettore"
+
+    assert cache.lookup([1.0, 0.0], "procedural", ["2B002"]).entry.chunks == [{"chunk_text": "x"}]
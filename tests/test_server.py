@@ -0,0 +1,214 @@
+"""
+Level 3 – Test di integrazione: server.py (servizio HTTP/JSON)
+
+Server reale su una porta libera, con stand-in locali al posto di
+Supabase e OpenAI (retrieval / embeddings / llm mockati come in test_pipeline).
+
+Testa:
+  - /healthz, /readyz (breaker aperto → 503), request ID ripreso o generato
+  - POST /query → QueryResult JSON; errori 400 / 500 / 502 / 504
+  - POST /lookup → lookup_collateral diretto; entry sconosciuta → 404
+  - backpressure: pool e coda pieni → 503 immediato
+  - chiusura ordinata: richieste in corso annullate dopo il periodo di grazia
+"""
+
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from unittest.mock import patch
+
+import pytest
+
+import resilience
+import server as server_mod
+from deadline import DeadlineExceeded
+from registry import REGISTRY
+
+
+DUAL_USE_ENTRY = next(e for e in REGISTRY if e["id"] == "dual_use")
+
+DUAL_USE_CHUNK = {
+    "chunk_text": "2B002: Acoustic wave devices...",
+    "metadata":   {"code": "2B002", "source_id": "dual_use"},
+    "celex_consolidated": "32021R0821",
+    "similarity": 1.0,
+}
+
+
+@pytest.fixture(autouse=True)
+def _reset():
+    resilience.reset()
+    yield
+    resilience.reset()
+
+
+@pytest.fixture
+def running():
+    """Avvia un server e restituisce una factory (workers, max_queue) → (server, base_url)."""
+    started: list[tuple[server_mod.QueryServer, threading.Thread]] = []
+
+    def _start(workers: int = 2, max_queue: int = 4):
+        srv = server_mod.create_server("127.0.0.1", 0, workers=workers, max_queue=max_queue)
+        t = threading.Thread(target=srv.serve_forever, daemon=True)
+        t.start()
+        started.append((srv, t))
+        return srv, f"http://127.0.0.1:{srv.server_address[1]}"
+
+    yield _start
+    for srv, t in started:
+        if not srv.draining:
+            srv.drain(0)
+        t.join(timeout=5)
+
+
+def _request(url: str, body: dict | None = None, headers: dict | None = None) -> tuple[int, dict, dict]:
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json", **(headers or {})})
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            return resp.status, json.loads(resp.read()), dict(resp.headers)
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read()), dict(e.headers)
+
+
+# ── Health / readiness ───────────────────────────────────────────────────────
+
+def test_healthz_generates_request_id(running):
+    _, base = running()
+    status, body, headers = _request(f"{base}/healthz")
+    assert status == 200 and body["status"] == "ok"
+    assert body["request_id"] == headers["X-Request-ID"]
+    assert len(body["request_id"]) == 32
+
+
+def test_readyz_reports_open_breaker(running):
+    _, base = running()
+    status, body, _ = _request(f"{base}/readyz")
+    assert status == 200 and body["status"] == "ready"
+
+    breaker, _ = resilience._state("supabase")
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    status, body, _ = _request(f"{base}/readyz")
+    assert status == 503
+    assert body["status"] == "degraded"
+    assert body["open_breakers"] == ["supabase"]
+
+
+# ── /query ────────────────────────────────────────────────────────────────────
+
+def test_query_returns_query_result(running):
+    _, base = running()
+    with patch("main.detect_code_from_registry", return_value=[(DUAL_USE_ENTRY, "2B002")]), \
+         patch("retrieval.lookup_collateral", return_value=[DUAL_USE_CHUNK]), \
+         patch("llm.generate_answer") as mock_llm:
+        status, body, headers = _request(
+            f"{base}/query", {"question": "dimmi il bene 2B002"}, {"X-Request-ID": "abc-123"}
+        )
+
+    assert status == 200
+    assert body["mode"] == "direct"
+    assert body["codes"] == ["2B002"]
+    assert body["chunks"][0]["chunk_text"].startswith("2B002")
+    assert body["request_id"] == headers["X-Request-ID"] == "abc-123"
+    mock_llm.assert_not_called()
+
+
+def test_query_validation_errors(running):
+    _, base = running()
+    status, body, _ = _request(f"{base}/query", {"question": "   "})
+    assert status == 400 and "question" in body["error"]
+    status, _, _ = _request(f"{base}/query", {"question": "x", "deadline": -1})
+    assert status == 400
+    status, body, _ = _request(f"{base}/query", {"question": "x", "deadline": True})
+    assert status == 400 and "deadline" in body["error"]
+    status, _, _ = _request(f"{base}/lookup", {"entry": "dual_use", "code": "2B002", "top_k": True})
+    assert status == 400
+    status, _, _ = _request(f"{base}/nope", {})
+    assert status == 404
+
+
+def test_query_deadline_exceeded_is_504(running):
+    _, base = running()
+    with patch("main.query", side_effect=DeadlineExceeded("tempo esaurito")):
+        status, body, _ = _request(f"{base}/query", {"question": "obblighi 2B002", "deadline": 1})
+    assert status == 504
+    assert "tempo esaurito" in body["error"]
+
+
+def test_unhandled_errors_are_json_500_or_502(running, capsys):
+    APIError = pytest.importorskip("postgrest.exceptions").APIError
+    _, base = running()
+    with patch("main.query", side_effect=KeyError("chunks")):
+        status, body, _ = _request(f"{base}/query", {"question": "x"}, {"X-Request-ID": "rid-500"})
+    assert status == 500 and body == {"error": "Errore interno del servizio.", "request_id": "rid-500"}
+    assert "rid-500" in capsys.readouterr().out
+
+    with patch("main.query", side_effect=APIError({"code": "42703", "message": "column missing"})):
+        status, body, _ = _request(f"{base}/query", {"question": "x"})
+    assert status == 502 and "column missing" in body["error"]
+
+
+# ── /lookup ───────────────────────────────────────────────────────────────────
+
+def test_lookup_calls_collateral_directly(running):
+    _, base = running()
+    with patch("retrieval.lookup_collateral", return_value=[DUAL_USE_CHUNK]) as mock_lookup:
+        status, body, _ = _request(f"{base}/lookup", {"entry": "dual_use", "code": " 2B002 ", "top_k": 3})
+    assert status == 200
+    assert body["entry"] == "dual_use" and body["code"] == "2B002"
+    assert body["chunks"] == [DUAL_USE_CHUNK]
+    mock_lookup.assert_called_once_with(DUAL_USE_ENTRY, "2B002", top_k=3)
+
+    status, body, _ = _request(f"{base}/lookup", {"entry": "sconosciuta", "code": "1"})
+    assert status == 404
+
+
+# ── Backpressure e chiusura ──────────────────────────────────────────────────
+
+def _blocking_query(release: threading.Event, entered: threading.Event):
+    def _query(question, deadline=None):
+        entered.set()
+        while not release.is_set():
+            deadline.check("stand-in")
+            time.sleep(0.01)
+        return {"mode": "empty", "intent": "generic", "codes": [], "dbs": [],
+                "chunks": [], "answer": None, "sources": [], "log": []}
+    return _query
+
+
+def test_saturated_pool_rejects_with_503(running):
+    _, base = running(workers=1, max_queue=0)
+    release, entered = threading.Event(), threading.Event()
+    results: list[int] = []
+    with patch("main.query", side_effect=_blocking_query(release, entered)):
+        t = threading.Thread(target=lambda: results.append(_request(f"{base}/query", {"question": "a"})[0]))
+        t.start()
+        assert entered.wait(5)
+        status, body, headers = _request(f"{base}/healthz")
+        release.set()
+        t.join(5)
+
+    assert status == 503 and headers["Retry-After"] == "1"
+    assert "saturo" in body["error"]
+    assert results == [200]
+
+
+def test_drain_cancels_inflight_after_grace(running):
+    srv, base = running()
+    release, entered = threading.Event(), threading.Event()
+    results: list[int] = []
+    with patch("main.query", side_effect=_blocking_query(release, entered)):
+        t = threading.Thread(target=lambda: results.append(_request(f"{base}/query", {"question": "a"})[0]))
+        t.start()
+        assert entered.wait(5)
+        assert srv.inflight() == 1
+        start = time.perf_counter()
+        srv.drain(0.2)
+        t.join(5)
+
+    assert time.perf_counter() - start < 3
+    assert results == [503]          # QueryCancelled → 503
+    assert srv.inflight() == 0
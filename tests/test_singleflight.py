@@ -0,0 +1,172 @@
+"""
+Level 1 – Unit test: singleflight.py
+
+Testa:
+  - chiamate concorrenti identiche (thread) → una sola esecuzione, risultato condiviso
+  - eccezione del leader propagata ai follower; chiave libera dopo la chiamata
+  - follower con deadline proprio; leader scaduto → il follower riprova
+  - asyncio: una sola coroutine per chiave
+  - integrazione: lookup_collateral / get_embedding concorrenti → una chiamata esterna
+Nessuna dipendenza esterna.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import deadline as deadline_mod
+from deadline import Deadline, DeadlineExceeded
+from singleflight import Group
+
+
+def _concurrent(n: int, fn):
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        futures = [pool.submit(fn) for _ in range(n)]
+        return [f.result() for f in futures]
+
+
+def _slow(result, calls: list, delay: float = 0.2):
+    def _fn():
+        calls.append(1)
+        time.sleep(delay)
+        return result
+    return _fn
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    group, calls = Group(), []
+    results = _concurrent(8, lambda: group.do("x", "k", _slow([1, 2], calls)))
+
+    assert len(calls) == 1
+    assert all(r == [1, 2] for r in results)
+    assert len({id(r) for r in results}) == 8       # copia per chiamante
+    assert group.stats()["x"] == {"calls": 8, "leaders": 1, "coalesced": 7}
+
+
+def test_different_keys_are_not_coalesced():
+    group, calls = Group(), []
+    _concurrent(4, lambda: group.do("x", threading.get_ident(), _slow(0, calls, 0.05)))
+    assert len(calls) == 4
+
+
+def test_no_caching_after_completion():
+    group, calls = Group(), []
+    group.do("x", "k", _slow(1, calls, 0))
+    group.do("x", "k", _slow(1, calls, 0))
+    assert len(calls) == 2
+
+
+def test_leader_exception_propagates_to_followers():
+    group = Group()
+
+    def _fail():
+        time.sleep(0.1)
+        raise RuntimeError("boom")
+
+    def _call():
+        try:
+            group.do("x", "k", _fail)
+        except RuntimeError as e:
+            return str(e)
+
+    assert _concurrent(4, _call) == ["boom"] * 4
+    assert group.stats()["x"]["leaders"] == 1
+
+
+def test_follower_respects_own_deadline():
+    group, release = Group(), threading.Event()
+    leader = threading.Thread(target=lambda: group.do("x", "k", lambda: release.wait(5)))
+    leader.start()
+    time.sleep(0.05)
+    with deadline_mod.active(Deadline(0.1)):
+        with pytest.raises(DeadlineExceeded):
+            group.do("x", "k", lambda: "mai")
+    release.set()
+    leader.join()
+
+
+def test_follower_retries_when_leader_deadline_expires():
+    group, calls = Group(), []
+
+    def _leader():
+        with deadline_mod.active(Deadline(0.05)):
+            try:
+                group.do("x", "k", lambda: (time.sleep(0.15), deadline_mod.current().check("x")))
+            except DeadlineExceeded:
+                pass
+
+    t = threading.Thread(target=_leader)
+    t.start()
+    time.sleep(0.02)
+    assert group.do("x", "k", _slow("ok", calls, 0)) == "ok"
+    t.join()
+    assert len(calls) == 1
+    assert group.stats()["x"]["leaders"] == 2
+
+
+def test_async_coalescing():
+    group, calls = Group(), []
+
+    async def _fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return [42]
+
+    async def _main():
+        return await asyncio.gather(*(group.do_async("x", "k", _fetch) for _ in range(5)))
+
+    results = asyncio.run(_main())
+    assert results == [[42]] * 5
+    assert len(calls) == 1
+    assert group.stats()["x"]["coalesced"] == 4
+
+
+def test_disabled_runs_every_call():
+    group, calls = Group(), []
+    with patch("config.SINGLE_FLIGHT_ENABLED", False):
+        _concurrent(3, lambda: group.do("x", "k", _slow(0, calls, 0.05)))
+    assert len(calls) == 3
+
+
+# ── Integrazione con retrieval / embeddings ─────────────────────────────────
+
+def test_concurrent_lookup_collateral_one_query():
+    import retrieval
+    from registry import REGISTRY
+
+    entry = next(e for e in REGISTRY if e["id"] == "dual_use")
+    calls = []
+
+    def _execute(query, hedge=False):
+        calls.append(1)
+        time.sleep(0.1)
+        return MagicMock(data=[{"code": "2B002", "description": "Acoustic", "celex_consolidated": "X"}])
+
+    with patch("retrieval._get_client"), patch("retrieval._execute", side_effect=_execute):
+        results = _concurrent(6, lambda: retrieval.lookup_collateral(entry, "2B002"))
+
+    assert len(calls) == 1
+    assert all(len(r) == 1 for r in results)
+
+
+def test_concurrent_get_embedding_one_call():
+    import embeddings
+
+    calls = []
+
+    def _create(**kwargs):
+        calls.append(kwargs["input"])
+        time.sleep(0.1)
+        return MagicMock(data=[MagicMock(embedding=[0.5] * 4)])
+
+    client = MagicMock()
+    client.embeddings.create.side_effect = _create
+    with patch("embeddings._get_client", return_value=client):
+        results = _concurrent(5, lambda: embeddings.get_embedding(" obblighi 8542 "))
+
+    assert calls == ["obblighi 8542"]
+    assert results == [[0.5] * 4] * 5
@@ -0,0 +1,77 @@
+"""
+Level 1 – Unit test: tools/sketches.py
+
+Testa:
+  - HyperLogLog: errore relativo entro la tolleranza teorica, cardinalità basse esatte
+  - SpaceSaving: heavy hitters corretti con contatori limitati
+  - Reservoir: dimensione costante, campione uniforme
+  - ColumnSketch: null, lunghezze, forme, copertura esatta e stimata dei pattern
+Nessuna dipendenza esterna.
+"""
+
+import random
+import sys
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tools.sketches import ColumnSketch, HyperLogLog, Reservoir, SpaceSaving, value_shape
+
+
+def test_value_shape():
+    assert value_shape("2B002") == "9A999"
+    assert value_shape("8544000000 80") == "9999999999 99"
+    assert value_shape("x" * 40) == "TEXT"
+
+
+@pytest.mark.parametrize("n", [50, 1_000, 100_000])
+def test_hyperloglog_error_bounds(n):
+    hll = HyperLogLog(p=12)
+    for i in range(n):
+        hll.add(f"code-{i}")
+        hll.add(f"code-{i}")        # i duplicati non contano
+    # 1.04/√4096 ≈ 1.6%: tolleranza a 4σ
+    assert abs(hll.estimate() - n) / n < 0.065
+
+
+def test_space_saving_finds_heavy_hitters():
+    rng = random.Random(1)
+    stream = ["9999"] * 5000 + ["9A999"] * 3000 + [f"noise{rng.randrange(10_000)}" for _ in range(4000)]
+    rng.shuffle(stream)
+    ss = SpaceSaving(k=16)
+    for item in stream:
+        ss.add(item, item)
+    top = ss.top(2)
+    assert [t[0] for t in top] == ["9999", "9A999"]
+    assert top[0][1] >= 5000 and len(ss._counts) == 16
+
+
+def test_reservoir_is_bounded_and_uniform():
+    hits = Counter()
+    for seed in range(200):
+        r = Reservoir(k=10, seed=seed)
+        for i in range(1000):
+            r.add(str(i))
+        assert len(r.items) == 10 and r.seen == 1000
+        hits.update(int(x) // 100 for x in r.items)
+    # 2000 estrazioni in 10 decili: ~200 ciascuno
+    assert all(130 < hits[d] < 270 for d in range(10))
+
+
+def test_column_sketch_summary_and_coverage():
+    sk = ColumnSketch(patterns={"dual_use": r"\b[0-9][A-E][0-9]{3}\b"}, reservoir_size=5)
+    values = ["2B002", "1A001", "3A225", None, "", "n/a", "9E003"]
+    for v in values:
+        sk.add(v)
+
+    summary = sk.summary()
+    assert summary["rows"] == 7 and summary["nulls"] == 2
+    assert summary["pattern_coverage"] == {"dual_use": 0.8}
+    assert summary["top_shapes"][0] == ["9A999", 4]
+    assert summary["lengths"] == [(3, 1), (5, 4)]
+    assert sk.coverage(r"\b[0-9][A-E][0-9]{3}\b") == pytest.approx(0.8)     # esatta (tracciato)
+    assert sk.coverage(r"^\d[A-Z]\d{3}$") == pytest.approx(0.8)             # stimata dalle forme
+    assert len(sk.reservoir.items) == 5
@@ -0,0 +1,69 @@
+"""
+Level 1 – Unit test: snapshots.py (snapshot locali su file JSON)
+
+Testa lettura da cache, refresh su scadenza/invalidazione e snapshot corrotti.
+Usa una directory temporanea: nessuna scrittura nel progetto.
+"""
+
+import os
+import time
+
+import pytest
+
+import config
+import snapshots
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(config, "SNAPSHOT_TTL_HOURS", 24.0)
+    return tmp_path
+
+
+def _counting_fetch(rows):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return rows
+
+    return fetch, calls
+
+
+def test_first_load_fetches_and_writes(cache_dir):
+    fetch, calls = _counting_fetch([{"a": 1}])
+    assert snapshots.load_rows("t", fetch) == [{"a": 1}]
+    assert len(calls) == 1
+    assert (cache_dir / "t.json").exists()
+
+
+def test_fresh_snapshot_skips_fetch():
+    fetch, calls = _counting_fetch([{"a": 1}])
+    snapshots.load_rows("t", fetch)
+    assert snapshots.load_rows("t", fetch) == [{"a": 1}]
+    assert len(calls) == 1
+
+
+def test_expired_snapshot_refreshes(cache_dir):
+    fetch, calls = _counting_fetch([{"a": 1}])
+    snapshots.load_rows("t", fetch)
+    old = time.time() - 25 * 3600
+    os.utime(cache_dir / "t.json", (old, old))
+    snapshots.load_rows("t", fetch)
+    assert len(calls) == 2
+
+
+def test_invalidate_forces_refresh():
+    fetch, calls = _counting_fetch([{"a": 1}])
+    snapshots.load_rows("t", fetch)
+    snapshots.invalidate("t")
+    snapshots.load_rows("t", fetch)
+    assert len(calls) == 2
+
+
+def test_corrupted_snapshot_refetched(cache_dir):
+    (cache_dir / "t.json").write_text("{non json", encoding="utf-8")
+    fetch, calls = _counting_fetch([{"a": 2}])
+    assert snapshots.load_rows("t", fetch) == [{"a": 2}]
+    assert len(calls) == 1
@@ -0,0 +1,108 @@
+"""
+Level 2 – Integration test: traversal.py (lookup batch mockato)
+
+Testa la traversal multi-hop del grafo links_to:
+  - una chiamata batch per tabella per hop
+  - normalizzazione dei codici con il pattern dell'entry destinazione
+  - limiti di profondità e fan-out, rilevamento cicli
+Nessuna chiamata reale al DB.
+"""
+
+from unittest.mock import patch
+
+import pytest
+
+import registry
+from traversal import traverse_links
+
+
+def _corr_chunk(nc: str, du: str) -> dict:
+    return {
+        "chunk_text": f"{nc}  {du}",
+        "metadata":   {"code": nc, "source_id": "dual_use_correlations", "text_value": du},
+        "celex_consolidated": None,
+        "similarity": 1.0,
+    }
+
+
+def _du_chunk(code: str) -> dict:
+    return {
+        "chunk_text": f"{code}: descrizione",
+        "metadata":   {"code": code, "source_id": "dual_use", "text_value": "descrizione"},
+        "celex_consolidated": "32021R0821",
+        "similarity": 1.0,
+    }
+
+
+@pytest.fixture
+def batch():
+    with patch("retrieval.lookup_collateral_batch") as mock_batch:
+        mock_batch.side_effect = lambda entry, codes: [_du_chunk(c) for c in codes]
+        yield mock_batch
+
+
+def test_single_hop_one_batch_query(batch):
+    seeds = [_corr_chunk("8544300000", "3E001"), _corr_chunk("8544420000", "3A001"),
+             _corr_chunk("8544490000", "3E001")]
+
+    result = traverse_links(seeds)
+
+    batch.assert_called_once()
+    entry, codes = batch.call_args[0]
+    assert entry["id"] == "dual_use"
+    assert codes == ["3E001", "3A001"]            # deduplicati, ordine di scoperta
+    assert result.codes == ["3E001", "3A001"]
+    assert result.entry_ids == ["dual_use"]
+    assert result.hops == 1 and result.queries == 1
+    assert not result.truncated
+
+
+def test_code_normalized_with_target_pattern(batch):
+    result = traverse_links([_corr_chunk("8544300000", "3e001.a")])
+    assert result.codes == ["3E001"]
+
+
+def test_seeds_without_links_to_no_queries(batch):
+    result = traverse_links([_du_chunk("2B002")])
+    batch.assert_not_called()
+    assert result.hops == 0
+    assert result.chunks == []
+
+
+def test_fanout_limit_truncates(batch):
+    seeds = [_corr_chunk(f"85443000{i:02d}", f"3E00{i}") for i in range(5)]
+
+    result = traverse_links(seeds, max_fanout=2)
+
+    assert batch.call_args[0][1] == ["3E000", "3E001"]
+    assert result.truncated
+
+
+def test_depth_zero_no_hops(batch):
+    result = traverse_links([_corr_chunk("8544300000", "3E001")], max_depth=0)
+    batch.assert_not_called()
+    assert result.truncated
+
+
+def test_cycle_detected_across_hops(monkeypatch):
+    """a → b → a: il codice già visitato non viene richiesto una seconda volta."""
+    entries = [
+        {"id": "a", "table": "a", "code_field": "c", "text_field": "t",
+         "pattern": r"\bA\d\b", "match_mode": "exact", "links_to": "b", "source": {}},
+        {"id": "b", "table": "b", "code_field": "c", "text_field": "t",
+         "pattern": r"\bB\d\b", "match_mode": "exact", "links_to": "a", "source": {}},
+    ]
+    monkeypatch.setattr(registry, "REGISTRY", entries)
+
+    def _rows(entry, codes):
+        nxt = {"a": "B1", "b": "A1"}[entry["id"]]
+        return [{"metadata": {"code": c, "source_id": entry["id"], "text_value": nxt}}
+                for c in codes]
+
+    with patch("retrieval.lookup_collateral_batch", side_effect=_rows) as mock_batch:
+        seed = {"metadata": {"code": "A1", "source_id": "a", "text_value": "B1"}}
+        result = traverse_links([seed], max_depth=5)
+
+    assert mock_batch.call_count == 1          # solo b:B1, poi a:A1 è già visitato
+    assert result.codes == ["B1"]
+    assert not result.truncated
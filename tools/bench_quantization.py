@@ -0,0 +1,125 @@
+"""
+CustomsAI – Benchmark quantizzazione embedding  (tools/bench_quantization.py)
+
+Confronta float16 e int8 (quantize.QuantizedMatrix) con float32 sugli
+embedding del corpus chunks: memoria, errore sul prodotto scalare,
+recall@k del top-k rispetto a float32 e tempo di scoring.
+
+Le query sono embedding del corpus perturbati con rumore gaussiano
+(simulano riformulazioni vicine a un chunk esistente).
+
+Utilizzo:
+    python3 tools/bench_quantization.py                    # embedding da Supabase
+    python3 tools/bench_quantization.py --limit 5000       # primi 5000 chunk
+    python3 tools/bench_quantization.py --synthetic 20000  # vettori casuali, nessun DB
+    python3 tools/bench_quantization.py --json
+"""
+
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+# Aggiungi la root del progetto al path per importare config e quantize
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import config
+from quantize import STORAGE_DTYPES, QuantizedMatrix, recall_at_k
+
+
+_PAGE_SIZE = 500
+_K_VALUES  = (1, 5, config.TOP_K)
+
+
+def load_corpus_embeddings(limit: int | None) -> np.ndarray:
+    """Legge chunks.embedding a pagine (ordinati per id), normalizzati a norma 1."""
+    from supabase import create_client
+    from retrieval import _parse_embedding
+
+    client = create_client(config.SUPABASE_URL, config.SUPABASE_SERVICE_KEY)
+    vectors: list[list[float]] = []
+    while limit is None or len(vectors) < limit:
+        page = (
+            client.table(config.TABLE_NAME)
+            .select("id, embedding")
+            .order("id")
+            .range(len(vectors), len(vectors) + _PAGE_SIZE - 1)
+            .execute()
+        ).data or []
+        vectors += [_parse_embedding(r["embedding"]) for r in page if r.get("embedding")]
+        if len(page) < _PAGE_SIZE:
+            break
+    return _unit_rows(np.asarray(vectors[:limit], dtype=np.float32))
+
+
+def _unit_rows(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    return m / np.where(norms == 0, 1.0, norms)
+
+
+def run_benchmark(corpus: np.ndarray, n_queries: int, noise: float, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(corpus), size=min(n_queries, len(corpus)), replace=False)
+    queries = _unit_rows(corpus[picks] + rng.normal(0, noise, (len(picks), corpus.shape[1])).astype(np.float32))
+
+    exact = queries @ corpus.T
+    results = {"corpus": int(len(corpus)), "dim": int(corpus.shape[1]), "queries": int(len(queries)), "storage": []}
+    for dtype in STORAGE_DTYPES:
+        matrix = QuantizedMatrix.from_array(corpus, dtype)
+        start = time.perf_counter()
+        approx = np.stack([matrix.dot(q) for q in queries])
+        elapsed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        results["storage"].append({
+            "dtype":         dtype,
+            "megabytes":     round(matrix.nbytes / 1e6, 2),
+            "max_abs_error": float(np.abs(approx - exact).max()),
+            "recall":        {f"@{k}": round(recall_at_k(exact, approx, k), 4) for k in _K_VALUES},
+            "ms_per_query":  round(elapsed_ms, 3),
+        })
+    return results
+
+
+def render_text(results: dict) -> str:
+    lines = [
+        f"Corpus: {results['corpus']} embedding × {results['dim']} dim, {results['queries']} query",
+        "",
+        f"{'dtype':<8} {'MB':>8} {'max err':>9} " + " ".join(f"{'R' + k:>7}" for k in results["storage"][0]["recall"]) + f" {'ms/query':>9}",
+    ]
+    for s in results["storage"]:
+        lines.append(
+            f"{s['dtype']:<8} {s['megabytes']:>8.2f} {s['max_abs_error']:>9.5f} "
+            + " ".join(f"{v:>7.4f}" for v in s["recall"].values())
+            + f" {s['ms_per_query']:>9.3f}"
+        )
+    return "\n".join(lines)
+
+
+def _parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="CustomsAI – Benchmark quantizzazione embedding.")
+    p.add_argument("--limit",     type=int,   help="Numero massimo di chunk letti dal DB")
+    p.add_argument("--synthetic", type=int,   metavar="N", help="Usa N vettori casuali (1536 dim) invece del DB")
+    p.add_argument("--queries",   type=int,   default=200,  help="Query campionate dal corpus (default 200)")
+    p.add_argument("--noise",     type=float, default=0.02, help="Deviazione standard del rumore sulle query")
+    p.add_argument("--json",      action="store_true", help="Output JSON")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    if args.synthetic:
+        corpus = _unit_rows(np.random.default_rng(1).normal(size=(args.synthetic, 1536)).astype(np.float32))
+    else:
+        corpus = load_corpus_embeddings(args.limit)
+    if not len(corpus):
+        print("[bench] nessun embedding trovato", file=sys.stderr)
+        sys.exit(1)
+
+    results = run_benchmark(corpus, args.queries, args.noise)
+    print(json.dumps(results, indent=2) if args.json else render_text(results))
+
+
+if __name__ == "__main__":
+    main()
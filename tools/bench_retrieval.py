@@ -0,0 +1,349 @@
+"""
+CustomsAI – Benchmark qualità del retrieval vs costo  (tools/bench_retrieval.py)
+
+Esegue un golden set di domande etichettate (CELEX e codici attesi) attraverso
+gli stadi di retrieval della pipeline (normalize_query → get_embedding →
+vector_search, con il fallback globale di main.py) su una griglia di
+TOP_K × type_filters × soglie di similarità, e misura per ogni combinazione:
+
+  recall@k     frazione dei riferimenti attesi presenti nei chunk recuperati
+  hit rate     domande con almeno un riferimento atteso recuperato
+  token        contesto passato all'LLM (prompt.format_context, ~CHARS_PER_TOKEN caratteri/token)
+  latenza      p50/p95 della vector search (l'embedding è uguale per tutte le combinazioni)
+
+La soglia scarta a valle i chunk con similarity < soglia (stesso risultato della
+query, contesto più corto). Raccomandazione: la combinazione con meno token tra
+quelle con recall entro --recall-tolerance dal massimo (a parità, p95 minore).
+Il grafico recall/token è testuale; --csv esporta la tabella per altri strumenti.
+
+Golden set: una domanda per riga,
+  {"question": "...", "expected_celex": ["32021R0821"], "expected_codes": ["2B002"], "intent": "classification"?}
+Esempio: tools/golden_set.example.jsonl.
+
+Filtri (--filters): none (ricerca globale) · pipeline (come main.py: ANNEX_CODE
+per le domande CLASSIFICATION, altrimenti globale) · un unit_type (es. ARTICLE).
+
+Utilizzo:
+    python3 tools/bench_retrieval.py golden.jsonl
+    python3 tools/bench_retrieval.py golden.jsonl --top-k 5,10,15 --thresholds 0,0.4 --filters pipeline,ARTICLE
+    python3 tools/bench_retrieval.py golden.jsonl --csv results.csv
+    python3 tools/bench_retrieval.py golden.jsonl --json
+"""
+
+import sys
+import csv
+import json
+import contextlib
+import math
+import time
+import argparse
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+
+# Aggiungi la root del progetto al path per importare config e i moduli della pipeline
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import config
+
+
+DEFAULT_TOP_K:      tuple[int, ...]   = (5, 8, 10, 15, 20)   # intervallo ammesso da config.TOP_K
+DEFAULT_THRESHOLDS: tuple[float, ...] = (0.0, 0.3, 0.4, 0.5)
+DEFAULT_FILTERS:    tuple[str, ...]   = ("none", "pipeline")
+RECALL_TOLERANCE:   float = 0.02
+# Stima dei token dai caratteri (stessa unità di MAX_CONTEXT_CHARS).
+CHARS_PER_TOKEN:    int   = 4
+
+_PLOT_WIDTH  = 56
+_PLOT_HEIGHT = 12
+
+SearchFn = Callable[[list[float], int, list[str] | None], list[dict]]
+EmbedFn  = Callable[[str], list[float]]
+
+
+@dataclass
+class GoldenItem:
+    question:       str
+    expected_celex: list[str] = field(default_factory=list)
+    expected_codes: list[str] = field(default_factory=list)
+    intent:         str | None = None     # default: retrieval.detect_intent(question)
+
+    @property
+    def expected(self) -> int:
+        return len(self.expected_celex) + len(self.expected_codes)
+
+
+# ============================================================
+# Golden set e metriche
+# ============================================================
+
+def load_golden(path: Path) -> list[GoldenItem]:
+    """Righe JSONL del golden set; ogni domanda deve avere almeno un riferimento atteso."""
+    items: list[GoldenItem] = []
+    for n, line in enumerate(path.read_text(encoding="utf-8").splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        raw = json.loads(line)
+        item = GoldenItem(
+            question=str(raw.get("question") or "").strip(),
+            expected_celex=[str(c).strip().upper() for c in raw.get("expected_celex", [])],
+            expected_codes=[str(c).strip().upper() for c in raw.get("expected_codes", [])],
+            intent=raw.get("intent"),
+        )
+        if not item.question or not item.expected:
+            raise ValueError(f"{path}:{n}: servono 'question' e almeno un expected_celex/expected_codes")
+        items.append(item)
+    if not items:
+        raise ValueError(f"{path}: golden set vuoto")
+    return items
+
+
+def found_references(item: GoldenItem, chunks: list[dict]) -> set[str]:
+    """
+    Riferimenti attesi presenti nei chunk: CELEX in celex_consolidated, codici
+    in metadata.code (anche come sotto-voce, "8544" ⊂ "8544000000 80") o nel testo.
+    """
+    celex = {str(c.get("celex_consolidated") or "").upper() for c in chunks}
+    codes = [str((c.get("metadata") or {}).get("code") or "").upper() for c in chunks]
+    texts = [str(c.get("chunk_text") or "").upper() for c in chunks]
+
+    found = {f"celex:{x}" for x in item.expected_celex if x in celex}
+    found |= {
+        f"code:{x}" for x in item.expected_codes
+        if any(code.startswith(x) for code in codes) or any(x in text for text in texts)
+    }
+    return found
+
+
+def recall(item: GoldenItem, chunks: list[dict]) -> float:
+    return len(found_references(item, chunks)) / item.expected
+
+
+def context_tokens(chunks: list[dict]) -> int:
+    from prompt import format_context
+    return math.ceil(len(format_context(chunks)) / CHARS_PER_TOKEN)
+
+
+def _percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * p / 100) - 1)] if ordered else 0.0
+
+
+# ============================================================
+# Esecuzione della griglia
+# ============================================================
+
+def _intent(item: GoldenItem):
+    from retrieval import Intent, detect_intent
+    return Intent(item.intent) if item.intent else detect_intent(item.question)
+
+
+def resolve_filters(mode: str, item: GoldenItem) -> list[str] | None:
+    from retrieval import Intent
+    if mode == "none":
+        return None
+    if mode == "pipeline":
+        return ["ANNEX_CODE"] if _intent(item) == Intent.CLASSIFICATION else None
+    return [mode.upper()]
+
+
+def _default_embed(text: str) -> list[float]:
+    import embeddings
+    return embeddings.get_embedding(text)
+
+
+def _default_search(embedding: list[float], k: int, type_filters: list[str] | None) -> list[dict]:
+    import retrieval
+    return retrieval.vector_search(embedding, top_k=k, type_filters=type_filters)
+
+
+def run_benchmark(
+    items: list[GoldenItem],
+    top_ks: tuple[int, ...] = DEFAULT_TOP_K,
+    filter_modes: tuple[str, ...] = DEFAULT_FILTERS,
+    thresholds: tuple[float, ...] = DEFAULT_THRESHOLDS,
+    search: SearchFn | None = None,
+    embed: EmbedFn | None = None,
+    repeats: int = 1,
+    verbose: bool = False,
+) -> dict:
+    """
+    Una vector search per domanda × filtro × k (latenza = mediana su `repeats`);
+    le soglie sono applicate ai risultati di quella ricerca.
+    Restituisce {"questions", "embedding_ms", "configs": [...]} con una riga per combinazione.
+    """
+    from query_normalizer import normalize_query
+
+    search = search or _default_search
+    embed = embed or _default_embed
+
+    embedding_ms: list[float] = []
+    vectors: list[list[float]] = []
+    for item in items:
+        start = time.perf_counter()
+        vectors.append(embed(normalize_query(item.question, _intent(item))))
+        embedding_ms.append((time.perf_counter() - start) * 1000)
+
+    configs: list[dict] = []
+    for mode in filter_modes:
+        for k in top_ks:
+            if verbose:
+                print(f"[bench] filtri={mode} k={k}…", file=sys.stderr)
+            latencies: list[float] = []
+            per_threshold: dict[float, list[tuple[float, int]]] = {t: [] for t in thresholds}
+            for item, vector in zip(items, vectors):
+                filters = resolve_filters(mode, item)
+                timings: list[float] = []
+                for _ in range(max(1, repeats)):
+                    start = time.perf_counter()
+                    chunks = search(vector, k, filters)
+                    if not chunks and filters:
+                        chunks = search(vector, k, None)      # fallback globale di main.py
+                    timings.append((time.perf_counter() - start) * 1000)
+                latencies.append(_percentile(timings, 50))
+                for t in thresholds:
+                    kept = [c for c in chunks if (c.get("similarity") or 0.0) >= t]
+                    per_threshold[t].append((recall(item, kept), context_tokens(kept)))
+
+            for t, rows in per_threshold.items():
+                configs.append({
+                    "filters":    mode,
+                    "top_k":      k,
+                    "threshold":  t,
+                    "recall":     round(sum(r for r, _ in rows) / len(rows), 4),
+                    "hit_rate":   round(sum(1 for r, _ in rows if r > 0) / len(rows), 4),
+                    "tokens":     round(sum(tok for _, tok in rows) / len(rows), 1),
+                    "p50_ms":     round(_percentile(latencies, 50), 1),
+                    "p95_ms":     round(_percentile(latencies, 95), 1),
+                })
+
+    return {
+        "questions":    len(items),
+        "embedding_ms": round(_percentile(embedding_ms, 50), 1),
+        "configs":      configs,
+    }
+
+
+def pareto_front(configs: list[dict]) -> list[dict]:
+    """Combinazioni non dominate (nessun'altra con recall ≥, token ≤ e almeno una stretta)."""
+    return [
+        c for c in configs
+        if not any(
+            o["recall"] >= c["recall"] and o["tokens"] <= c["tokens"]
+            and (o["recall"] > c["recall"] or o["tokens"] < c["tokens"])
+            for o in configs
+        )
+    ]
+
+
+def recommend(configs: list[dict], tolerance: float = RECALL_TOLERANCE) -> dict:
+    """La combinazione più economica (token, poi p95) con recall entro `tolerance` dal massimo."""
+    best = max(c["recall"] for c in configs)
+    eligible = [c for c in configs if c["recall"] >= best - tolerance]
+    return min(eligible, key=lambda c: (c["tokens"], c["p95_ms"], c["top_k"]))
+
+
+# ============================================================
+# Rendering
+# ============================================================
+
+def _label(c: dict) -> str:
+    return f"{c['filters']}/k={c['top_k']}/t={c['threshold']:g}"
+
+
+def render_plot(configs: list[dict]) -> list[str]:
+    """Grafico testuale recall (y) vs token (x): * frontiera di Pareto, · altre combinazioni."""
+    max_tokens = max(c["tokens"] for c in configs) or 1
+    grid = [[" "] * _PLOT_WIDTH for _ in range(_PLOT_HEIGHT)]
+    front = {id(c) for c in pareto_front(configs)}
+    for c in sorted(configs, key=lambda c: id(c) in front):
+        x = round(c["tokens"] / max_tokens * (_PLOT_WIDTH - 1))
+        y = _PLOT_HEIGHT - 1 - round(c["recall"] * (_PLOT_HEIGHT - 1))
+        grid[y][x] = "*" if id(c) in front else "·"
+    lines = []
+    for i, row in enumerate(grid):
+        recall_tick = 1 - i / (_PLOT_HEIGHT - 1)
+        lines.append(f"  {recall_tick:>4.2f} │{''.join(row)}")
+    lines.append(f"       └{'─' * _PLOT_WIDTH}")
+    lines.append(f"        0{'token di contesto':^{_PLOT_WIDTH - 10}}{max_tokens:>8.0f}")
+    return lines
+
+
+def render_text(results: dict, tolerance: float = RECALL_TOLERANCE) -> str:
+    configs = results["configs"]
+    front = {id(c) for c in pareto_front(configs)}
+    choice = recommend(configs, tolerance)
+    lines = [
+        f"Golden set: {results['questions']} domande · embedding p50 {results['embedding_ms']:.0f} ms",
+        "",
+        f"   {'filtri':<12} {'k':>3} {'soglia':>6} {'recall':>7} {'hit':>6} {'token':>7} {'p50 ms':>8} {'p95 ms':>8}",
+    ]
+    for c in configs:
+        mark = "→" if c is choice else "*" if id(c) in front else " "
+        lines.append(
+            f" {mark} {c['filters']:<12} {c['top_k']:>3} {c['threshold']:>6.2f} {c['recall']:>7.3f} "
+            f"{c['hit_rate']:>6.2f} {c['tokens']:>7.0f} {c['p50_ms']:>8.1f} {c['p95_ms']:>8.1f}"
+        )
+    lines += ["", "Recall vs token (* frontiera di Pareto)"] + render_plot(configs)
+    lines += [
+        "",
+        f"Consigliato: {_label(choice)} · recall {choice['recall']:.3f} "
+        f"(max {max(c['recall'] for c in configs):.3f}, tolleranza {tolerance:g}) · "
+        f"~{choice['tokens']:.0f} token · p95 {choice['p95_ms']:.0f} ms "
+        f"(TOP_K attuale: {config.TOP_K})",
+    ]
+    return "\n".join(lines)
+
+
+def write_csv(results: dict, path: Path) -> None:
+    with path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(results["configs"][0]))
+        writer.writeheader()
+        writer.writerows(results["configs"])
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def _csv_list(cast):
+    return lambda s: tuple(cast(x) for x in s.split(",") if x.strip())
+
+
+def _parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="CustomsAI – Benchmark recall@k vs token e latenza del retrieval.")
+    p.add_argument("golden", type=Path, help="Golden set JSONL (question, expected_celex, expected_codes)")
+    p.add_argument("--top-k",      type=_csv_list(int),   default=DEFAULT_TOP_K, metavar="K1,K2",
+                   help=f"Valori di TOP_K (default {','.join(map(str, DEFAULT_TOP_K))})")
+    p.add_argument("--filters",    type=_csv_list(str),   default=DEFAULT_FILTERS, metavar="F1,F2",
+                   help="none | pipeline | unit_type (default none,pipeline)")
+    p.add_argument("--thresholds", type=_csv_list(float), default=DEFAULT_THRESHOLDS, metavar="T1,T2",
+                   help=f"Soglie di similarità (default {','.join(map(str, DEFAULT_THRESHOLDS))})")
+    p.add_argument("--repeats",    type=int, default=1, help="Ricerche cronometrate per domanda (mediana)")
+    p.add_argument("--recall-tolerance", type=float, default=RECALL_TOLERANCE,
+                   help=f"Perdita di recall ammessa per la raccomandazione (default {RECALL_TOLERANCE})")
+    p.add_argument("--csv",        type=Path, metavar="FILE", help="Esporta la tabella in CSV")
+    p.add_argument("--json",       action="store_true", help="Output JSON")
+    p.add_argument("--verbose",    action="store_true", help="Stampa progressione su stderr")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    items = load_golden(args.golden)
+    # I log di retrieval ("[vector] …") vanno su stderr: stdout resta il solo report.
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run_benchmark(
+            items, args.top_k, args.filters, args.thresholds,
+            repeats=args.repeats, verbose=args.verbose,
+        )
+    results["recommended"] = recommend(results["configs"], args.recall_tolerance)
+    if args.csv:
+        write_csv(results, args.csv)
+        print(f"[bench] CSV salvato in: {args.csv}", file=sys.stderr)
+    print(json.dumps(results, indent=2) if args.json else render_text(results, args.recall_tolerance))
+
+
+if __name__ == "__main__":
+    main()
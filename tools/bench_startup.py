@@ -0,0 +1,249 @@
+"""
+CustomsAI – Benchmark dell'avvio della CLI  (tools/bench_startup.py)
+
+Misura quanto costa `python main.py "2B002"` prima di qualunque rete:
+
+  import main   `python -X importtime -c "import main"`: tempo cumulativo, costo
+                per package (somma dei tempi "self") e package pesanti caricati
+                (openai, supabase, numpy devono restare differiti al primo uso)
+  percorso      lookup diretto CODE_SPECIFIC in un processo nuovo con Supabase
+  diretto       stand-in a latenza zero (tools/loadtest.py): avvio interprete +
+                import main + import del client supabase + query(), confrontato
+                con DIRECT_PATH_TARGET_MS. Una domanda per entry (codice DU e
+                codice NC). Le letture di intere tabelle costano FULL_SCAN_STUB_MS:
+                un indice in memoria costruito sul percorso della domanda va
+                fuori target. Nessun LLM: openai e numpy non devono essere importati.
+  --live        wall time di `python main.py "<domanda>"` vero (credenziali .env,
+                include la latenza di rete verso Supabase)
+
+Ogni misura è la mediana di --repeats processi. Con --check l'uscita è 1 se il
+percorso diretto supera il target o carica un modulo che dovrebbe essere differito.
+
+Utilizzo:
+    python3 tools/bench_startup.py
+    python3 tools/bench_startup.py "Cosa è il bene 2B002?" "8544" --repeats 10 --check
+    python3 tools/bench_startup.py --live
+    python3 tools/bench_startup.py --json
+"""
+
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import time
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Un codice dual_use (lookup exact) e uno di nomenclatura (indice gerarchico + correlazioni).
+DEFAULT_QUESTIONS: tuple[str, ...] = ("2B002", "8544")
+DEFAULT_REPEATS:  int = 5
+# Latenza stand-in di una lettura di intera tabella (paging completo di nomenclature).
+FULL_SCAN_STUB_MS: float = 2000.0
+# Target del percorso diretto senza rete (interprete + import + query con stand-in).
+# Riferimento: ~1.1 s quando openai/supabase/numpy erano importati da `import main`.
+DIRECT_PATH_TARGET_MS: float = 500.0
+
+# Package che `import main` non deve caricare: arrivano al primo uso.
+DEFERRED_ON_IMPORT: tuple[str, ...] = ("openai", "supabase", "numpy")
+# Package che un lookup diretto non deve caricare (supabase serve, l'LLM no).
+DEFERRED_ON_DIRECT: tuple[str, ...] = ("openai", "numpy")
+
+_TOP_PACKAGES = 10
+
+# Eseguito in un processo nuovo: tempi per fase, modo e package caricati su stdout (JSON).
+_DIRECT_PATH_SCRIPT = """
+import contextlib, json, sys, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+import supabase                      # pagato dal vero retrieval._get_client() al primo lookup
+t2 = time.perf_counter()
+from tools.loadtest import Stubs, stand_ins
+with stand_ins(Stubs(supabase_ms=0, scan_ms=float(sys.argv[2]), embedding_ms=0, llm_ms=0, jitter=0)), \\
+        contextlib.redirect_stdout(sys.stderr):
+    t3 = time.perf_counter()
+    result = main.query(sys.argv[1])
+    t4 = time.perf_counter()
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000, "client_ms": (t2 - t1) * 1000, "query_ms": (t4 - t3) * 1000,
+    "mode": result["mode"], "intent": result["intent"],
+    "loaded": sorted(m for m in sys.argv[3:] if m in sys.modules),
+}))
+"""
+
+
+# ============================================================
+# -X importtime
+# ============================================================
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int, int]]:
+    """
+    Righe di `-X importtime` → [(modulo, self µs, cumulativo µs, profondità)].
+    La profondità è il rientro del nome (0 = import di primo livello).
+    """
+    rows: list[tuple[str, int, int, int]] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue                                    # intestazione "self [us] | cumulative | …"
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(parts[0]), int(parts[1]), depth))
+    return rows
+
+
+def package_costs(rows: list[tuple[str, int, int, int]]) -> dict[str, float]:
+    """Somma dei tempi self per package di primo livello, in ms, dal più costoso."""
+    costs: dict[str, float] = defaultdict(float)
+    for name, self_us, _, _ in rows:
+        costs[name.split(".")[0]] += self_us / 1000
+    return dict(sorted(costs.items(), key=lambda kv: -kv[1]))
+
+
+def measure_import(module: str = "main", repeats: int = DEFAULT_REPEATS) -> dict:
+    """
+    Importa `module` in --repeats processi nuovi con -X importtime.
+    cumulative_ms: mediana del tempo cumulativo del modulo; packages dall'ultima esecuzione.
+    """
+    totals: list[float] = []
+    rows: list[tuple[str, int, int, int]] = []
+    for _ in range(repeats):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=ROOT, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"import {module} fallito:\n{proc.stderr[-2000:]}")
+        rows = parse_importtime(proc.stderr)
+        totals += [cum / 1000 for name, _, cum, depth in rows if name == module and depth == 0]
+    loaded = {name.split(".")[0] for name, *_ in rows}
+    return {
+        "module":        module,
+        "cumulative_ms": round(statistics.median(totals), 1) if totals else 0.0,
+        "packages":      {k: round(v, 1) for k, v in list(package_costs(rows).items())[:_TOP_PACKAGES]},
+        "deferred_loaded": [m for m in DEFERRED_ON_IMPORT if m in loaded],
+    }
+
+
+# ============================================================
+# Percorso diretto
+# ============================================================
+
+def _wall_ms(argv: list[str]) -> tuple[float, subprocess.CompletedProcess]:
+    start = time.perf_counter()
+    proc = subprocess.run(argv, cwd=ROOT, capture_output=True, text=True)
+    return (time.perf_counter() - start) * 1000, proc
+
+
+def measure_direct_path(question: str = DEFAULT_QUESTIONS[0], repeats: int = DEFAULT_REPEATS,
+                        target_ms: float = DIRECT_PATH_TARGET_MS) -> dict:
+    """
+    Lookup diretto in processi nuovi con Supabase stand-in (latenza zero, salvo
+    FULL_SCAN_STUB_MS per le letture di intere tabelle).
+    total_ms = avvio interprete (`python -c pass`) + import main + import supabase + query().
+    """
+    interpreter = statistics.median(_wall_ms([sys.executable, "-c", "pass"])[0] for _ in range(repeats))
+    phases: dict[str, list[float]] = defaultdict(list)
+    last: dict = {}
+    for _ in range(repeats):
+        _, proc = _wall_ms([sys.executable, "-c", _DIRECT_PATH_SCRIPT,
+                            question, str(FULL_SCAN_STUB_MS), *DEFERRED_ON_DIRECT])
+        if proc.returncode != 0:
+            raise RuntimeError(f"percorso diretto fallito:\n{proc.stderr[-2000:]}")
+        last = json.loads(proc.stdout.strip().splitlines()[-1])
+        for key in ("import_ms", "client_ms", "query_ms"):
+            phases[key].append(last[key])
+
+    result = {"question": question, "mode": last["mode"], "intent": last["intent"],
+              "interpreter_ms": round(interpreter, 1)}
+    result.update({key: round(statistics.median(values), 1) for key, values in phases.items()})
+    result["total_ms"] = round(interpreter + sum(result[k] for k in phases), 1)
+    result["target_ms"] = target_ms
+    result["deferred_loaded"] = last["loaded"]
+    result["ok"] = (result["total_ms"] <= target_ms and not result["deferred_loaded"]
+                    and result["mode"] == "direct")
+    return result
+
+
+def measure_live(question: str = DEFAULT_QUESTIONS[0], repeats: int = DEFAULT_REPEATS) -> dict:
+    """Wall time di `python main.py "<domanda>"` reale (rete inclusa)."""
+    times: list[float] = []
+    for _ in range(repeats):
+        elapsed, proc = _wall_ms([sys.executable, "main.py", question])
+        if proc.returncode != 0:
+            raise RuntimeError(f"main.py fallito:\n{(proc.stdout + proc.stderr)[-2000:]}")
+        times.append(elapsed)
+    return {"question": question, "p50_ms": round(statistics.median(times), 1),
+            "max_ms": round(max(times), 1)}
+
+
+# ============================================================
+# Report
+# ============================================================
+
+def render_text(report: dict) -> str:
+    imp = report["import"]
+    lines = [
+        "=== import main (-X importtime) ===",
+        f"  cumulativo: {imp['cumulative_ms']:.1f} ms",
+        "  differiti caricati: " + (", ".join(imp["deferred_loaded"]) or "nessuno"),
+        "  package (self ms):",
+    ]
+    lines += [f"    {name:<24} {ms:8.1f}" for name, ms in imp["packages"].items()]
+    for direct in report["direct"]:
+        lines += [
+            "",
+            f"=== percorso diretto: {direct['question']!r} → {direct['intent']}/{direct['mode']} ===",
+            f"  interprete   {direct['interpreter_ms']:8.1f} ms",
+            f"  import main  {direct['import_ms']:8.1f} ms",
+            f"  client       {direct['client_ms']:8.1f} ms   (import supabase)",
+            f"  query        {direct['query_ms']:8.1f} ms   (Supabase stand-in, letture intere "
+            f"tabelle {FULL_SCAN_STUB_MS:.0f} ms)",
+            f"  totale       {direct['total_ms']:8.1f} ms   target {direct['target_ms']:.0f} ms"
+            f" → {'OK' if direct['ok'] else 'FUORI TARGET'}",
+            "  differiti caricati: " + (", ".join(direct["deferred_loaded"]) or "nessuno"),
+        ]
+    for live in report.get("live", []):
+        lines += ["", f"=== live: python main.py {live['question']!r} ===",
+                  f"  p50 {live['p50_ms']:.1f} ms · max {live['max_ms']:.1f} ms"]
+    return "\n".join(lines)
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def _parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="CustomsAI – Benchmark dell'avvio della CLI (import e percorso diretto).")
+    p.add_argument("questions", nargs="*", default=list(DEFAULT_QUESTIONS),
+                   help=f"Domande a lookup diretto (default {' '.join(DEFAULT_QUESTIONS)})")
+    p.add_argument("--repeats",   type=int, default=DEFAULT_REPEATS, help="Processi per misura (mediana)")
+    p.add_argument("--target-ms", type=float, default=DIRECT_PATH_TARGET_MS,
+                   help=f"Target del percorso diretto senza rete (default {DIRECT_PATH_TARGET_MS:.0f})")
+    p.add_argument("--live",  action="store_true", help="Misura anche `python main.py` reale (credenziali .env)")
+    p.add_argument("--check", action="store_true", help="Uscita 1 se fuori target o con moduli differiti caricati")
+    p.add_argument("--json",  action="store_true", help="Output JSON")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    report = {
+        "import": measure_import("main", args.repeats),
+        "direct": [measure_direct_path(q, args.repeats, args.target_ms) for q in args.questions],
+    }
+    if args.live:
+        report["live"] = [measure_live(q, args.repeats) for q in args.questions]
+    print(json.dumps(report, indent=2) if args.json else render_text(report))
+    ok = all(d["ok"] for d in report["direct"]) and not report["import"]["deferred_loaded"]
+    if args.check and not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,11 +8,24 @@
 --   list_public_tables()                         → tabelle pubbliche + stima righe
 --   get_table_columns(p_table)                   → colonne con tipo e nullability
 --   sample_column_values(p_table, p_col, p_limit) → valori distinti da una colonna
+--   sample_table_columns(p_table, p_columns, p_limit) → valori distinti di più colonne (1 chiamata)
+--   pattern_coverage(p_table, p_column, p_pattern, p_examples) → righe che matchano una regex (tutta la tabella)
+--   explain_lookup(p_table, p_column, p_value, p_mode, p_columns, p_order, p_limit)
+--                                                → piano (EXPLAIN JSON) del lookup exact/prefix
+--   list_table_indexes(p_table)                  → indici della tabella con definizione (pg_get_indexdef)
+--   stream_table_page(p_table, p_columns, p_after, p_limit) → pagina di righe in ordine di ctid (keyset)
 --
 -- SICUREZZA:
 --   - SECURITY DEFINER: le funzioni girano con i permessi del proprietario
 --   - sample_column_values usa format() con %I (quote_ident) → no SQL injection
 --   - sample_column_values valida il table_name contro pg_class prima di eseguire
+--   - sample_table_columns valida tabella e colonne contro il catalogo prima di eseguire
+--   - pattern_coverage passa la regex come letterale (%L), mai come SQL
+--   - explain_lookup esegue solo EXPLAIN (senza ANALYZE): la query non viene eseguita;
+--     colonne e ordinamento validati contro il catalogo e quotati con %I
+--   - list_table_indexes legge solo il catalogo (nessun SQL dinamico)
+--   - stream_table_page valida le colonne contro il catalogo, le quota con %I / %L
+--     e passa il cursore come parametro ($1), mai come SQL
 
 
 -- ============================================================
@@ -108,3 +121,272 @@ begin
   );
 end;
 $$;
+
+
+-- ============================================================
+-- 4. sample_table_columns
+--    Come sample_column_values, ma per tutte le colonne indicate
+--    in una sola chiamata: una riga (column_name, value) per valore.
+--    Le colonne inesistenti sono ignorate; stessa validazione e
+--    quoting (%I / %L) di sample_column_values.
+-- ============================================================
+
+drop function if exists sample_table_columns(text, text[], int);
+
+create or replace function sample_table_columns(
+  p_table   text,
+  p_columns text[],
+  p_limit   int default 20
+)
+returns table(column_name text, value text)
+language plpgsql
+security definer
+stable
+as $$
+declare
+  col text;
+begin
+  if not exists (
+    select 1
+    from pg_class c
+    join pg_namespace n on n.oid = c.relnamespace
+    where n.nspname = 'public'
+      and c.relname = p_table
+      and c.relkind = 'r'
+  ) then
+    raise exception 'Table % not found in public schema', p_table;
+  end if;
+
+  foreach col in array p_columns loop
+    continue when not exists (
+      select 1
+      from pg_attribute a
+      join pg_class     c on c.oid = a.attrelid
+      join pg_namespace n on n.oid = c.relnamespace
+      where n.nspname = 'public'
+        and c.relname = p_table
+        and a.attname = col
+        and a.attnum  > 0
+        and not a.attisdropped
+    );
+
+    return query execute format(
+      'select %L::text, v from (select distinct %I::text as v from public.%I where %I is not null limit %s) s',
+      col, col, p_table, col, p_limit
+    );
+  end loop;
+end;
+$$;
+
+
+-- ============================================================
+-- 5. pattern_coverage
+--    Copertura di una regex (sintassi ARE di PostgreSQL, case-insensitive)
+--    su TUTTE le righe non null di una colonna, in un solo round trip:
+--    totale, righe conformi e fino a p_examples valori non conformi.
+--    La regex arriva già tradotta da Python (tools/scan_db.py:
+--    to_postgres_regex, es. \b → \y).
+-- ============================================================
+
+drop function if exists pattern_coverage(text, text, text, int);
+
+create or replace function pattern_coverage(
+  p_table    text,
+  p_column   text,
+  p_pattern  text,
+  p_examples int default 5
+)
+returns table(total bigint, matched bigint, examples text[])
+language plpgsql
+security definer
+stable
+as $$
+begin
+  if not exists (
+    select 1
+    from pg_attribute a
+    join pg_class     c on c.oid = a.attrelid
+    join pg_namespace n on n.oid = c.relnamespace
+    where n.nspname = 'public'
+      and c.relname = p_table
+      and c.relkind = 'r'
+      and a.attname = p_column
+      and a.attnum  > 0
+      and not a.attisdropped
+  ) then
+    raise exception 'Column %.% not found in public schema', p_table, p_column;
+  end if;
+
+  return query execute format(
+    'select count(*), count(*) filter (where %1$I::text ~* %3$L), '
+    '  array(select %1$I::text from public.%2$I '
+    '        where %1$I is not null and not (%1$I::text ~* %3$L) limit %4$s) '
+    'from public.%2$I where %1$I is not null',
+    p_column, p_table, p_pattern, p_examples
+  );
+end;
+$$;
+
+
+-- ============================================================
+-- 6. explain_lookup
+--    Piano del lookup generato da retrieval.lookup_collateral:
+--      p_mode = 'exact'  → where col = p_value
+--      p_mode = 'prefix' → where col like p_value || '%'
+--    con la stessa proiezione (p_columns, default la sola colonna del
+--    filtro), ordinamento (p_order) e limit (p_limit) del piano di fetch.
+--    Solo EXPLAIN (format json), senza ANALYZE: serve a scoprire
+--    sequential scan dovute a indici mancanti (es. text_pattern_ops)
+--    e sort espliciti dovuti a un ordinamento non coperto dall'indice.
+-- ============================================================
+
+drop function if exists explain_lookup(text, text, text, text);
+drop function if exists explain_lookup(text, text, text, text, text[], text, int);
+
+create or replace function explain_lookup(
+  p_table   text,
+  p_column  text,
+  p_value   text,
+  p_mode    text   default 'exact',
+  p_columns text[] default null,
+  p_order   text   default null,
+  p_limit   int    default 5
+)
+returns json
+language plpgsql
+security definer
+as $$
+declare
+  plan        json;
+  missing     text;
+  select_list text;
+begin
+  -- Filtro, proiezione e ordinamento: solo colonne esistenti della tabella
+  select c into missing
+  from unnest(
+    array[p_column]
+    || coalesce(p_columns, '{}'::text[])
+    || case when p_order is null then '{}'::text[] else array[p_order] end
+  ) as c
+  where not exists (
+    select 1
+    from pg_attribute a
+    join pg_class     t on t.oid = a.attrelid
+    join pg_namespace n on n.oid = t.relnamespace
+    where n.nspname = 'public'
+      and t.relname = p_table
+      and t.relkind = 'r'
+      and a.attname = c
+      and a.attnum  > 0
+      and not a.attisdropped
+  )
+  limit 1;
+  if missing is not null then
+    raise exception 'Column %.% not found in public schema', p_table, missing;
+  end if;
+  if p_mode not in ('exact', 'prefix') then
+    raise exception 'Unsupported mode %', p_mode;
+  end if;
+
+  select string_agg(format('%I', c), ', ' order by i) into select_list
+  from unnest(coalesce(p_columns, array[p_column])) with ordinality as u(c, i);
+
+  execute format(
+    'explain (format json) select %s from public.%I where %I %s %L%s limit %s',
+    select_list, p_table, p_column,
+    case when p_mode = 'exact' then '=' else 'like' end,
+    case when p_mode = 'exact' then p_value else p_value || '%' end,
+    case when p_order is null then '' else format(' order by %I', p_order) end,
+    greatest(coalesce(p_limit, 5), 1)
+  ) into plan;
+  return plan;
+end;
+$$;
+
+
+-- ============================================================
+-- 7. list_table_indexes
+--    Indici di una tabella pubblica con la definizione completa
+--    (pg_get_indexdef): usata da scan_db --suggest-indexes per
+--    non riproporre indici già presenti.
+-- ============================================================
+
+drop function if exists list_table_indexes(text);
+
+create or replace function list_table_indexes(p_table text)
+returns table(index_name text, index_def text)
+language sql
+security definer
+stable
+as $$
+  select
+    i.relname::text                  as index_name,
+    pg_get_indexdef(i.oid)::text     as index_def
+  from pg_index x
+  join pg_class     c on c.oid = x.indrelid
+  join pg_class     i on i.oid = x.indexrelid
+  join pg_namespace n on n.oid = c.relnamespace
+  where n.nspname = 'public'
+    and c.relname = p_table
+    and x.indisvalid
+  order by i.relname;
+$$;
+
+
+-- ============================================================
+-- 8. stream_table_page
+--    Pagina di righe (solo p_columns, come oggetto JSON) in ordine di
+--    ctid, dopo il cursore p_after (ctid testuale della riga precedente,
+--    null = inizio): keyset pagination per le tabelle senza colonna
+--    univoca, usata da scan_db --deep. Con PostgreSQL ≥ 14 la condizione
+--    ctid > p_after è una TID Range Scan (nessun OFFSET, nessun sort).
+--    Aggiornamenti concorrenti possono spostare righe (nuovo ctid).
+-- ============================================================
+
+drop function if exists stream_table_page(text, text[], text, int);
+
+create or replace function stream_table_page(
+  p_table   text,
+  p_columns text[],
+  p_after   text default null,
+  p_limit   int  default 1000
+)
+returns table(row_ctid text, row_data json)
+language plpgsql
+security definer
+stable
+as $$
+declare
+  missing     text;
+  select_list text;
+begin
+  select c into missing
+  from unnest(p_columns) as c
+  where not exists (
+    select 1
+    from pg_attribute a
+    join pg_class     t on t.oid = a.attrelid
+    join pg_namespace n on n.oid = t.relnamespace
+    where n.nspname = 'public'
+      and t.relname = p_table
+      and t.relkind = 'r'
+      and a.attname = c
+      and a.attnum  > 0
+      and not a.attisdropped
+  )
+  limit 1;
+  if missing is not null or coalesce(array_length(p_columns, 1), 0) = 0 then
+    raise exception 'Column %.% not found in public schema', p_table, coalesce(missing, '(nessuna)');
+  end if;
+
+  select string_agg(format('t.%I', c), ', ' order by i) into select_list
+  from unnest(p_columns) with ordinality as u(c, i);
+
+  return query execute format(
+    'select t.ctid::text, row_to_json(r) from public.%I t '
+    'cross join lateral (select %s) r '
+    'where $1 is null or t.ctid > $1::tid order by t.ctid limit %s',
+    p_table, select_list, greatest(coalesce(p_limit, 1000), 1)
+  ) using p_after;
+end;
+$$;
@@ -0,0 +1,569 @@
+"""
+CustomsAI – Ingestion incrementale dei chunk  (tools/ingest_chunks.py)
+
+Carica in public.chunks i chunk prodotti dall'estrazione EUR-Lex,
+ricalcolando l'embedding solo per i chunk nuovi o modificati:
+
+  1. legge in streaming uno o più file JSONL, un chunk per riga:
+       {"text": "...", "metadata": {...}, "celex_consolidated": "...", "key": "..."}
+     (key facoltativa: default = hash di celex_consolidated + metadata + ordinale
+      della riga tra quelle del file con lo stesso celex/metadata)
+  2. calcola content_hash (SHA-256 del solo testo, cioè di ciò che viene
+     embeddato) e lo confronta con quello già in tabella per la stessa
+     chunk_key → i chunk invariati sono saltati
+  3. embedding dei chunk nuovi/modificati in batch (una richiesta OpenAI per
+     batch), con al massimo --concurrency richieste in volo; un testo già
+     presente in tabella con un'altra chunk_key (es. nuova consolidazione dello
+     stesso atto) riusa il suo embedding invece di ricalcolarlo
+  4. upsert in blocco su chunk_key (on_conflict) a ogni batch completato
+  5. checkpoint: per ogni file (percorso + dimensione + mtime), l'ultima riga
+     fino alla quale tutti i batch sono stati scritti; un nuovo avvio riparte da
+     lì, un file rigenerato nello stesso percorso è riletto da capo
+  6. report: righe lette, invariati, embedding calcolati, token, throughput
+  7. --replace-legacy: a run senza errori elimina le righe caricate prima della
+     migrazione (chunk_key NULL) dei celex appena ingeriti
+  8. --prune: a run senza errori elimina le chunk_key in tabella assenti dai file
+     sorgente (es. chunk della consolidazione precedente); i file indicati
+     devono essere l'intero corpus
+
+Utilizzo:
+    python3 tools/ingest_chunks.py data/chunks_32021R0821.jsonl
+    python3 tools/ingest_chunks.py data/*.jsonl --batch 128 --concurrency 4
+    python3 tools/ingest_chunks.py data/*.jsonl --dry-run     # solo conteggio modifiche
+    python3 tools/ingest_chunks.py data/*.jsonl --restart     # ignora il checkpoint
+    python3 tools/ingest_chunks.py data/*.jsonl --replace-legacy
+    python3 tools/ingest_chunks.py data/*.jsonl --prune       # data/ = corpus completo
+
+Prerequisiti:
+    Eseguire supabase_chunks_ingest.sql (colonne chunk_key, content_hash, indice
+    su content_hash, ricalcolo degli hash esistenti).
+"""
+
+import sys
+import json
+import time
+import hashlib
+import argparse
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+
+# Aggiungi la root del progetto al path per importare config ed embeddings
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import config
+
+
+# ──────────────────────────────────────────────────────────────
+# Costanti
+# ──────────────────────────────────────────────────────────────
+
+# Righe lette per pagina quando si caricano gli hash esistenti.
+_HASH_PAGE_SIZE = 1000
+# Valori per filtro in(...) nelle richieste DELETE/SELECT (lunghezza dell'URL).
+_IN_FILTER_BATCH = 50
+
+DEFAULT_CHECKPOINT = Path(config.CACHE_DIR) / "ingest_checkpoint.json"
+
+
+# ──────────────────────────────────────────────────────────────
+# Dataclass
+# ──────────────────────────────────────────────────────────────
+
+@dataclass
+class SourceChunk:
+    file:    str
+    line:    int            # numero di riga (1-based) nel file sorgente
+    source:  str            # chiave di checkpoint del file (percorso + dimensione + mtime)
+    key:     str
+    hash:    str
+    row:     dict           # riga pronta per l'upsert (senza embedding)
+
+
+@dataclass
+class IngestReport:
+    read:       int = 0
+    unchanged:  int = 0
+    skipped:    int = 0     # righe già coperte dal checkpoint
+    invalid:    int = 0     # righe non JSON o senza testo
+    embedded:   int = 0
+    reused:     int = 0     # embedding copiati da righe con lo stesso content_hash
+    upserted:   int = 0
+    batches:    int = 0
+    tokens:     int = 0
+    elapsed_s:  float = 0.0
+    errors:     list[str] = field(default_factory=list)
+
+    @property
+    def chunks_per_s(self) -> float:
+        return self.embedded / self.elapsed_s if self.elapsed_s else 0.0
+
+    @property
+    def tokens_per_s(self) -> float:
+        return self.tokens / self.elapsed_s if self.elapsed_s else 0.0
+
+
+# ──────────────────────────────────────────────────────────────
+# Hash e chiavi
+# ──────────────────────────────────────────────────────────────
+
+def content_hash(text: str) -> str:
+    """
+    Hash di ciò che viene embeddato: il testo normalizzato negli spazi. Il celex
+    non ne fa parte, così una nuova consolidazione con testo invariato non
+    ricalcola l'embedding (supabase_chunks_ingest.sql ricalcola gli hash esistenti).
+    """
+    normalized = " ".join((text or "").split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def _identity(record: dict) -> str:
+    return json.dumps(
+        {"celex": record.get("celex_consolidated"), "metadata": record.get("metadata") or {}},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+
+
+def chunk_key(record: dict, ordinal: int = 0) -> str:
+    """
+    Identità stabile del chunk: "key" esplicita, altrimenti hash di celex + metadata
+    + ordinale. L'ordinale distingue i chunk con gli stessi metadata (articolo
+    spezzato in più chunk): senza, l'upsert on_conflict li sovrascriverebbe a vicenda.
+    """
+    if record.get("key"):
+        return str(record["key"])
+    identity = f"{_identity(record)}\n{ordinal}"
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()[:32]
+
+
+def checkpoint_key(path: Path) -> str:
+    """Chiave di checkpoint: percorso + dimensione + mtime, così un file rigenerato riparte da capo."""
+    stat = path.stat()
+    return f"{path}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+def iter_source_chunks(
+    paths: Iterable[Path],
+    checkpoint: dict[str, int],
+    report: IngestReport,
+    seen: dict[str, str | None] | None = None,
+) -> Iterator[SourceChunk]:
+    """
+    Legge i file JSONL in streaming, saltando le righe già coperte dal checkpoint.
+
+    Le righe saltate sono comunque decodificate: l'ordinale di chunk_key conta
+    tutte le righe del file con lo stesso celex/metadata, anche quelle già scritte.
+    Le voci di checkpoint di versioni precedenti dello stesso file sono rimosse.
+    seen (facoltativo) raccoglie chunk_key → celex di tutte le righe valide, anche
+    quelle saltate dal checkpoint (--replace-legacy, --prune).
+    """
+    for path in paths:
+        source = checkpoint_key(path)
+        for stale in [k for k in checkpoint if k != source and k.rsplit("|", 2)[0] == str(path)]:
+            del checkpoint[stale]
+        done = checkpoint.get(source, 0)
+        ordinals: dict[str, int] = {}
+        with open(path, encoding="utf-8") as f:
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                skip = line_no <= done
+                if skip:
+                    report.skipped += 1
+                else:
+                    report.read += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    report.invalid += not skip
+                    continue
+                text = (record.get("text") or "").strip()
+                if not text:
+                    report.invalid += not skip
+                    continue
+                celex = record.get("celex_consolidated")
+                identity = _identity(record)
+                ordinal = ordinals.get(identity, 0)
+                ordinals[identity] = ordinal + 1
+                key = chunk_key(record, ordinal)
+                if seen is not None:
+                    seen[key] = celex
+                if skip:
+                    continue
+                digest = content_hash(text)
+                yield SourceChunk(
+                    file=str(path),
+                    line=line_no,
+                    source=source,
+                    key=key,
+                    hash=digest,
+                    row={
+                        "chunk_key":          key,
+                        "content_hash":       digest,
+                        "text":               text,
+                        "metadata":           record.get("metadata") or {},
+                        "celex_consolidated": celex,
+                    },
+                )
+
+
+# ──────────────────────────────────────────────────────────────
+# Checkpoint
+# ──────────────────────────────────────────────────────────────
+
+def load_checkpoint(path: Path) -> dict[str, int]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_checkpoint(path: Path, checkpoint: dict[str, int]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(checkpoint, indent=2), encoding="utf-8")
+    tmp.replace(path)
+
+
+class _Watermark:
+    """
+    Batch completati fuori ordine → posizione (file, riga) fino alla quale TUTTI
+    i batch precedenti sono stati scritti. Solo questa può andare nel checkpoint.
+    """
+
+    def __init__(self, checkpoint: dict[str, int]):
+        self.checkpoint = checkpoint
+        self._ends: dict[int, list[tuple[str, int]]] = {}   # batch → posizioni coperte
+        self._done: set[int] = set()
+        self._next = 0                                       # primo batch non ancora confermato
+
+    def register(self, batch_no: int, positions: list[tuple[str, int]]) -> None:
+        self._ends[batch_no] = positions
+
+    def complete(self, batch_no: int) -> bool:
+        """Segna il batch come scritto; True se il checkpoint è avanzato."""
+        self._done.add(batch_no)
+        advanced = False
+        while self._next in self._done:
+            for file, line in self._ends.pop(self._next, []):
+                self.checkpoint[file] = max(self.checkpoint.get(file, 0), line)
+            self._done.discard(self._next)
+            self._next += 1
+            advanced = True
+        return advanced
+
+
+# ──────────────────────────────────────────────────────────────
+# Pipeline
+# ──────────────────────────────────────────────────────────────
+
+def run_ingestion(
+    chunks: Iterable[SourceChunk],
+    existing: dict[str, str],
+    embed_fn: Callable[[list[str]], tuple[list[list[float]], int]],
+    upsert_fn: Callable[[list[dict]], None],
+    report: IngestReport,
+    batch_size: int = 100,
+    concurrency: int = 4,
+    checkpoint: dict[str, int] | None = None,
+    on_checkpoint: Callable[[dict[str, int]], None] | None = None,
+    reuse_fn: Callable[[list[str]], dict[str, list[float]]] | None = None,
+) -> IngestReport:
+    """
+    Embedding + upsert dei chunk nuovi/modificati.
+
+    existing:  chunk_key → content_hash già in tabella
+    embed_fn:  testi → (vettori, token) — una richiesta per batch
+    upsert_fn: righe complete di embedding → upsert in blocco
+    reuse_fn:  content_hash → embedding già in tabella; i chunk il cui hash è
+               già presente (sotto un'altra chunk_key, o scritto da un batch
+               precedente) copiano quel vettore invece di chiamare embed_fn
+
+    Le richieste di embedding girano in un pool di `concurrency` thread, con al
+    massimo `concurrency` batch in volo; gli upsert avvengono nel thread chiamante
+    man mano che i batch terminano. Un batch fallito blocca l'avanzamento del
+    checkpoint: al prossimo avvio si riparte da lui (i batch successivi già
+    scritti risultano invariati grazie all'hash).
+    """
+    start = time.perf_counter()
+    watermark = _Watermark(checkpoint if checkpoint is not None else {})
+    stored = set(existing.values())   # hash con embedding già in tabella
+    in_flight: dict[Future, tuple[int, list[SourceChunk]]] = {}
+    pending: list[SourceChunk] = []
+    positions: list[tuple[str, int]] = []
+    batch_no = 0
+
+    def _drain(block_until: int) -> None:
+        while len(in_flight) > block_until:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                no, batch = in_flight.pop(future)
+                try:
+                    vectors, tokens, reused = future.result()
+                    upsert_fn([{**c.row, "embedding": v} for c, v in zip(batch, vectors)])
+                except Exception as e:  # noqa: BLE001 – il batch viene riprovato al prossimo avvio
+                    report.errors.append(f"batch {no}: {type(e).__name__}: {e}")
+                    continue
+                stored.update(c.hash for c in batch)
+                report.embedded += len(batch) - reused
+                report.reused   += reused
+                report.upserted += len(batch)
+                report.tokens   += tokens
+                report.batches  += 1
+                if watermark.complete(no) and on_checkpoint:
+                    on_checkpoint(watermark.checkpoint)
+
+    def _submit(executor: ThreadPoolExecutor) -> None:
+        nonlocal pending, positions, batch_no
+        watermark.register(batch_no, positions)
+        if pending:
+            reusable = {c.hash for c in pending if c.hash in stored} if reuse_fn else set()
+            future = executor.submit(_embed_batch, pending, reusable)
+            in_flight[future] = (batch_no, pending)
+        else:
+            watermark.complete(batch_no)   # solo chunk invariati: nulla da scrivere
+        batch_no += 1
+        pending, positions = [], []
+
+    def _embed_batch(
+        batch: list[SourceChunk], reusable: set[str],
+    ) -> tuple[list[list[float]], int, int]:
+        found = reuse_fn(sorted(reusable)) if reusable else {}
+        fresh = [c for c in batch if c.hash not in found]
+        vectors, tokens = embed_fn([c.row["text"] for c in fresh]) if fresh else ([], 0)
+        fresh_vectors = iter(vectors)
+        aligned = [found[c.hash] if c.hash in found else next(fresh_vectors) for c in batch]
+        return aligned, tokens, len(batch) - len(fresh)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        scanned = 0
+        for chunk in chunks:
+            scanned += 1
+            positions.append((chunk.source, chunk.line))
+            if existing.get(chunk.key) == chunk.hash:
+                report.unchanged += 1
+            else:
+                # Stessa chunk_key due volte nello stesso upsert → errore Postgres
+                # ("ON CONFLICT DO UPDATE command cannot affect row a second time"):
+                # vince l'ultima occorrenza, come farebbero due upsert successivi.
+                pending = [c for c in pending if c.key != chunk.key]
+                pending.append(chunk)
+                existing[chunk.key] = chunk.hash   # duplicati identici più avanti: invariati
+            # Confine di batch anche sui soli invariati, così il checkpoint avanza.
+            if len(pending) >= batch_size or scanned % (batch_size * 10) == 0:
+                _drain(concurrency - 1)
+                _submit(executor)
+        _drain(concurrency - 1)
+        _submit(executor)
+        _drain(0)
+
+    if on_checkpoint:
+        on_checkpoint(watermark.checkpoint)
+    report.elapsed_s = time.perf_counter() - start
+    return report
+
+
+# ──────────────────────────────────────────────────────────────
+# Supabase
+# ──────────────────────────────────────────────────────────────
+
+def _get_client():
+    from supabase import create_client
+    return create_client(config.SUPABASE_URL, config.SUPABASE_SERVICE_KEY)
+
+
+def load_existing_hashes(client) -> dict[str, str]:
+    """chunk_key → content_hash di tutte le righe già presenti (keyset pagination)."""
+    hashes: dict[str, str] = {}
+    cursor: str | None = None
+    while True:
+        query = client.table(config.TABLE_NAME).select("chunk_key, content_hash").not_.is_("chunk_key", "null")
+        if cursor is not None:
+            query = query.gt("chunk_key", cursor)
+        rows = query.order("chunk_key").limit(_HASH_PAGE_SIZE).execute().data or []
+        hashes.update({r["chunk_key"]: r.get("content_hash") for r in rows})
+        if len(rows) < _HASH_PAGE_SIZE:
+            return hashes
+        cursor = rows[-1]["chunk_key"]
+
+
+def count_legacy_rows(client) -> int:
+    """Righe caricate prima della migrazione (chunk_key NULL): l'upsert non le vede."""
+    result = (
+        client.table(config.TABLE_NAME)
+        .select("chunk_key", count="exact")
+        .is_("chunk_key", "null")
+        .limit(1)
+        .execute()
+    )
+    return result.count or 0
+
+
+def delete_legacy_rows(client, celex_values: Iterable[str]) -> int:
+    """Elimina le righe con chunk_key NULL dei celex indicati (ora presenti con chunk_key)."""
+    celex = sorted(celex_values)
+    deleted = 0
+    for i in range(0, len(celex), _IN_FILTER_BATCH):
+        rows = (
+            client.table(config.TABLE_NAME)
+            .delete()
+            .is_("chunk_key", "null")
+            .in_("celex_consolidated", celex[i:i + _IN_FILTER_BATCH])
+            .execute()
+            .data
+        ) or []
+        deleted += len(rows)
+    return deleted
+
+
+def load_embeddings_by_hash(client, hashes: list[str]) -> dict[str, list[float]]:
+    """
+    content_hash → embedding delle righe già in tabella (anche legacy). Il vettore
+    torna come lo restituisce PostgREST e viene riscritto tale e quale nell'upsert.
+    """
+    found: dict[str, list[float]] = {}
+    for i in range(0, len(hashes), _IN_FILTER_BATCH):
+        rows = (
+            client.table(config.TABLE_NAME)
+            .select("content_hash, embedding")
+            .in_("content_hash", hashes[i:i + _IN_FILTER_BATCH])
+            .not_.is_("embedding", "null")
+            .execute()
+            .data
+        ) or []
+        for row in rows:
+            found.setdefault(row["content_hash"], row["embedding"])
+    return found
+
+
+def stale_keys(existing: Iterable[str], seen: Iterable[str]) -> list[str]:
+    """chunk_key in tabella che non compaiono più nei file sorgente."""
+    return sorted(set(existing) - set(seen))
+
+
+def delete_stale_rows(client, keys: list[str]) -> int:
+    """Elimina le righe con le chunk_key indicate (--prune)."""
+    deleted = 0
+    for i in range(0, len(keys), _IN_FILTER_BATCH):
+        rows = (
+            client.table(config.TABLE_NAME)
+            .delete()
+            .in_("chunk_key", keys[i:i + _IN_FILTER_BATCH])
+            .execute()
+            .data
+        ) or []
+        deleted += len(rows)
+    return deleted
+
+
+# ──────────────────────────────────────────────────────────────
+# Report
+# ──────────────────────────────────────────────────────────────
+
+def render_report(report: IngestReport, dry_run: bool = False) -> str:
+    lines = [
+        "=== INGESTION CHUNKS" + (" (dry-run)" if dry_run else "") + " ===",
+        f"Righe lette:          {report.read}",
+        f"Saltate (checkpoint): {report.skipped}",
+        f"Non valide:           {report.invalid}",
+        f"Invariate (hash):     {report.unchanged}",
+        f"Da ricalcolare:       {report.read - report.invalid - report.unchanged}" if dry_run
+        else f"Embedding calcolati:  {report.embedded} in {report.batches} batch",
+    ]
+    if not dry_run and report.reused:
+        lines.append(f"Embedding riusati:    {report.reused} (stesso content_hash)")
+    if not dry_run:
+        lines += [
+            f"Upsert:               {report.upserted}",
+            f"Token:                {report.tokens}",
+            f"Durata:               {report.elapsed_s:.1f}s "
+            f"({report.chunks_per_s:.1f} chunk/s, {report.tokens_per_s:.0f} token/s)",
+        ]
+    if report.errors:
+        lines.append(f"Errori ({len(report.errors)}):")
+        lines += [f"  - {e}" for e in report.errors]
+    return "\n".join(lines)
+
+
+# ──────────────────────────────────────────────────────────────
+# CLI
+# ──────────────────────────────────────────────────────────────
+
+def _parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        description="CustomsAI – Ingestion incrementale dei chunk.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=(
+            "Prerequisiti:\n"
+            "  Eseguire supabase_chunks_ingest.sql su Supabase prima del primo utilizzo.\n"
+        ),
+    )
+    p.add_argument("files",         nargs="+", type=Path, help="File JSONL sorgente")
+    p.add_argument("--batch",       type=int, default=100, help="Chunk per richiesta di embedding (default 100)")
+    p.add_argument("--concurrency", type=int, default=4,   help="Richieste di embedding in volo (default 4)")
+    p.add_argument("--checkpoint",  type=Path, default=DEFAULT_CHECKPOINT, help="File di checkpoint")
+    p.add_argument("--restart",     action="store_true", help="Ignora il checkpoint esistente")
+    p.add_argument("--dry-run",     action="store_true", help="Conta i chunk da ricalcolare senza scrivere")
+    p.add_argument("--replace-legacy", action="store_true",
+                   help="A run senza errori elimina le righe con chunk_key NULL dei celex ingeriti")
+    p.add_argument("--prune",       action="store_true",
+                   help="A run senza errori elimina le chunk_key assenti dai file "
+                        "(i file devono essere l'intero corpus)")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    client = _get_client()
+    existing = load_existing_hashes(client)
+    loaded_keys = list(existing)   # run_ingestion aggiorna existing durante la run
+    checkpoint = {} if args.restart else load_checkpoint(args.checkpoint)
+    report = IngestReport()
+    seen: dict[str, str | None] = {}
+    chunks = iter_source_chunks(args.files, checkpoint, report, seen)
+    legacy = count_legacy_rows(client)
+    if legacy and not args.replace_legacy:
+        print(f"[ingest] {legacy} righe con chunk_key NULL (caricate prima della migrazione): "
+              f"restano accanto ai nuovi chunk finché non si usa --replace-legacy")
+
+    if args.dry_run:
+        for chunk in chunks:
+            if existing.get(chunk.key) == chunk.hash:
+                report.unchanged += 1
+        print(render_report(report, dry_run=True))
+        if args.prune:
+            print(f"[ingest] chunk_key da eliminare con --prune: {len(stale_keys(loaded_keys, seen))}")
+        return
+
+    import embeddings
+
+    def _upsert(rows: list[dict]) -> None:
+        client.table(config.TABLE_NAME).upsert(rows, on_conflict="chunk_key").execute()
+
+    run_ingestion(
+        chunks,
+        existing,
+        embeddings.embed_batch,
+        _upsert,
+        report,
+        batch_size=args.batch,
+        concurrency=max(1, args.concurrency),
+        checkpoint=checkpoint,
+        on_checkpoint=lambda cp: save_checkpoint(args.checkpoint, cp),
+        reuse_fn=lambda hashes: load_embeddings_by_hash(client, hashes),
+    )
+    print(render_report(report))
+    if report.errors:
+        sys.exit(1)
+    if args.replace_legacy and legacy:
+        deleted = delete_legacy_rows(client, {c for c in seen.values() if c})
+        print(f"[ingest] righe legacy eliminate: {deleted}")
+    if args.prune:
+        deleted = delete_stale_rows(client, stale_keys(loaded_keys, seen))
+        print(f"[ingest] chunk_key obsolete eliminate: {deleted}")
+
+
+if __name__ == "__main__":
+    main()
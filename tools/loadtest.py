@@ -0,0 +1,605 @@
+"""
+CustomsAI – Load test  (tools/loadtest.py)
+
+Riproduce un corpus JSONL di domande contro main.query() o contro l'endpoint
+POST /query di server.py e misura quante domande al secondo regge il deployment.
+
+Target (--target):
+  local     main.query() nel processo, un thread per richiesta in volo
+  server    server.py avviato nel processo su una porta libera (pool, backpressure 503)
+  URL       servizio già in esecuzione, es. http://127.0.0.1:8000
+
+Carico:
+  --qps R           open loop: arrivi a tasso fisso, indipendenti dalle risposte;
+                    la latenza parte dall'istante di arrivo programmato (le code
+                    del load tester non nascondono i ritardi del sistema)
+  --concurrency N   closed loop: N utenti virtuali, ognuno invia la domanda
+                    successiva appena riceve la risposta
+
+Stand-in (--stub, solo target local/server): Supabase e OpenAI sostituiti da
+client finti con latenza configurabile (--supabase-ms, --scan-ms, --embedding-ms, --llm-ms,
+±--jitter). Restano reali routing, resilience, single-flight e deadline; gli
+snapshot delle tabelle vanno in una directory temporanea.
+
+Corpus: una domanda per riga, {"question": "...", "intent": "code_specific"?}.
+L'intent è quello restituito da query(); per le richieste fallite si usa
+quello del corpus (o "unknown"). Esempio: tools/loadtest_corpus.example.jsonl.
+
+Report: throughput, tasso di errore per tipo, latenza per intent
+(p50/p95/p99, istogramma a bucket logaritmici) sulle richieste riuscite.
+
+Utilizzo:
+    python3 tools/loadtest.py corpus.jsonl --stub --concurrency 8 --requests 500
+    python3 tools/loadtest.py corpus.jsonl --stub --qps 20 --duration 60 --llm-ms 1500
+    python3 tools/loadtest.py corpus.jsonl --target server --stub --qps 50 --duration 30
+    python3 tools/loadtest.py corpus.jsonl --target http://127.0.0.1:8000 --qps 5 --json
+"""
+
+import argparse
+import contextlib
+import hashlib
+import http.client
+import io
+import json
+import math
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+from unittest.mock import patch
+
+# Aggiungi la root del progetto al path per importare config e i moduli della pipeline
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import config
+
+
+# ──────────────────────────────────────────────────────────────
+# Costanti
+# ──────────────────────────────────────────────────────────────
+
+# Limiti superiori (ms) dei bucket dell'istogramma; l'ultimo bucket è "oltre".
+HISTOGRAM_BOUNDS_MS: tuple[float, ...] = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+# Richieste in volo al massimo in open loop (oltre, gli arrivi aspettano e la latenza lo registra).
+MAX_INFLIGHT: int = 256
+HTTP_TIMEOUT_SECONDS: float = 120.0
+STUB_EMBEDDING_DIM: int = 1536
+STUB_VECTOR_ROWS: int = 5
+STUB_CELEX: str = "32021R0821"
+
+
+# ──────────────────────────────────────────────────────────────
+# Strutture dati
+# ──────────────────────────────────────────────────────────────
+
+@dataclass
+class Sample:
+    """Esito di una richiesta del load test."""
+    intent:     str
+    latency_ms: float
+    ok:         bool
+    error:      str | None = None    # tipo di errore (eccezione o "HTTP 503")
+    mode:       str | None = None    # QueryResult.mode delle richieste riuscite
+
+
+@dataclass
+class Stubs:
+    """
+    Latenze (ms) dei client finti; jitter = variazione uniforme relativa (0.2 → ±20%).
+    scan_ms: latenza aggiuntiva di una lettura di intera tabella (costruzione
+    degli indici in memoria), che lo stand-in restituisce vuota.
+    """
+    supabase_ms:  float = 20.0
+    scan_ms:      float = 0.0
+    embedding_ms: float = 80.0
+    llm_ms:       float = 1200.0
+    jitter:       float = 0.2
+    seed:         int   = 0
+
+
+# ──────────────────────────────────────────────────────────────
+# Corpus
+# ──────────────────────────────────────────────────────────────
+
+def load_corpus(path: Path) -> list[dict]:
+    """Righe {"question", "intent"?} del file JSONL; righe vuote e commenti (#) ignorati."""
+    records: list[dict] = []
+    for n, line in enumerate(path.read_text(encoding="utf-8").splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        record = json.loads(line)
+        if not isinstance(record.get("question"), str) or not record["question"].strip():
+            raise ValueError(f"{path}:{n}: campo 'question' mancante o vuoto")
+        records.append(record)
+    if not records:
+        raise ValueError(f"{path}: corpus vuoto")
+    return records
+
+
+# ──────────────────────────────────────────────────────────────
+# Stand-in di Supabase e OpenAI
+# ──────────────────────────────────────────────────────────────
+
+class _Latency:
+    def __init__(self, stubs: Stubs):
+        self._stubs = stubs
+        self._rng = random.Random(stubs.seed)
+        self._lock = threading.Lock()
+
+    def sleep(self, ms: float) -> None:
+        with self._lock:
+            factor = self._rng.uniform(1 - self._stubs.jitter, 1 + self._stubs.jitter)
+        time.sleep(max(0.0, ms * factor) / 1000)
+
+
+class _StubQuery:
+    """
+    Builder PostgREST finto: registra filtri e limit, execute() attende la
+    latenza di Supabase. Lookup per codice → una riga sintetica; letture di
+    intere tabelle (like '%', paginazione dei chunk) → nessuna riga.
+    """
+
+    def __init__(self, latency: _Latency, ms: float, table: str | None = None, rpc: str | None = None,
+                 params=None, scan_ms: float = 0.0):
+        self._latency, self._ms, self._scan_ms = latency, ms, scan_ms
+        self._table, self._rpc, self._params = table, rpc, params or {}
+        self._columns: list[str] = []
+        self._match: tuple[str, str] | None = None
+        self._limit = 1
+
+    def select(self, columns: str):
+        self._columns = [c.strip() for c in columns.split(",") if c.strip()]
+        return self
+
+    def eq(self, column: str, value):
+        self._match = (column, str(value))
+        return self
+
+    def like(self, column: str, pattern: str):
+        self._match = (column, pattern.rstrip("%"))
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    def __getattr__(self, _name):
+        # order, gt, range, filter, in_, or_ … non cambiano la forma della risposta.
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        full_scan = self._rpc is None and (self._match is None or not self._match[1])
+        self._latency.sleep(self._ms + (self._scan_ms if full_scan else 0.0))
+        return SimpleNamespace(data=self._rows())
+
+    def _rows(self) -> list[dict]:
+        if self._rpc is not None:
+            return _stub_vector_rows(self._rpc, self._params)
+        if self._match is None or not self._match[1]:
+            return []
+        column, code = self._match
+        row = {c: f"Testo stand-in per {code}" for c in self._columns}
+        row.update({column: code, "celex_consolidated": STUB_CELEX})
+        row.update({c: None for c in ("indent", "hier_pos") if c in row})
+        return [row][:self._limit]
+
+
+def _stub_vector_rows(rpc: str, params: dict) -> list[dict]:
+    unit_type = (params.get("type_filters") or ["ARTICLE"])[0]
+    rows = [
+        {
+            "text":               f"Art. {i + 1} – testo stand-in ({unit_type})",
+            "metadata":           {"unit_type": unit_type},
+            "celex_consolidated": STUB_CELEX,
+            "source_url":         None,
+            "similarity":         round(0.9 - i * 0.02, 2),
+        }
+        for i in range(min(STUB_VECTOR_ROWS, params.get("match_count") or STUB_VECTOR_ROWS))
+    ]
+    if rpc.endswith("_mmr"):
+        for r in rows:
+            r["embedding"] = _stub_vector(r["text"])
+    return rows
+
+
+class _StubSupabase:
+    def __init__(self, latency: _Latency, stubs: Stubs):
+        self._latency, self._stubs = latency, stubs
+
+    def table(self, name: str) -> _StubQuery:
+        return _StubQuery(self._latency, self._stubs.supabase_ms, table=name, scan_ms=self._stubs.scan_ms)
+
+    def rpc(self, name: str, params: dict) -> _StubQuery:
+        return _StubQuery(self._latency, self._stubs.supabase_ms, rpc=name, params=params)
+
+
+def _stub_vector(text: str) -> list[float]:
+    """Vettore deterministico per testo (stessa domanda → stesso embedding)."""
+    rng = random.Random(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest())
+    return [rng.uniform(-1, 1) for _ in range(STUB_EMBEDDING_DIM)]
+
+
+class _StubOpenAI:
+    def __init__(self, latency: _Latency, stubs: Stubs):
+        def _embed(model, input, **kwargs):
+            latency.sleep(stubs.embedding_ms)
+            texts = [input] if isinstance(input, str) else list(input)
+            return SimpleNamespace(
+                data=[SimpleNamespace(embedding=_stub_vector(t)) for t in texts],
+                usage=SimpleNamespace(total_tokens=sum(len(t.split()) for t in texts)),
+            )
+
+        def _complete(model, messages, **kwargs):
+            latency.sleep(stubs.llm_ms)
+            message = SimpleNamespace(content="Risposta stand-in del load test.")
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+        self.embeddings = SimpleNamespace(create=_embed)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=_complete))
+
+
+@contextlib.contextmanager
+def stand_ins(stubs: Stubs) -> Iterator[None]:
+    """
+    Sostituisce i client Supabase e OpenAI della pipeline con gli stand-in.
+    Indici in memoria e snapshot costruiti durante il test non sopravvivono:
+    alla chiusura tornano quelli precedenti.
+    """
+    import embeddings
+    import llm
+    import retrieval
+
+    latency = _Latency(stubs)
+    supabase = _StubSupabase(latency, stubs)
+    openai = _StubOpenAI(latency, stubs)
+    with contextlib.ExitStack() as stack:
+        cache_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix="customsai-loadtest-"))
+        stack.enter_context(patch.object(config, "CACHE_DIR", Path(cache_dir)))
+        stack.enter_context(patch.object(retrieval, "_get_client", lambda: supabase))
+        stack.enter_context(patch.object(embeddings, "_get_client", lambda: openai))
+        stack.enter_context(patch.object(llm, "_get_client", lambda: openai))
+        stack.enter_context(patch.dict(retrieval._HIERARCHY_INDEXES, clear=True))
+        stack.enter_context(patch.dict(retrieval._CORRELATION_GRAPHS, clear=True))
+        stack.enter_context(patch.object(retrieval, "_LEXICAL_INDEX", None))
+        yield
+
+
+# ──────────────────────────────────────────────────────────────
+# Target
+# ──────────────────────────────────────────────────────────────
+
+Target = Callable[[str], dict]
+
+
+def local_target(deadline: float | None = None) -> Target:
+    """main.query() nel processo: restituisce il QueryResult."""
+    import main
+
+    def _call(question: str) -> dict:
+        return dict(main.query(question, deadline=deadline))
+    return _call
+
+
+class HttpError(Exception):
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+def http_target(base_url: str, deadline: float | None = None) -> Target:
+    """
+    POST {base_url}/query: status ≠ 200 → HttpError. Se il server risponde e
+    chiude prima di aver letto il corpo (503 del pool saturo), l'invio fallisce
+    ma la risposta è comunque letta e conteggiata come tale.
+    """
+    url = urlsplit(base_url)
+    path = url.path.rstrip("/") + "/query"
+
+    def _call(question: str) -> dict:
+        body = {"question": question, **({"deadline": deadline} if deadline else {})}
+        conn = http.client.HTTPConnection(url.hostname, url.port, timeout=HTTP_TIMEOUT_SECONDS)
+        try:
+            try:
+                conn.request("POST", path, json.dumps(body).encode("utf-8"), {"Content-Type": "application/json"})
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            resp = conn.getresponse()
+            data = resp.read()
+            if resp.status != 200:
+                raise HttpError(resp.status)
+            return json.loads(data)
+        finally:
+            conn.close()
+    return _call
+
+
+@contextlib.contextmanager
+def in_process_server(workers: int | None = None, max_queue: int | None = None) -> Iterator[str]:
+    """server.py su una porta libera; restituisce l'URL base e lo chiude all'uscita."""
+    import server as server_mod
+
+    srv = server_mod.create_server("127.0.0.1", 0, workers=workers, max_queue=max_queue)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    try:
+        host, port = srv.server_address[:2]
+        yield f"http://{host}:{port}"
+    finally:
+        srv.drain(0)
+        thread.join()
+
+
+# ──────────────────────────────────────────────────────────────
+# Generazione del carico
+# ──────────────────────────────────────────────────────────────
+
+def _execute(target: Target, record: dict, scheduled: float) -> Sample:
+    try:
+        result = target(record["question"])
+    except Exception as e:
+        return Sample(
+            intent=record.get("intent") or "unknown",
+            latency_ms=(time.perf_counter() - scheduled) * 1000,
+            ok=False, error=str(e) if isinstance(e, HttpError) else type(e).__name__,
+        )
+    return Sample(
+        intent=result.get("intent") or record.get("intent") or "unknown",
+        latency_ms=(time.perf_counter() - scheduled) * 1000,
+        ok=True, mode=result.get("mode"),
+    )
+
+
+def run_open_loop(
+    target: Target,
+    corpus: list[dict],
+    qps: float,
+    requests: int,
+    max_inflight: int = MAX_INFLIGHT,
+) -> tuple[list[Sample], float]:
+    """`requests` arrivi a `qps` al secondo (corpus ripetuto in ordine); (campioni, secondi)."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_inflight, thread_name_prefix="load") as pool:
+        futures = []
+        for i in range(requests):
+            scheduled = start + i / qps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(_execute, target, corpus[i % len(corpus)], scheduled))
+        samples = [f.result() for f in futures]
+    return samples, time.perf_counter() - start
+
+
+def run_closed_loop(
+    target: Target,
+    corpus: list[dict],
+    concurrency: int,
+    requests: int | None = None,
+    duration: float | None = None,
+) -> tuple[list[Sample], float]:
+    """
+    `concurrency` utenti virtuali fino a `requests` richieste totali o per
+    `duration` secondi (il primo limite raggiunto); (campioni, secondi).
+    """
+    if requests is None and duration is None:
+        raise ValueError("Indicare requests o duration")
+    lock = threading.Lock()
+    issued = 0
+    samples: list[Sample] = []
+    start = time.perf_counter()
+    stop_at = start + duration if duration is not None else float("inf")
+
+    def _user() -> None:
+        nonlocal issued
+        while time.perf_counter() < stop_at:
+            with lock:
+                if requests is not None and issued >= requests:
+                    return
+                record = corpus[issued % len(corpus)]
+                issued += 1
+            sample = _execute(target, record, time.perf_counter())
+            with lock:
+                samples.append(sample)
+
+    threads = [threading.Thread(target=_user, name=f"user-{i}") for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, time.perf_counter() - start
+
+
+# ──────────────────────────────────────────────────────────────
+# Statistiche e report
+# ──────────────────────────────────────────────────────────────
+
+def percentile(values: list[float], p: float) -> float:
+    """Percentile nearest-rank (0 per liste vuote)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * p / 100) - 1)]
+
+
+def histogram(latencies: list[float]) -> list[tuple[str, int]]:
+    """[(etichetta del bucket, conteggio)] sui limiti HISTOGRAM_BOUNDS_MS."""
+    counts = Counter()
+    for ms in latencies:
+        counts[next((b for b in HISTOGRAM_BOUNDS_MS if ms <= b), None)] += 1
+    labels = [(f"≤{b:g}", counts[b]) for b in HISTOGRAM_BOUNDS_MS]
+    return labels + [(f">{HISTOGRAM_BOUNDS_MS[-1]:g}", counts[None])]
+
+
+def _latency_stats(samples: list[Sample]) -> dict:
+    ok = [s.latency_ms for s in samples if s.ok]
+    return {
+        "requests":  len(samples),
+        "errors":    sum(1 for s in samples if not s.ok),
+        "p50_ms":    round(percentile(ok, 50), 1),
+        "p95_ms":    round(percentile(ok, 95), 1),
+        "p99_ms":    round(percentile(ok, 99), 1),
+        "max_ms":    round(max(ok, default=0.0), 1),
+        "histogram": histogram(ok),
+    }
+
+
+def summarize(samples: list[Sample], elapsed: float, settings: dict | None = None) -> dict:
+    by_intent: dict[str, list[Sample]] = defaultdict(list)
+    for s in samples:
+        by_intent[s.intent].append(s)
+    errors = Counter(s.error for s in samples if not s.ok)
+    completed = sum(1 for s in samples if s.ok)
+    return {
+        "settings":       settings or {},
+        "requests":       len(samples),
+        "completed":      completed,
+        "elapsed_s":      round(elapsed, 2),
+        "throughput_qps": round(completed / elapsed, 2) if elapsed > 0 else 0.0,
+        "error_rate":     round(sum(errors.values()) / len(samples), 4) if samples else 0.0,
+        "errors":         dict(errors.most_common()),
+        "modes":          dict(Counter(s.mode for s in samples if s.ok).most_common()),
+        "latency":        {
+            "all": _latency_stats(samples),
+            **{intent: _latency_stats(group) for intent, group in sorted(by_intent.items())},
+        },
+    }
+
+
+def render_text(report: dict) -> str:
+    s = report["settings"]
+    load = f"open loop {s['qps']:g} qps" if s.get("qps") else f"closed loop ×{s.get('concurrency')}"
+    lines = [
+        f"Target: {s.get('target', '?')} · {load}"
+        + (f" · stand-in {s['stubs']}" if s.get("stubs") else ""),
+        f"Richieste: {report['requests']} in {report['elapsed_s']:.1f}s · "
+        f"throughput {report['throughput_qps']:.2f} risposte/s · errori {report['error_rate']:.1%}",
+    ]
+    if report["errors"]:
+        lines.append("Errori: " + ", ".join(f"{k} ×{v}" for k, v in report["errors"].items()))
+    if report["modes"]:
+        lines.append("Modalità: " + ", ".join(f"{k} ×{v}" for k, v in report["modes"].items()))
+
+    lines += ["", f"{'intent':<22} {'req':>6} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+    for intent, st in report["latency"].items():
+        lines.append(
+            f"{intent:<22} {st['requests']:>6} {st['errors']:>5} {st['p50_ms']:>9.1f} "
+            f"{st['p95_ms']:>9.1f} {st['p99_ms']:>9.1f} {st['max_ms']:>9.1f}"
+        )
+
+    for intent, st in report["latency"].items():
+        if intent == "all" or not any(c for _, c in st["histogram"]):
+            continue
+        peak = max(c for _, c in st["histogram"])
+        lines += ["", f"Istogramma {intent} (ms)"]
+        for label, count in st["histogram"]:
+            if count:
+                lines.append(f"  {label:>8} {'█' * max(1, round(30 * count / peak)):<30} {count}")
+    return "\n".join(lines)
+
+
+# ──────────────────────────────────────────────────────────────
+# CLI
+# ──────────────────────────────────────────────────────────────
+
+def _parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        description="CustomsAI – Load test su main.query() o POST /query.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=(
+            "Esempi:\n"
+            "  python3 tools/loadtest.py tools/loadtest_corpus.example.jsonl --stub --concurrency 8\n"
+            "  python3 tools/loadtest.py corpus.jsonl --target server --stub --qps 50 --duration 30\n"
+            "  python3 tools/loadtest.py corpus.jsonl --target http://127.0.0.1:8000 --qps 5\n"
+        ),
+    )
+    p.add_argument("corpus", type=Path, help="File JSONL con {\"question\", \"intent\"?} per riga")
+    p.add_argument("--target", default="local", help="local | server | URL del servizio (default local)")
+    load = p.add_mutually_exclusive_group()
+    load.add_argument("--qps", type=float, metavar="R", help="Open loop: R arrivi al secondo")
+    load.add_argument("--concurrency", type=int, default=4, metavar="N",
+                      help="Closed loop: N utenti virtuali (default 4)")
+    p.add_argument("--requests", type=int, metavar="N", help="Richieste totali (default: una per riga del corpus)")
+    p.add_argument("--duration", type=float, metavar="S", help="Durata in secondi (al posto di --requests)")
+    p.add_argument("--deadline", type=float, metavar="S", help="Budget per richiesta passato a query()")
+    p.add_argument("--stub", action="store_true", help="Supabase e OpenAI sostituiti da stand-in (target local/server)")
+    p.add_argument("--supabase-ms", type=float, default=Stubs.supabase_ms, help="Latenza stand-in Supabase")
+    p.add_argument("--scan-ms", type=float, default=Stubs.scan_ms,
+                   help="Latenza aggiuntiva stand-in di una lettura di intera tabella")
+    p.add_argument("--embedding-ms", type=float, default=Stubs.embedding_ms, help="Latenza stand-in embedding OpenAI")
+    p.add_argument("--llm-ms", type=float, default=Stubs.llm_ms, help="Latenza stand-in LLM OpenAI")
+    p.add_argument("--jitter", type=float, default=Stubs.jitter, help="Variazione relativa delle latenze stand-in")
+    p.add_argument("--workers", type=int, help="Worker del server in processo (--target server)")
+    p.add_argument("--json", action="store_true", help="Output JSON")
+    p.add_argument("--output", metavar="FILE", help="Salva il report su file")
+    p.add_argument("--verbose", action="store_true", help="Non silenziare i log della pipeline")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    corpus = load_corpus(args.corpus)
+    remote = args.target not in ("local", "server")
+    if args.stub and remote:
+        print("[loadtest] --stub non applicabile a un servizio esterno", file=sys.stderr)
+        sys.exit(2)
+    requests = args.requests or (None if args.duration else len(corpus))
+    if args.qps and requests is None:
+        requests = max(1, int(args.duration * args.qps))
+
+    stubs = Stubs(
+        supabase_ms=args.supabase_ms, scan_ms=args.scan_ms, embedding_ms=args.embedding_ms,
+        llm_ms=args.llm_ms, jitter=args.jitter,
+    ) if args.stub else None
+    settings = {
+        "target": args.target, "qps": args.qps, "concurrency": None if args.qps else args.concurrency,
+        "corpus": str(args.corpus), "deadline": args.deadline,
+        "stubs": (f"supabase {stubs.supabase_ms:g} ms (scan +{stubs.scan_ms:g} ms), "
+                  f"embedding {stubs.embedding_ms:g} ms, llm {stubs.llm_ms:g} ms ±{stubs.jitter:.0%}")
+                 if stubs else None,
+    }
+
+    import resilience
+    import singleflight
+
+    with contextlib.ExitStack() as stack:
+        if stubs:
+            stack.enter_context(stand_ins(stubs))
+        if args.target == "local":
+            target = local_target(args.deadline)
+        else:
+            base = stack.enter_context(in_process_server(args.workers)) if args.target == "server" else args.target
+            target = http_target(base, args.deadline)
+        if not args.verbose:
+            stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+        resilience.reset()
+        singleflight.reset()
+
+        print(f"[loadtest] {len(corpus)} domande → {args.target} ({settings['stubs'] or 'dipendenze reali'})", file=sys.stderr)
+        if args.qps:
+            samples, elapsed = run_open_loop(target, corpus, args.qps, requests)
+        else:
+            samples, elapsed = run_closed_loop(target, corpus, args.concurrency, requests, args.duration)
+
+    report = summarize(samples, elapsed, settings)
+    if not remote:
+        report["dependencies"] = resilience.metrics_snapshot()
+        report["coalesced"] = singleflight.stats()
+    output = json.dumps(report, indent=2, ensure_ascii=False) if args.json else render_text(report)
+    if args.output:
+        Path(args.output).write_text(output, encoding="utf-8")
+        print(f"[loadtest] Report salvato in: {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
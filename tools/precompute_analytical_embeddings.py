@@ -0,0 +1,94 @@
+"""
+CustomsAI – Precompute embedding query analitica DU  (tools/precompute_analytical_embeddings.py)
+
+Calcola l'embedding di analytical_embeddings.analytical_query() per:
+  - ogni codice DU della tabella dell'entry "dual_use"
+  - le combinazioni di codici DU più frequenti, cioè quelle che il traversal
+    links_to produce per le voci NC (prefissi a 4, 6, 8 e 10 cifre) del
+    grafo di correlazioni
+
+e le salva in config.ANALYTICAL_EMBEDDINGS_FILE, letto da main.query
+in analytical mode al posto della chiamata live a OpenAI.
+
+Utilizzo:
+    python3 tools/precompute_analytical_embeddings.py               # codici + 500 combinazioni
+    python3 tools/precompute_analytical_embeddings.py --combos 2000
+    python3 tools/precompute_analytical_embeddings.py --dry-run     # conta senza chiamare OpenAI
+"""
+
+import sys
+import argparse
+from collections import Counter
+from pathlib import Path
+
+# Aggiungi la root del progetto al path per importare config e registry
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import analytical_embeddings
+import embeddings
+import retrieval
+from registry import REGISTRY, get_entry
+from traversal import normalize_code
+
+
+# Lunghezze dei prefissi NC con cui gli utenti citano i codici (capitolo… sottovoce).
+_NC_PREFIX_LENGTHS = (4, 6, 8, 10)
+
+
+def du_codes(entry: dict) -> list[str]:
+    """Tutti i codici dell'entry DU, ordinati (retrieval.iter_table_rows)."""
+    codes: list[str] = []
+    for page in retrieval.iter_table_rows(entry, columns=[entry["code_field"]]):
+        codes += [str(r[entry["code_field"]]).strip().upper() for r in page if r.get(entry["code_field"])]
+    return list(dict.fromkeys(codes))
+
+
+def frequent_combinations(du_entry: dict, top_n: int) -> list[tuple[str, int]]:
+    """
+    Combinazioni di 2+ codici DU (chiave analitica) prodotte dalle voci NC dei grafi
+    di correlazione che puntano a du_entry, ordinate per frequenza decrescente.
+    """
+    counts: Counter[str] = Counter()
+    for entry in REGISTRY:
+        if entry.get("links_to") != du_entry["id"] or not entry.get("correlation_index"):
+            continue
+        graph = retrieval.correlation_graph(entry)
+        prefixes = {s[:n] for s in graph.sources() for n in _NC_PREFIX_LENGTHS if len(s) >= n}
+        for prefix in prefixes:
+            codes = list(dict.fromkeys(normalize_code(du_entry, t) for t in graph.forward(prefix)))
+            if len(codes) >= 2:
+                counts[analytical_embeddings.analytical_key(codes)] += 1
+    return counts.most_common(top_n)
+
+
+def _parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="CustomsAI – Precompute embedding query analitica DU.")
+    p.add_argument("--entry",   default="dual_use", help="Entry registry dei codici DU (default dual_use)")
+    p.add_argument("--combos",  type=int, default=500, help="Combinazioni frequenti da includere (default 500)")
+    p.add_argument("--batch",   type=int, default=100, help="Testi per richiesta di embedding (default 100)")
+    p.add_argument("--dry-run", action="store_true", help="Conta chiavi e query senza chiamare OpenAI")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    entry = get_entry(args.entry)
+    if entry is None:
+        print(f"[precompute] entry sconosciuta: {args.entry}", file=sys.stderr)
+        sys.exit(1)
+
+    codes  = du_codes(entry)
+    combos = [k for k, _ in frequent_combinations(entry, args.combos)]
+    keys   = list(dict.fromkeys(codes + combos))
+    print(f"[precompute] {len(codes)} codici + {len(combos)} combinazioni → {len(keys)} embedding")
+    if args.dry_run or not keys:
+        return
+
+    texts = [f"{analytical_embeddings.ANALYTICAL_QUERY_PREFIX} {k}" for k in keys]
+    vectors = embeddings.get_embeddings(texts, batch_size=args.batch)
+    path = analytical_embeddings.save_store(keys, vectors)
+    print(f"[precompute] store salvato in: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,24 +11,38 @@ Utilizzo:
     python3 tools/scan_db.py --json                 # output JSON
     python3 tools/scan_db.py --json --output r.json # salva su file
     python3 tools/scan_db.py --skip-tables t1,t2    # escludi tabelle extra
+    python3 tools/scan_db.py --workers 8 --rate 20  # tabelle e colonne in parallelo (≤ 20 RPC/s)
+    python3 tools/scan_db.py --no-cache             # ri-profila anche le tabelle invariate
+    python3 tools/scan_db.py --deep                 # profilo su tutte le righe (sketch in streaming)
+    python3 tools/scan_db.py --perf                 # latenza dei lookup + piano (EXPLAIN) per entry
+    python3 tools/scan_db.py --suggest-indexes      # DDL degli indici mancanti (CREATE INDEX CONCURRENTLY)
 
 Prerequisiti:
     Deployare tools/catalog.sql su Supabase prima del primo utilizzo.
 """
 
+import os
 import re
 import sys
 import json
+import time
+import hashlib
 import argparse
+import threading
+from collections import Counter
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Executor, ThreadPoolExecutor
 from pathlib import Path
-from dataclasses import dataclass, field
+from dataclasses import asdict, dataclass, field
 from datetime import date
 
 # Aggiungi la root del progetto al path per importare config e registry
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 import config
-from registry import REGISTRY
+from registry import REGISTRY, get_fetch_plan, get_key_field
+from tools.sketches import ColumnSketch
+from hierarchy import HIERARCHY_INDENT_FIELD, HIERARCHY_ORDER_FIELD
 from supabase import create_client, Client
 
 
@@ -71,6 +85,25 @@ PATTERN_COVERAGE_WARN: float = 0.80   # % minima per considerare un pattern vali
 CONFIDENCE_THRESHOLD:  float = 0.30   # sotto questa soglia: nessun suggerimento
 SAMPLE_SIZE:           int   = 20     # campioni per rilevamento pattern
 SAMPLE_SIZE_VALIDATION: int  = 30     # campioni per verifica pattern coverage
+MATCH_MODE_SAMPLE_SIZE: int  = 5000   # campioni del code_field per l'analisi dei prefissi (se serve)
+DEEP_PAGE_SIZE:         int  = 1000   # righe per pagina nel profilo completo (--deep)
+DEEP_RESERVOIR_SIZE:    int  = 200    # campione uniforme per colonna nel profilo completo
+
+# Check di performance dei lookup (--perf)
+LATENCY_PROBE_REPEATS:  int   = 5      # lookup cronometrati per entry
+LOOKUP_P95_WARN_MS:     float = 250.0  # p95 oltre soglia → check fallito
+SEQ_SCAN_MIN_ROWS:      int   = 1000   # sotto questa stima una seq scan è normale
+
+# Indici suggeriti (--suggest-indexes)
+# unit_type usati come type_filters nella vector search (main.py: CLASSIFICATION → ANNEX_CODE):
+# uno HNSW parziale per ciascuno, oltre a quello globale per le ricerche senza filtro.
+ANN_UNIT_TYPES: tuple[str, ...] = ("ANNEX_CODE",)
+PG_IDENTIFIER_MAX: int = 63
+
+# Cache dei profili: tabelle con colonne e row_estimate invariati non sono ri-profilate.
+DEFAULT_SCAN_CACHE = Path(config.CACHE_DIR) / "scan_cache.json"
+# Da incrementare quando cambia la logica di profiling (invalida i profili salvati).
+SCAN_CACHE_VERSION = 3
 
 
 # ──────────────────────────────────────────────────────────────
@@ -81,6 +114,14 @@ class CatalogNotDeployedError(RuntimeError):
     pass
 
 
+class PatternTranslationError(ValueError):
+    """Pattern Python senza equivalente nelle regex di PostgreSQL."""
+
+
+class SamplingError(RuntimeError):
+    """RPC di campionamento fallita: un profilo costruito senza campioni non è affidabile."""
+
+
 # ──────────────────────────────────────────────────────────────
 # Strutture dati
 # ──────────────────────────────────────────────────────────────
@@ -99,6 +140,37 @@ class Check:
     detail: str = ""
 
 
+@dataclass
+class LookupPerf:
+    """Latenza e piano del lookup di una entry (check_lookup_performance)."""
+    mode:       str             # "exact" | "prefix"
+    code:       str             # valore cercato (prefisso per "prefix")
+    p50_ms:     float
+    p95_ms:     float
+    scan_nodes: list[str]       # tipi di nodo di scansione nel piano (es. ["Index Only Scan"])
+    index:      str | None      # primo indice usato dal piano
+    seq_scan:   bool
+
+
+@dataclass
+class IndexSpec:
+    """Indice richiesto da un percorso di accesso di retrieval.py (suggest_indexes)."""
+    table:    str
+    name:     str
+    key:      str                  # colonna o espressione, con opclass (es. "goods_code text_pattern_ops")
+    method:   str = "btree"
+    where:    str | None = None    # predicato degli indici parziali
+    reason:   str = ""             # percorso di accesso servito
+    existing: str | None = None    # indice già presente che lo copre
+
+    def ddl(self) -> str:
+        where = f" where {self.where}" if self.where else ""
+        return (
+            f"create index concurrently if not exists {self.name}\n"
+            f"  on public.{self.table} using {self.method} ({self.key}){where};"
+        )
+
+
 @dataclass
 class ScanResult:
     """Risultato della validazione di una entry del registry."""
@@ -106,6 +178,7 @@ class ScanResult:
     table:        str
     row_estimate: int
     checks:       list[Check] = field(default_factory=list)
+    performance:  LookupPerf | None = None
 
     @property
     def status(self) -> str:
@@ -114,6 +187,18 @@ class ScanResult:
         return "ok"
 
 
+@dataclass
+class PatternCoverage:
+    """Copertura di un pattern su tutte le righe di una colonna (RPC pattern_coverage)."""
+    total:    int
+    matched:  int
+    examples: list[str] = field(default_factory=list)   # valori non conformi
+
+    @property
+    def ratio(self) -> float:
+        return self.matched / self.total if self.total else 0.0
+
+
 @dataclass
 class DraftEntry:
     """Profilo di una tabella non in registry, con draft entry suggerita."""
@@ -127,6 +212,10 @@ class DraftEntry:
     confidence:     float
     notes:          list[str] = field(default_factory=list)
     sample_codes:   list[str] = field(default_factory=list)
+    hierarchy_levels: list[int] = field(default_factory=list)   # lunghezze dei codici (prefix_profile)
+    hierarchy_depth:  int = 0                                   # profondità massima della catena di prefissi
+    column_stats:   dict[str, dict] = field(default_factory=dict)  # solo --deep: ColumnSketch.summary()
+    sampling_failed: bool = False                               # campionamento fallito: mai in cache
 
 
 # ──────────────────────────────────────────────────────────────
@@ -137,6 +226,83 @@ def _get_client() -> Client:
     return create_client(config.SUPABASE_URL, config.SUPABASE_SERVICE_KEY)
 
 
+class Throttle:
+    """
+    Limite delle richieste verso Supabase in modalità --workers:
+    al più max_inflight richieste in volo e al più `rate` avvii al secondo (0 = illimitato).
+    """
+
+    def __init__(self, max_inflight: int, rate: float = 0.0):
+        self._slots    = threading.BoundedSemaphore(max(1, max_inflight))
+        self._interval = 1.0 / rate if rate > 0 else 0.0
+        self._next     = 0.0
+        self._lock     = threading.Lock()
+
+    def _wait_turn(self) -> None:
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self._interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def run(self, fn: Callable[[], object]) -> object:
+        with self._slots:
+            self._wait_turn()
+            return fn()
+
+
+class ThrottledClient:
+    """
+    Proxy del client Supabase (e dei builder che restituisce): ogni .execute()
+    passa da Throttle.run. Le catene client.table(...).select(...).eq(...) restano invariate.
+    """
+
+    def __init__(self, target, throttle: Throttle):
+        self._target   = target
+        self._throttle = throttle
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._target, name)
+        if name == "execute":
+            return lambda *a, **kw: self._throttle.run(lambda: attr(*a, **kw))
+        if callable(attr):
+            return lambda *a, **kw: ThrottledClient(attr(*a, **kw), self._throttle)
+        return attr
+
+    def execute_timed(self) -> tuple[object, float]:
+        """execute() → (risposta, secondi della sola richiesta, esclusa l'attesa di slot e rate)."""
+        execute = self._target.execute
+
+        def _timed() -> tuple[object, float]:
+            start = time.perf_counter()
+            return execute(), time.perf_counter() - start
+
+        return self._throttle.run(_timed)
+
+
+def _timed_execute_ms(query) -> float:
+    """Millisecondi della sola richiesta: con ThrottledClient esclude le attese del Throttle."""
+    if isinstance(query, ThrottledClient):
+        return query.execute_timed()[1] * 1000
+    start = time.perf_counter()
+    query.execute()
+    return (time.perf_counter() - start) * 1000
+
+
+def _map(pool: Executor | None, fn: Callable, items: Iterable) -> list:
+    """map ordinato: in parallelo sul pool se presente, altrimenti sequenziale."""
+    return list(pool.map(fn, items)) if pool is not None else [fn(i) for i in items]
+
+
+def _is_missing_function(e: Exception) -> bool:
+    """True se PostgREST segnala una funzione RPC non deployata."""
+    msg = str(e)
+    return "PGRST202" in msg or "Could not find the function" in msg
+
+
 def _check_catalog_deployed(client: Client) -> None:
     """
     Verifica che le RPC catalog siano deployate.
@@ -145,8 +311,7 @@ def _check_catalog_deployed(client: Client) -> None:
     try:
         client.rpc("list_public_tables", {}).execute()
     except Exception as e:
-        msg = str(e)
-        if any(k in msg for k in ("PGRST202", "Could not find the function", "function")):
+        if _is_missing_function(e) or "function" in str(e):
             raise CatalogNotDeployedError(
                 "\n[ERRORE] Le funzioni catalog non sono deployate su Supabase.\n"
                 "\nSoluzione: esegui tools/catalog.sql nel SQL Editor di Supabase:\n"
@@ -178,17 +343,119 @@ def get_columns(client: Client, table: str) -> list[ColumnInfo]:
 
 
 def sample_values(
-    client: Client, table: str, col: str, n: int = SAMPLE_SIZE
+    client: Client, table: str, col: str, n: int = SAMPLE_SIZE, strict: bool = False
 ) -> list[str]:
+    """Campione di `col`; se la RPC fallisce [] (strict=True: SamplingError)."""
     try:
         resp = client.rpc("sample_column_values", {
             "p_table": table, "p_column": col, "p_limit": n,
         }).execute()
         return [r["value"] for r in (resp.data or []) if r.get("value")]
-    except Exception:
+    except Exception as e:
+        if strict:
+            raise SamplingError(f"sample_column_values({table}.{col}) fallita: {e}") from e
         return []
 
 
+# False dopo il primo PGRST202: catalog.sql senza sample_table_columns → RPC per colonna.
+_TABLE_SAMPLING_AVAILABLE = True
+
+
+def sample_table(
+    client: Client,
+    table: str,
+    columns: list[str],
+    n: int = SAMPLE_SIZE,
+    pool: Executor | None = None,
+) -> dict[str, list[str]]:
+    """
+    Campioni di tutte le `columns` con una sola RPC (sample_table_columns).
+    Se la funzione non è deployata ripiega su sample_values per colonna (su `pool` se presente).
+    Qualunque altro errore RPC solleva SamplingError: campioni vuoti darebbero un
+    profilo "nessun campo codice" indistinguibile da quello di una tabella vera.
+    """
+    global _TABLE_SAMPLING_AVAILABLE
+    if not columns:
+        return {}
+    if _TABLE_SAMPLING_AVAILABLE:
+        try:
+            resp = client.rpc("sample_table_columns", {
+                "p_table": table, "p_columns": columns, "p_limit": n,
+            }).execute()
+        except Exception as e:
+            if not _is_missing_function(e):
+                raise SamplingError(f"sample_table_columns({table}) fallita: {e}") from e
+            _TABLE_SAMPLING_AVAILABLE = False
+        else:
+            samples: dict[str, list[str]] = {c: [] for c in columns}
+            for r in resp.data or []:
+                if r.get("value") and r.get("column_name") in samples:
+                    samples[r["column_name"]].append(r["value"])
+            return samples
+
+    values = _map(pool, lambda col: sample_values(client, table, col, n, strict=True), columns)
+    return dict(zip(columns, values))
+
+
+# Escape Python → ARE di PostgreSQL: \b in PostgreSQL è il backspace, il confine di parola è \y.
+_PG_ESCAPES = {"b": r"\y", "B": r"\Y"}
+
+
+def to_postgres_regex(pattern: str) -> str:
+    r"""
+    Traduce un pattern del registry (re di Python) nella sintassi ARE di PostgreSQL:
+    \b/\B fuori dalle classi → \y/\Y, gruppi nominati → gruppi semplici, flag
+    inline iniziali (?i) rimossi (la RPC usa ~*, già case-insensitive).
+    Solleva PatternTranslationError per costrutti senza equivalente.
+    """
+    out: list[str] = []
+    i, in_class = 0, False
+    flags = re.match(r"\(\?[aiLmsux]+\)", pattern)
+    if flags:
+        if set(flags.group()[2:-1]) - {"i"}:
+            raise PatternTranslationError(f"flag inline non supportati: {flags.group()}")
+        i = flags.end()
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\" and i + 1 < len(pattern):
+            nxt = pattern[i + 1]
+            if not in_class and nxt in _PG_ESCAPES:
+                out.append(_PG_ESCAPES[nxt])
+            elif nxt in "AZ" and not in_class:
+                out.append("^" if nxt == "A" else "$")
+            else:
+                out.append(ch + nxt)
+            i += 2
+            continue
+        if in_class:
+            in_class = ch != "]" or pattern[i - 1] == "["
+        elif ch == "[":
+            in_class = True
+        elif pattern.startswith("(?P<", i):
+            i = pattern.index(">", i) + 1
+            out.append("(")
+            continue
+        elif pattern.startswith("(?P=", i) or pattern.startswith("(?(", i):
+            raise PatternTranslationError(f"costrutto non supportato in PostgreSQL: {pattern[i:i + 4]}")
+        out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+def pattern_coverage(client: Client, table: str, column: str, pattern: str, examples: int = 5) -> PatternCoverage:
+    """Copertura di `pattern` calcolata dal DB su tutte le righe (RPC pattern_coverage, un round trip)."""
+    resp = client.rpc("pattern_coverage", {
+        "p_table": table, "p_column": column,
+        "p_pattern": to_postgres_regex(pattern), "p_examples": examples,
+    }).execute()
+    row = (resp.data or [{}])[0]
+    return PatternCoverage(
+        total=int(row.get("total") or 0),
+        matched=int(row.get("matched") or 0),
+        examples=list(row.get("examples") or []),
+    )
+
+
 # ──────────────────────────────────────────────────────────────
 # Layer 3 – Pattern detection
 # ──────────────────────────────────────────────────────────────
@@ -293,37 +560,81 @@ def detect_pattern(
     return None, "exact", 0.0, notes
 
 
-def detect_match_mode(samples: list[str]) -> str:
+@dataclass
+class PrefixProfile:
+    """Relazioni di prefisso tra i codici campionati (prefix_profile)."""
+    n:                   int
+    prefix_pairs:        int              # coppie (i<j) in cui un codice è prefisso dell'altro
+    depth_distribution:  dict[int, int]   # profondità (n. di antenati nel campione) → codici distinti
+    length_distribution: dict[int, int]   # lunghezza → codici distinti (livelli della gerarchia)
+
+    @property
+    def pair_ratio(self) -> float:
+        total = self.n * (self.n - 1) / 2
+        return self.prefix_pairs / total if total else 0.0
+
+    @property
+    def max_depth(self) -> int:
+        return max(self.depth_distribution, default=0)
+
+
+def prefix_profile(samples: list[str]) -> PrefixProfile:
     """
-    Suggerisce 'exact' o 'prefix' basandosi sull'analisi delle relazioni
-    di prefisso tra i campioni.
+    Analisi delle relazioni di prefisso in O(n log n): in ordine lessicografico
+    i codici che estendono p seguono p in un blocco contiguo, quindi una pila
+    contiene in ogni momento la catena degli antenati del codice corrente.
+    Duplicati: coppie uguali contano come relazione di prefisso (come startswith).
     """
-    if not samples:
-        return "exact"
+    counts = Counter(s.strip().split()[0] for s in samples if s.strip())
+    n = sum(counts.values())
+    pairs = sum(c * (c - 1) // 2 for c in counts.values())
+    depths: Counter[int] = Counter()
+
+    stack: list[tuple[str, int]] = []   # (codice antenato, occorrenze cumulate della catena)
+    for code in sorted(counts):
+        while stack and not code.startswith(stack[-1][0]):
+            stack.pop()
+        ancestors = stack[-1][1] if stack else 0
+        pairs += counts[code] * ancestors
+        depths[len(stack)] += 1
+        stack.append((code, ancestors + counts[code]))
+
+    return PrefixProfile(
+        n=n,
+        prefix_pairs=pairs,
+        depth_distribution=dict(sorted(depths.items())),
+        length_distribution=dict(sorted(Counter(len(c) for c in counts).items())),
+    )
 
-    clean = [s.strip().split()[0] for s in samples]
-    n = len(clean)
-    if n < 2:
-        return "exact"
 
-    prefix_pairs = sum(
-        1
-        for i in range(n)
-        for j in range(i + 1, n)
-        if clean[i].startswith(clean[j]) or clean[j].startswith(clean[i])
-    )
-    total_pairs = n * (n - 1) / 2
+def detect_match_mode(samples: list[str], profile: PrefixProfile | None = None) -> str:
+    """
+    Suggerisce 'exact' o 'prefix' basandosi sull'analisi delle relazioni
+    di prefisso tra i campioni (prefix_profile, sub-quadratica).
+    """
+    profile = profile or prefix_profile(samples)
+    if profile.n < 2:
+        return "exact"
 
-    if prefix_pairs / total_pairs > 0.20:
+    if profile.pair_ratio > 0.20:
         return "prefix"
 
-    lengths = [len(s) for s in clean]
+    lengths = list(profile.length_distribution)
     if max(lengths) - min(lengths) >= 4:
         return "prefix"
 
     return "exact"
 
 
+def describe_hierarchy(profile: PrefixProfile) -> str:
+    """Nota leggibile: livelli (lunghezze) e profondità della gerarchia di prefissi."""
+    levels = "/".join(str(l) for l in profile.length_distribution)
+    return (
+        f"Gerarchia di prefissi su {profile.n} campioni: livelli di {levels} caratteri, "
+        f"profondità max {profile.max_depth}, {profile.pair_ratio:.0%} coppie prefisso"
+    )
+
+
 # ──────────────────────────────────────────────────────────────
 # Layer 3 – Validazione entry registry
 # ──────────────────────────────────────────────────────────────
@@ -334,7 +645,7 @@ def validate_registry_entry(
     all_table_names: set[str],
 ) -> ScanResult:
     """
-    Esegue 6 check su una entry del registry contro il DB reale.
+    Esegue 7 check su una entry del registry contro il DB reale.
     Si ferma al primo errore bloccante (tabella mancante, campi mancanti).
     """
     result = ScanResult(
@@ -379,25 +690,12 @@ def validate_registry_entry(
         return result
 
     # ── 4. Copertura pattern ─────────────────────────────────
-    regex = re.compile(entry["pattern"], re.IGNORECASE)
-    hits = sum(1 for s in samples if regex.search(s))
-    coverage = hits / len(samples)
-    coverage_ok = coverage >= PATTERN_COVERAGE_WARN
-    result.checks.append(Check(
-        "pattern_coverage", coverage_ok,
-        f"{coverage:.0%} dei campioni matchano il pattern"
-        + ("" if coverage_ok else f"  (soglia: {PATTERN_COVERAGE_WARN:.0%})"),
-    ))
+    result.checks.append(_check_pattern_coverage(client, entry, samples))
 
     # ── 5. Lookup di verifica ────────────────────────────────
     sample_code = samples[0].strip().upper().split()[0]
     try:
-        q = client.table(entry["table"]).select(entry["code_field"])
-        if entry["match_mode"] == "exact":
-            q = q.eq(entry["code_field"], sample_code)
-        else:
-            q = q.like(entry["code_field"], f"{sample_code[:4]}%")
-        resp = q.limit(5).execute()
+        resp = _lookup_query(client, entry, _lookup_value(entry, sample_code)).execute()
         n_results = len(resp.data or [])
         result.checks.append(Check(
             "sample_lookup", n_results > 0,
@@ -422,19 +720,315 @@ def validate_registry_entry(
             "" if static_ok else "source.celex o source.url mancante",
         ))
 
+    # ── 7. Piano di fetch ────────────────────────────────────
+    result.checks.append(_check_fetch_plan(entry, col_names))
+
     return result
 
 
+def _lookup_value(entry: dict, code: str) -> str:
+    """Valore cercato dal lookup di verifica: il codice (exact) o i primi 4 caratteri (prefix)."""
+    return code if entry["match_mode"] == "exact" else code[:4]
+
+
+def _lookup_plan(entry: dict) -> dict:
+    """Piano di fetch del lookup con il limit effettivo (TOP_K se non dichiarato), come retrieval."""
+    plan = get_fetch_plan(entry)
+    return {**plan, "limit": plan["limit"] or config.TOP_K}
+
+
+def _lookup_query(client: Client, entry: dict, value: str):
+    """
+    Lookup come in retrieval.lookup_collateral: colonne, ordinamento e limit dal
+    piano di fetch; eq (exact) o like 'value%' (prefix).
+    """
+    plan = _lookup_plan(entry)
+    q = client.table(entry["table"]).select(",".join(plan["columns"]))
+    if entry["match_mode"] == "exact":
+        q = q.eq(entry["code_field"], value)
+    else:
+        q = q.like(entry["code_field"], f"{value}%")
+    if plan["order_by"]:
+        q = q.order(plan["order_by"])
+    return q.limit(plan["limit"])
+
+
+def _check_pattern_coverage(client: Client, entry: dict, samples: list[str]) -> Check:
+    """
+    Copertura del pattern su tutte le righe (RPC pattern_coverage); se la funzione
+    non è deployata o il pattern non è traducibile, sui campioni letti in Python.
+    """
+    try:
+        cov = pattern_coverage(client, entry["table"], entry["code_field"], entry["pattern"])
+    except PatternTranslationError as e:
+        fallback = f"  ({e}: verifica sui campioni)"
+    except Exception as e:
+        if not _is_missing_function(e):
+            return Check("pattern_coverage", False, f"Errore: {e}")
+        fallback = "  (pattern_coverage non deployata: verifica sui campioni)"
+    else:
+        ok = cov.total > 0 and cov.ratio >= PATTERN_COVERAGE_WARN
+        detail = f"{cov.ratio:.1%} di {cov.total} righe matchano il pattern"
+        if not ok:
+            detail += f"  (soglia: {PATTERN_COVERAGE_WARN:.0%})"
+        if cov.examples:
+            detail += f"  · non conformi: {', '.join(cov.examples[:3])}"
+        return Check("pattern_coverage", ok, detail)
+
+    regex = re.compile(entry["pattern"], re.IGNORECASE)
+    hits = sum(1 for s in samples if regex.search(s))
+    coverage = hits / len(samples)
+    coverage_ok = coverage >= PATTERN_COVERAGE_WARN
+    return Check(
+        "pattern_coverage", coverage_ok,
+        f"{coverage:.0%} dei campioni matchano il pattern"
+        + ("" if coverage_ok else f"  (soglia: {PATTERN_COVERAGE_WARN:.0%})")
+        + fallback,
+    )
+
+
+def _check_fetch_plan(entry: dict, col_names: set[str]) -> Check:
+    """
+    Verifica che colonne e order_by del piano di fetch (dichiarato o derivato)
+    esistano nella tabella: una colonna mancante farebbe fallire ogni lookup.
+    Per le entry con hierarchy_index verifica anche indent e hier_pos.
+    """
+    plan = get_fetch_plan(entry)
+    wanted = plan["columns"] + ([plan["order_by"]] if plan["order_by"] else [])
+    if entry.get("hierarchy_index"):
+        wanted += [HIERARCHY_INDENT_FIELD, HIERARCHY_ORDER_FIELD]
+    missing = [c for c in dict.fromkeys(wanted) if c not in col_names]
+    if missing:
+        return Check(
+            "fetch_plan_columns", False,
+            f"Colonne del piano di fetch non trovate: {', '.join(missing)}"
+            + ("" if "fetch" in entry else "  (dichiarare 'fetch' nell'entry)"),
+        )
+    return Check(
+        "fetch_plan_columns", True,
+        f"{len(plan['columns'])} colonne proiettate: {', '.join(plan['columns'])}",
+    )
+
+
+# ──────────────────────────────────────────────────────────────
+# Layer 3b – Performance dei lookup (--perf)
+# ──────────────────────────────────────────────────────────────
+
+def _percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def explain_lookup(client: Client, entry: dict, value: str) -> list[dict]:
+    """
+    Piano EXPLAIN (JSON) del lookup dell'entry (RPC explain_lookup, senza eseguire
+    la query): stessa proiezione, ordinamento e limit di _lookup_query.
+    """
+    plan = _lookup_plan(entry)
+    resp = client.rpc("explain_lookup", {
+        "p_table": entry["table"], "p_column": entry["code_field"],
+        "p_value": value, "p_mode": entry["match_mode"],
+        "p_columns": plan["columns"], "p_order": plan["order_by"], "p_limit": plan["limit"],
+    }).execute()
+    plan = resp.data
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan if isinstance(plan, list) else [plan] if plan else []
+
+
+def _plan_nodes(node: dict) -> Iterator[dict]:
+    yield node
+    for child in node.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def check_lookup_performance(
+    client: Client,
+    entry: dict,
+    row_estimate: int,
+    repeats: int | None = None,
+) -> tuple[Check, LookupPerf | None]:
+    """
+    Cronometra `repeats` lookup (stessa query di lookup_collateral; con --workers/--rate
+    solo la richiesta, non l'attesa del Throttle) e legge il piano:
+    fallisce con p95 > LOOKUP_P95_WARN_MS o con una seq scan su tabelle oltre
+    SEQ_SCAN_MIN_ROWS righe (indice mancante, es. text_pattern_ops per prefix).
+    """
+    repeats = repeats or LATENCY_PROBE_REPEATS
+    samples = sample_values(client, entry["table"], entry["code_field"], 1)
+    if not samples:
+        return Check("lookup_performance", False, "Nessun codice da cercare"), None
+    value = _lookup_value(entry, samples[0].strip().upper().split()[0])
+
+    timings: list[float] = []
+    try:
+        for _ in range(repeats):
+            timings.append(_timed_execute_ms(_lookup_query(client, entry, value)))
+    except Exception as e:
+        return Check("lookup_performance", False, f"Errore: {e}"), None
+
+    scan_nodes: list[str] = []
+    index: str | None = None
+    plan_note = ""
+    try:
+        for root in explain_lookup(client, entry, value):
+            for node in _plan_nodes(root.get("Plan", {})):
+                if node.get("Relation Name") == entry["table"]:
+                    scan_nodes.append(node.get("Node Type", "?"))
+                    index = index or node.get("Index Name")
+    except Exception as e:
+        plan_note = ("  (explain_lookup non deployata o da aggiornare)" if _is_missing_function(e)
+                     else f"  (piano non disponibile: {e})")
+
+    perf = LookupPerf(
+        mode=entry["match_mode"], code=value,
+        p50_ms=round(_percentile(timings, 50), 1), p95_ms=round(_percentile(timings, 95), 1),
+        scan_nodes=scan_nodes, index=index,
+        seq_scan="Seq Scan" in scan_nodes,
+    )
+    problems: list[str] = []
+    if perf.p95_ms > LOOKUP_P95_WARN_MS:
+        problems.append(f"p95 oltre {LOOKUP_P95_WARN_MS:.0f} ms")
+    if perf.seq_scan and row_estimate >= SEQ_SCAN_MIN_ROWS:
+        hint = " (text_pattern_ops)" if entry["match_mode"] == "prefix" else ""
+        problems.append(f"sequential scan: manca un indice su {entry['code_field']}{hint}")
+
+    plan = ", ".join(scan_nodes) or "?"
+    detail = (
+        f"{perf.mode} '{value}' ×{repeats}: p50 {perf.p50_ms:.0f} ms · p95 {perf.p95_ms:.0f} ms"
+        f" · piano: {plan}{f' ({index})' if index else ''}{plan_note}"
+    )
+    if problems:
+        detail += "  ⚠ " + "; ".join(problems)
+    return Check("lookup_performance", not problems, detail), perf
+
+
 # ──────────────────────────────────────────────────────────────
 # Layer 4 – Profiling tabelle non in registry
 # ──────────────────────────────────────────────────────────────
 
+# False dopo il primo PGRST202: catalog.sql senza stream_table_page → OFFSET su tutte le colonne.
+_CTID_STREAMING_AVAILABLE = True
+
+
+def stream_table(
+    client: Client,
+    table: str,
+    columns: list[str],
+    key: str | None,
+    page_size: int | None = None,
+) -> Iterator[list[dict]]:
+    """
+    Pagine di righe (solo `columns`) dell'intera tabella: keyset pagination su `key`
+    (colonna univoca, es. "id") se disponibile, altrimenti keyset su ctid (RPC
+    stream_table_page). Senza la RPC: OFFSET ordinato su tutte le colonne lette,
+    così le righe a pari valore sono identiche e nessuna è saltata o ripetuta.
+    """
+    global _CTID_STREAMING_AVAILABLE
+    page_size = page_size or DEEP_PAGE_SIZE
+    if key is None and _CTID_STREAMING_AVAILABLE:
+        try:
+            yield from _stream_by_ctid(client, table, columns, page_size)
+            return
+        except Exception as e:
+            if not _is_missing_function(e):
+                raise
+            _CTID_STREAMING_AVAILABLE = False
+
+    select = ",".join(dict.fromkeys(columns + ([key] if key else [])))
+    cursor, offset = None, 0
+    while True:
+        q = client.table(table).select(select)
+        if key:
+            if cursor is not None:
+                q = q.gt(key, cursor)
+            q = q.order(key).limit(page_size)
+        else:
+            for col in columns:
+                q = q.order(col)
+            q = q.range(offset, offset + page_size - 1)
+        rows = q.execute().data or []
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        cursor, offset = rows[-1].get(key) if key else None, offset + page_size
+
+
+def _stream_by_ctid(client: Client, table: str, columns: list[str], page_size: int) -> Iterator[list[dict]]:
+    after: str | None = None
+    while True:
+        resp = client.rpc("stream_table_page", {
+            "p_table": table, "p_columns": columns, "p_after": after, "p_limit": page_size,
+        }).execute()
+        page = resp.data or []
+        rows = [r["row_data"] if isinstance(r["row_data"], dict) else json.loads(r["row_data"]) for r in page]
+        if rows:
+            yield rows
+        if len(page) < page_size:
+            return
+        after = page[-1]["row_ctid"]
+
+
+def deep_profile_columns(
+    client: Client,
+    table: str,
+    cols: list[ColumnInfo],
+    key: str | None = None,
+    page_size: int | None = None,
+) -> dict[str, ColumnSketch]:
+    """
+    Profilo completo delle colonne `cols` su tutte le righe, a memoria costante:
+    una ColumnSketch per colonna (righe, null, distinti HLL, lunghezze, forme,
+    campione reservoir, copertura esatta dei pattern del registry).
+    Le pagine sono lette con stream_table (keyset su `key` se indicata, altrimenti su ctid).
+    """
+    names = [c.name for c in cols]
+    if not names:
+        return {}
+    patterns = {e["id"]: e["pattern"] for e in REGISTRY}
+    sketches = {
+        name: ColumnSketch(patterns, DEEP_RESERVOIR_SIZE, seed=i) for i, name in enumerate(names)
+    }
+    for page in stream_table(client, table, names, key, page_size):
+        for row in page:
+            for name in names:
+                sketches[name].add(row.get(name))
+    return sketches
+
+
+def _deep_pattern_coverage(
+    client: Client, table: str, column: str, pattern: str, sketch: ColumnSketch,
+) -> tuple[float, bool]:
+    """
+    Copertura del pattern rilevato sull'intera colonna → (frazione, esatta).
+    Esatta dallo sketch per i pattern del registry (contati durante lo streaming),
+    altrimenti dalla RPC pattern_coverage; se non disponibile, stima dalle forme.
+    """
+    if sketch.tracks(pattern):
+        return sketch.coverage(pattern), True
+    try:
+        return pattern_coverage(client, table, column, pattern, examples=0).ratio, True
+    except Exception:   # RPC assente o pattern non traducibile
+        return sketch.coverage(pattern), False
+
+
 def profile_unknown_table(
-    client: Client, table: str, row_estimate: int
+    client: Client,
+    table: str,
+    row_estimate: int,
+    pool: Executor | None = None,
+    cols: list[ColumnInfo] | None = None,
+    deep: bool = False,
 ) -> DraftEntry:
     """
     Profila una tabella non in registry.
     Rileva code_field, text_field, pattern, match_mode e genera una DraftEntry.
+    Campioni con una sola RPC per tabella (sample_table); `cols` evita di rileggere
+    le colonne se già note, `pool` serve il fallback per colonna in parallelo.
+    deep=True: campioni e statistiche da tutte le righe (deep_profile_columns),
+    con cardinalità e copertura del pattern sull'intera tabella in draft.column_stats.
+    Campionamento fallito → draft.sampling_failed con l'errore nelle note.
     """
     draft = DraftEntry(
         table=table, row_estimate=row_estimate,
@@ -443,7 +1037,8 @@ def profile_unknown_table(
         has_celex_field=False, confidence=0.0,
     )
 
-    cols = get_columns(client, table)
+    if cols is None:
+        cols = get_columns(client, table)
     if not cols:
         draft.notes.append("Impossibile leggere le colonne")
         return draft
@@ -451,16 +1046,35 @@ def profile_unknown_table(
     col_names = {c.name for c in cols}
     draft.has_celex_field = "celex_consolidated" in col_names
 
-    # Campiona tutte le colonne utili
-    samples_by_col: dict[str, list[str]] = {}
-    for c in cols:
-        if c.name in SKIP_COLS:
-            continue
-        if any(t in c.data_type for t in SKIP_TYPES):
-            continue
-        vals = sample_values(client, table, c.name, SAMPLE_SIZE)
-        if vals:
-            samples_by_col[c.name] = vals
+    # Campiona tutte le colonne utili (ordine delle colonne preservato)
+    eligible = [
+        c for c in cols
+        if c.name not in SKIP_COLS and not any(t in c.data_type for t in SKIP_TYPES)
+    ]
+    sampled = [c.name for c in eligible]
+    sketches: dict[str, ColumnSketch] = {}
+    if deep:
+        # Campione uniforme su tutte le righe (valori distinti) invece dei primi distinti.
+        # Errori dello streaming (RPC, rete, timeout) come un campionamento fallito:
+        # la tabella resta senza profilo e la scansione prosegue con le altre.
+        try:
+            sketches = deep_profile_columns(client, table, eligible, key="id" if "id" in col_names else None)
+        except Exception as e:
+            draft.sampling_failed = True
+            draft.notes.append(f"Profilo completo fallito, profilo non disponibile: {e}")
+            return draft
+        samples = {col: list(dict.fromkeys(sk.reservoir.items)) for col, sk in sketches.items()}
+        draft.column_stats = {col: sk.summary() for col, sk in sketches.items()}
+    else:
+        try:
+            samples = sample_table(client, table, sampled, SAMPLE_SIZE, pool)
+        except SamplingError as e:
+            draft.sampling_failed = True
+            draft.notes.append(f"Campionamento fallito, profilo non disponibile: {e}")
+            return draft
+    samples_by_col: dict[str, list[str]] = {
+        col: samples[col] for col in sampled if samples.get(col)
+    }
 
     # Rileva code_field: colonna con confidence massima, con bonus per nome
     code_candidates: list[tuple[str, float]] = []
@@ -481,9 +1095,45 @@ def profile_unknown_table(
         draft.notes        = notes
         draft.sample_codes = svals[:5]
 
+        # match_mode su un campione ampio del code_field, solo se serve: non per i
+        # pattern già nel registry (match_mode dall'entry) né quando il campione
+        # contiene già tutti i valori distinti della colonna (o tutte le righe, deep).
+        registry_match = _match_registry_patterns(svals)[0] is not None
+        exhaustive = sketches[best_col].rows <= DEEP_RESERVOIR_SIZE if deep else len(svals) < SAMPLE_SIZE
+        codes = svals
+        if not registry_match and not exhaustive:
+            try:
+                codes = sample_values(client, table, best_col, MATCH_MODE_SAMPLE_SIZE, strict=True) or svals
+            except SamplingError as e:
+                draft.sampling_failed = True
+                draft.notes.append(f"Campionamento fallito, match_mode non verificato: {e}")
+        profile = prefix_profile(codes)
+        draft.hierarchy_levels = list(profile.length_distribution)
+        draft.hierarchy_depth  = profile.max_depth
+        if not registry_match:
+            draft.match_mode = detect_match_mode(codes, profile)
+        if profile.max_depth > 0:
+            draft.notes.append(describe_hierarchy(profile))
+
+        if deep and pattern:
+            sk = sketches[best_col]
+            coverage, exact = _deep_pattern_coverage(client, table, best_col, pattern, sk)
+            draft.column_stats[best_col]["code_pattern_coverage"] = round(coverage, 4)
+            draft.column_stats[best_col]["code_pattern_coverage_exact"] = exact
+            draft.notes.append(
+                f"Profilo completo: {sk.rows} righe, ~{sk.distinct.estimate()} valori distinti, "
+                + (f"copertura pattern {coverage:.0%}" if exact
+                   else f"copertura pattern ~{coverage:.0%} (stimata dalle forme più frequenti)")
+            )
+            if coverage < PATTERN_COVERAGE_WARN:
+                draft.notes.append(
+                    f"Copertura del pattern sotto soglia ({PATTERN_COVERAGE_WARN:.0%}) sull'intera tabella"
+                    + ("" if exact else " (stima)")
+                )
+
     # Rileva text_field: prima colonna con nome hint, poi quella con valori più lunghi
     for hint in TEXT_FIELD_HINTS:
-        for col in col_names:
+        for col in (c.name for c in cols):
             if hint in col.lower() and col != draft.code_field and col not in SKIP_COLS:
                 draft.text_field = col
                 break
@@ -509,6 +1159,203 @@ def profile_unknown_table(
     return draft
 
 
+# ──────────────────────────────────────────────────────────────
+# Layer 4b – Cache dei profili
+# ──────────────────────────────────────────────────────────────
+
+def table_signature(cols: list[ColumnInfo], row_estimate: int, deep: bool = False) -> str:
+    """Firma di una tabella: colonne (nome, tipo, nullability), row_estimate, modalità e versione del profiling."""
+    h = hashlib.sha256(f"v{SCAN_CACHE_VERSION}|{row_estimate}{'|deep' if deep else ''}".encode())
+    for c in cols:
+        h.update(f"|{c.name}:{c.data_type}:{int(c.is_nullable)}".encode())
+    return h.hexdigest()
+
+
+class ScanCache:
+    """
+    Profili delle tabelle non in registry tra un'esecuzione e l'altra (JSON locale).
+    Un profilo è riusato solo se la firma (colonne + row_estimate) è invariata.
+    """
+
+    def __init__(self, path: Path | None):
+        self.path = path
+        self.hits = self.misses = 0
+        self._entries: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        if path is not None and path.exists():
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+                self._entries = data.get("tables", {}) if data.get("version") == SCAN_CACHE_VERSION else {}
+            except (OSError, ValueError):
+                pass    # cache illeggibile: si ri-profila tutto
+
+    def get(self, table: str, signature: str) -> DraftEntry | None:
+        with self._lock:
+            cached = self._entries.get(table)
+            if cached is None or cached.get("signature") != signature:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return DraftEntry(**cached["draft"])
+
+    def put(self, table: str, signature: str, draft: DraftEntry) -> None:
+        with self._lock:
+            self._entries[table] = {"signature": signature, "draft": asdict(draft)}
+
+    def save(self, tables: set[str] | None = None) -> None:
+        """Scrittura atomica; con `tables` elimina i profili delle tabelle non più presenti."""
+        if self.path is None:
+            return
+        with self._lock:
+            entries = {t: e for t, e in self._entries.items() if tables is None or t in tables}
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(
+                json.dumps({"version": SCAN_CACHE_VERSION, "tables": entries}, ensure_ascii=False, indent=1),
+                encoding="utf-8",
+            )
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[scan] impossibile salvare la cache {self.path.name}: {e}", file=sys.stderr)
+
+
+# ──────────────────────────────────────────────────────────────
+# Layer 4c – Indici suggeriti (--suggest-indexes)
+# ──────────────────────────────────────────────────────────────
+
+def _index_name(table: str, *parts: str) -> str:
+    slug = "_".join(re.sub(r"[^a-z0-9]+", "_", p.lower()).strip("_") for p in parts)
+    return f"{table}_{slug}_idx"[:PG_IDENTIFIER_MAX]
+
+
+def required_indexes(entries: list[dict] | None = None) -> list[IndexSpec]:
+    """
+    Indici richiesti dai percorsi di accesso di retrieval.py:
+      - entry "exact"  → btree (code_field): .eq() di lookup_collateral
+      - entry "prefix" → btree (code_field text_pattern_ops) per like 'x%'
+                         + btree (code_field, key_field) per order(code_field) e la
+                         keyset pagination di _iter_rows (cursore composto)
+      - order_by dichiarato ≠ code_field (exact) → btree composito (code_field, order_by)
+      - chunks → ((metadata->>'code')) per get_annex_chunks_by_codes, HNSW su
+                 embedding globale e parziale per ogni unit_type in ANN_UNIT_TYPES
+    Senza duplicati (stessa tabella, metodo, chiave e predicato).
+    """
+    specs: list[IndexSpec] = []
+    for entry in REGISTRY if entries is None else entries:
+        table, code = entry["table"], entry["code_field"]
+        order_by = get_fetch_plan(entry)["order_by"]
+        if entry["match_mode"] == "prefix":
+            specs.append(IndexSpec(
+                table, _index_name(table, code, "pattern"), f"{code} text_pattern_ops",
+                reason=f"{entry['id']}: lookup prefix (like '<codice>%')",
+            ))
+            key = get_key_field(entry)
+            specs.append(IndexSpec(
+                table, _index_name(table, code, key), f"{code}, {key}",
+                reason=f"{entry['id']}: order by {code} + keyset pagination su ({code}, {key})",
+            ))
+        elif order_by and order_by != code:
+            specs.append(IndexSpec(
+                table, _index_name(table, code, order_by), f"{code}, {order_by}",
+                reason=f"{entry['id']}: lookup exact ordinato per {order_by}",
+            ))
+        else:
+            specs.append(IndexSpec(
+                table, _index_name(table, code), code,
+                reason=f"{entry['id']}: lookup exact (= '<codice>')",
+            ))
+
+    specs.append(IndexSpec(
+        "chunks", _index_name("chunks", "metadata_code"), "(metadata->>'code')",
+        where="(metadata->>'code') is not null",
+        reason="get_annex_chunks_by_codes: metadata->>code in (…)",
+    ))
+    specs.append(IndexSpec(
+        "chunks", _index_name("chunks", "embedding", "hnsw"), "embedding vector_cosine_ops",
+        method="hnsw", reason="vector_search senza type_filters",
+    ))
+    for unit_type in ANN_UNIT_TYPES:
+        specs.append(IndexSpec(
+            "chunks", _index_name("chunks", "embedding", unit_type, "hnsw"), "embedding vector_cosine_ops",
+            method="hnsw", where=f"unit_type = '{unit_type}'",
+            reason=f"vector_search con type_filters=['{unit_type}']",
+        ))
+
+    unique: dict[tuple, IndexSpec] = {}
+    for spec in specs:
+        unique.setdefault((spec.table, spec.method, _norm_sql(spec.key), _norm_sql(spec.where or "")), spec)
+    return list(unique.values())
+
+
+def _norm_sql(text: str) -> str:
+    """Forma confrontabile di chiavi e predicati (pg_get_indexdef aggiunge parentesi, cast e spazi)."""
+    return re.sub(r'[\s"()]|::text', "", text.lower())
+
+
+def _split_top_level(text: str) -> list[str]:
+    parts, depth, current = [], 0, ""
+    for ch in text:
+        depth += (ch == "(") - (ch == ")")
+        if ch == "," and depth == 0:
+            parts.append(current)
+            current = ""
+        else:
+            current += ch
+    return parts + [current]
+
+
+def index_covers(indexdef: str, spec: IndexSpec) -> bool:
+    """
+    True se l'indice (definizione di pg_get_indexdef) serve `spec`: stesso metodo,
+    prime colonne uguali alla chiave richiesta (opclass inclusa) e stesso predicato.
+    Indici UNIQUE e composti con colonne in più contano come copertura.
+    """
+    head, _, where = indexdef.partition(" WHERE ")
+    head = head.partition(" INCLUDE ")[0]
+    m = re.search(r"USING (\w+) \((.*)\)\s*$", head, re.IGNORECASE)
+    if not m or m.group(1).lower() != spec.method:
+        return False
+    have = [_norm_sql(c) for c in _split_top_level(m.group(2))]
+    want = [_norm_sql(c) for c in _split_top_level(spec.key)]
+    return have[:len(want)] == want and _norm_sql(where) == _norm_sql(spec.where or "")
+
+
+def list_indexes(client: Client, table: str) -> list[tuple[str, str]]:
+    """[(index_name, index_def)] della tabella (RPC list_table_indexes)."""
+    resp = client.rpc("list_table_indexes", {"p_table": table}).execute()
+    return [(r["index_name"], r["index_def"]) for r in resp.data or []]
+
+
+def suggest_indexes(
+    client: Client,
+    table_names: set[str],
+    entries: list[dict] | None = None,
+) -> list[IndexSpec]:
+    """
+    required_indexes() sulle tabelle esistenti, con `existing` valorizzato per
+    quelli già coperti da un indice. Senza la RPC list_table_indexes
+    (catalog.sql non aggiornato) nessun indice risulta presente: il DDL usa
+    comunque "if not exists".
+    """
+    specs = [s for s in required_indexes(entries) if s.table in table_names]
+    existing: dict[str, list[tuple[str, str]]] = {}
+    for table in dict.fromkeys(s.table for s in specs):
+        try:
+            existing[table] = list_indexes(client, table)
+        except Exception as e:
+            if not _is_missing_function(e):
+                raise
+            print("[scan] list_table_indexes non deployata: indici esistenti non verificati", file=sys.stderr)
+            break
+    for spec in specs:
+        spec.existing = next(
+            (name for name, indexdef in existing.get(spec.table, []) if index_covers(indexdef, spec)),
+            None,
+        )
+    return specs
+
+
 # ──────────────────────────────────────────────────────────────
 # Layer 5 – Rendering report
 # ──────────────────────────────────────────────────────────────
@@ -660,6 +1507,7 @@ def render_json_report(
                 {"name": c.name, "passed": c.passed, "detail": c.detail}
                 for c in r.checks
             ],
+            **({"performance": asdict(r.performance)} if r.performance else {}),
         }
 
     def draft_to_dict(d: DraftEntry) -> dict:
@@ -670,6 +1518,8 @@ def render_json_report(
             "draft_entry":  _draft_dict(d) if d.code_field else None,
             "notes":        d.notes,
             "sample_codes": d.sample_codes,
+            "hierarchy":    {"levels": d.hierarchy_levels, "max_depth": d.hierarchy_depth},
+            **({"columns": d.column_stats} if d.column_stats else {}),
         }
 
     return json.dumps(
@@ -683,6 +1533,45 @@ def render_json_report(
     )
 
 
+def render_index_report(specs: list[IndexSpec], as_json: bool = False) -> str:
+    """
+    DDL pronto da eseguire per gli indici mancanti, con quelli già presenti
+    come commento. CREATE INDEX CONCURRENTLY non può girare in una transazione:
+    eseguire le istruzioni una alla volta (non in un unico blocco del SQL Editor).
+    """
+    missing = [s for s in specs if not s.existing]
+    if as_json:
+        return json.dumps(
+            {
+                "scan_date": date.today().isoformat(),
+                "indexes": [
+                    {**asdict(s), "ddl": None if s.existing else s.ddl()} for s in specs
+                ],
+            },
+            indent=2,
+            ensure_ascii=False,
+        )
+
+    L = [
+        "-- CustomsAI – indici suggeriti da tools/scan_db.py --suggest-indexes",
+        f"-- Data: {date.today().isoformat()} · {len(specs)} richiesti · {len(missing)} mancanti",
+        "-- CONCURRENTLY non ammesso in una transazione: eseguire un'istruzione alla volta.",
+    ]
+    for s in specs:
+        L += ["", f"-- {s.reason}"]
+        if s.existing:
+            L.append(f"-- già presente: {s.existing}")
+        else:
+            L.append(s.ddl())
+    if any(s.method == "hnsw" and s.where and not s.existing for s in specs):
+        L += [
+            "",
+            "-- Gli HNSW parziali sono usati solo se il filtro unit_type è noto al planner",
+            "-- (type_filters costante nella chiamata RPC); altrimenti resta quello globale.",
+        ]
+    L.append("")
+    return "\n".join(L)
+
 # ──────────────────────────────────────────────────────────────
 # CLI
 # ──────────────────────────────────────────────────────────────
@@ -699,6 +1588,7 @@ def _parse_args() -> argparse.Namespace:
             "  python3 tools/scan_db.py --check-only\n"
             "  python3 tools/scan_db.py --json --output report.json\n"
             "  python3 tools/scan_db.py --skip-tables log_table,temp\n"
+            "  python3 tools/scan_db.py --suggest-indexes --output indexes.sql\n"
         ),
     )
     p.add_argument("--json",         action="store_true", help="Output JSON")
@@ -706,9 +1596,101 @@ def _parse_args() -> argparse.Namespace:
     p.add_argument("--skip-tables",  metavar="T1,T2",     help="Tabelle aggiuntive da escludere (CSV)")
     p.add_argument("--check-only",   action="store_true", help="Valida solo il registry esistente")
     p.add_argument("--verbose",      action="store_true", help="Stampa progressione su stderr")
+    p.add_argument("--workers",      type=int, default=1, metavar="N",
+                   help="Tabelle e colonne scansionate in parallelo (default 1 = sequenziale)")
+    p.add_argument("--rate",         type=float, default=0.0, metavar="R",
+                   help="Massimo R richieste al secondo verso Supabase (default 0 = illimitato)")
+    p.add_argument("--cache",        metavar="FILE", default=str(DEFAULT_SCAN_CACHE),
+                   help=f"Cache dei profili (default {DEFAULT_SCAN_CACHE})")
+    p.add_argument("--no-cache",     action="store_true", help="Ri-profila tutte le tabelle (la cache viene riscritta)")
+    p.add_argument("--perf",         action="store_true",
+                   help="Cronometra i lookup di ogni entry e controlla il piano (EXPLAIN)")
+    p.add_argument("--perf-repeats", type=int, default=LATENCY_PROBE_REPEATS, metavar="N",
+                   help=f"Lookup cronometrati per entry (default {LATENCY_PROBE_REPEATS})")
+    p.add_argument("--deep",         action="store_true",
+                   help="Profilo su tutte le righe (sketch: distinti, forme, copertura pattern)")
+    p.add_argument("--suggest-indexes", action="store_true",
+                   help="Solo DDL degli indici mancanti per registry e chunks (CREATE INDEX CONCURRENTLY)")
     return p.parse_args()
 
 
+def run_scan(
+    client: Client,
+    skip: set[str],
+    check_only: bool = False,
+    workers: int = 1,
+    verbose: bool = False,
+    cache: ScanCache | None = None,
+    deep: bool = False,
+    perf: bool = False,
+    perf_repeats: int | None = None,
+) -> tuple[list[ScanResult], list[DraftEntry]]:
+    """
+    Validazione del registry e profiling delle tabelle non registrate.
+    Con workers > 1: entry e tabelle su un pool, colonne di ogni tabella su un
+    secondo pool (stessa dimensione); i risultati restano nell'ordine di input,
+    quindi il report è identico a quello sequenziale.
+    Con `cache`: le tabelle con firma invariata riusano il profilo salvato
+    (una sola RPC, get_table_columns, invece del campionamento); i profili con
+    campionamento fallito non sono salvati.
+    Con `perf`: check lookup_performance per ogni entry la cui tabella esiste.
+    """
+    all_tables = list_tables(client)
+    table_name_set = {t for t, _ in all_tables}
+    row_estimates = dict(all_tables)
+
+    table_pool  = ThreadPoolExecutor(workers, thread_name_prefix="scan") if workers > 1 else None
+    column_pool = ThreadPoolExecutor(workers, thread_name_prefix="sample") if workers > 1 else None
+    try:
+        # ── Validazione registry ─────────────────────────────
+        def _validate(entry: dict) -> ScanResult:
+            if verbose:
+                print(f"[scan] validating '{entry['id']}'…", file=sys.stderr)
+            result = validate_registry_entry(client, entry, table_name_set)
+            result.row_estimate = row_estimates.get(entry["table"], 0)
+            if perf and entry["table"] in table_name_set:
+                check, result.performance = check_lookup_performance(
+                    client, entry, result.row_estimate, perf_repeats
+                )
+                result.checks.append(check)
+            return result
+
+        registry_results = _map(table_pool, _validate, REGISTRY)
+
+        # ── Profiling tabelle non in registry ────────────────
+        drafts: list[DraftEntry] = []
+        if not check_only:
+            registry_tables = {e["table"] for e in REGISTRY}
+            unknown = [
+                (t, r)
+                for t, r in all_tables
+                if t not in registry_tables and t not in skip
+            ]
+
+            def _profile(item: tuple[str, int]) -> DraftEntry:
+                table, row_estimate = item
+                cols = get_columns(client, table)
+                signature = table_signature(cols, row_estimate, deep)
+                if cache is not None and (cached := cache.get(table, signature)) is not None:
+                    if verbose:
+                        print(f"[scan] '{table}' invariata (cache)", file=sys.stderr)
+                    return cached
+                if verbose:
+                    print(f"[scan] profiling '{table}'…", file=sys.stderr)
+                draft = profile_unknown_table(client, table, row_estimate, column_pool, cols=cols, deep=deep)
+                if cache is not None and cols and not draft.sampling_failed:
+                    cache.put(table, signature, draft)
+                return draft
+
+            drafts = _map(table_pool, _profile, unknown)
+    finally:
+        for pool in (table_pool, column_pool):
+            if pool is not None:
+                pool.shutdown(wait=True)
+
+    return registry_results, drafts
+
+
 def main() -> None:
     args = _parse_args()
     client = _get_client()
@@ -720,37 +1702,29 @@ def main() -> None:
         print(e, file=sys.stderr)
         sys.exit(1)
 
-    # Lista tutte le tabelle pubbliche
-    all_tables = list_tables(client)
-    table_name_set = {t for t, _ in all_tables}
-
     # Costruisci il set di tabelle da saltare
     skip = set(SYSTEM_TABLES_SKIP)
     if args.skip_tables:
         skip.update(t.strip() for t in args.skip_tables.split(","))
 
-    # ── Validazione registry ─────────────────────────────────
-    registry_results: list[ScanResult] = []
-    for entry in REGISTRY:
-        if args.verbose:
-            print(f"[scan] validating '{entry['id']}'…", file=sys.stderr)
-        registry_results.append(
-            validate_registry_entry(client, entry, table_name_set)
-        )
-
-    # ── Profiling tabelle non in registry ────────────────────
-    drafts: list[DraftEntry] = []
+    if args.suggest_indexes:
+        specs = suggest_indexes(client, {t for t, _ in list_tables(client)})
+        _write_output(render_index_report(specs, as_json=args.json), args.output)
+        return
+
+    if args.workers > 1 or args.rate > 0:
+        client = ThrottledClient(client, Throttle(max(1, args.workers), args.rate))
+    cache = ScanCache(None if args.no_cache else Path(args.cache))
+    registry_results, drafts = run_scan(
+        client, skip, check_only=args.check_only, workers=args.workers,
+        verbose=args.verbose, cache=cache, deep=args.deep,
+        perf=args.perf, perf_repeats=args.perf_repeats,
+    )
     if not args.check_only:
-        registry_tables = {e["table"] for e in REGISTRY}
-        unknown = [
-            (t, r)
-            for t, r in all_tables
-            if t not in registry_tables and t not in skip
-        ]
-        for table, row_estimate in unknown:
-            if args.verbose:
-                print(f"[scan] profiling '{table}'…", file=sys.stderr)
-            drafts.append(profile_unknown_table(client, table, row_estimate))
+        if args.no_cache:
+            cache.path = Path(args.cache)
+        cache.save({d.table for d in drafts})
+        print(f"[scan] profili: {cache.hits} dalla cache, {cache.misses} ricalcolati", file=sys.stderr)
 
     # ── Rendering ────────────────────────────────────────────
     output = (
@@ -759,9 +1733,13 @@ def main() -> None:
         else render_text_report(registry_results, drafts)
     )
 
-    if args.output:
-        Path(args.output).write_text(output, encoding="utf-8")
-        print(f"[scan_db] Report salvato in: {args.output}", file=sys.stderr)
+    _write_output(output, args.output)
+
+
+def _write_output(output: str, path: str | None) -> None:
+    if path:
+        Path(path).write_text(output, encoding="utf-8")
+        print(f"[scan_db] Report salvato in: {path}", file=sys.stderr)
     else:
         print(output)
 
@@ -0,0 +1,189 @@
+"""
+CustomsAI – Sketch a memoria costante per il profiling completo  (tools/sketches.py)
+
+Usati da scan_db --deep per profilare colonne intere, pagina per pagina,
+senza tenere le righe in memoria:
+
+  HyperLogLog     → stima dei valori distinti (errore ≈ 1.04/√m, m = 2^p registri)
+  SpaceSaving     → forme più frequenti (heavy hitters, k contatori)
+  Reservoir       → campione uniforme di k valori su tutto lo stream
+  ColumnSketch    → combinazione per colonna: righe, null, lunghezze, forme,
+                    distinti, campione e hit esatti dei pattern indicati
+
+Forma di un valore: cifre → "9", lettere → "A", altri caratteri invariati
+("2B002" → "9A999", "8544000000 80" → "9999999999 99"); oltre SHAPE_MAX_LEN
+caratteri la forma è "TEXT".
+"""
+
+import hashlib
+import math
+import random
+import re
+from collections import Counter
+
+
+SHAPE_MAX_LEN = 32
+# Lunghezze oltre questa soglia finiscono in un unico bucket (istogramma limitato).
+LENGTH_BUCKET_MAX = 256
+
+
+def value_shape(value: str) -> str:
+    if len(value) > SHAPE_MAX_LEN:
+        return "TEXT"
+    return "".join("9" if c.isdigit() else "A" if c.isalpha() else c for c in value)
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+# ============================================================
+# HyperLogLog
+# ============================================================
+
+class HyperLogLog:
+    """Conteggio approssimato dei distinti con 2^p registri da un byte."""
+
+    def __init__(self, p: int = 12):
+        self.p = p
+        self.m = 1 << p
+        self._registers = bytearray(self.m)
+
+    def add(self, value: str) -> None:
+        h = _hash64(value)
+        idx = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self._registers[idx]:
+            self._registers[idx] = rank
+
+    def estimate(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -r for r in self._registers)
+        zeros = self._registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            return round(m * math.log(m / zeros))     # linear counting per cardinalità basse
+        return round(raw)
+
+
+# ============================================================
+# SpaceSaving (heavy hitters)
+# ============================================================
+
+class SpaceSaving:
+    """
+    Top-k elementi più frequenti con k contatori: un elemento nuovo a contatori
+    pieni sostituisce il minimo ereditandone il conteggio (sovrastima ≤ error).
+    """
+
+    def __init__(self, k: int = 64):
+        self.k = k
+        self._counts: dict[str, list] = {}    # elemento → [count, error, esempio]
+
+    def add(self, item: str, example: str) -> None:
+        slot = self._counts.get(item)
+        if slot is not None:
+            slot[0] += 1
+        elif len(self._counts) < self.k:
+            self._counts[item] = [1, 0, example]
+        else:
+            victim = min(self._counts, key=lambda i: self._counts[i][0])
+            floor = self._counts.pop(victim)[0]
+            self._counts[item] = [floor + 1, floor, example]
+
+    def top(self, n: int | None = None) -> list[tuple[str, int, str]]:
+        """[(elemento, conteggio, esempio)] per conteggio decrescente (poi elemento)."""
+        ranked = sorted(self._counts.items(), key=lambda kv: (-kv[1][0], kv[0]))
+        return [(item, c, ex) for item, (c, _, ex) in ranked[:n]]
+
+
+# ============================================================
+# Reservoir sampling
+# ============================================================
+
+class Reservoir:
+    """Campione uniforme di k elementi (Algorithm R), deterministico dato il seed."""
+
+    def __init__(self, k: int = 200, seed: int = 0):
+        self.k = k
+        self.seen = 0
+        self.items: list[str] = []
+        self._rng = random.Random(seed)
+
+    def add(self, item: str) -> None:
+        self.seen += 1
+        if len(self.items) < self.k:
+            self.items.append(item)
+        else:
+            j = self._rng.randrange(self.seen)
+            if j < self.k:
+                self.items[j] = item
+
+
+# ============================================================
+# Sketch per colonna
+# ============================================================
+
+class ColumnSketch:
+    """Profilo in streaming di una colonna a memoria costante."""
+
+    def __init__(self, patterns: dict[str, str] | None = None, reservoir_size: int = 200, seed: int = 0):
+        self.rows  = 0
+        self.nulls = 0
+        self.lengths: Counter[int] = Counter()
+        self.shapes    = SpaceSaving()
+        self.distinct  = HyperLogLog()
+        self.reservoir = Reservoir(reservoir_size, seed)
+        self._patterns = {k: re.compile(p, re.IGNORECASE) for k, p in (patterns or {}).items()}
+        self.pattern_hits: Counter[str] = Counter()
+
+    def add(self, value) -> None:
+        self.rows += 1
+        if value is None or value == "":
+            self.nulls += 1
+            return
+        text = str(value).strip()
+        self.lengths[min(len(text), LENGTH_BUCKET_MAX)] += 1
+        self.shapes.add(value_shape(text), text)
+        self.distinct.add(text)
+        self.reservoir.add(text)
+        for key, regex in self._patterns.items():
+            if regex.search(text):
+                self.pattern_hits[key] += 1
+
+    @property
+    def non_null(self) -> int:
+        return self.rows - self.nulls
+
+    def tracks(self, pattern: str) -> bool:
+        """True se `pattern` è contato riga per riga (coverage esatta)."""
+        return any(regex.pattern == pattern for regex in self._patterns.values())
+
+    def coverage(self, pattern: str) -> float:
+        """
+        Frazione dei valori non null che matchano `pattern`: esatta per i pattern
+        tracciati (tracks), altrimenti stimata dalle forme più frequenti (un esempio
+        per forma, forme fuori dai contatori SpaceSaving escluse).
+        """
+        if not self.non_null:
+            return 0.0
+        for key, regex in self._patterns.items():
+            if regex.pattern == pattern:
+                return self.pattern_hits[key] / self.non_null
+        regex = re.compile(pattern, re.IGNORECASE)
+        hits = sum(c for _, c, example in self.shapes.top() if regex.search(example))
+        return min(1.0, hits / self.non_null)
+
+    def summary(self) -> dict:
+        return {
+            "rows":              self.rows,
+            "nulls":             self.nulls,
+            "distinct_estimate": self.distinct.estimate() if self.non_null else 0,
+            "lengths":           sorted(self.lengths.items()),
+            "top_shapes":        [[shape, count] for shape, count, _ in self.shapes.top(5)],
+            "pattern_coverage":  {
+                k: round(self.pattern_hits[k] / self.non_null, 4) if self.non_null else 0.0
+                for k in self._patterns
+            },
+        }
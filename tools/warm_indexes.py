@@ -0,0 +1,44 @@
+"""
+CustomsAI – Costruzione degli indici in memoria  (tools/warm_indexes.py)
+
+Legge le tabelle delle entry con hierarchy_index / correlation_index
+(nomenclature, dual_use_correlations) e, con HYBRID_ENABLED, la tabella chunks
+per l'indice BM25, e scrive gli snapshot locali in config.CACHE_DIR. I lookup non leggono mai un'intera tabella: senza snapshot
+valido usano la query sul DB, quindi la CLI beneficia dell'indice gerarchico
+solo dopo questo passo (o dopo l'avvio di server.py, che lo esegue in background).
+
+Da eseguire dopo il deploy e a ogni scadenza di SNAPSHOT_TTL_HOURS (es. cron).
+
+Utilizzo:
+    python3 tools/warm_indexes.py              # riusa gli snapshot ancora validi
+    python3 tools/warm_indexes.py --refresh    # rilegge sempre le tabelle
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+# Aggiungi la root del progetto al path per importare config e registry
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import retrieval
+
+
+def _parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="CustomsAI – Costruzione degli indici in memoria e dei loro snapshot.")
+    p.add_argument("--refresh", action="store_true", help="Ignora gli snapshot validi e rilegge le tabelle")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    started = time.monotonic()
+    built = retrieval.warm_indexes(refresh=args.refresh)
+    for entry_id, rows in built.items():
+        print(f"[warm] {entry_id}: {rows} righe indicizzate")
+    print(f"[warm] completato in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
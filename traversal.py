@@ -0,0 +1,104 @@
+"""
+CustomsAI – Traversal multi-hop del grafo links_to del registry
+
+Parte dai risultati collaterali (seed) e segue i links_to in ampiezza:
+a ogni hop i text_value delle righe di un'entry con links_to sono codici
+dell'entry destinazione, cercati con UNA query per tabella
+(retrieval.lookup_collateral_batch).
+
+Limiti:
+  - max_depth   → numero massimo di hop
+  - max_fanout  → codici nuovi per entry destinazione per hop (eccedenza scartata)
+  - visited     → coppie (entry_id, codice) già richieste: nessun ciclo, nessuna query ripetuta
+
+Registry-driven: nessun id o tabella hardcoded, qualsiasi nuova entry con
+links_to viene attraversata automaticamente.
+"""
+
+import re
+from dataclasses import dataclass, field
+
+import config
+import retrieval
+from registry import get_entry
+from retrieval import ChunkRow
+
+
+@dataclass
+class TraversalResult:
+    chunks:    list[ChunkRow] = field(default_factory=list)  # righe raggiunte, in ordine di hop
+    codes:     list[str]      = field(default_factory=list)  # codici richiesti, in ordine di scoperta
+    entry_ids: list[str]      = field(default_factory=list)  # entry con ≥1 risultato
+    hops:      int = 0
+    queries:   int = 0
+    truncated: bool = False   # True se max_depth o max_fanout hanno tagliato la frontiera
+
+
+def normalize_code(target: dict, value: str) -> str:
+    """
+    Estrae il codice dal text_value secondo il pattern dell'entry destinazione
+    (es. "3E001.a" → "3E001"); se il pattern non trova nulla usa il valore intero.
+    """
+    match = re.search(target["pattern"], value, re.IGNORECASE)
+    return (match.group(0) if match else value).strip().upper()
+
+
+def traverse_links(
+    seeds: list[ChunkRow],
+    max_depth: int | None = None,
+    max_fanout: int | None = None,
+) -> TraversalResult:
+    """
+    Visita in ampiezza il grafo links_to a partire dai chunk collaterali `seeds`.
+    Restituisce le righe raggiunte (esclusi i seed), i codici richiesti e le
+    statistiche (hop eseguiti, query, troncamento).
+    """
+    depth_limit  = config.TRAVERSAL_MAX_DEPTH if max_depth is None else max_depth
+    fanout_limit = config.TRAVERSAL_MAX_FANOUT if max_fanout is None else max_fanout
+
+    result = TraversalResult()
+    visited: set[tuple[str, str]] = {
+        (c.get("metadata", {}).get("source_id"), str(c.get("metadata", {}).get("code", "")).upper())
+        for c in seeds
+    }
+    frontier = seeds
+
+    while frontier:
+        # Raggruppa i codici della frontiera per entry destinazione (ordine stabile).
+        requests: dict[str, list[str]] = {}
+        for chunk in frontier:
+            meta   = chunk.get("metadata", {})
+            source = get_entry(meta.get("source_id") or "")
+            target = get_entry(source.get("links_to", "")) if source else None
+            value  = str(meta.get("text_value", "")).strip()
+            if not target or not value:
+                continue
+            code = normalize_code(target, value)
+            if (target["id"], code) in visited:
+                continue
+            visited.add((target["id"], code))
+            requests.setdefault(target["id"], []).append(code)
+
+        if not requests:
+            break
+        if result.hops >= depth_limit:
+            result.truncated = True
+            break
+
+        result.hops += 1
+        frontier = []
+        for target_id, codes in requests.items():
+            if len(codes) > fanout_limit:
+                result.truncated = True
+                codes = codes[:fanout_limit]
+            result.codes += codes
+
+            rows = retrieval.lookup_collateral_batch(get_entry(target_id), codes)
+            result.queries += 1
+            if rows:
+                result.chunks += rows
+                frontier += rows
+                if target_id not in result.entry_ids:
+                    result.entry_ids.append(target_id)
+
+    return result